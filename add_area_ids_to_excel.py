@@ -1,64 +1,14 @@
-import requests
+from centers_catalog import get_centers_catalog
 import pandas as pd
 import os
-import json
 import re
 from fuzzywuzzy import process, fuzz
 
 def get_areas(instance_id="tt_portal_adeslas", lang="es"):
-    """Obtiene todas las áreas/centros de TuoTempo"""
-    url = f"https://app.tuotempo.com/api/v3/{instance_id}/areas"
-    headers = {"content-type": "application/json; charset=UTF-8"}
-    params = {"lang": lang}
-    
-    print(f"Obteniendo áreas desde: {url}")
+    """Obtiene todas las áreas/centros de TuoTempo (catálogo compartido con caché)"""
+    print("Obteniendo áreas desde el catálogo de centros de TuoTempo")
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Guardar la respuesta completa para referencia
-        with open('areas_response.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        # Depurar la estructura de la respuesta
-        print("Estructura de la respuesta:")
-        print(f"Tipo de datos: {type(data)}")
-        print(f"Claves principales: {list(data.keys()) if isinstance(data, dict) else 'No es un diccionario'}")
-        
-        # Manejar diferentes formatos de respuesta
-        areas = []
-        if isinstance(data, dict):
-            if "return" in data:
-                ret_data = data["return"]
-                if isinstance(ret_data, dict) and "results" in ret_data:
-                    results = ret_data["results"]
-                    if isinstance(results, dict) and "areas" in results:
-                        areas = results["areas"]
-                    elif isinstance(results, list):
-                        # Algunos endpoints devuelven directamente una lista
-                        areas = results
-                elif isinstance(ret_data, list):
-                    # Algunos endpoints devuelven la lista directamente en "return"
-                    areas = ret_data
-            elif "results" in data:
-                # Formato alternativo donde "results" está en el nivel superior
-                results = data["results"]
-                if isinstance(results, dict) and "areas" in results:
-                    areas = results["areas"]
-                elif isinstance(results, list):
-                    areas = results
-            elif "areas" in data:
-                # Formato donde "areas" está en el nivel superior
-                areas = data["areas"]
-        elif isinstance(data, list):
-            # La respuesta es directamente una lista
-            areas = data
-        
-        if not isinstance(areas, list):
-            print(f"Error: No se pudo extraer una lista de áreas. Tipo obtenido: {type(areas)}")
-            return []
-            
+        areas = get_centers_catalog(instance_id, lang).all()
         print(f"Se encontraron {len(areas)} áreas/centros")
         return areas
     except Exception as e:
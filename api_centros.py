@@ -2,7 +2,7 @@ from flask import Blueprint, request, jsonify
 import os
 from dotenv import load_dotenv
 import logging
-from tuotempo_api import TuoTempoAPI
+from centers_catalog import get_centers_catalog
 from datetime import datetime
 
 # Cargar variables de entorno
@@ -26,7 +26,8 @@ def status():
     return jsonify({
         "service": "API Centros TuoTempo",
         "status": "online",
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "catalogo_centros": get_centers_catalog().stats()
     })
 
 @centros_api.route('/api/centros', methods=['GET'])
@@ -37,41 +38,30 @@ def obtener_centros():
     Query parameters:
     - cp: Código postal (opcional)
     - provincia: Provincia (opcional)
+    - ciudad: Ciudad (opcional)
     
     Returns:
         JSON con la lista de centros
     """
+    return _buscar_centros(request.args.get('cp'), request.args.get('provincia'), request.args.get('ciudad'))
+
+def _buscar_centros(codigo_postal=None, provincia=None, ciudad=None):
+    """Filtra el catálogo de centros y construye la respuesta JSON."""
     try:
-        # Obtener parámetros de la solicitud
-        codigo_postal = request.args.get('cp')
-        provincia = request.args.get('provincia')
-        
-        logger.info(f"Buscando centros - CP: {codigo_postal}, Provincia: {provincia}")
-        
-        # Crear instancia de la API
-        api = TuoTempoAPI(lang='es', environment='PRE')
+        logger.info(f"Buscando centros - CP: {codigo_postal}, Provincia: {provincia}, Ciudad: {ciudad}")
         
-        # Obtener centros (primero por provincia si se especifica)
-        centers_response = api.get_centers(province=provincia)
-        
-        if centers_response.get("result") != "OK":
-            error_msg = f"Error al obtener centros: {centers_response.get('message', 'Error desconocido')}"
+        # Catálogo en caché con índices por CP, provincia y ciudad
+        catalog = get_centers_catalog()
+        if not catalog.refresh():
+            error_msg = "Error al obtener centros: catálogo de TuoTempo no disponible"
             logger.error(error_msg)
             return jsonify({"success": False, "message": error_msg}), 500
         
-        # Extraer la lista de centros
-        centers_list = centers_response.get('return', {}).get('results', [])
+        centers_list = catalog.search(cp=codigo_postal, province=provincia, city=ciudad)
         
         if not centers_list:
             return jsonify({"success": True, "message": "No se encontraron centros", "centros": []}), 200
         
-        # Filtrar por código postal si se especifica
-        if codigo_postal:
-            centers_list = [
-                centro for centro in centers_list 
-                if isinstance(centro, dict) and str(centro.get('cp', '')).strip() == str(codigo_postal).strip()
-            ]
-        
         # Campos a incluir en la respuesta
         campos = [
             'areaid',
@@ -117,7 +107,6 @@ def obtener_centros_por_cp(codigo_postal):
     Returns:
         JSON con la lista de centros
     """
-    # Redirigir a la versión con query parameters
-    return obtener_centros()
+    return _buscar_centros(codigo_postal, request.args.get('provincia'), request.args.get('ciudad'))
 
 
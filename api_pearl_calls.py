@@ -4,10 +4,14 @@ Proporciona endpoints para controlar el sistema de llamadas desde la interfaz we
 """
 
 from flask import Flask, request, jsonify, Blueprint
+import base64
 import logging
 import json
+import os
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 from db import get_connection
 from call_manager import (CallManager, get_call_manager, CallStatus, set_override_phone, get_override_phone)
@@ -19,6 +23,104 @@ logger = logging.getLogger(__name__)
 # Crear blueprint para las APIs de llamadas
 api_pearl_calls = Blueprint('api_pearl_calls', __name__, url_prefix='/api/calls')
 
+# Segundos que se reutiliza el total del listado de leads para unos mismos filtros
+LEADS_COUNT_CACHE_SECONDS = int(os.getenv('LEADS_COUNT_CACHE_SECONDS', 30))
+LEADS_COUNT_CACHE_MAX = 256
+
+_leads_count_cache: Dict[tuple, Tuple[int, float]] = {}
+_leads_count_lock = threading.Lock()
+
+
+def invalidate_leads_count_cache():
+    """Descarta los totales cacheados del listado de leads."""
+    with _leads_count_lock:
+        _leads_count_cache.clear()
+
+
+@api_pearl_calls.after_request
+def _invalidate_counts_after_write(response):
+    # Cualquier escritura desde este blueprint puede cambiar los totales del listado
+    if request.method != 'GET':
+        invalidate_leads_count_cache()
+    return response
+
+
+def _count_leads(cursor, where_clause: str, params: List, mode: str) -> Tuple[Optional[int], bool]:
+    """
+    Total de leads que cumplen ``where_clause``.
+
+    Args:
+        mode: 'exact' (siempre COUNT), 'cached' (reutiliza el total durante
+            LEADS_COUNT_CACHE_SECONDS) o 'none' (no cuenta).
+
+    Returns:
+        (total, cacheado)
+    """
+    if mode == 'none':
+        return None, False
+    key = (where_clause, tuple(params))
+    if mode == 'cached':
+        cached = _leads_count_cache.get(key)
+        if cached and time.time() - cached[1] < LEADS_COUNT_CACHE_SECONDS:
+            return cached[0], True
+
+    cursor.execute(f"SELECT COUNT(*) as total FROM leads l WHERE {where_clause}", params)
+    total = cursor.fetchone()['total']
+    with _leads_count_lock:
+        if len(_leads_count_cache) >= LEADS_COUNT_CACHE_MAX:
+            _leads_count_cache.clear()
+        _leads_count_cache[key] = (total, time.time())
+    return total, False
+
+
+def _encode_leads_cursor(lead: Dict) -> str:
+    """Cursor opaco con la posición de ``lead`` en el orden del listado."""
+    updated_at = lead['updated_at']
+    position = [lead['call_priority'], updated_at.isoformat() if updated_at else None, lead['id']]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def _decode_leads_cursor(cursor: str) -> Tuple[Optional[int], Optional[datetime], int]:
+    """Inverso de ``_encode_leads_cursor``; ValueError si el cursor no es válido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        priority, updated_at, lead_id = json.loads(raw)
+        return (None if priority is None else int(priority),
+                datetime.fromisoformat(updated_at) if updated_at else None,
+                int(lead_id))
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def _leads_seek_condition(priority: Optional[int], updated_at: Optional[datetime],
+                          lead_id: int) -> Tuple[str, List]:
+    """
+    Condición "posterior al cursor" para ``ORDER BY call_priority ASC,
+    updated_at DESC, id DESC`` (MySQL ordena los NULL primero en ASC y
+    últimos en DESC).
+    """
+    params: List = []
+    # Mismo updated_at: desempate por id
+    same_updated = "(l.updated_at <=> %s AND l.id < %s)"
+    params_same_updated = [updated_at, lead_id]
+    if updated_at is None:
+        after_updated = same_updated
+        params_after_updated = params_same_updated
+    else:
+        after_updated = f"(l.updated_at < %s OR l.updated_at IS NULL OR {same_updated})"
+        params_after_updated = [updated_at] + params_same_updated
+
+    if priority is None:
+        condition = f"(l.call_priority IS NOT NULL OR (l.call_priority IS NULL AND {after_updated}))"
+        params.extend(params_after_updated)
+    else:
+        # La cota inferior permite recorrer el índice por rango
+        condition = (f"(l.call_priority >= %s AND (l.call_priority > %s "
+                     f"OR (l.call_priority = %s AND {after_updated})))")
+        params.extend([priority, priority, priority] + params_after_updated)
+    return condition, params
+
+
 @api_pearl_calls.route('/status', methods=['GET'])
 def get_call_system_status():
     """
@@ -86,7 +188,7 @@ def start_calling_system():
             }), 400
         
         # Configurar parámetros opcionales
-        max_concurrent = data.get('max_concurrent', 3)
+        max_concurrent = data.get('max_concurrent', manager.max_concurrent_calls)
         selected_leads = data.get('selected_leads')
         override_phone = data.get('override_phone')
         
@@ -294,12 +396,17 @@ def get_leads_for_calling():
         - estado2: Filtrar por status_level_2 (subestado)
         - selected_only: true/false - Solo leads seleccionados
         - origen_archivo: Filtrar por archivo de origen (puede ser múltiple)
-        - limit: Número máximo de resultados (default: 100)
-        - offset: Offset para paginación (default: 0)
+        - limit: Número máximo de resultados (default: 25)
+        - cursor: ``next_cursor`` de la página anterior (paginación por cursor;
+          el coste no depende de la profundidad de la página)
+        - offset: Offset para paginación cuando no hay cursor (default: 0).
+          Con cursor solo se devuelve tal cual, para la numeración de la UI.
+        - count: exact | cached (default) | none - cómo calcular ``total``
     
     Returns:
         JSON: Lista de leads con información relevante
     """
+    conn = None
     try:
         # Obtener parámetros de filtro
         city = request.args.get('city')
@@ -311,6 +418,18 @@ def get_leads_for_calling():
         origen_archivos = request.args.getlist('origen_archivo')  # Múltiples valores
         limit = int(request.args.get('limit', 25))
         offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor') or None
+        count_mode = request.args.get('count', 'cached')
+        if count_mode not in ('exact', 'cached', 'none'):
+            count_mode = 'cached'
+        try:
+            seek = _decode_leads_cursor(page_cursor) if page_cursor else None
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
         # Construir query dinámicamente
         conditions = []
@@ -359,6 +478,14 @@ def get_leads_for_calling():
         
         # Query principal
         where_clause = " AND ".join(conditions)
+        count_params = list(params)
+        
+        # Con cursor se busca directamente la posición en el índice en lugar de saltar filas
+        page_conditions = list(conditions)
+        if seek:
+            seek_condition, seek_params = _leads_seek_condition(*seek)
+            page_conditions.append(seek_condition)
+            params.extend(seek_params)
         
         query = f"""
             SELECT 
@@ -379,25 +506,13 @@ def get_leads_for_calling():
                 pc.last_call_time,
                 pc.calls_with_recording
             FROM leads l
-            LEFT JOIN (
-                SELECT 
-                    lead_id,
-                    COUNT(*) as call_count,
-                    SUM(duration) as total_duration,
-                    MAX(call_time) as last_call_time,
-                    COUNT(CASE WHEN recording_url IS NOT NULL THEN 1 END) as calls_with_recording
-                FROM pearl_calls 
-                GROUP BY lead_id
-            ) pc ON l.id = pc.lead_id
-            WHERE {where_clause}
-            ORDER BY l.call_priority ASC, l.updated_at DESC
+            LEFT JOIN lead_call_stats pc ON l.id = pc.lead_id
+            WHERE {" AND ".join(page_conditions)}
+            ORDER BY l.call_priority ASC, l.updated_at DESC, l.id DESC
             LIMIT %s OFFSET %s
         """
-        params.extend([limit, offset])
-        
-        # Query para contar total
-        count_query = f"SELECT COUNT(*) as total FROM leads l WHERE {where_clause}"
-        count_params = params[:-2]  # Excluir limit y offset
+        # Se pide una fila de más para saber si hay página siguiente sin contar
+        params.extend([limit + 1, 0 if seek else offset])
         
         conn = get_connection()
         # Hacemos un commit para asegurar que leemos el estado más reciente de la BD,
@@ -408,9 +523,11 @@ def get_leads_for_calling():
         # Ejecutar consultas
         cursor.execute(query, params)
         leads = cursor.fetchall()
+        has_more = len(leads) > limit
+        leads = leads[:limit]
+        next_cursor = _encode_leads_cursor(leads[-1]) if has_more and leads else None
         
-        cursor.execute(count_query, count_params)
-        total_count = cursor.fetchone()['total']
+        total_count, total_cached = _count_leads(cursor, where_clause, count_params, count_mode)
         
         # Formatear fechas para JSON
         for lead in leads:
@@ -426,7 +543,9 @@ def get_leads_for_calling():
                 "total": total_count,
                 "limit": limit,
                 "offset": offset,
-                "has_more": offset + limit < total_count
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+                "total_cached": total_cached
             },
             "filters_applied": {
                 "city": city,
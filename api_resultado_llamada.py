@@ -4,8 +4,8 @@ from datetime import datetime
 import logging
 import os
 from dotenv import load_dotenv
-from config import settings
-import mysql.connector
+from db import get_connection
+from lead_lookup import normalize_phone, find_lead_by_phone
 
 # Cargar variables de entorno si existe un archivo .env
 load_dotenv()
@@ -34,37 +34,12 @@ except ImportError:
 # colgarán del prefijo /api que se registra en la app principal.
 resultado_api = Blueprint('resultado_api', __name__)
 
-# Configuración de la base de datos usando settings
-DB_CONFIG = {
-    'host': settings.DB_HOST,
-    'port': settings.DB_PORT,
-    'user': settings.DB_USER,
-    'password': settings.DB_PASSWORD,
-    'database': settings.DB_DATABASE,
-    'ssl_disabled': True,  # Deshabilitar SSL para evitar errores de conexión
-    'autocommit': True,
-    'charset': 'utf8mb4',
-    'use_unicode': True
-}
-
 def get_db_connection():
-    """Establece conexión con la base de datos MySQL"""
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except mysql.connector.Error as err:
-        logger.error(f"Error conectando a MySQL: {err}")
-        # Si falla con SSL, intentar sin SSL
-        if 'SSL' in str(err) or '2026' in str(err):
-            try:
-                logger.info("Intentando conexión sin SSL...")
-                config_no_ssl = DB_CONFIG.copy()
-                config_no_ssl['ssl_disabled'] = True
-                connection = mysql.connector.connect(**config_no_ssl)
-                return connection
-            except mysql.connector.Error as err2:
-                logger.error(f"Error conectando sin SSL: {err2}")
-        return None
+    """Obtiene una conexión del pool compartido de MySQL (ver db.py)."""
+    conn = get_connection()
+    if conn is None:
+        logger.error("Error conectando a MySQL: no hay conexión disponible en el pool")
+    return conn
 
 @resultado_api.route('/api/status', methods=['GET'])
 def status():
@@ -89,14 +64,9 @@ def actualizar_resultado():
         logger.error("Petición rechazada: No se proporcionó número de teléfono.")
         return jsonify({"error": "Se requiere el número de teléfono"}), 400
 
-    import re
     telefono_raw = str(data.get('telefono'))
-    # Eliminar caracteres no numéricos
-    telefono_digits = re.sub(r'\D', '', telefono_raw)
-    # Conservar los 9 dígitos finales (núm. nacional) si sobran
-    if len(telefono_digits) > 9:
-        telefono_digits = telefono_digits[-9:]
-    telefono = telefono_digits
+    # Solo dígitos, conservando los 9 finales (núm. nacional), como telefono_norm
+    telefono = normalize_phone(telefono_raw)
 
     # -------------------------------------------------------------
     # 1. Extracción de parámetros adicionales y reglas de negocio
@@ -536,11 +506,8 @@ def actualizar_resultado():
             cursor_temp.execute("SHOW COLUMNS FROM leads LIKE 'lead_status'")
             has_lead_status = cursor_temp.fetchone() is not None
             
-            if has_lead_status:
-                cursor_temp.execute("SELECT call_attempts_count, lead_status FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 1", (telefono,))
-            else:
-                cursor_temp.execute("SELECT call_attempts_count FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 1", (telefono,))
-            current_lead = cursor_temp.fetchone()
+            lead_columns = "call_attempts_count, lead_status" if has_lead_status else "call_attempts_count"
+            current_lead = find_lead_by_phone(cursor_temp, telefono, columns=lead_columns, include_secondary=False)
             cursor_temp.close()
             
             if current_lead:
@@ -595,7 +562,8 @@ def actualizar_resultado():
 
     # Construir la consulta SQL dinámicamente
     set_clause = ", ".join([f"{key} = %s" for key in update_data.keys()])
-    sql_query = f"UPDATE leads SET {set_clause} WHERE telefono = %s"
+    # telefono_norm es una columna generada e indexada (ver lead_lookup.py)
+    sql_query = f"UPDATE leads SET {set_clause} WHERE telefono_norm = %s"
     
     values = list(update_data.values())
     values.append(telefono)  # teléfono ya normalizado
@@ -605,20 +573,13 @@ def actualizar_resultado():
         cursor.execute(sql_query, tuple(values))
 
         if cursor.rowcount == 0:
-            # Intentar de nuevo comparando solo los dígitos del teléfono completos
-            logger.info("No hubo coincidencia exacta; probando coincidencia por todos los dígitos del número")
-            sql_query_digits = f"UPDATE leads SET {set_clause} WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s"
-            values_digits = list(update_data.values()) + [telefono]
-            cursor.execute(sql_query_digits, tuple(values_digits))
-            if cursor.rowcount == 0:
-                # Puede que los valores enviados ya coincidan y por eso no se actualizó ninguna fila.
-                cursor.execute("SELECT 1 FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 1", (telefono,))
-                if cursor.fetchone():
-                    logger.info(f"Lead {telefono} encontrado pero sin cambios a aplicar.")
-                    return jsonify({"success": True, "message": "Lead encontrado. No había cambios que aplicar."})
-                else:
-                    logger.warning(f"No se encontró ningún lead con el teléfono: {telefono}")
-                    return jsonify({"error": f"No se encontró ningún lead con el teléfono {telefono}"}), 404
+            # Puede que los valores enviados ya coincidan y por eso no se actualizó ninguna fila.
+            if find_lead_by_phone(cursor, telefono, include_secondary=False):
+                logger.info(f"Lead {telefono} encontrado pero sin cambios a aplicar.")
+                return jsonify({"success": True, "message": "Lead encontrado. No había cambios que aplicar."})
+            else:
+                logger.warning(f"No se encontró ningún lead con el teléfono: {telefono}")
+                return jsonify({"error": f"No se encontró ningún lead con el teléfono {telefono}"}), 404
 
         conn.commit()
         logger.info(f"Lead con teléfono {telefono} actualizado correctamente. {cursor.rowcount} fila(s) afectada(s).")
@@ -630,15 +591,12 @@ def actualizar_resultado():
             try:
                 # Obtener los datos del lead actualizado para la notificación
                 cursor_email = conn.cursor()
-                cursor_email.execute("""
-                    SELECT nombre, apellidos, telefono, cita, hora_cita, preferencia_horario, 
-                           nombre_clinica, conPack, status_level_1, status_level_2
-                    FROM leads 
-                    WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s 
-                    LIMIT 1
-                """, (telefono,))
-                
-                lead_data = cursor_email.fetchone()
+                lead_data = find_lead_by_phone(
+                    cursor_email, telefono,
+                    columns="""nombre, apellidos, telefono, cita, hora_cita, preferencia_horario,
+                               nombre_clinica, conPack, status_level_1, status_level_2""",
+                    include_secondary=False
+                )
                 cursor_email.close()
                 
                 if lead_data:
@@ -674,8 +632,7 @@ def actualizar_resultado():
             try:
                 # Obtener el ID del lead actualizado
                 cursor_id = conn.cursor()
-                cursor_id.execute("SELECT id FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 1", (telefono,))
-                lead_result = cursor_id.fetchone()
+                lead_result = find_lead_by_phone(cursor_id, telefono, include_secondary=False)
                 cursor_id.close()
                 
                 if lead_result:
@@ -860,12 +817,8 @@ def verificar_telefono():
         }), 400
 
     # Normalizar teléfono igual que actualizar_resultado
-    import re
     telefono_raw = str(telefono_raw)
-    telefono_digits = re.sub(r'\D', '', telefono_raw)
-    if len(telefono_digits) > 9:
-        telefono_digits = telefono_digits[-9:]
-    telefono = telefono_digits
+    telefono = normalize_phone(telefono_raw)
 
     logger.info(f"Verificando teléfono: {telefono_raw} -> {telefono}")
 
@@ -901,16 +854,16 @@ def verificar_telefono():
             "leads": exact_results2
         }
 
-        # Búsqueda 3: Con REGEXP (como usa actualizar_resultado)
-        cursor.execute("SELECT id, nombre, apellidos, telefono, telefono2, status_level_1, status_level_2 FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 5", (telefono,))
+        # Búsqueda 3: Por teléfono normalizado (como usa actualizar_resultado)
+        cursor.execute("SELECT id, nombre, apellidos, telefono, telefono2, status_level_1, status_level_2 FROM leads WHERE telefono_norm = %s LIMIT 5", (telefono,))
         regexp_results = cursor.fetchall()
         results["busquedas"]["regexp_telefono"] = {
             "encontrados": len(regexp_results),
             "leads": regexp_results
         }
 
-        # Búsqueda 4: Con REGEXP en telefono2
-        cursor.execute("SELECT id, nombre, apellidos, telefono, telefono2, status_level_1, status_level_2 FROM leads WHERE REGEXP_REPLACE(telefono2, '[^0-9]', '') = %s LIMIT 5", (telefono,))
+        # Búsqueda 4: Por teléfono normalizado en telefono2
+        cursor.execute("SELECT id, nombre, apellidos, telefono, telefono2, status_level_1, status_level_2 FROM leads WHERE telefono2_norm = %s LIMIT 5", (telefono,))
         regexp_results2 = cursor.fetchall()
         results["busquedas"]["regexp_telefono2"] = {
             "encontrados": len(regexp_results2),
@@ -992,12 +945,8 @@ def marcar_reserva_automatica():
             }), 400
         
         # Normalizar teléfono (igual que en actualizar_resultado)
-        import re
         telefono_raw = str(telefono_raw)
-        telefono_digits = re.sub(r'\D', '', telefono_raw)
-        if len(telefono_digits) > 9:
-            telefono_digits = telefono_digits[-9:]
-        telefono = telefono_digits
+        telefono = normalize_phone(telefono_raw)
 
         reserva_automatica = data.get('reserva_automatica', True)
         if not isinstance(reserva_automatica, bool):
@@ -1025,14 +974,7 @@ def marcar_reserva_automatica():
             cursor = conn.cursor()
             
             # Buscar el lead por teléfono
-            cursor.execute("""
-                SELECT id, nombre, apellidos 
-                FROM leads 
-                WHERE telefono = %s OR telefono2 = %s
-                LIMIT 1
-            """, (telefono, telefono))
-            
-            lead = cursor.fetchone()
+            lead = find_lead_by_phone(cursor, telefono, columns="id, nombre, apellidos")
             if not lead:
                 return jsonify({
                     "success": False,
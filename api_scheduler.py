@@ -10,7 +10,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List
 
 from db import get_connection
-from call_scheduler import CallScheduler, schedule_failed_call, get_next_scheduled_calls
+from call_scheduler import CallScheduler, schedule_failed_call, schedule_failed_calls, get_next_scheduled_calls
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -117,6 +117,67 @@ def schedule_call_retry():
             "error": str(e)
         }), 500
 
+@api_scheduler.route('/schedule/batch', methods=['POST'])
+def schedule_call_retries():
+    """
+    Programa reintentos para un lote de llamadas fallidas en una sola transacción.
+    
+    Body JSON:
+        {
+            "items": [{"lead_id": 123, "outcome": "no_answer"}, ...]
+        }
+    
+    Returns:
+        JSON: Resultado por lead (scheduled, closed, already_closed, not_found, error)
+    """
+    try:
+        data = request.get_json(silent=True)
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                "success": False,
+                "error": "items debe ser una lista no vacía de {lead_id, outcome}"
+            }), 400
+        
+        valid_outcomes = ['no_answer', 'busy', 'hang_up', 'error', 'invalid_phone']
+        batch = []
+        for item in items:
+            outcome = item.get('outcome') if isinstance(item, dict) else None
+            if outcome not in valid_outcomes:
+                return jsonify({
+                    "success": False,
+                    "error": f"Outcome inválido. Debe ser uno de: {', '.join(valid_outcomes)}"
+                }), 400
+            batch.append((int(item['lead_id']), outcome))
+        
+        results = schedule_failed_calls(batch)
+        summary = {}
+        for result in results.values():
+            summary[result['result']] = summary.get(result['result'], 0) + 1
+        
+        return jsonify({
+            "success": True,
+            "summary": summary,
+            "results": {
+                str(lead_id): dict(result, scheduled_at=result['scheduled_at'].isoformat())
+                if result.get('scheduled_at') else result
+                for lead_id, result in results.items()
+            },
+            "timestamp": datetime.now().isoformat()
+        })
+        
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            "success": False,
+            "error": "Cada item debe tener un lead_id entero válido"
+        }), 400
+    except Exception as e:
+        logger.error(f"Error programando reintentos por lote: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @api_scheduler.route('/pending', methods=['GET'])
 def get_pending_calls():
     """
@@ -3,57 +3,35 @@ from datetime import datetime, timedelta
 import os
 import requests
 from dotenv import load_dotenv
-from pathlib import Path
 import json
-import re
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
-from tuotempo import Tuotempo
+from db import get_connection
+from lead_lookup import normalize_phone, find_lead_by_phone
+from tuotempo import get_tuotempo_client_for_env
+from tuotempo_api import get_tuotempo_http_stats
+from slot_availability_cache import get_slot_cache_stats
+import reservation_idempotency
+from slot_store import find_offered_slot, list_offered_slots, save_offered_slots
 
 # Crear el Blueprint para la API de Tuotempo
 tuotempo_api = Blueprint('tuotempo_api', __name__)
 
 # --- Funciones de Utilidad ---
 def _norm_phone(phone: str) -> str:
-    """Normaliza un número de teléfono eliminando caracteres no numéricos."""
+    """Normaliza un número de teléfono (últimos 9 dígitos, ver lead_lookup)."""
     if not phone:
         return ""
-    phone_digits = re.sub(r'\D', '', str(phone))
-    # Tomar los últimos 9 dígitos para números españoles
-    if len(phone_digits) > 9:
-        phone_digits = phone_digits[-9:]
-    return phone_digits
+    return normalize_phone(phone)
 
 def _get_db_connection():
-    """Obtiene una conexión a la base de datos MySQL."""
-    try:
-        # Configuración de la base de datos (misma que en api_resultado_llamada.py)
-        DB_CONFIG = {
-            'host': os.getenv('MYSQL_HOST', 'localhost'),
-            'port': int(os.getenv('MYSQL_PORT', 3306)),
-            'user': os.getenv('MYSQL_USER', 'root'),
-            'password': os.getenv('MYSQL_PASSWORD', ''),
-            'database': os.getenv('MYSQL_DATABASE', 'tuotempo'),
-            'ssl_disabled': True,
-            'autocommit': True,
-            'charset': 'utf8mb4',
-            'use_unicode': True
-        }
-        
-        # Intentar conexión con SSL deshabilitado
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except mysql.connector.Error as e:
-        current_app.logger.error(f"Error conectando a MySQL: {e}")
-        # Fallback: intentar sin SSL explícitamente
-        try:
-            DB_CONFIG_FALLBACK = DB_CONFIG.copy()
-            DB_CONFIG_FALLBACK.pop('ssl_disabled', None)
-            connection = mysql.connector.connect(**DB_CONFIG_FALLBACK)
-            return connection
-        except mysql.connector.Error as e2:
-            current_app.logger.error(f"Error en fallback de conexión MySQL: {e2}")
-            return None
+    """Obtiene una conexión del pool compartido de MySQL (ver db.py)."""
+    conn = get_connection()
+    if conn is None:
+        current_app.logger.error("Error conectando a MySQL: no hay conexión disponible en el pool")
+    return conn
 
 def _buscar_fecha_nacimiento(telefono):
     """Busca la fecha de nacimiento de un lead en la base de datos por teléfono."""
@@ -69,10 +47,8 @@ def _buscar_fecha_nacimiento(telefono):
         cursor = conn.cursor()
         telefono_norm = _norm_phone(telefono)
         
-        # Buscar por teléfono normalizado
-        query = "SELECT fecha_nacimiento FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s LIMIT 1"
-        cursor.execute(query, (telefono_norm,))
-        result = cursor.fetchone()
+        # Buscar por teléfono normalizado (columna indexada telefono_norm)
+        result = find_lead_by_phone(cursor, telefono_norm, columns="fecha_nacimiento", include_secondary=False)
         
         if result and result[0]:
             fecha_nacimiento = result[0]
@@ -93,18 +69,6 @@ def _buscar_fecha_nacimiento(telefono):
             cursor.close()
             conn.close()
 
-def parse_date(date_string):
-    """Intenta convertir un string de fecha a objeto date, probando varios formatos."""
-    if not isinstance(date_string, str):
-        return None
-    for fmt in ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y'):
-        try:
-            return datetime.strptime(date_string, fmt).date()
-        except (ValueError, TypeError):
-            pass
-    current_app.logger.warning(f"No se pudo procesar la fecha: {date_string} con los formatos conocidos.")
-    return None
-
 def _extract_availabilities(resp: dict) -> list:
     """Devuelve la lista de availabilities sin importar la profundidad."""
     if not isinstance(resp, dict):
@@ -127,13 +91,101 @@ def _normalize_time_str(time_str):
         return f"{parts[0]}:{parts[1]}"
     return None
 
-# --- Configuración de Caché ---
-import tempfile
+# --- Búsqueda de slots por semanas ---
+SLOTS_WEEKS = 4  # semanas consultadas como máximo a partir de fecha_inicio
+SLOTS_FANOUT_ENABLED = os.getenv('SLOTS_FANOUT_ENABLED', 'true').lower() == 'true'
+SLOTS_FANOUT_MAX_WORKERS = int(os.getenv('SLOTS_FANOUT_MAX_WORKERS', 8))  # consultas simultáneas por worker
+
+# Pool compartido por todas las peticiones del worker: limita las llamadas simultáneas a TuoTempo
+_slots_executor = ThreadPoolExecutor(max_workers=SLOTS_FANOUT_MAX_WORKERS, thread_name_prefix='slots-fanout')
+
+
+def _filtrar_periodo(slots, periodo):
+    """Filtra los slots por franja: 'manana' (antes de las 14:00), 'tarde' (desde las 14:00) o todos."""
+    if periodo == 'manana':
+        return [s for s in slots if int(s['startTime'].split(':')[0]) < 14]
+    if periodo == 'tarde':
+        return [s for s in slots if int(s['startTime'].split(':')[0]) >= 14]
+    return list(slots)
+
+
+def _consultar_semana(tuotempo, centro_id, fecha_consulta_str, logger):
+    """Consulta una semana en TuoTempo. Devuelve (respuesta, latencia en ms)."""
+    logger.info(f"Buscando slots para la semana del {fecha_consulta_str}")
+    tuotempo_call_params = {'locations_lid': [centro_id], 'start_date': fecha_consulta_str, 'days': 7}
+    logger.info(f"[TUOTEMPO_TRACE] Calling get_available_slots with params: {json.dumps(tuotempo_call_params)}")
+
+    inicio = time.perf_counter()
+    res = tuotempo.get_available_slots(locations_lid=[centro_id], start_date=fecha_consulta_str, days=7)
+    latencia_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+    logger.info(f"[TUOTEMPO_TRACE] Raw response from get_available_slots: {json.dumps(res, indent=2)}")
+    return res, latencia_ms
+
+
+def _buscar_slots_secuencial(tuotempo, centro_id, semanas, periodo):
+    """Consulta las semanas una a una y se detiene en la primera con slots."""
+    logger = current_app.logger
+    inicio = time.perf_counter()
+    slots_list, slots_return, detalle = [], {}, []
+    for fecha_consulta_str in semanas:
+        res, latencia_ms = _consultar_semana(tuotempo, centro_id, fecha_consulta_str, logger)
+        slots_return = res
+        slots_list = _filtrar_periodo(_extract_availabilities(res), periodo)
+        detalle.append({'fecha_inicio': fecha_consulta_str, 'estado': 'ok',
+                        'latency_ms': latencia_ms, 'slots': len(slots_list)})
+        if slots_list:
+            logger.info(f"Encontrados {len(slots_list)} slots. Terminando búsqueda.")
+            break
+    return slots_list, slots_return, {
+        'modo': 'secuencial',
+        'semana_elegida': detalle[-1]['fecha_inicio'] if slots_list else None,
+        'semanas': detalle,
+        'total_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
 
-# Usar tempfile.gettempdir() que es compatible con Windows y Unix
-SLOTS_CACHE_DIR = Path(tempfile.gettempdir()) / "cached_slots"
-# Asegurar que el directorio existe
-SLOTS_CACHE_DIR.mkdir(exist_ok=True)
+def _buscar_slots_paralelo(tuotempo, centro_id, semanas, periodo):
+    """
+    Lanza todas las semanas a la vez y devuelve la primera (en orden de fecha)
+    con slots en cuanto se conoce: no espera a las semanas posteriores. Las que
+    siguen en curso terminan en segundo plano y quedan en la caché de
+    disponibilidad (ver slot_availability_cache.py).
+    """
+    logger = current_app.logger
+    inicio = time.perf_counter()
+    futuros = [_slots_executor.submit(_consultar_semana, tuotempo, centro_id, fecha, logger) for fecha in semanas]
+    slots_list, slots_return, elegida = [], {}, None
+    detalle = [{'fecha_inicio': fecha, 'estado': 'pendiente'} for fecha in semanas]
+
+    for i, futuro in enumerate(futuros):
+        try:
+            res, latencia_ms = futuro.result()
+        except Exception as e:
+            logger.error(f"Error consultando slots de la semana del {semanas[i]}: {e}")
+            detalle[i].update(estado='error', error=str(e))
+            continue
+        slots_return = res
+        slots_list = _filtrar_periodo(_extract_availabilities(res), periodo)
+        detalle[i].update(estado='ok', latency_ms=latencia_ms, slots=len(slots_list))
+        if slots_list:
+            elegida = semanas[i]
+            logger.info(f"Encontrados {len(slots_list)} slots. Terminando búsqueda.")
+            break
+
+    # Latencias de las semanas posteriores que ya hubieran terminado
+    for i, futuro in enumerate(futuros):
+        if detalle[i]['estado'] == 'pendiente' and futuro.done() and not futuro.exception():
+            res, latencia_ms = futuro.result()
+            detalle[i].update(estado='ok', latency_ms=latencia_ms,
+                              slots=len(_filtrar_periodo(_extract_availabilities(res), periodo)))
+
+    return slots_list, slots_return, {
+        'modo': 'paralelo',
+        'semana_elegida': elegida,
+        'semanas': detalle,
+        'total_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
 
 # --- Endpoints de la API ---
 @tuotempo_api.route('/')
@@ -150,28 +202,19 @@ def status():
     return jsonify({
         'status': 'ok',
         'timestamp': datetime.now().isoformat(),
-        'service': os.getenv('RAILWAY_SERVICE_NAME', 'Unknown')
+        'service': os.getenv('RAILWAY_SERVICE_NAME', 'Unknown'),
+        'slot_cache': get_slot_cache_stats(),
+        'reservation_idempotency': reservation_idempotency.get_idempotency_stats(),
+        'tuotempo_http': get_tuotempo_http_stats()
     })
 
 @tuotempo_api.route('/api/slots', methods=['GET'])
 def obtener_slots():
     env = request.args.get('env', 'PRO').upper()
     
-    # Valores predeterminados si las variables de entorno no están disponibles
-    api_key = os.getenv(f'TUOTEMPO_API_KEY_{env}')
-    api_secret = os.getenv(f'TUOTEMPO_API_SECRET_{env}', 'default_secret')
-    instance_id = os.getenv('TUOTEMPO_INSTANCE_ID', 'tt_portal_adeslas')
-    
-    # Usar valores predeterminados para PRO y PRE si no están en las variables de entorno
-    if not api_key:
-        if env == 'PRO':
-            api_key = "24b98d8d41b970d38362b52bd3505c04"
-        else:  # PRE
-            api_key = "3a5835be0f540c7591c754a2bf0758bb"
-    
-    current_app.logger.info(f"Usando API key: {api_key[:5]}... para entorno {env} con instance_id {instance_id}")
-        
-    tuotempo = Tuotempo(api_key, api_secret, instance_id)
+    tuotempo = get_tuotempo_client_for_env(env)
+    current_app.logger.info(f"Usando API key: {tuotempo.api_key[:5]}... para entorno {env} "
+                            f"con instance_id {tuotempo.instance_id}")
     
     centro_id = request.args.get('centro_id')
     fecha_inicio_str = request.args.get('fecha_inicio')
@@ -186,47 +229,22 @@ def obtener_slots():
     except ValueError:
         return jsonify({'error': 'Formato de fecha_inicio inválido, usar DD-MM-YYYY'}), 400
 
-    slots_list = []
-    slots_return = {}
-    
-    for offset_weeks in range(4):
-        fecha_consulta_dt = fecha_base_dt + timedelta(days=7 * offset_weeks)
-        fecha_consulta_str = fecha_consulta_dt.strftime("%d-%m-%Y")
-        
-        current_app.logger.info(f"Buscando slots para la semana del {fecha_consulta_str}")
-        
-        tuotempo_call_params = {'locations_lid': [centro_id], 'start_date': fecha_consulta_str, 'days': 7}
-        current_app.logger.info(f"[TUOTEMPO_TRACE] Calling get_available_slots with params: {json.dumps(tuotempo_call_params)}")
-        
-        res = tuotempo.get_available_slots(locations_lid=[centro_id], start_date=fecha_consulta_str, days=7)
-        
-        current_app.logger.info(f"[TUOTEMPO_TRACE] Raw response from get_available_slots: {json.dumps(res, indent=2)}")
-        
-        slots_return = res
-        current_slots = _extract_availabilities(res)
-        
-        if current_slots:
-            if periodo == 'manana':
-                slots_list.extend([s for s in current_slots if int(s['startTime'].split(':')[0]) < 14])
-            elif periodo == 'tarde':
-                slots_list.extend([s for s in current_slots if int(s['startTime'].split(':')[0]) >= 14])
-            else:
-                slots_list.extend(current_slots)
-
-        if slots_list:
-            current_app.logger.info(f"Encontrados {len(slots_list)} slots. Terminando búsqueda.")
-            break
+    fanout = request.args.get('fanout', '1' if SLOTS_FANOUT_ENABLED else '0').lower() not in ('0', 'false', 'no')
+    semanas = [(fecha_base_dt + timedelta(days=7 * offset_weeks)).strftime("%d-%m-%Y")
+               for offset_weeks in range(SLOTS_WEEKS)]
+    if fanout:
+        slots_list, slots_return, meta = _buscar_slots_paralelo(tuotempo, centro_id, semanas, periodo)
+    else:
+        slots_list, slots_return, meta = _buscar_slots_secuencial(tuotempo, centro_id, semanas, periodo)
 
     phone_norm = _norm_phone(phone)
-    cache_file = SLOTS_CACHE_DIR / f"slots_{phone_norm}.json"
     try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(slots_return, f, ensure_ascii=False, indent=4)
-        current_app.logger.info(f"Slots guardados en caché para el teléfono {phone_norm} en {cache_file}")
+        guardados = save_offered_slots(phone_norm, slots_return, area_id=centro_id)
+        current_app.logger.info(f"{guardados} slots ofrecidos guardados para el teléfono {phone_norm}")
     except Exception as e:
-        current_app.logger.error(f"No se pudo escribir en el fichero de caché {cache_file}: {e}")
+        current_app.logger.error(f"No se pudieron guardar los slots ofrecidos al teléfono {phone_norm}: {e}")
 
-    return jsonify({'success': True, 'slots': slots_list})
+    return jsonify({'success': True, 'slots': slots_list, 'meta': meta})
 
 
 @tuotempo_api.route('/api/logs/tuotempo', methods=['GET'])
@@ -265,88 +283,31 @@ def get_tuotempo_logs():
 
 @tuotempo_api.route('/api/debug/cache', methods=['GET'])
 def debug_cache():
-    """Endpoint para diagnosticar problemas con el caché de slots."""
+    """Endpoint para diagnosticar los slots ofrecidos a un teléfono (ver slot_store.py)."""
     try:
         phone = request.args.get('phone', '+34629203315')
+        fecha = request.args.get('fecha')
+        hora = request.args.get('hora')
 
         # Normalizar teléfono usando la función estándar
         phone_cache = _norm_phone(phone)
+        ofrecidos = list_offered_slots(phone_cache)
 
         result = {
             "phone_original": phone,
             "phone_normalized": phone_cache,
-            "cache_info": {}
+            "cache_info": {
+                "total_slots": len(ofrecidos),
+                "sample_slots": ofrecidos[:5],
+            },
+            "slot_cache": get_slot_cache_stats()
         }
 
-        # Verificar archivo de caché
-        cache_path = Path("/tmp/cached_slots") / f"slots_{phone_cache}.json"
-        result["cache_file_path"] = str(cache_path)
-        result["cache_file_exists"] = cache_path.exists()
-
-        if cache_path.exists():
-            try:
-                with cache_path.open('r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-
-                # Estadísticas del archivo de caché
-                if 'availabilities' in cached_data:
-                    availabilities = cached_data['availabilities']
-                    result["cache_info"] = {
-                        "total_slots": len(availabilities),
-                        "file_size_bytes": cache_path.stat().st_size,
-                        "last_modified": datetime.fromtimestamp(cache_path.stat().st_mtime).isoformat()
-                    }
-
-                    # Mostrar algunos slots de ejemplo
-                    sample_slots = []
-                    for slot in availabilities[:5]:  # Primeros 5 slots
-                        if isinstance(slot, dict):
-                            sample_slots.append({
-                                "start_date": slot.get('start_date'),
-                                "startTime": slot.get('startTime'),
-                                "endTime": slot.get('endTime'),
-                                "resourceid": slot.get('resourceid'),
-                                "activityid": slot.get('activityid'),
-                                "areaTitle": slot.get('areaTitle')
-                            })
-                    result["cache_info"]["sample_slots"] = sample_slots
-
-                    # Buscar el slot específico que está causando problema
-                    target_date = "10/10/2025"  # Fecha del problema
-                    target_time = "13:30"      # Hora del problema
-
-                    matching_slots = []
-                    for slot in availabilities:
-                        if isinstance(slot, dict):
-                            if (slot.get('start_date') == target_date and
-                                slot.get('startTime') == target_time):
-                                matching_slots.append({
-                                    "start_date": slot.get('start_date'),
-                                    "startTime": slot.get('startTime'),
-                                    "endTime": slot.get('endTime'),
-                                    "resourceid": slot.get('resourceid'),
-                                    "activityid": slot.get('activityid'),
-                                    "areaTitle": slot.get('areaTitle')
-                                })
-
-                    result["cache_info"]["target_slot_found"] = len(matching_slots) > 0
-                    result["cache_info"]["matching_slots"] = matching_slots
-
-                else:
-                    result["cache_info"]["error"] = "No 'availabilities' key in cache file"
-
-            except Exception as e:
-                result["cache_info"]["error"] = f"Error reading cache file: {str(e)}"
-        else:
-            result["cache_info"]["error"] = "Cache file does not exist"
-
-            # Listar archivos en el directorio de caché
-            cache_dir = Path("/tmp/cached_slots")
-            if cache_dir.exists():
-                cache_files = [f.name for f in cache_dir.iterdir() if f.is_file()]
-                result["available_cache_files"] = cache_files
-            else:
-                result["cache_directory_exists"] = False
+        # Buscar un slot concreto (?fecha=...&hora=...) igual que lo hace /api/reservar
+        if fecha and hora:
+            slot = find_offered_slot(phone_cache, fecha, hora)
+            result["cache_info"]["target_slot_found"] = slot is not None
+            result["cache_info"]["matching_slot"] = slot
 
         return jsonify(result)
 
@@ -381,55 +342,11 @@ def reservar():
     idempotency_key = f"{phone_cache}_{start_date}_{start_time}_{resource_id}"
     current_app.logger.info(f"Clave de idempotencia generada: {idempotency_key}")
 
-    # Verificar si ya existe una reserva reciente para esta combinación
-    # (implementación simplificada - en producción usar Redis o BD)
-    import hashlib
-    import time
-    cache_key = hashlib.md5(idempotency_key.encode()).hexdigest()
-    cache_file = Path(f"/tmp/reservation_cache_{cache_key}.json")
-
-    # Verificar caché de reservas recientes (últimos 2 minutos)
-    if cache_file.exists():
-        try:
-            with open(cache_file, 'r') as f:
-                cached_data = json.load(f)
-
-            cache_time = cached_data.get('timestamp', 0)
-            if time.time() - cache_time < 120:  # 2 minutos
-                cached_result = cached_data.get('result')
-                current_app.logger.info(f"Reserva duplicada detectada - devolviendo resultado cacheado: {cached_result.get('result')}")
-
-                # Si la reserva anterior fue exitosa, devolver el mismo resultado
-                if cached_result.get('result') == 'OK':
-                    return jsonify(cached_result), 200
-                elif cached_result.get('result') == 'SLOT_CONFLICT':
-                    return jsonify({
-                        "error": cached_result.get('msg', 'Slot no disponible'),
-                        "error_type": "SLOT_CONFLICT",
-                        "recommended_action": cached_result.get('recommended_action'),
-                        "details": cached_result.get('details', {})
-                    }), 409
-        except Exception as e:
-            current_app.logger.warning(f"Error leyendo caché de idempotencia: {e}")
-            # Continuar con la reserva normal si hay error en caché
-
     env = data.get('env', 'PRO').upper()
 
-    # Valores predeterminados si las variables de entorno no están disponibles
-    api_key = os.getenv(f'TUOTEMPO_API_KEY_{env}')
-    api_secret = os.getenv(f'TUOTEMPO_API_SECRET_{env}', 'default_secret')
-    instance_id = os.getenv('TUOTEMPO_INSTANCE_ID', 'tt_portal_adeslas')
-    
-    # Usar valores predeterminados para PRO y PRE si no están en las variables de entorno
-    if not api_key:
-        if env == 'PRO':
-            api_key = "24b98d8d41b970d38362b52bd3505c04"
-        else:  # PRE
-            api_key = "3a5835be0f540c7591c754a2bf0758bb"
-    
-    current_app.logger.info(f"Usando API key: {api_key[:5]}... para entorno {env} con instance_id {instance_id}")
-
-    tuotempo = Tuotempo(api_key, api_secret, instance_id)
+    tuotempo = get_tuotempo_client_for_env(env)
+    current_app.logger.info(f"Usando API key: {tuotempo.api_key[:5]}... para entorno {env} "
+                            f"con instance_id {tuotempo.instance_id}")
 
     if isinstance(availability, dict):
         # Normalizar claves de disponibilidad a formato esperado por Tuotempo (snakecase minúsculas)
@@ -452,46 +369,16 @@ def reservar():
     critical_keys = {'endTime', 'resourceid', 'activityid'}
     if critical_keys - availability.keys():
         # El teléfono ya está normalizado arriba
-        cache_path = SLOTS_CACHE_DIR / f"slots_{phone_cache}.json"
-        if cache_path.exists():
-            current_app.logger.info(f"Fichero de caché encontrado en: {cache_path}")
-            try:
-                with cache_path.open('r', encoding='utf-8') as f:
-                    cached_response = json.load(f)
-                slots_list = _extract_availabilities(cached_response)
-                
-                availability_completed = False
-                for s in slots_list:
-                    if not isinstance(s, dict): continue
-                    
-                    cached_date = parse_date(s.get('start_date'))
-                    request_date = parse_date(availability.get('start_date'))
-
-                    # Normalizar horas para una comparación robusta (ignorar segundos)
-                    cached_time_norm = _normalize_time_str(s.get('startTime'))
-                    request_time_norm = _normalize_time_str(availability.get('startTime'))
-
-                    # Log detallado para depurar la comparación
-                    current_app.logger.info(f"[CACHE_DEBUG] Comparing cache slot: [date: {s.get('start_date')} -> {cached_date}, time: {cached_time_norm}] with request: [date: {availability.get('start_date')} -> {request_date}, time: {request_time_norm}]")
-                    current_app.logger.info(f"[CACHE_DEBUG] Date match: {cached_date == request_date}, Time match: {cached_time_norm == request_time_norm}")
-
-                    if cached_date and request_date and cached_date == request_date and cached_time_norm and cached_time_norm == request_time_norm:
-                        # Trazas adicionales para verificar IDs
-                        found_resource_id = s.get('resourceid')
-                        found_activity_id = s.get('activityid')
-                        current_app.logger.info(f"Slot coincidente encontrado en caché. resourceId: '{found_resource_id}', activityId: '{found_activity_id}'")
-                        
-                        current_app.logger.info(f"Completando datos desde el slot de caché: {s}")
-                        availability.update(s)
-                        availability_completed = True
-                        current_app.logger.info(f"Availability completada desde cache. Datos actuales: {availability}")
-                        break                 
-                if not availability_completed:
-                    current_app.logger.warning(f"No se encontró un slot coincidente en la caché para {availability.get('start_date')} a las {availability.get('startTime')}")
-            except Exception as e:
-                current_app.logger.error(f"Error al leer o procesar el fichero de caché {cache_path}: {e}")
-        else:
-            current_app.logger.warning(f"Fichero de caché NO encontrado en la ruta: {cache_path}")
+        try:
+            slot = find_offered_slot(phone_cache, availability.get('start_date'), availability.get('startTime'))
+            if slot:
+                current_app.logger.info(f"Slot ofrecido encontrado. resourceId: '{slot.get('resourceid')}', activityId: '{slot.get('activityid')}'")
+                availability.update(slot)
+                current_app.logger.info(f"Availability completada desde los slots ofrecidos. Datos actuales: {availability}")
+            else:
+                current_app.logger.warning(f"No se encontró un slot ofrecido para {availability.get('start_date')} a las {availability.get('startTime')}")
+        except Exception as e:
+            current_app.logger.error(f"Error al buscar el slot ofrecido para el teléfono {phone_cache}: {e}")
 
     missing_fields = [k for k in critical_keys if k not in availability or not availability[k]]
     if missing_fields:
@@ -504,12 +391,8 @@ def reservar():
                 # Usar teléfono ya normalizado
                 phone_for_slots = phone_cache
 
-                # Obtener slots para esa fecha
-                tuotempo_instance = Tuotempo(
-                    os.getenv('TUOTEMPO_API_KEY'),
-                    os.getenv('TUOTEMPO_SECRET_KEY'),
-                    os.getenv('TUOTEMPO_INSTANCE_ID')
-                )
+                # Obtener slots para esa fecha (con el cliente compartido de este entorno)
+                tuotempo_instance = tuotempo
 
                 # Formato de fecha esperado por get_available_slots
                 date_parts = availability.get('start_date', '').split('-')
@@ -580,27 +463,32 @@ def reservar():
         'activityid': availability.get('activityid')
     }
 
+    # Reclamar la clave de idempotencia: si otra petición está reservando el mismo slot
+    # se espera a su resultado en lugar de reservar dos veces (ver reservation_idempotency.py)
+    claim = reservation_idempotency.claim(idempotency_key)
+    if claim.state == reservation_idempotency.IN_PROGRESS:
+        return jsonify({
+            "error": "Ya hay una reserva en curso para este slot",
+            "error_type": "RESERVATION_IN_PROGRESS",
+            "recommended_action": "Reintentar en unos segundos"
+        }), 409
+    token = claim.token
+
     try:
-        tuotempo_call_params = {'user_info': user_info_norm, 'availability': availability_norm}
-        current_app.logger.info(f"[TUOTEMPO_TRACE] Calling create_reservation with params: {json.dumps(tuotempo_call_params)}")
+        if claim.state == reservation_idempotency.REPLAY:
+            res = claim.result
+            current_app.logger.info(f"Reserva duplicada detectada - devolviendo resultado guardado: {res.get('result')}")
+        else:
+            tuotempo_call_params = {'user_info': user_info_norm, 'availability': availability_norm}
+            current_app.logger.info(f"[TUOTEMPO_TRACE] Calling create_reservation with params: {json.dumps(tuotempo_call_params)}")
 
-        res = tuotempo.create_reservation(user_info=user_info_norm, availability=availability_norm)
+            res = tuotempo.create_reservation(user_info=user_info_norm, availability=availability_norm)
 
-        current_app.logger.info(f"[TUOTEMPO_TRACE] Raw response from create_reservation: {json.dumps(res)}")
+            current_app.logger.info(f"[TUOTEMPO_TRACE] Raw response from create_reservation: {json.dumps(res)}")
 
-        # Guardar resultado en caché para idempotencia
-        try:
-            import time
-            cache_data = {
-                'timestamp': time.time(),
-                'idempotency_key': idempotency_key,
-                'result': res
-            }
-            with open(cache_file, 'w') as f:
-                json.dump(cache_data, f)
-            current_app.logger.info(f"Resultado guardado en caché para clave: {idempotency_key}")
-        except Exception as e:
-            current_app.logger.warning(f"Error guardando caché de idempotencia: {e}")
+            # Guardar el resultado para los duplicados (o liberar la clave si no es repetible)
+            reservation_idempotency.complete(idempotency_key, token, res)
+            token = None
 
         if res.get('result') == 'OK':
             return jsonify(res), 200
@@ -630,6 +518,7 @@ def reservar():
                 "details": res
             }), 502
     except Exception as e:
+        reservation_idempotency.release(idempotency_key, token)
         current_app.logger.exception("Excepción al llamar a Tuotempo para crear la reserva")
         return jsonify({"error": "Ocurrió un error interno en el servidor"}), 500
 
@@ -40,6 +40,14 @@ def create_app(config_class='config.settings'):
         from blueprints import register_apis
         register_apis(app)
 
+    # 4.2. Arrancar los workers de trabajos en segundo plano (cargas, exportaciones)
+    from background_jobs import start_job_runner
+    start_job_runner()
+
+    # 4.3. Limpieza periódica de las claves de idempotencia de /api/reservar
+    from reservation_idempotency import start_idempotency_purger
+    start_idempotency_purger()
+
     # 5. Definir un comando CLI para crear un usuario (opcional pero útil)
     @app.cli.command("create-user")
     def create_user():
@@ -1,5 +1,5 @@
 from flask import Flask, request, jsonify
-from tuotempo_api import TuoTempoAPI
+from tuotempo_api import TuoTempoAPI, registration_ids
 from datetime import datetime
 import os
 
@@ -87,6 +87,7 @@ def confirm_appointment():
     )
     
     # Registrar usuario primero si se proporcionan datos
+    member_id = data.get('member_id')
     if all(k in data for k in ['fname', 'lname', 'birthday', 'phone']):
         user_response = api.register_non_insured_user(
             fname=data['fname'],
@@ -97,11 +98,16 @@ def confirm_appointment():
         
         if user_response.get("result") != "OK":
             return jsonify({"error": "Failed to register user", "details": user_response}), 400
+        member_id, _ = registration_ids(user_response)
+    
+    if not member_id:
+        return jsonify({"error": "Missing member_id or user registration fields"}), 400
     
     # Confirmar cita
     appointment_response = api.confirm_appointment(
         availability=data['availability'],
-        communication_phone=data['communication_phone']
+        communication_phone=data['communication_phone'],
+        member_id=member_id
     )
     
     return jsonify(appointment_response)
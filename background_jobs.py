@@ -0,0 +1,372 @@
+"""
+Cola de trabajos en segundo plano respaldada por MySQL (tabla ``background_jobs``).
+
+Las operaciones largas del dashboard (cargas de ficheros, exportaciones,
+mantenimiento del agregado de leads) se encolan con ``enqueue_job`` y las
+ejecuta un ``JobRunner`` con ``BACKGROUND_JOB_WORKERS`` hilos, fuera de la
+petición web y de su timeout. Cada worker de gunicorn arranca su runner; un
+trabajo lo reclama un único hilo con ``SELECT ... FOR UPDATE SKIP LOCKED``.
+
+- Estados: ``queued`` -> ``running`` -> ``completed`` / ``failed`` /
+  ``cancelled``.
+- El handler recibe un ``JobContext``: ``progress(...)`` publica el progreso
+  (columna ``progress``) y ``check_cancelled()`` corta el trabajo si se ha
+  pedido su cancelación con ``request_cancel``.
+- Los tipos registrados con ``host_bound=True`` (p. ej. cargas de un fichero
+  subido al disco local) se encolan con ``host`` = máquina que los encola y
+  sólo los reclama un runner de esa máquina. Si esa máquina no vuelve, el
+  trabajo se queda en cola hasta que se cancele.
+- Los runners marcan sus trabajos en curso cada ``HEARTBEAT_SECONDS``; un
+  trabajo ``running`` sin latido durante ``STALE_AFTER_SECONDS`` (el proceso
+  murió o se reinició) se da por fallido.
+
+Los tipos de trabajo se registran con ``register_job_type`` (ver
+``dashboard_jobs``).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from db import connection as db_connection
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOBS_ENABLED = os.getenv('BACKGROUND_JOBS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+BACKGROUND_JOB_WORKERS = int(os.getenv('BACKGROUND_JOB_WORKERS', 2))
+POLL_SECONDS = float(os.getenv('BACKGROUND_JOBS_POLL_SECONDS', 5))
+HEARTBEAT_SECONDS = 15
+STALE_AFTER_SECONDS = int(os.getenv('BACKGROUND_JOBS_STALE_SECONDS', 120))
+# Intervalo mínimo entre escrituras de progreso de un mismo trabajo
+PROGRESS_MIN_INTERVAL = 1.0
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_handlers: Dict[str, Callable[[Dict[str, Any], 'JobContext'], Optional[Dict[str, Any]]]] = {}
+_host_bound_types = set()
+_runner: Optional['JobRunner'] = None
+_runner_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Lanzada por ``JobContext.check_cancelled`` cuando se ha pedido cancelar el trabajo."""
+
+
+def register_job_type(job_type: str, handler: Callable[[Dict[str, Any], 'JobContext'], Optional[Dict[str, Any]]],
+                      host_bound: bool = False):
+    """
+    Registra el handler de un tipo de trabajo: ``handler(params, ctx) -> result``.
+    Con ``host_bound`` sus trabajos sólo los ejecuta la máquina que los encoló.
+    """
+    _handlers[job_type] = handler
+    if host_bound:
+        _host_bound_types.add(job_type)
+    else:
+        _host_bound_types.discard(job_type)
+
+
+def _to_json(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, ensure_ascii=False,
+                      default=lambda v: v.isoformat() if isinstance(v, (date, datetime)) else str(v))
+
+
+def _from_json(value: Any) -> Any:
+    if value is None or isinstance(value, (dict, list)):
+        return value
+    return json.loads(value)
+
+
+def _job_dict(row: Dict[str, Any]) -> Dict[str, Any]:
+    job = dict(row)
+    for key in ('params', 'progress', 'result'):
+        job[key] = _from_json(job.get(key))
+    job['cancel_requested'] = bool(job.get('cancel_requested'))
+    for key in ('created_at', 'started_at', 'finished_at', 'heartbeat_at'):
+        if isinstance(job.get(key), datetime):
+            job[key] = job[key].isoformat(timespec='seconds')
+    return job
+
+
+def enqueue_job(job_type: str, params: Optional[Dict[str, Any]] = None,
+                usuario_id: Optional[int] = None) -> int:
+    """Encola un trabajo y devuelve su id."""
+    if job_type not in _handlers:
+        raise ValueError(f"Tipo de trabajo desconocido: {job_type}")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO background_jobs (job_type, params, usuario_id, host) VALUES (%s, %s, %s, %s)",
+            (job_type, _to_json(params or {}), usuario_id,
+             socket.gethostname() if job_type in _host_bound_types else None)
+        )
+        job_id = cursor.lastrowid
+        conn.commit()
+        cursor.close()
+    logger.info(f"[JOBS] Trabajo #{job_id} ({job_type}) encolado")
+    if _runner:
+        _runner.wake()
+    return job_id
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    """Estado de un trabajo (o ``None`` si no existe)."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM background_jobs WHERE id = %s", (job_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    return _job_dict(row) if row else None
+
+
+def list_jobs(limit: int = 20, job_types: Optional[List[str]] = None,
+              active_only: bool = False) -> List[Dict[str, Any]]:
+    """Últimos trabajos (más recientes primero)."""
+    conditions, params = ["1=1"], []
+    if job_types:
+        conditions.append(f"job_type IN ({', '.join(['%s'] * len(job_types))})")
+        params.extend(job_types)
+    if active_only:
+        conditions.append(f"status IN ({', '.join(['%s'] * len(ACTIVE_STATUSES))})")
+        params.extend(ACTIVE_STATUSES)
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT * FROM background_jobs WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT %s",
+            params + [limit]
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    return [_job_dict(row) for row in rows]
+
+
+def request_cancel(job_id: int) -> bool:
+    """
+    Cancela un trabajo: si está en cola no llega a ejecutarse; si está en
+    curso, el handler se detiene en su siguiente ``check_cancelled``.
+    Devuelve False si el trabajo ya había terminado (o no existe).
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE background_jobs
+            SET status = 'cancelled', cancel_requested = TRUE, finished_at = NOW()
+            WHERE id = %s AND status = 'queued'
+        """, (job_id,))
+        cancelled = cursor.rowcount
+        if not cancelled:
+            cursor.execute("""
+                UPDATE background_jobs SET cancel_requested = TRUE
+                WHERE id = %s AND status = 'running'
+            """, (job_id,))
+            cancelled = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    if cancelled:
+        logger.info(f"[JOBS] Cancelación solicitada para el trabajo #{job_id}")
+    return bool(cancelled)
+
+
+class JobContext:
+    """Lo que ve un handler de su trabajo: progreso y cancelación."""
+
+    def __init__(self, job_id: int, job_type: str, usuario_id: Optional[int]):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.usuario_id = usuario_id
+        self._cancel_requested = False
+        self._last_write = 0.0
+
+    def progress(self, force: bool = False, **values):
+        """Publica el progreso (como mucho una escritura por segundo salvo ``force``)."""
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_MIN_INTERVAL:
+            return
+        self._last_write = now
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE background_jobs SET progress = %s, heartbeat_at = NOW() WHERE id = %s",
+                    (_to_json(values), self.job_id)
+                )
+                cursor.execute("SELECT cancel_requested FROM background_jobs WHERE id = %s", (self.job_id,))
+                row = cursor.fetchone()
+                self._cancel_requested = bool(row and row[0])
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            logger.warning(f"[JOBS] No se pudo publicar el progreso del trabajo #{self.job_id}: {e}")
+
+    @property
+    def cancel_requested(self) -> bool:
+        """Si se ha pedido cancelar (según la última lectura hecha en ``progress``)."""
+        return self._cancel_requested
+
+    def check_cancelled(self):
+        """Lanza ``JobCancelled`` si se ha pedido cancelar el trabajo."""
+        if self._cancel_requested:
+            raise JobCancelled()
+
+
+class JobRunner:
+    """Hilos que reclaman y ejecutan trabajos de ``background_jobs``."""
+
+    def __init__(self, workers: int = BACKGROUND_JOB_WORKERS, poll_seconds: float = POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.host = socket.gethostname()
+        self.name = f"{self.host}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running: Dict[int, str] = {}
+        self._running_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"JobWorker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="JobHeartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"[JOBS] Runner {self.name} iniciado con {self.workers} workers")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Despierta a los workers (hay un trabajo nuevo en cola)."""
+        self._wake.set()
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        with db_connection() as conn:
+            try:
+                conn.start_transaction()
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("""
+                    SELECT id, job_type, params, usuario_id FROM background_jobs
+                    WHERE status = 'queued' AND (host IS NULL OR host = %s)
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """, (self.host,))
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute("""
+                        UPDATE background_jobs
+                        SET status = 'running', worker = %s, started_at = NOW(), heartbeat_at = NOW()
+                        WHERE id = %s
+                    """, (self.name, row['id']))
+                conn.commit()
+                cursor.close()
+                return row
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _finish(self, job_id: int, status: str, result: Any = None, error: Optional[str] = None):
+        """Cierra un trabajo propio en curso (no pisa uno ya dado por fallido por falta de latido)."""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE background_jobs
+                SET status = %s, result = %s, error = %s, finished_at = NOW(), heartbeat_at = NOW()
+                WHERE id = %s AND status = 'running' AND worker = %s
+            """, (status, _to_json(result), error, job_id, self.name))
+            finished = cursor.rowcount
+            conn.commit()
+            cursor.close()
+        if not finished:
+            logger.warning(f"[JOBS] El trabajo #{job_id} ya no estaba en curso en {self.name}; "
+                           f"se descarta su resultado ({status})")
+
+    def _run_job(self, row: Dict[str, Any]):
+        job_id, job_type = row['id'], row['job_type']
+        handler = _handlers.get(job_type)
+        if handler is None:
+            self._finish(job_id, 'failed', error=f"Tipo de trabajo desconocido: {job_type}")
+            return
+        ctx = JobContext(job_id, job_type, row.get('usuario_id'))
+        with self._running_lock:
+            self._running[job_id] = job_type
+        started = time.monotonic()
+        logger.info(f"[JOBS] Ejecutando trabajo #{job_id} ({job_type})")
+        try:
+            result = handler(_from_json(row['params']) or {}, ctx)
+            self._finish(job_id, 'completed', result=result)
+            logger.info(f"[JOBS] Trabajo #{job_id} completado en {time.monotonic() - started:.1f}s")
+        except JobCancelled:
+            self._finish(job_id, 'cancelled', error="Cancelado por el usuario")
+            logger.info(f"[JOBS] Trabajo #{job_id} cancelado")
+        except Exception as e:
+            logger.error(f"[JOBS] Trabajo #{job_id} ({job_type}) fallido: {e}", exc_info=True)
+            self._finish(job_id, 'failed', error=str(e))
+        finally:
+            with self._running_lock:
+                self._running.pop(job_id, None)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except Exception as e:
+                logger.error(f"[JOBS] Error reclamando trabajos: {e}")
+                row = None
+            if row:
+                self._run_job(row)
+                continue
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _heartbeat(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._running_lock:
+                job_ids = list(self._running)
+            try:
+                with db_connection() as conn:
+                    cursor = conn.cursor()
+                    if job_ids:
+                        cursor.execute(
+                            f"UPDATE background_jobs SET heartbeat_at = NOW() "
+                            f"WHERE id IN ({', '.join(['%s'] * len(job_ids))})", job_ids
+                        )
+                    cursor.execute("""
+                        UPDATE background_jobs
+                        SET status = 'failed', finished_at = NOW(),
+                            error = 'Interrumpido: el proceso que lo ejecutaba dejó de responder'
+                        WHERE status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND
+                    """, (STALE_AFTER_SECONDS,))
+                    if cursor.rowcount:
+                        logger.warning(f"[JOBS] {cursor.rowcount} trabajos interrumpidos marcados como fallidos")
+                    conn.commit()
+                    cursor.close()
+            except Exception as e:
+                logger.error(f"[JOBS] Error en el latido de trabajos: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._running_lock:
+            running = dict(self._running)
+        return {'runner': self.name, 'workers': self.workers, 'running': running}
+
+
+def start_job_runner() -> Optional[JobRunner]:
+    """Arranca (una vez por proceso) el runner de trabajos con los handlers del dashboard."""
+    global _runner
+    if not BACKGROUND_JOBS_ENABLED:
+        logger.info("[JOBS] Trabajos en segundo plano desactivados (BACKGROUND_JOBS_ENABLED)")
+        return None
+    with _runner_lock:
+        if _runner is None:
+            import dashboard_jobs  # noqa: F401  (registra los tipos de trabajo)
+            _runner = JobRunner()
+            _runner.start()
+    return _runner
@@ -9,8 +9,12 @@ import logging
 import secrets
 import string
 
-from db import get_connection
-from utils import load_excel_data, exportar_datos_completos, send_password_reset_email, verify_reset_token
+from db import get_connection, get_pool_stats
+from lead_search import search_leads as search_lead_index
+from dashboard_stats import invalidate_dashboard_stats
+from utils import send_password_reset_email, verify_reset_token
+from background_jobs import enqueue_job, get_job, list_jobs, request_cancel
+from dashboard_jobs import MAINTENANCE_JOB_TYPES
 from flask import send_file
 
 # Configurar logger para este blueprint
@@ -67,6 +71,17 @@ def login():
 def health():
     return 'OK', 200
 
+@bp.route('/health/db')
+def health_db():
+    """Métricas del pool de conexiones MySQL del worker actual."""
+    return jsonify(get_pool_stats()), 200
+
+@bp.route('/health/pearl')
+def health_pearl():
+    """Contadores y latencias por endpoint del cliente HTTP de Pearl AI del worker actual."""
+    from pearl_caller import get_pearl_metrics
+    return jsonify(get_pearl_metrics()), 200
+
 @bp.route('/logout')
 def logout():
     session.clear()
@@ -88,9 +103,14 @@ def index():
     response = make_response(render_template('dashboard.html', stats=stats))
     
     # Añadir headers anti-cache para evitar datos desactualizados
+    # (la caché de estadísticas es del servidor y se invalida cuando cambian los leads)
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
+    cache_info = stats.get('cache') or {}
+    response.headers['X-Stats-Cache'] = 'hit' if cache_info.get('hit') else 'miss'
+    if cache_info.get('age_seconds') is not None:
+        response.headers['X-Stats-Age'] = str(cache_info['age_seconds'])
     
     return response
 
@@ -202,105 +222,40 @@ def recargar_datos():
 
 
 def ejecutar_recarga(archivo_path, origen_archivo_personalizado=None):
-    try:
-        connection = get_connection()
-        if not connection:
-            flash("No se pudo conectar a la base de datos.", "danger")
-            return redirect(url_for('main.recargar_datos'))
-
-        # Contar registros existentes antes de la carga
-        cursor = connection.cursor()
-        try:
-            cursor.execute("SELECT COUNT(*) FROM leads")
-            registros_previos = cursor.fetchone()[0]
-            logger.info(f"Registros existentes en leads: {registros_previos}")
-            logger.info(f"Añadiendo nuevos datos desde: {os.path.basename(archivo_path)} (modo aditivo)")
-        finally:
-            cursor.close()
-
-        # Determinar el nombre del archivo origen
-        if origen_archivo_personalizado:
-            nombre_archivo_origen = origen_archivo_personalizado.upper()
-        else:
-            # Extraer nombre del archivo sin extensión para usar como origen
-            nombre_archivo_origen = os.path.splitext(os.path.basename(archivo_path))[0].upper()
-        
-        logger.info(f"Usando archivo origen: {nombre_archivo_origen}")
-        resultado_carga = load_excel_data(connection, archivo_path, origen_archivo=nombre_archivo_origen)
-        connection.commit() # Forzar el commit para que los datos sean visibles inmediatamente
-        
-        registros = resultado_carga.get('insertados', 0)
-        errores = resultado_carga.get('errores', 0)
-        
-        # Contar registros totales después de la carga
-        cursor = connection.cursor()
-        try:
-            cursor.execute("SELECT COUNT(*) FROM leads")
-            registros_totales = cursor.fetchone()[0]
-            logger.info(f"Total de registros después de la carga: {registros_totales}")
-        finally:
-            cursor.close()
-        
-        mensaje = f"Carga completada (modo aditivo). Insertados: {registros}. Errores: {errores}. Total en BD: {registros_totales}."
-
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "INSERT INTO recargas (usuario_id, archivo, registros_importados, resultado, mensaje) VALUES (%s, %s, %s, %s, %s)",
-                (session['user_id'], os.path.basename(archivo_path), registros, 'ok', mensaje)
-            )
-        connection.commit()
-        flash(mensaje, 'success')
+    """Encola la carga del archivo (la ejecuta un worker de background_jobs)."""
+    # Determinar el nombre del archivo origen
+    if origen_archivo_personalizado:
+        nombre_archivo_origen = origen_archivo_personalizado.upper()
+    else:
+        # Extraer nombre del archivo sin extensión para usar como origen
+        nombre_archivo_origen = os.path.splitext(os.path.basename(archivo_path))[0].upper()
 
+    try:
+        job_id = enqueue_job('importar_leads', {
+            'archivo_path': archivo_path,
+            'origen_archivo': nombre_archivo_origen,
+        }, usuario_id=session['user_id'])
+        logger.info(f"Carga de {os.path.basename(archivo_path)} encolada como trabajo #{job_id} "
+                    f"(archivo origen: {nombre_archivo_origen})")
+        flash(f"Carga de {os.path.basename(archivo_path)} en curso (trabajo #{job_id}). "
+              f"Puedes seguir su progreso en esta página.", 'info')
     except Exception as e:
-        error_message = f"Error crítico durante la recarga: {str(e)}"
-        logger.error(error_message, exc_info=True)
-        try:
-            conn_err = get_connection()
-            if conn_err:
-                with conn_err.cursor() as cursor:
-                    cursor.execute(
-                        "INSERT INTO recargas (usuario_id, archivo, registros_importados, resultado, mensaje) VALUES (%s, %s, %s, %s, %s)",
-                        (session.get('user_id', -1), os.path.basename(archivo_path), 0, 'error', error_message)
-                    )
-                conn_err.commit()
-                conn_err.close()
-        except Exception as e2:
-            logger.error(f"No se pudo registrar el error en el historial: {e2}")
-        flash(f'Error en la recarga: {error_message}', 'danger')
-    finally:
-        if 'connection' in locals() and connection and connection.is_connected():
-            connection.close()
-    
+        logger.error(f"Error encolando la recarga: {e}", exc_info=True)
+        flash(f'Error en la recarga: {e}', 'danger')
+
     return redirect(url_for('main.recargar_datos'))
 
 @bp.route('/exportar-datos-completos')
 @login_required
 def exportar_datos_completos_endpoint():
-    """Endpoint para descargar el archivo Excel con leads y llamadas."""
+    """Encola la exportación de leads y llamadas a Excel; se descarga desde /api/jobs/<id>/download."""
     try:
-        connection = get_connection()
-        success, result = exportar_datos_completos(connection)
-        if success:
-            filepath = result
-            filename = os.path.basename(filepath)
-            # Registrar la acción de exportación en el historial
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "INSERT INTO recargas (usuario_id, archivo, registros_importados, resultado, mensaje) VALUES (%s, %s, %s, %s, %s)",
-                    (session['user_id'], filename, 0, 'export', f'Exportado a {filename}')
-                )
-            connection.commit()
-            # Enviar el archivo directamente al navegador
-            return send_file(filepath, as_attachment=True, download_name=filename)
-        else:
-            flash(f'Error al exportar los datos: {result}', 'danger')
+        job_id = enqueue_job('exportar_datos', usuario_id=session['user_id'])
+        flash(f"Exportación en curso (trabajo #{job_id}). El enlace de descarga aparecerá en esta página.", 'info')
     except Exception as e:
         logger.error(f"Error en el endpoint de exportación: {e}", exc_info=True)
         flash(f'Ocurrió un error inesperado durante la exportación: {e}', 'danger')
-    finally:
-        if 'connection' in locals() and connection and connection.is_connected():
-            connection.close()
-            
+
     return redirect(url_for('main.recargar_datos'))
 
 @bp.route('/eliminar-archivo-origen', methods=['POST'])
@@ -347,6 +302,7 @@ def eliminar_archivo_origen():
         """, (archivo_origen,))
         
         connection.commit()
+        invalidate_dashboard_stats()
         
         # Registrar en el historial
         mensaje = f"Eliminados {eliminados} leads del archivo '{archivo_origen}'"
@@ -398,13 +354,6 @@ def leads():
         # Base query
         query = "SELECT * FROM leads"
         
-        # Filtro de búsqueda (teléfono, nombre, o clínica)
-        if search:
-            conditions.append("(telefono LIKE %s OR telefono2 LIKE %s OR nombre LIKE %s OR apellidos LIKE %s OR nombre_clinica LIKE %s)")
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param, search_param, search_param])
-            print(f"DEBUG - Added search condition for: {search}")
-        
         # Filtro por estado
         if estado:
             conditions.append("status_level_1 = %s")
@@ -449,18 +398,23 @@ def leads():
                 conditions.append("(conPack = 0 OR conPack IS NULL)")
             print(f"DEBUG - Added conPack condition for: {con_pack}")
         
-        # Agregar condiciones WHERE si existen
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        # Ordenar y limitar
-        query += " ORDER BY updated_at DESC, nombre_clinica LIMIT 100"
-        
-        print(f"DEBUG - Final query: {query}")
-        print(f"DEBUG - Params: {params}")
-        
-        cursor.execute(query, params)
-        leads_data = cursor.fetchall()
+        if search:
+            # Búsqueda (teléfono, nombre, o clínica) por índices, ordenada por relevancia
+            leads_data = search_lead_index(cursor, search, limit=100, conditions=conditions, params=params)
+            logger.debug(f"Búsqueda de leads: {search!r} ({len(leads_data)} resultados)")
+        else:
+            # Agregar condiciones WHERE si existen
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            
+            # Ordenar y limitar
+            query += " ORDER BY updated_at DESC, nombre_clinica LIMIT 100"
+            
+            print(f"DEBUG - Final query: {query}")
+            print(f"DEBUG - Params: {params}")
+            
+            cursor.execute(query, params)
+            leads_data = cursor.fetchall()
         
         print(f"DEBUG - Results found: {len(leads_data)}")
         if leads_data:
@@ -721,6 +675,10 @@ def railway_verification():
     """Página de verificación de servicios en Railway."""
     return render_template('railway_verification.html')
 
+SEARCH_LEADS_COLUMNS = ('id', 'nombre', 'apellidos', 'telefono', 'telefono2', 'email', 'ciudad',
+                        'status_level_1', 'status_level_2', 'call_status', 'call_priority',
+                        'last_call_attempt', 'call_attempts_count', 'manual_management', 'updated_at')
+
 @bp.route('/api/search-leads', methods=['GET'])
 @login_required
 def search_leads():
@@ -735,27 +693,8 @@ def search_leads():
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Buscar por teléfono (telefono o telefono2), nombre, apellidos o ID
-        query = """
-            SELECT id, nombre, apellidos, telefono, telefono2, email, ciudad,
-                   status_level_1, status_level_2, call_status, call_priority,
-                   last_call_attempt, call_attempts_count, manual_management, updated_at
-            FROM leads 
-            WHERE (telefono LIKE %s OR telefono2 LIKE %s 
-                   OR nombre LIKE %s OR apellidos LIKE %s OR id = %s)
-            ORDER BY updated_at DESC
-            LIMIT %s
-        """
-        
-        search_pattern = f'%{search_term}%'
-        # Intentar convertir a ID numérico, usar 0 si no es un número
-        try:
-            search_id = int(search_term)
-        except ValueError:
-            search_id = 0
-            
-        cursor.execute(query, (search_pattern, search_pattern, search_pattern, search_pattern, search_id, limit))
-        leads = cursor.fetchall()
+        # Buscar por teléfono (telefono o telefono2), nombre, apellidos, clínica o ID
+        leads = search_lead_index(cursor, search_term, columns=SEARCH_LEADS_COLUMNS, limit=limit)
         
         # Formatear fechas para JSON
         for lead in leads:
@@ -778,6 +717,65 @@ def search_leads():
             cursor.close()
             conn.close()
 
+# --- TRABAJOS EN SEGUNDO PLANO (ver background_jobs.py) ---
+
+@bp.route('/api/jobs', methods=['GET'])
+@login_required
+def api_jobs():
+    """Últimos trabajos en segundo plano (?tipo=...&activos=1&limit=N)."""
+    limit = min(int(request.args.get('limit', 20)), 100)
+    job_types = request.args.getlist('tipo') or None
+    active_only = request.args.get('activos') in ('1', 'true')
+    try:
+        return jsonify({'jobs': list_jobs(limit=limit, job_types=job_types, active_only=active_only)})
+    except Exception as e:
+        logger.error(f"Error listando trabajos: {e}")
+        return jsonify({'error': 'Error listando trabajos', 'jobs': []}), 500
+
+@bp.route('/api/jobs', methods=['POST'])
+@admin_required
+def api_jobs_create():
+    """Encola un trabajo de mantenimiento: {"tipo": ..., "params": {...}}."""
+    data = request.get_json(silent=True) or {}
+    job_type = data.get('tipo')
+    if job_type not in MAINTENANCE_JOB_TYPES:
+        return jsonify({'error': f"Tipo de trabajo no permitido. Opciones: {', '.join(MAINTENANCE_JOB_TYPES)}"}), 400
+    job_id = enqueue_job(job_type, data.get('params') or {}, usuario_id=session['user_id'])
+    return jsonify({'job_id': job_id, 'job': get_job(job_id)}), 202
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def api_job_status(job_id):
+    """Estado y progreso de un trabajo."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job)
+
+@bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def api_job_cancel(job_id):
+    """Pide la cancelación de un trabajo en cola o en curso."""
+    if not request_cancel(job_id):
+        return jsonify({'error': 'El trabajo no existe o ya ha terminado'}), 409
+    return jsonify({'job': get_job(job_id)}), 202
+
+@bp.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+@login_required
+def api_job_download(job_id):
+    """
+    Descarga el fichero generado por un trabajo de exportación terminado.
+    El fichero está en el disco de la réplica que ejecutó el trabajo
+    (``job['worker']``); en otra réplica sin ``data/`` compartido da 404.
+    """
+    job = get_job(job_id)
+    if not job or job['job_type'] != 'exportar_datos' or job['status'] != 'completed':
+        abort(404)
+    filepath = (job.get('result') or {}).get('ruta')
+    if not filepath or not os.path.isfile(filepath):
+        abort(404)
+    return send_file(filepath, as_attachment=True, download_name=os.path.basename(filepath))
+
 # --- REGISTRO DE APIS ---
 
 # Esta función ha sido combinada con la función register_apis anterior
@@ -788,8 +786,8 @@ def search_leads():
 def get_statistics():
     return {'total_leads': 0, 'active_calls': 0, 'completed_calls': 0}
 
-# Las funciones load_excel_data, exportar_datos_completos, send_password_reset_email y verify_reset_token
-# se importan ahora desde utils.py
+# Las funciones send_password_reset_email y verify_reset_token se importan ahora desde utils.py;
+# las cargas y exportaciones se ejecutan como trabajos en segundo plano (dashboard_jobs.py)
 
 @bp.route('/debug_utiles_positivos')
 def debug_utiles_positivos():
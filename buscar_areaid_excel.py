@@ -15,60 +15,19 @@ Ejemplo:
     python buscar_areaid_excel.py --excel "clinicas.xlsx" --nombre "NOMBRE_CLINICA" --direccion "DIRECCION_CLINICA"
 """
 
-import requests
+from centers_catalog import get_centers_catalog
 import pandas as pd
 import os
-import json
 import re
 import argparse
 from fuzzywuzzy import process, fuzz
 from datetime import datetime
 
 def get_areas(instance_id="tt_portal_adeslas", lang="es"):
-    """Obtiene todas las áreas/centros de TuoTempo"""
-    url = f"https://app.tuotempo.com/api/v3/{instance_id}/areas"
-    headers = {"content-type": "application/json; charset=UTF-8"}
-    params = {"lang": lang}
-    
+    """Obtiene todas las áreas/centros de TuoTempo (catálogo compartido con caché)"""
     print(f"🔍 Obteniendo áreas desde TuoTempo...")
     try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Guardar la respuesta completa para referencia
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        with open(f'areas_response_{timestamp}.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        # Manejar diferentes formatos de respuesta
-        areas = []
-        if isinstance(data, dict):
-            if "return" in data:
-                ret_data = data["return"]
-                if isinstance(ret_data, dict) and "results" in ret_data:
-                    results = ret_data["results"]
-                    if isinstance(results, dict) and "areas" in results:
-                        areas = results["areas"]
-                    elif isinstance(results, list):
-                        areas = results
-                elif isinstance(ret_data, list):
-                    areas = ret_data
-            elif "results" in data:
-                results = data["results"]
-                if isinstance(results, dict) and "areas" in results:
-                    areas = results["areas"]
-                elif isinstance(results, list):
-                    areas = results
-            elif "areas" in data:
-                areas = data["areas"]
-        elif isinstance(data, list):
-            areas = data
-        
-        if not isinstance(areas, list):
-            print(f"❌ Error: No se pudo extraer una lista de áreas. Tipo obtenido: {type(areas)}")
-            return []
-            
+        areas = get_centers_catalog(instance_id, lang).all()
         print(f"✅ Se encontraron {len(areas)} áreas/centros disponibles")
         return areas
     except Exception as e:
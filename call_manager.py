@@ -8,15 +8,16 @@ import os
 import threading
 import time
 import logging
-import json
-from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Callable, Any
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
 
 from pearl_caller import get_pearl_client, PearlAPIError
-from db import get_connection
+from db import get_connection, connection
+from rate_limiter import TokenBucket
+from write_behind import WriteBehindBuffer
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -100,17 +101,35 @@ class CallManager:
             self.call_queue = Queue()
             self.is_running = False
             self.workers: List[threading.Thread] = []
-            self.active_calls = {}
-            self.max_concurrent_calls = 3
+            self.max_concurrent_calls = int(os.getenv('CALLS_MAX_CONCURRENT', 3))
             self.current_session_id: Optional[int] = None
+            self.on_call_started = None
+            self.on_call_completed = None
+            self.on_call_failed = None
             self.on_stats_updated = None
+            # Límite de tasa hacia Pearl AI (llamadas/segundo y ráfaga máxima)
+            self.rate_limiter = TokenBucket(
+                rate=float(os.getenv('PEARL_CALLS_PER_SECOND', 2)),
+                capacity=float(os.getenv('PEARL_CALLS_BURST', 0)) or None
+            )
+            # Segundos que stop_calling() espera a que terminen las llamadas en curso
+            self.stop_timeout = float(os.getenv('CALLS_STOP_TIMEOUT', 60))
+            self._stop_event = threading.Event()
+            self._stats_lock = threading.Lock()
+            self._dispatcher_thread: Optional[threading.Thread] = None
+            self._call_latencies = deque(maxlen=1000)
+            # Escritura por lotes del registro de intentos (pearl_calls + leads)
+            self.bookkeeping_batch_size = int(os.getenv('CALLS_BOOKKEEPING_BATCH', 25))
+            self.bookkeeping_max_delay = float(os.getenv('CALLS_BOOKKEEPING_FLUSH_SECONDS', 2))
+            self._bookkeeping: Optional[WriteBehindBuffer] = None
             self.stats = {
                 'total': 0,
                 'completed': 0,
                 'failed': 0,
                 'no_answer': 0,
                 'busy': 0,
-                'in_progress': 0
+                'in_progress': 0,
+                'skipped': 0
             }
             self._initialized = True
             logger.info("CallManager initialized")
@@ -184,13 +203,7 @@ class CallManager:
                 logger.info(f"📞 IDs específicos encontrados: {[lead['id'] for lead in leads]}")
 
             # Marcar como iniciado y procesar en background
-            self.is_running = True
-
-            # Iniciar procesamiento asíncrono
-            import threading
-            thread = threading.Thread(target=self._process_leads_async, args=(leads,))
-            thread.daemon = True
-            thread.start()
+            self._launch(leads)
 
             logger.info("[ASYNC] Sistema de llamadas iniciado en background")
             return True
@@ -200,400 +213,342 @@ class CallManager:
             self.is_running = False
             return False
 
+    def _launch(self, leads: List[Dict]):
+        """Arranca el despachador de llamadas en un hilo de fondo."""
+        self.is_running = True
+        self._stop_event.clear()
+        with self._stats_lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+            self.stats['total'] = len(leads)
+            self._call_latencies.clear()
+
+        self._dispatcher_thread = threading.Thread(
+            target=self._process_leads_async, args=(leads,), name="CallDispatcher", daemon=True
+        )
+        self._dispatcher_thread.start()
+
     def _process_leads_async(self, leads):
-        """Procesa los leads de forma asíncrona en background"""
+        """
+        Despachador de llamadas: reparte los leads entre ``max_concurrent_calls``
+        workers a través de una cola acotada (backpressure) y respeta el límite
+        de tasa de Pearl AI. Al detenerse, descarta los leads pendientes y
+        espera a que terminen las llamadas en curso.
+        """
         try:
-            logger.info(f"[ASYNC] Procesando {len(leads)} leads en background")
+            workers_count = max(1, int(self.max_concurrent_calls))
+            logger.info(f"[ASYNC] Procesando {len(leads)} leads en background con {workers_count} workers")
+
+            self.call_queue = Queue(maxsize=workers_count * 2)
+            self._bookkeeping = WriteBehindBuffer(
+                self._flush_call_bookkeeping,
+                max_items=self.bookkeeping_batch_size,
+                max_delay=self.bookkeeping_max_delay,
+                name="call-bookkeeping",
+                after_flush=self._run_result_callbacks
+            )
+            self.workers = []
+            for i in range(workers_count):
+                worker = threading.Thread(target=self._worker, name=f"CallWorker-{i + 1}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
 
-            # Procesar cada lead con teléfonos normalizados
+            enqueued = 0
             for lead in leads:
-                # VERIFICACIÓN MODO PRUEBA - LOGS DETALLADOS
-                logger.info(f"🔍 VERIFICACIÓN MODO PRUEBA - Lead ID: {lead['id']}")
-                logger.info(f"📞 Override phone configurado: {_override_phone}")
-                logger.info(f"📱 Teléfono original del lead: {lead.get('telefono', 'N/A')}")
-                logger.info(f"📱 Teléfono secundario del lead: {lead.get('telefono2', 'N/A')}")
-
-                # Determinar qué teléfono usar - APLICAR OVERRIDE
-                if _override_phone:
-                    phone_to_use = _override_phone
-                    logger.warning(f"🧪 MODO PRUEBA ACTIVO - Usando teléfono override: {phone_to_use}")
-                else:
-                    phone_to_use = lead['telefono'] if lead['telefono'] else lead['telefono2']
-                    logger.info(f"📞 Usando teléfono normal del lead: {phone_to_use}")
+                task = CallTask(lead_id=lead['id'], phone_number='', lead_data=lead)
+                # Bloquear mientras la cola esté llena (backpressure), salvo parada
+                while not self._stop_event.is_set():
+                    try:
+                        self.call_queue.put(task, timeout=0.5)
+                        enqueued += 1
+                        break
+                    except Full:
+                        continue
+                if self._stop_event.is_set():
+                    break
 
-                # Normalizar el teléfono añadiendo +34 si es necesario
-                normalized_phone = normalize_spanish_phone(phone_to_use)
+            if self._stop_event.is_set():
+                with self._stats_lock:
+                    self.stats['skipped'] += len(leads) - enqueued
+                self._drain_pending()
 
-                logger.info(f"🎯 Teléfono FINAL normalizado: {normalized_phone}")
-                logger.info(f"✅ Procesando lead {lead['id']}: {lead.get('nombre', 'N/A')} - {phone_to_use} -> {normalized_phone}")
+            # Un centinela por worker para que terminen al vaciar la cola
+            for _ in self.workers:
+                self.call_queue.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.workers = []
 
-                # Llamar callbacks si existen
-                if self.on_call_started:
-                    self.on_call_started(lead['id'], normalized_phone)
+            logger.info("[ASYNC] Sistema de llamadas completado en background")
 
-                # Ejecutar llamada real con Pearl AI
-                logger.info(f"[PEARL] INICIANDO LLAMADA A PEARL AI")
-                logger.info(f"[PEARL] Numero final enviado a Pearl: {normalized_phone}")
-                outbound_id = self.pearl_client.get_default_outbound_id()
-                success, api_response = self.pearl_client.make_call(outbound_id, normalized_phone, lead)
+        except Exception as e:
+            logger.error(f"[ERROR] Error procesando leads en background: {e}")
+        finally:
+            # Persistir los intentos pendientes antes de dar la ejecución por terminada
+            if self._bookkeeping:
+                self._bookkeeping.close()
+            self.is_running = False
+            if self.on_stats_updated:
+                self.on_stats_updated(self.stats.copy())
 
-                # Guardar call_id basico en pearl_calls para procesamiento posterior
-                if success and api_response and 'id' in api_response:
-                    try:
-                        call_id = api_response.get('id')
-                        if call_id:
-                            logger.info(f"[CALL_BASIC] Guardando call_id basico: {call_id}")
-
-                            # Guardar registro basico que sera completado por calls_updater posteriormente
-                            conn_calls = get_connection()
-                            cursor_calls = conn_calls.cursor()
-
-                            # Insertar registro basico con la informacion minima disponible
-                            cursor_calls.execute("""
-                                INSERT INTO pearl_calls
-                                (call_id, phone_number, lead_id, outbound_id, status, call_time, created_at)
-                                VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-                                ON DUPLICATE KEY UPDATE
-                                lead_id = VALUES(lead_id),
-                                phone_number = VALUES(phone_number),
-                                outbound_id = VALUES(outbound_id)
-                            """, [
-                                call_id,
-                                normalized_phone,
-                                lead['id'],
-                                outbound_id,
-                                '1'  # Status temporal, sera actualizado por calls_updater
-                            ])
-
-                            conn_calls.commit()
-                            cursor_calls.close()
-                            conn_calls.close()
-
-                            logger.info(f"[OK] Call_id basico guardado. calls_updater completara los detalles mas tarde.")
-
-                    except Exception as details_err:
-                        logger.error(f"[ERROR] Error guardando call_id basico: {details_err}")
-
-                # Actualizar estadísticas
-                if success:
-                    self.stats['completed'] += 1
-                    call_status = CallStatus.COMPLETED.value
-                else:
-                    self.stats['failed'] += 1
-                    call_status = CallStatus.FAILED.value
+    def _drain_pending(self):
+        """Descarta los leads encolados que aún no se han marcado."""
+        skipped = 0
+        while True:
+            try:
+                task = self.call_queue.get_nowait()
+            except Empty:
+                break
+            if task is not None:
+                skipped += 1
+            self.call_queue.task_done()
+        if skipped:
+            with self._stats_lock:
+                self.stats['skipped'] += skipped
+            logger.info(f"[ASYNC] {skipped} leads pendientes descartados por parada del sistema")
 
-                # Registrar intento en la BD
-                try:
-                    conn_upd = get_connection()
-                    cur_upd = conn_upd.cursor()
-                    cur_upd.execute("""
-                        UPDATE leads l
-                        SET call_attempts_count = (
-                            SELECT COUNT(*) FROM pearl_calls pc WHERE pc.lead_id = l.id
-                        ),
-                            last_call_attempt = NOW(),
-                            call_status = %s
-                        WHERE l.id = %s
-                    """, (call_status, lead['id']))
-                    conn_upd.commit()
-                    cur_upd.close()
-                    conn_upd.close()
-                except Exception as db_err:
-                    logger.error(f"Error actualizando lead {lead['id']} en BD: {db_err}")
-
-                # Llamar callbacks según resultado
-                if success and self.on_call_completed:
-                    self.on_call_completed(lead['id'], normalized_phone, api_response)
-                elif not success and self.on_call_failed:
-                    self.on_call_failed(lead['id'], normalized_phone, api_response)
-
-                # Emitir actualización de stats si corresponde
-                if self.on_stats_updated:
-                    self.on_stats_updated(self.stats)
+    def _worker(self):
+        """Consume tareas de la cola y realiza las llamadas respetando el límite de tasa."""
+        while True:
+            task = self.call_queue.get()
+            try:
+                if task is None:
+                    return
+                if self._stop_event.is_set():
+                    with self._stats_lock:
+                        self.stats['skipped'] += 1
+                    continue
+                if not self.rate_limiter.acquire(stop_event=self._stop_event):
+                    with self._stats_lock:
+                        self.stats['skipped'] += 1
+                    continue
+                self._process_call(task)
+            except Exception as e:
+                logger.error(f"[ERROR] Error procesando lead {getattr(task, 'lead_id', None)}: {e}")
+            finally:
+                self.call_queue.task_done()
 
-            logger.info("[ASYNC] Sistema de llamadas completado en background")
-            self.is_running = False
-            if self.on_stats_updated:
-                self.on_stats_updated(self.stats)
+    def _process_call(self, task: CallTask):
+        """Realiza la llamada real a Pearl AI para un lead y registra el intento."""
+        lead = task.lead_data
+
+        # VERIFICACIÓN MODO PRUEBA - LOGS DETALLADOS
+        logger.info(f"🔍 VERIFICACIÓN MODO PRUEBA - Lead ID: {lead['id']}")
+        logger.info(f"📞 Override phone configurado: {_override_phone}")
+        logger.info(f"📱 Teléfono original del lead: {lead.get('telefono', 'N/A')}")
+        logger.info(f"📱 Teléfono secundario del lead: {lead.get('telefono2', 'N/A')}")
+
+        # Determinar qué teléfono usar - APLICAR OVERRIDE
+        if _override_phone:
+            phone_to_use = _override_phone
+            logger.warning(f"🧪 MODO PRUEBA ACTIVO - Usando teléfono override: {phone_to_use}")
+        else:
+            phone_to_use = lead['telefono'] if lead['telefono'] else lead['telefono2']
+            logger.info(f"📞 Usando teléfono normal del lead: {phone_to_use}")
+
+        # Normalizar el teléfono añadiendo +34 si es necesario
+        normalized_phone = normalize_spanish_phone(phone_to_use)
+        task.phone_number = normalized_phone
+
+        logger.info(f"🎯 Teléfono FINAL normalizado: {normalized_phone}")
+        logger.info(f"✅ Procesando lead {lead['id']}: {lead.get('nombre', 'N/A')} - {phone_to_use} -> {normalized_phone}")
 
+        with self._stats_lock:
+            self.stats['in_progress'] += 1
+
+        # Llamar callbacks si existen
+        if self.on_call_started:
+            self.on_call_started(lead['id'], normalized_phone)
+
+        # Ejecutar llamada real con Pearl AI
+        logger.info(f"[PEARL] INICIANDO LLAMADA A PEARL AI")
+        logger.info(f"[PEARL] Numero final enviado a Pearl: {normalized_phone}")
+        outbound_id = self.pearl_client.get_default_outbound_id()
+        started = time.monotonic()
+        try:
+            success, api_response = self.pearl_client.make_call(outbound_id, normalized_phone, lead)
         except Exception as e:
-            logger.error(f"[ERROR] Error procesando leads en background: {e}")
-            self.is_running = False
-    
-    def stop_calling(self) -> bool:
-        """Detiene el sistema de llamadas."""
+            logger.error(f"[PEARL] Error llamando a lead {lead['id']}: {e}")
+            success, api_response = False, {'error': str(e)}
+        latency = time.monotonic() - started
+
+        # Actualizar estadísticas
+        with self._stats_lock:
+            self.stats['in_progress'] -= 1
+            self._call_latencies.append(latency)
+            if success:
+                self.stats['completed'] += 1
+                call_status = CallStatus.COMPLETED.value
+            else:
+                self.stats['failed'] += 1
+                call_status = CallStatus.FAILED.value
+            stats_snapshot = self.stats.copy()
+
+        # Registrar el intento (call_id basico en pearl_calls + estado del lead) en
+        # el buffer de escritura diferida; los callbacks de resultado se ejecutan
+        # cuando el lote se ha persistido, fuera del lock de volcado.
+        call_id = api_response.get('id') if success and isinstance(api_response, dict) else None
+        self._bookkeeping.add({
+            'lead_id': lead['id'],
+            'call_id': call_id,
+            'phone': normalized_phone,
+            'outbound_id': outbound_id,
+            'call_status': call_status,
+            'success': success,
+            'api_response': api_response,
+        })
+
+        # Emitir actualización de stats si corresponde
+        if self.on_stats_updated:
+            self.on_stats_updated(stats_snapshot)
+
+    def _flush_call_bookkeeping(self, items: List[Dict]):
+        """
+        Persiste un lote de intentos en una sola transacción: un INSERT multi-fila
+        en pearl_calls, un UPDATE de leads por estado y un recálculo agrupado de
+        call_attempts_count. Las marcas de tiempo salen de ``NOW()`` de la BD.
+
+        Si falla, la transacción se deshace y el error se propaga para que el
+        buffer cuente el fallo y reintente el lote.
+        """
+        try:
+            with connection() as conn:
+                conn.start_transaction()
+                cursor = conn.cursor()
+
+                calls = [item for item in items if item['call_id']]
+                if calls:
+                    logger.info(f"[CALL_BASIC] Guardando {len(calls)} call_ids basicos")
+                    placeholders = ', '.join(['(%s, %s, %s, %s, %s, NOW(), NOW())'] * len(calls))
+                    params = []
+                    for item in calls:
+                        # Status temporal, sera actualizado por calls_updater
+                        params.extend([item['call_id'], item['phone'], item['lead_id'],
+                                       item['outbound_id'], '1'])
+                    cursor.execute(f"""
+                        INSERT INTO pearl_calls
+                        (call_id, phone_number, lead_id, outbound_id, status, call_time, created_at)
+                        VALUES {placeholders}
+                        ON DUPLICATE KEY UPDATE
+                        lead_id = VALUES(lead_id),
+                        phone_number = VALUES(phone_number),
+                        outbound_id = VALUES(outbound_id)
+                    """, params)
+
+                # Último intento de cada lead dentro del lote, agrupado por estado
+                latest = {}
+                for item in items:
+                    latest[item['lead_id']] = item
+                by_status: Dict[str, List[Dict]] = {}
+                for item in latest.values():
+                    by_status.setdefault(item['call_status'], []).append(item)
+
+                for call_status, group in by_status.items():
+                    ids = [item['lead_id'] for item in group]
+                    cursor.execute(f"""
+                        UPDATE leads
+                        SET call_status = %s,
+                            last_call_attempt = NOW()
+                        WHERE id IN ({', '.join(['%s'] * len(ids))})
+                    """, [call_status] + ids)
+
+                # Intentos de los leads con llamadas nuevas (lead_call_stats lo mantienen los triggers)
+                counted_ids = sorted({item['lead_id'] for item in calls})
+                if counted_ids:
+                    cursor.execute(f"""
+                        UPDATE leads l
+                        JOIN lead_call_stats s ON s.lead_id = l.id
+                        SET l.call_attempts_count = s.call_count
+                        WHERE l.id IN ({', '.join(['%s'] * len(counted_ids))})
+                    """, counted_ids)
+
+                conn.commit()
+                cursor.close()
+            logger.info(f"[OK] Registro de {len(items)} intentos guardado ({len(calls)} en pearl_calls)")
+        except Exception as db_err:
+            logger.error(f"Error guardando registro de {len(items)} intentos en BD: {db_err}")
+            raise
+
+    def _run_result_callbacks(self, items: List[Dict]):
+        """Callbacks de resultado de un lote ya volcado (o descartado tras agotar los reintentos)."""
+        for item in items:
+            try:
+                if item['success'] and self.on_call_completed:
+                    self.on_call_completed(item['lead_id'], item['phone'], item['api_response'])
+                elif not item['success'] and self.on_call_failed:
+                    self.on_call_failed(item['lead_id'], item['phone'], item['api_response'])
+            except Exception as cb_err:
+                logger.error(f"Error en callback de resultado del lead {item['lead_id']}: {cb_err}")
+
+    def stop_calling(self, wait: bool = True) -> bool:
+        """
+        Detiene el sistema de llamadas de forma ordenada: no se inician nuevas
+        llamadas, se descartan los leads pendientes y, si ``wait`` es True, se
+        espera (hasta ``stop_timeout`` segundos) a que terminen las llamadas en curso.
+        """
         if not self.is_running:
             logger.warning("El sistema de llamadas no está ejecutándose")
             return False
-            
+
+        self._stop_event.set()
+        logger.info("Deteniendo sistema de llamadas: esperando a las llamadas en curso...")
+
+        dispatcher = self._dispatcher_thread
+        if wait and dispatcher and dispatcher is not threading.current_thread():
+            dispatcher.join(timeout=self.stop_timeout)
+            if dispatcher.is_alive():
+                logger.warning(f"Quedan llamadas en curso tras {self.stop_timeout}s; terminarán en segundo plano")
+                return False
+
         self.is_running = False
         logger.info("Sistema de llamadas detenido")
         return True
 
     def start(self, leads: List[Dict]):
+        """Lanza el despachador para una lista de leads ya cargados (id, nombre, telefono, telefono2)."""
         if self.is_running:
             logging.warning("Call manager is already running.")
-            return
+            return False
 
-        with self.app.app_context():
-            new_session = Session()
-            db.session.add(new_session)
-            db.session.commit()
-            self.current_session_id = new_session.id
+        leads = [lead for lead in leads if lead.get('telefono') or lead.get('telefono2')]
+        if not leads:
+            logger.warning("No hay leads con teléfono para llamar")
+            return False
 
-        self.is_running = True
-        self.stats = self.stats.fromkeys(self.stats, 0)
-        self.stats['total'] = len(leads)
-
-        for lead_data in leads:
-            if self._add_lead_to_queue(lead_data):
-                self._update_lead_status(lead_data['id'], 'queued')
-
-        self.workers = []
-        for i in range(self.max_concurrent_calls):
-            worker = threading.Thread(target=self._worker, daemon=True)
-            worker.start()
-            self.workers.append(worker)
-        
+        self._launch(leads)
         logger.info(f"Call manager started with {len(leads)} leads and {self.max_concurrent_calls} workers.")
         self._emit_status()
+        return True
 
     def stop(self):
-        if not self.is_running:
-            logger.warning("Call manager is not running.")
-            return
-
-        self.is_running = False
-        # Empty the queue to make workers finish if they are waiting
-        while not self.call_queue.empty():
-            try:
-                self.call_queue.get_nowait()
-            except Empty:
-                break
-        
-        # Wait for current workers to finish
-        for worker in self.workers:
-            worker.join(timeout=5)
-
-        self.workers = []
-        self.current_session_id = None
-        logger.info("Call manager stopped.")
+        self.stop_calling()
         self._emit_status()
 
     def get_status(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = self.stats.copy()
+            latencies = sorted(self._call_latencies)
+
+        latency_stats = {'count': len(latencies)}
+        if latencies:
+            latency_stats.update({
+                'avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1),
+            })
+
         return {
             'is_running': self.is_running,
+            'stopping': self._stop_event.is_set() and self.is_running,
             'queue_size': self.call_queue.qsize(),
-            'active_calls': self.stats.get('in_progress', 0),
-            'stats': self.stats
+            'active_calls': stats.get('in_progress', 0),
+            'max_concurrent_calls': self.max_concurrent_calls,
+            'rate_limit': self.rate_limiter.stats(),
+            'call_latency': latency_stats,
+            'bookkeeping': self._bookkeeping.stats() if self._bookkeeping else None,
+            'stats': stats
         }
 
-    def _add_lead_to_queue(self, lead_data: Dict) -> bool:
-        # Log detallado para verificar modo de prueba
-        logger.info(f"🔍 VERIFICACIÓN MODO PRUEBA - Lead ID: {lead_data['id']}")
-        logger.info(f"📞 Override phone configurado: {_override_phone}")
-        logger.info(f"📱 Teléfono original del lead: {lead_data.get('telefono', 'N/A')}")
-        logger.info(f"📱 Teléfono secundario del lead: {lead_data.get('telefono2', 'N/A')}")
-        
-        phone = _override_phone if _override_phone else lead_data.get('telefono', '').strip()
-        logger.info(f"🎯 Teléfono seleccionado (1ra pasada): {phone}")
-        
-        if not self.pearl_client.validate_phone_number(phone):
-            logger.info(f"❌ Teléfono inválido, probando teléfono2...")
-            phone = _override_phone if _override_phone else lead_data.get('telefono2', '').strip()
-            logger.info(f"🎯 Teléfono seleccionado (2da pasada): {phone}")
-
-        if self.pearl_client.validate_phone_number(phone):
-            logger.info(f"✅ Teléfono FINAL válido: {phone}")
-            if _override_phone:
-                logger.warning(f"🧪 MODO PRUEBA ACTIVO - Llamando a {phone} en lugar del teléfono real del lead")
-            task = CallTask(
-                lead_id=lead_data['id'],
-                phone_number=phone,
-                lead_data=lead_data
-            )
-            self.call_queue.put(task)
-            return True
-        else:
-            logger.warning(f"Lead {lead_data['id']} has no valid phone number. Skipping.")
-            self._update_lead_status(lead_data['id'], 'failed', error_message="Invalid phone number")
-            self.stats['failed'] += 1
-            return False
-
-    def _worker(self):
-        while self.is_running:
-            try:
-                task = self.call_queue.get(timeout=1)
-                self.stats['in_progress'] += 1
-                self._emit_status()
-                self._process_call(task)
-                self.stats['in_progress'] -= 1
-                self.call_queue.task_done()
-            except Empty:
-                if not self.is_running:
-                    break
-                # If the queue is empty, check for active calls.
-                # If none, we can stop the system.
-                if self.stats.get('in_progress', 0) == 0 and self.call_queue.empty():
-                    logger.info("All calls processed. Stopping manager.")
-                    self.stop()
-                    break
-                continue
-
-    def _process_call(self, task: CallTask):
-        lead_id = task.lead_id
-        phone_number = task.phone_number
-        logger.info(f"Processing call for lead {lead_id} to {phone_number}")
-        self._update_lead_status(lead_id, 'in_progress')
-
-        call_id = self._create_call_record(lead_id, phone_number)
-
-        try:
-            # Real call logic with PearlClient would go here
-            # We simulate the call result for now
-            # call_result = self.pearl_client.make_call(phone_number, lead_id)
-            time.sleep(5) # Simulate call duration
-            call_result = {'status': 'completed', 'duration': 5}
-
-            status = call_result.get('status', 'failed')
-            self._update_lead_status(lead_id, status)
-            self._update_call_record(call_id, status, call_result.get('duration'))
-            
-            if status == 'completed':
-                self.stats['completed'] += 1
-            else:
-                self.stats[status] = self.stats.get(status, 0) + 1
-
-        except Exception as e:
-            logger.error(f"Error processing call for lead {lead_id}: {e}")
-            self._update_lead_status(lead_id, 'failed', error_message=str(e))
-            self._update_call_record(call_id, 'failed', duration=0, error_message=str(e))
-            self.stats['failed'] += 1
-        finally:
-            self._emit_status()
-
-    def _update_lead_status(self, lead_id: int, status: str, error_message: Optional[str] = None):
-        """
-        Actualiza el estado de un lead en la base de datos.
-        
-        Args:
-            lead_id (int): ID del lead
-            status (str): Nuevo estado
-            error_message (str, optional): Mensaje de error si aplica
-        """
-        try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                # Primero verificamos si el lead existe y obtenemos su valor de call_attempts actual
-                cursor.execute(
-                    "SELECT call_attempts FROM leads WHERE id = %s",
-                    (lead_id,)
-                )
-                result = cursor.fetchone()
-                
-                if result:
-                    # Incrementamos call_attempts en 1 o establecemos como 1 si es NULL
-                    call_attempts = 1 if result[0] is None else result[0] + 1
-                    
-                    # Actualizamos el estado del lead
-                    sql = """
-                    UPDATE leads 
-                    SET call_status = %s, 
-                        last_call_time = %s, 
-                        call_attempts = %s
-                    """
-                    
-                    params = [status, datetime.utcnow(), call_attempts]
-                    
-                    # Añadir mensaje de error si existe
-                    if error_message:
-                        sql += ", last_call_error = %s"
-                        params.append(error_message)
-                    
-                    sql += " WHERE id = %s"
-                    params.append(lead_id)
-                    
-                    cursor.execute(sql, params)
-                    conn.commit()
-                    
-                    # Si hay callback para notificar actualizaciones, lo llamamos
-                    if self.on_status_update:
-                        # Obtener datos actualizados para el callback
-                        cursor.execute("SELECT * FROM leads WHERE id = %s", (lead_id,))
-                        lead_data = cursor.fetchone()
-                        if lead_data:
-                            # Convertir a diccionario usando los nombres de columnas
-                            column_names = [desc[0] for desc in cursor.description]
-                            lead_dict = dict(zip(column_names, lead_data))
-                            self.on_status_update('lead_update', lead_dict)
-                            
-            conn.close()
-        except Exception as e:
-            logger.error(f"Error actualizando estado de lead {lead_id}: {e}")
-            # Intentar cerrar la conexión en caso de error
-            try:
-                conn.close()
-            except:
-                pass
-
-    def _create_call_record(self, lead_id: int, phone_number: str) -> int:
-        try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                # Insertar registro de llamada y obtener el ID generado
-                cursor.execute(
-                    """INSERT INTO calls (lead_id, session_id, phone_number, status, start_time)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING id""",
-                    (lead_id, self.current_session_id, phone_number, 'initiated', datetime.utcnow())
-                )
-                call_id = cursor.fetchone()[0]
-                conn.commit()
-                conn.close()
-                return call_id
-        except Exception as e:
-            logger.error(f"Error creando registro de llamada para lead {lead_id}: {e}")
-            try:
-                conn.close()
-            except:
-                pass
-            return -1  # Valor de error
-
-    def _update_call_record(self, call_id: int, status: str, duration: Optional[int] = None, error_message: Optional[str] = None):
-        if call_id < 0:  # Omitir actualización si el ID no es válido (caso de error en _create_call_record)
-            return
-            
-        try:
-            conn = get_connection()
-            with conn.cursor() as cursor:
-                # Construir la consulta SQL con los campos a actualizar
-                sql = "UPDATE calls SET status = %s, end_time = %s"
-                params = [status, datetime.utcnow()]
-                
-                # Añadir duración si está disponible
-                if duration is not None:
-                    sql += ", duration_seconds = %s"
-                    params.append(duration)
-                    
-                # Añadir mensaje de error si existe
-                if error_message:
-                    sql += ", error_message = %s"
-                    params.append(error_message)
-                    
-                # Completar la consulta con la condición WHERE
-                sql += " WHERE id = %s"
-                params.append(call_id)
-                
-                # Ejecutar la actualización
-                cursor.execute(sql, params)
-                conn.commit()
-                conn.close()
-        except Exception as e:
-            logger.error(f"Error actualizando registro de llamada {call_id}: {e}")
-            try:
-                conn.close()
-            except:
-                pass
-
     def _emit_status(self):
         if self.on_status_update:
             self.on_status_update('status_update', self.get_status())            
@@ -604,108 +559,6 @@ class CallManager:
                 except Exception as e:
                     logger.error(f"Error en callback on_stats_updated: {e}")
 
-    
-    # Método duplicado eliminado
-    
-    def _update_lead_call_data(self, lead_id: int, response_data: Dict):
-        """
-        Actualiza los datos de llamada de un lead.
-        
-        Args:
-            lead_id (int): ID del lead
-            response_data (Dict): Respuesta de la API de Pearl
-        """
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Extraer datos relevantes
-            call_id = response_data.get('callId') or response_data.get('id')
-            pearl_response = json.dumps(response_data)
-            
-            query = """
-                UPDATE leads SET 
-                    call_id = %s,
-                    pearl_call_response = %s,
-                    call_time = %s,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """
-            
-            cursor.execute(query, [call_id, pearl_response, datetime.now(), lead_id])
-            conn.commit()
-            
-        except Exception as e:
-            logger.error(f"Error actualizando datos de llamada para lead {lead_id}: {e}")
-        finally:
-            if conn:
-                conn.close()
-    
-    def _increment_call_attempts(self, lead_id: int):
-        """
-        Incrementa el contador de intentos de llamada.
-        
-        Args:
-            lead_id (int): ID del lead
-        """
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            query = """
-                UPDATE leads l SET 
-                    call_attempts_count = (
-                        SELECT COUNT(*) FROM pearl_calls pc WHERE pc.lead_id = l.id
-                    ),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE l.id = %s
-            """
-            
-            cursor.execute(query, [lead_id])
-            conn.commit()
-            
-        except Exception as e:
-            logger.error(f"Error incrementando intentos para lead {lead_id}: {e}")
-        finally:
-            if conn:
-                conn.close()
-    
-    def _cleanup_completed_calls(self):
-        """
-        Limpia llamadas completadas del diccionario de llamadas activas.
-        """
-        completed_leads = []
-        
-        for lead_id, call_info in self.active_calls.items():
-            if not call_info['thread'].is_alive():
-                completed_leads.append(lead_id)
-        
-        for lead_id in completed_leads:
-            del self.active_calls[lead_id]
-    
-    def _cleanup_active_calls(self):
-        """
-        Limpia y actualiza estado de todas las llamadas activas al detener.
-        """
-        for lead_id, call_info in self.active_calls.items():
-            if call_info['thread'].is_alive():
-                # No podemos forzar parar el thread, pero actualizamos el estado
-                logger.warning(f"Llamada activa para lead {lead_id} al detener gestor")
-                self._update_lead_status(lead_id, CallStatus.ERROR, "Proceso interrumpido")
-        
-        self.active_calls.clear()
-    
-    def reset_stats(self):
-        """Reinicia las estadísticas."""
-        self.stats = {
-            "total_calls": 0,
-            "successful_calls": 0,
-            "failed_calls": 0,
-            "busy_calls": 0,
-            "no_answer_calls": 0,
-            "error_calls": 0
-        }
-        logger.info("Estadísticas reiniciadas")
 
 # Instancia global del gestor (singleton)
 _call_manager = None
@@ -4,11 +4,11 @@ Este módulo extiende el call_manager.py para usar automáticamente el scheduler
 """
 
 import logging
-import re
 from datetime import datetime
-from typing import Dict, Optional
-from reprogramar_llamadas_simple import simple_reschedule_failed_call, get_pymysql_connection, cancel_scheduled_calls_for_lead, complete_scheduled_call
+from typing import Dict, List, Optional, Tuple
+from reprogramar_llamadas_simple import simple_reschedule_failed_call, simple_reschedule_failed_calls, get_pymysql_connection, cancel_scheduled_calls_for_lead, complete_scheduled_call
 from db import get_connection
+from lead_lookup import find_leads_by_phone
 
 logger = logging.getLogger(__name__)
 
@@ -146,12 +146,7 @@ def close_lead_with_reason(lead_id: int, reason: str, telefono: str = None) -> b
             # Fallback: si no encontró por id, intentar cerrar por teléfono
             if telefono:
                 try:
-                    phone_digits = re.sub(r'[^0-9]', '', telefono)
-                    cursor.execute(
-                        "SELECT id FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s",
-                        (phone_digits,)
-                    )
-                    matches = cursor.fetchall()
+                    matches = find_leads_by_phone(cursor, telefono, include_secondary=False)
                     logger.debug(f"[DEBUG_CLOSE] Leads coincidentes por teléfono {telefono}: {matches}")
                     if matches:
                         fallback_id = matches[0]['id']
@@ -224,7 +219,7 @@ def increment_call_attempts_count(lead_id: int, telefono: str = None) -> bool:
             cursor.execute("""
                 UPDATE leads l
                 SET call_attempts_count = (
-                        SELECT COUNT(*) FROM pearl_calls pc WHERE pc.lead_id = l.id
+                        SELECT COALESCE(MAX(s.call_count), 0) FROM lead_call_stats s WHERE s.lead_id = l.id
                     ),
                     last_call_attempt = NOW(),
                     updated_at = NOW()
@@ -249,13 +244,8 @@ def increment_call_attempts_count(lead_id: int, telefono: str = None) -> bool:
             # Fallback: intentar incrementar por teléfono si se proporcionó
             if telefono:
                 try:
-                    phone_digits = re.sub(r'[^0-9]', '', telefono)
                     # Intentar coincidir leads por teléfono si id falló
-                    cursor.execute(
-                        "SELECT id FROM leads WHERE REGEXP_REPLACE(telefono, '[^0-9]', '') = %s",
-                        (phone_digits,)
-                    )
-                    matches = cursor.fetchall()
+                    matches = find_leads_by_phone(cursor, telefono, include_secondary=False)
                     logger.debug(f"[DEBUG_INCREMENT] Leads coincidentes por teléfono {telefono}: {matches}")
                     if matches:
                         fallback_id = matches[0]['id']
@@ -264,7 +254,7 @@ def increment_call_attempts_count(lead_id: int, telefono: str = None) -> bool:
                             """
                             UPDATE leads l
                             SET call_attempts_count = (
-                                    SELECT COUNT(*) FROM pearl_calls pc WHERE pc.lead_id = l.id
+                                    SELECT COALESCE(MAX(s.call_count), 0) FROM lead_call_stats s WHERE s.lead_id = l.id
                                 ),
                                 last_call_attempt = NOW(),
                                 updated_at = NOW()
@@ -310,7 +300,8 @@ def increment_call_attempts_count(lead_id: int, telefono: str = None) -> bool:
             except:
                 pass
 
-def enhanced_process_call_result(lead_id: int, call_result: Dict, pearl_response: Dict = None, telefono: str = None):
+def enhanced_process_call_result(lead_id: int, call_result: Dict, pearl_response: Dict = None, telefono: str = None,
+                                 reschedule: Optional[List[Tuple[int, str]]] = None):
     """
     Procesa el resultado de una llamada e integra con el scheduler automáticamente.
     
@@ -318,6 +309,9 @@ def enhanced_process_call_result(lead_id: int, call_result: Dict, pearl_response
         lead_id: ID del lead
         call_result: Resultado de la llamada de Pearl AI
         pearl_response: Respuesta completa de la API de Pearl
+        reschedule: Si se pasa, las reprogramaciones se añaden aquí como
+                    ``(lead_id, outcome)`` en lugar de hacerse una a una; el
+                    llamante las aplica con ``reschedule_failed_calls``.
     """
     # Safety checks at the very beginning
     if lead_id is None or not isinstance(lead_id, int):
@@ -400,6 +394,10 @@ def enhanced_process_call_result(lead_id: int, call_result: Dict, pearl_response
                         # Casos que se pueden reprogramar (no contesta, busy, hang_up)
                         logger.info(f"Llamada fallida para lead {lead_id} ({outcome}). Reprogramando...")
                         
+                        if reschedule is not None:
+                            reschedule.append((lead_id, outcome))
+                            return True
+
                         # Usar versión segura de reprogramación
                         try:
                             scheduled = simple_reschedule_failed_call(lead_id, outcome)
@@ -443,6 +441,25 @@ def enhanced_process_call_result(lead_id: int, call_result: Dict, pearl_response
         logger.error(f"Error procesando resultado de llamada para lead {lead_id}: {e}")
         return False
 
+def reschedule_failed_calls(pending: List[Tuple[int, str]]) -> Dict[int, bool]:
+    """
+    Reprograma en un solo lote las llamadas acumuladas por
+    ``enhanced_process_call_result(..., reschedule=pending)``.
+
+    Returns:
+        dict: lead_id -> True si se reprogramó, False si se cerró
+    """
+    if not pending:
+        return {}
+    try:
+        results = simple_reschedule_failed_calls(pending)
+    except Exception as e:
+        logger.error(f"Error en reprogramación de {len(pending)} leads: {e}")
+        return {}
+    scheduled = sum(1 for ok in results.values() if ok)
+    logger.info(f"Reprogramados {scheduled} leads; {len(results) - scheduled} cerrados por máximo intentos")
+    return results
+
 def map_status_to_db_enum(status: str) -> str:
     """
     Mapea el status de Pearl AI a los valores válidos del ENUM de call_status.
@@ -562,7 +579,7 @@ def update_lead_with_call_result(lead_id: int, status: str, outcome: str,
                 UPDATE leads l SET
                     call_status = %s,
                     call_attempts_count = (
-                        SELECT COUNT(*) FROM pearl_calls pc WHERE pc.lead_id = l.id
+                        SELECT COALESCE(MAX(s.call_count), 0) FROM lead_call_stats s WHERE s.lead_id = l.id
                     ),
                     last_call_attempt = NOW(),
                     call_error_message = %s,
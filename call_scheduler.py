@@ -14,9 +14,10 @@ from mysql.connector import Error
 from datetime import datetime, timedelta
 import logging
 from db import get_connection
+from working_calendar import WorkingCalendar, calendar_from_config
 import logging
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -24,6 +25,237 @@ logger = logging.getLogger(__name__)
 
 _CS_LOG = logging.getLogger('call_scheduler')
 
+# Callbacks a invocar cuando cambia call_schedule en este proceso (p. ej. el
+# despachador de llamadas programadas, para despertar sin esperar al resync)
+_schedule_listeners = []
+
+def add_schedule_listener(callback):
+    """Registra ``callback()`` para ser avisado cuando se programa una llamada."""
+    _schedule_listeners.append(callback)
+
+def notify_schedule_changed():
+    """Avisa a los listeners registrados de que call_schedule ha cambiado."""
+    for callback in list(_schedule_listeners):
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"Error notificando cambio de call_schedule: {e}")
+
+# Leads por sentencia en las operaciones por lotes (tamaño de la lista IN)
+RETRY_BATCH_CHUNK = 500
+
+def closure_reason_for(closure_reasons: Dict, outcome: str) -> str:
+    """Razón de cierre de un lead que agota sus intentos, según el último resultado."""
+    closure_reasons = closure_reasons or {}
+    if outcome == 'no_answer':
+        return closure_reasons.get('no_answer', 'Ilocalizable')
+    if outcome == 'hang_up':
+        return closure_reasons.get('hang_up', 'No colabora')
+    if outcome in ['invalid_phone', 'error']:
+        return closure_reasons.get('invalid_phone', 'Telefono erroneo')
+    return 'Ilocalizable'
+
+def cancel_pending_schedules(cursor, lead_ids: List[int]):
+    """
+    Cancela las llamadas pendientes de ``lead_ids``. Con uniq_lead_status
+    (lead_id, status) sólo cabe una fila 'cancelled' por lead: la anterior se
+    borra antes de cancelar la pendiente.
+    """
+    placeholders = ', '.join(['%s'] * len(lead_ids))
+    cursor.execute(f"""
+        DELETE c FROM call_schedule c
+        JOIN call_schedule p ON p.lead_id = c.lead_id AND p.status = 'pending'
+        WHERE c.lead_id IN ({placeholders}) AND c.status = 'cancelled'
+    """, lead_ids)
+    cursor.execute(f"""
+        UPDATE call_schedule SET
+            status = 'cancelled',
+            updated_at = NOW()
+        WHERE lead_id IN ({placeholders}) AND status = 'pending'
+    """, lead_ids)
+
+def _close_exhausted(cursor, reason: str, lead_ids: List[int]):
+    """Cierra los leads que agotan intentos y cancela sus pendientes."""
+    cursor.execute(f"""
+        UPDATE leads SET
+            lead_status = 'closed',
+            closure_reason = %s,
+            call_attempts_count = COALESCE(call_attempts_count, 0) + 1,
+            call_status = 'completed',
+            last_call_attempt = NOW(),
+            updated_at = NOW()
+        WHERE id IN ({', '.join(['%s'] * len(lead_ids))})
+    """, [reason, *lead_ids])
+    cancel_pending_schedules(cursor, lead_ids)
+
+def _schedule_retries(cursor, rows: List[Tuple[int, int, str, datetime]]):
+    """Suma el intento y crea (o actualiza) la llamada pendiente de cada lead."""
+    ids = [lead_id for lead_id, _, _, _ in rows]
+    cursor.execute(f"""
+        UPDATE leads SET
+            call_attempts_count = COALESCE(call_attempts_count, 0) + 1,
+            last_call_attempt = NOW(),
+            call_status = 'calling',
+            updated_at = NOW()
+        WHERE id IN ({', '.join(['%s'] * len(ids))})
+    """, ids)
+    params = []
+    for lead_id, attempts, outcome, scheduled_time in rows:
+        params.extend([lead_id, scheduled_time, attempts, outcome])
+    # uniq_lead_status (lead_id, status): la fila pendiente existente se actualiza
+    cursor.execute(f"""
+        INSERT INTO call_schedule
+        (lead_id, scheduled_at, attempt_number, status, last_outcome)
+        VALUES {', '.join(["(%s, %s, %s, 'pending', %s)"] * len(rows))}
+        ON DUPLICATE KEY UPDATE
+            scheduled_at = VALUES(scheduled_at),
+            attempt_number = VALUES(attempt_number),
+            last_outcome = VALUES(last_outcome),
+            updated_at = NOW()
+    """, params)
+
+def _write_isolated(cursor, items: list, write, lead_of, results: Dict[int, Dict]) -> int:
+    """
+    Escribe ``items`` por bloques con ``write(cursor, chunk)``. Si un bloque
+    falla se deshace (SAVEPOINT) y se repite lead a lead; los leads que siguen
+    fallando quedan como ``'error'`` sin afectar al resto del lote.
+
+    Returns:
+        Número de elementos escritos.
+    """
+    written = 0
+    for i in range(0, len(items), RETRY_BATCH_CHUNK):
+        chunk = items[i:i + RETRY_BATCH_CHUNK]
+        cursor.execute("SAVEPOINT retry_chunk")
+        try:
+            write(cursor, chunk)
+            written += len(chunk)
+            continue
+        except Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT retry_chunk")
+            logger.warning(f"Error en bloque de {len(chunk)} reintentos, se repite lead a lead: {e}")
+        for item in chunk:
+            cursor.execute("SAVEPOINT retry_lead")
+            try:
+                write(cursor, [item])
+                written += 1
+            except Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT retry_lead")
+                logger.error(f"Error programando reintento del lead {lead_of(item)}: {e}")
+                results[lead_of(item)] = {'result': 'error'}
+    return written
+
+def schedule_retries_batch(scheduler, batch: Iterable[Tuple[int, str]]) -> Dict[int, Dict]:
+    """
+    Programa (o cierra) los reintentos de muchos leads en una sola transacción.
+
+    Calcula en memoria el siguiente hueco laboral con el calendario del
+    scheduler (el de la región ``leads.delegacion`` si ``regional_calendars``
+    define uno, una vez por región) y escribe con sentencias por conjuntos: un SELECT ... FOR UPDATE
+    de los leads, un UPDATE para los que se reprograman, un UPDATE por razón de
+    cierre para los que agotan intentos, la cancelación de sus pendientes y un
+    INSERT multi-fila con ON DUPLICATE KEY UPDATE sobre call_schedule. Si un
+    bloque falla se repite lead a lead, de modo que un lead problemático sólo
+    marca como ``'error'`` su propio resultado.
+
+    Args:
+        scheduler: ``CallScheduler`` o ``CallSchedulerMultiTimeframes``.
+        batch: Pares ``(lead_id, outcome)``. Si un lead aparece varias veces
+            cuenta como un único intento con el último resultado.
+
+    Returns:
+        Dict lead_id -> ``{'result': 'scheduled' | 'closed' | 'already_closed' |
+        'not_found' | 'error', ...}`` con ``scheduled_at`` y ``attempt_number``
+        para los reprogramados y ``closure_reason`` para los cerrados.
+    """
+    outcomes: Dict[int, str] = {}
+    for lead_id, outcome in batch:
+        if lead_id is None or not isinstance(lead_id, int):
+            logger.error(f"Invalid lead_id: {lead_id}")
+            continue
+        outcomes[lead_id] = str(outcome) if outcome is not None else 'unknown'
+    if not outcomes:
+        return {}
+
+    scheduler._ensure_config_loaded()
+    max_attempts = int(scheduler.config.get('max_attempts', 6) or 6)
+    reschedule_hours = float(scheduler.config.get('reschedule_hours', 30) or 30)
+    closure_reasons = scheduler.config.get('closure_reasons', {}) or {}
+    calendar = scheduler.get_calendar()
+    base_time = datetime.now() + timedelta(hours=reschedule_hours)
+    # Los reintentos de una misma región comparten el mismo hueco laboral
+    region_times: Dict[Optional[str], datetime] = {}
+
+    def scheduled_time_for(region: Optional[str]) -> datetime:
+        if region not in region_times:
+            region_times[region] = calendar.for_region(region).next_working(base_time)
+        return region_times[region]
+
+    results: Dict[int, Dict] = {}
+    conn = get_connection()
+    if not conn:
+        logger.error("No se pudo conectar a la BD")
+        return {lead_id: {'result': 'error'} for lead_id in outcomes}
+
+    try:
+        conn.start_transaction()
+        with conn.cursor(dictionary=True) as cursor:
+            lead_ids = list(outcomes)
+            leads = {}
+            for i in range(0, len(lead_ids), RETRY_BATCH_CHUNK):
+                chunk = lead_ids[i:i + RETRY_BATCH_CHUNK]
+                cursor.execute(f"""
+                    SELECT id, call_attempts_count, lead_status, delegacion
+                    FROM leads
+                    WHERE id IN ({', '.join(['%s'] * len(chunk))})
+                    FOR UPDATE
+                """, chunk)
+                leads.update({row['id']: row for row in cursor.fetchall()})
+
+            to_schedule: List[Tuple[int, int, str, datetime]] = []
+            to_close: Dict[str, List[int]] = {}
+            for lead_id, outcome in outcomes.items():
+                lead = leads.get(lead_id)
+                if not lead:
+                    logger.error(f"Lead {lead_id} no existe en la BD. Abortando retry.")
+                    results[lead_id] = {'result': 'not_found'}
+                    continue
+                if lead['lead_status'] == 'closed':
+                    results[lead_id] = {'result': 'already_closed'}
+                    continue
+                attempts = (lead['call_attempts_count'] or 0) + 1
+                if attempts >= max_attempts:
+                    reason = closure_reason_for(closure_reasons, outcome)
+                    to_close.setdefault(reason, []).append(lead_id)
+                    results[lead_id] = {'result': 'closed', 'closure_reason': reason, 'attempt_number': attempts}
+                else:
+                    scheduled_time = scheduled_time_for(lead['delegacion'])
+                    to_schedule.append((lead_id, attempts, outcome, scheduled_time))
+                    results[lead_id] = {'result': 'scheduled', 'scheduled_at': scheduled_time,
+                                        'attempt_number': attempts}
+
+            # Las filas están bloqueadas: call_attempts_count + 1 == attempts calculado
+            closed = 0
+            for reason, ids in to_close.items():
+                close = lambda cur, chunk, reason=reason: _close_exhausted(cur, reason, chunk)
+                closed += _write_isolated(cursor, ids, close, lambda lead_id: lead_id, results)
+            scheduled = _write_isolated(cursor, to_schedule, _schedule_retries, lambda row: row[0], results)
+
+        conn.commit()
+    except Error as e:
+        logger.error(f"Error programando reintentos para {len(outcomes)} leads: {e}")
+        conn.rollback()
+        return {lead_id: {'result': 'error'} for lead_id in outcomes}
+    finally:
+        conn.close()
+
+    if scheduled or closed:
+        notify_schedule_changed()
+    logger.info(f"[SCHEDULER] Reintentos por lote: {scheduled} reprogramados "
+                f"({', '.join(str(t) for t in sorted(set(region_times.values())))}), "
+                f"{closed} cerrados por máximo de intentos, {len(outcomes) - scheduled - closed} omitidos o con error")
+    return results
+
 class CallScheduler:
     def __init__(self):
         # Initialize with safe defaults - avoid database call in __init__
@@ -36,6 +268,7 @@ class CallScheduler:
             'closure_reasons': {}
         }
         self._config_loaded = False
+        self._calendar = None
     
     def _ensure_config_loaded(self):
         """Carga la configuración si no se ha cargado aún (lazy loading)."""
@@ -46,6 +279,7 @@ class CallScheduler:
                 logger.warning(f"Could not load config from database, using defaults: {e}")
                 # Keep default config if loading fails
             self._config_loaded = True
+            self._calendar = None
     
     def load_config(self) -> Dict:
         """Carga la configuración desde la base de datos."""
@@ -140,257 +374,37 @@ class CallScheduler:
         
         return start, end
     
+    def get_calendar(self) -> WorkingCalendar:
+        """Calendario laboral compilado para la configuración actual."""
+        self._ensure_config_loaded()
+        if self._calendar is None:
+            # Este scheduler solo usa el horario único working_hours_start/end
+            config = {k: v for k, v in self.config.items() if k != 'working_time_slots'}
+            self._calendar = calendar_from_config(config)
+        return self._calendar
+
     def is_working_time(self, dt: datetime) -> bool:
         """Verifica si una fecha/hora está en horario laboral."""
-        self._ensure_config_loaded()
-        # Verificar día de la semana (1=Lunes, 7=Domingo)
-        working_days = self.config.get('working_days', [1, 2, 3, 4, 5]) or [1, 2, 3, 4, 5]
-        
-        # Handle bytearray or string values in working_days list
-        if isinstance(working_days, (list, tuple)):
-            safe_working_days = []
-            for day in working_days:
-                if isinstance(day, bytearray):
-                    day = day.decode('utf-8')
-                try:
-                    safe_working_days.append(int(day))
-                except (ValueError, TypeError):
-                    continue
-            working_days = safe_working_days if safe_working_days else [1, 2, 3, 4, 5]
-        weekday = dt.isoweekday()  # 1=Monday, 7=Sunday
-        
-        if weekday not in working_days:
-            return False
-        
-        # Verificar hora
-        start_hour, end_hour = self.get_working_hours()
-        current_time = dt.time()
-        
-        # Safety checks for hour strings
-        if not start_hour or ':' not in str(start_hour):
-            start_hour = '10:00'
-        if not end_hour or ':' not in str(end_hour):
-            end_hour = '20:00'
-        
-        # Convertir strings de hora a time objects
-        from datetime import time
-        start_time = time(*map(int, start_hour.split(':')))
-        end_time = time(*map(int, end_hour.split(':')))
-        
-        return start_time <= current_time <= end_time
+        return self.get_calendar().is_working(dt)
     
     def find_next_working_slot(self, base_datetime: datetime) -> datetime:
         """Encuentra el siguiente slot en horario laboral."""
-        self._ensure_config_loaded()
-        candidate = base_datetime
-        working_days = self.config.get('working_days', [1, 2, 3, 4, 5]) or [1, 2, 3, 4, 5]
-        
-        # Handle bytearray or string values in working_days list
-        if isinstance(working_days, (list, tuple)):
-            safe_working_days = []
-            for day in working_days:
-                if isinstance(day, bytearray):
-                    day = day.decode('utf-8')
-                try:
-                    safe_working_days.append(int(day))
-                except (ValueError, TypeError):
-                    continue
-            working_days = safe_working_days if safe_working_days else [1, 2, 3, 4, 5]
-            
-        start_hour, _ = self.get_working_hours()
-        
-        # Safety check for start_hour
-        if not start_hour or ':' not in str(start_hour):
-            start_hour = '10:00'
-        
-        # Si ya está en horario laboral, devolverlo
-        if self.is_working_time(candidate):
-            return candidate
-        
-        # Buscar el siguiente día/hora laboral
-        max_iterations = 14  # Máximo 2 semanas
-        iterations = 0
-        
-        while not self.is_working_time(candidate) and iterations < max_iterations:
-            iterations += 1
-            weekday = candidate.isoweekday()
-            
-            if weekday in working_days:
-                # Es día laboral, ajustar solo la hora
-                start_time = datetime.strptime(start_hour, '%H:%M').time()
-                candidate = candidate.replace(
-                    hour=start_time.hour, 
-                    minute=start_time.minute, 
-                    second=0, 
-                    microsecond=0
-                )
-                if self.is_working_time(candidate):
-                    break
-            
-            # Pasar al siguiente día a la hora de inicio
-            candidate = candidate.replace(
-                hour=int(start_hour.split(':')[0]), 
-                minute=int(start_hour.split(':')[1]), 
-                second=0, 
-                microsecond=0
-            ) + timedelta(days=1)
-        
-        return candidate
+        return self.get_calendar().next_working(base_datetime)
     
-    def schedule_retry(self, lead_id: int, outcome: str) -> bool:
-        """
-        Programa un reintento para un lead según el resultado.
-        
-        Args:
-            lead_id: ID del lead
-            outcome: Resultado de la llamada ('no_answer', 'busy', 'hang_up', etc.)
-        
-        Returns:
-            bool: True si se programó correctamente, False si se cerró el lead
-        """
-        # Safety checks for None values
-        if outcome is None:
-            outcome = 'unknown'
-        if not isinstance(outcome, str):
-            outcome = str(outcome) if outcome is not None else 'unknown'
-        
-        conn = get_connection()
-        if not conn:
-            logger.error("No se pudo conectar a la BD")
-            return False
-        
-        try:
-            with conn.cursor(dictionary=True) as cursor:
-                # Obtener información actual del lead
-                # Forzar lectura de la fila real para evitar ID mal calculado
-                cursor.execute("""
-                    SELECT id AS real_id, call_attempts_count, lead_status, telefono, nombre, apellidos
-                    FROM leads 
-                    WHERE id = %s
-                """, (lead_id,))
-                lead = cursor.fetchone()
-                if not lead:
-                    logger.error(f"Lead {lead_id} no existe en la BD. Abortando retry.")
-                    return False
-                # Forzar uso del ID real para evitar lead_id erróneo
-                lead_id = lead['real_id']
-                logger.debug(f"[SCHEDULER] Lead real obtenido: {lead_id} (telefono={lead.get('telefono')})")
-                
-                if lead['lead_status'] == 'closed':
-                    logger.info(f"Lead {lead_id} ya está cerrado")
-                    return False
-                
-                # Incrementar contador de intentos
-                attempts = (lead['call_attempts_count'] or 0) + 1
-                # Ensure config is loaded
-                self._ensure_config_loaded()
-                    
-                max_attempts = int(self.config.get('max_attempts', 6) or 6)
-                
-                # Si alcanzó el máximo de intentos, cerrar el lead
-                if attempts >= max_attempts:
-                    return self._close_lead(cursor, lead_id, outcome, attempts)
-                
-                # Calcular fecha de reprogramación (configurable en horas)
-                reschedule_hours = float(self.config.get('reschedule_hours', 30) or 30)
-                next_attempt_time = datetime.now() + timedelta(hours=reschedule_hours)
-                
-                # Ajustar al siguiente horario laboral
-                scheduled_time = self.find_next_working_slot(next_attempt_time)
-                
-                # Actualizar el lead
-                cursor.execute("""
-                    UPDATE leads SET
-                        call_attempts_count = %s,
-                        last_call_attempt = NOW(),
-                        call_status = 'calling',
-                        updated_at = NOW()
-                    WHERE id = %s
-                """, (attempts, lead_id))
-                
-                # Verificar si ya existe una llamada pendiente para este lead
-                cursor.execute("""
-                    SELECT id FROM call_schedule 
-                    WHERE lead_id = %s AND status = 'pending'
-                    LIMIT 1
-                """, (lead_id,))
-                
-                existing_schedule = cursor.fetchone()
-                
-                if existing_schedule:
-                    # Actualizar la llamada existente
-                    cursor.execute("""
-                        UPDATE call_schedule SET
-                            scheduled_at = %s,
-                            attempt_number = %s,
-                            last_outcome = %s,
-                            updated_at = NOW()
-                        WHERE id = %s
-                    """, (scheduled_time, attempts, outcome, existing_schedule['id']))
-                    logger.info(f"📅 Actualizada llamada programada existente para lead {lead_id}")
-                else:
-                    # Crear nueva llamada programada
-                    cursor.execute("""
-                        INSERT INTO call_schedule 
-                        (lead_id, scheduled_at, attempt_number, status, last_outcome)
-                        VALUES (%s, %s, %s, 'pending', %s)
-                    """, (lead_id, scheduled_time, attempts, outcome))
-                    logger.info(f"📅 Nueva llamada programada creada para lead {lead_id}")
+    def schedule_retries(self, batch: Iterable[Tuple[int, str]]) -> Dict[int, Dict]:
+        """Programa los reintentos de un lote de ``(lead_id, outcome)``. Ver ``schedule_retries_batch``."""
+        return schedule_retries_batch(self, batch)
 
-                conn.commit()
-                logger.debug(f"[SCHEDULER] call_schedule upsert para lead {lead_id}: scheduled_at={scheduled_time}, intento={attempts}")
-                
-                logger.info(f"Lead {lead_id} ({lead['nombre'] or ''} {lead['apellidos'] or ''}) "
-                           f"reprogramado para {scheduled_time} (intento {attempts}/{max_attempts})")
-                
-                return True
-                
-        except Error as e:
-            logger.error(f"Error programando reintento para lead {lead_id}: {e}")
-            if conn:
-                conn.rollback()
-            return False
-        finally:
-            conn.close()
-    
-    def _close_lead(self, cursor, lead_id: int, outcome: str, attempts: int) -> bool:
-        """Cierra un lead después del máximo de intentos."""
-        self._ensure_config_loaded()
-        closure_reasons = self.config.get('closure_reasons', {}) or {}
-        
-        # Determinar razón de cierre según el outcome
-        if outcome == 'no_answer':
-            closure_reason = closure_reasons.get('no_answer', 'Ilocalizable')
-        elif outcome == 'hang_up':
-            closure_reason = closure_reasons.get('hang_up', 'No colabora')
-        elif outcome in ['invalid_phone', 'error']:
-            closure_reason = closure_reasons.get('invalid_phone', 'Telefono erroneo')
-        else:
-            closure_reason = 'Ilocalizable'  # Por defecto
-        
-        # Actualizar el lead como cerrado
-        cursor.execute("""
-            UPDATE leads SET
-                lead_status = 'closed',
-                closure_reason = %s,
-                call_attempts_count = %s,
-                call_status = 'completed',
-                last_call_attempt = NOW(),
-                updated_at = NOW()
-            WHERE id = %s
-        """, (closure_reason, attempts, lead_id))
-        
-        # Cancelar llamadas pendientes en call_schedule
-        cursor.execute("""
-            UPDATE call_schedule SET
-                status = 'cancelled',
-                updated_at = NOW()
-            WHERE lead_id = %s AND status = 'pending'
-        """, (lead_id,))
-        
-        logger.info(f"Lead {lead_id} CERRADO después de {attempts} intentos. "
-                   f"Razón: {closure_reason}")
-        
+    def schedule_retry(self, lead_id: int, outcome: str) -> bool:
+        """Programa un reintento para una llamada fallida. True si se reprogramó, False si se cerró."""
+        result = self.schedule_retries([(lead_id, outcome)]).get(lead_id, {})
+        if result.get('result') == 'scheduled':
+            logger.info(f"Lead {lead_id} reprogramado para {result['scheduled_at']} "
+                        f"(intento {result['attempt_number']})")
+            return True
+        if result.get('result') == 'closed':
+            logger.info(f"Lead {lead_id} CERRADO después de {result['attempt_number']} intentos. "
+                        f"Razón: {result['closure_reason']}")
         return False
     
     def get_pending_calls(self, limit: int = 50) -> List[Dict]:
@@ -565,6 +579,14 @@ def schedule_failed_call(lead_id: int, outcome: str) -> bool:
         logger.error(f"Error in schedule_failed_call for lead {lead_id}: {e}")
         return False
 
+def schedule_failed_calls(batch: Iterable[Tuple[int, str]]) -> Dict[int, Dict]:
+    """Función de conveniencia para programar un lote de llamadas fallidas."""
+    try:
+        return CallScheduler().schedule_retries(batch)
+    except Exception as e:
+        logger.error(f"Error in schedule_failed_calls: {e}")
+        return {}
+
 def get_next_scheduled_calls(limit: int = 10) -> List[Dict]:
     """Función de conveniencia para obtener próximas llamadas."""
     scheduler = CallScheduler()
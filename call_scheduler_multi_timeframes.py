@@ -14,11 +14,13 @@ Ejemplos de uso:
 
 import mysql.connector
 from mysql.connector import Error
-from datetime import datetime, timedelta, time
+from datetime import datetime, time
 import logging
 from db import get_connection
+from call_scheduler import schedule_retries_batch
+from working_calendar import WorkingCalendar, calendar_from_config
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +35,7 @@ class CallSchedulerMultiTimeframes:
             'closure_reasons': {}
         }
         self._config_loaded = False
+        self._calendar = None
 
     def _ensure_config_loaded(self):
         """Carga la configuración si no se ha cargado aún (lazy loading)."""
@@ -42,6 +45,7 @@ class CallSchedulerMultiTimeframes:
             except Exception as e:
                 logger.warning(f"Could not load config from database, using defaults: {e}")
             self._config_loaded = True
+            self._calendar = None
 
     def load_config(self) -> Dict:
         """Carga la configuración desde la base de datos con soporte para múltiples formatos."""
@@ -187,222 +191,42 @@ class CallSchedulerMultiTimeframes:
             # Fallback seguro
             return '10:00', '20:00'
 
-    def is_working_time(self, dt: datetime) -> bool:
-        """Verifica si una fecha/hora está en alguna de las franjas laborales."""
+    def get_calendar(self) -> WorkingCalendar:
+        """Calendario laboral compilado (franjas, días, festivos) para la configuración actual."""
         self._ensure_config_loaded()
+        if self._calendar is None:
+            self._calendar = calendar_from_config(self.config)
+        return self._calendar
 
-        # Verificar día de la semana
-        working_days = self.config.get('working_days', [1, 2, 3, 4, 5])
-        weekday = dt.isoweekday()  # 1=Monday, 7=Sunday
-
-        if weekday not in working_days:
-            return False
-
-        # Verificar si está en alguna franja horaria
-        current_time = dt.time()
-        time_slots = self.get_working_time_slots()
-
-        for slot in time_slots:
-            start_time = time(*map(int, slot['start'].split(':')))
-            end_time = time(*map(int, slot['end'].split(':')))
-
-            # Manejar franjas que cruzan medianoche (ej: 22:00-06:00)
-            if start_time <= end_time:
-                # Franja normal (ej: 09:00-17:00)
-                if start_time <= current_time <= end_time:
-                    return True
-            else:
-                # Franja que cruza medianoche (ej: 22:00-06:00)
-                if current_time >= start_time or current_time <= end_time:
-                    return True
-
-        return False
+    def is_working_time(self, dt: datetime) -> bool:
+        """Verifica si una fecha/hora está en alguna de las franjas laborales."""
+        return self.get_calendar().is_working(dt)
 
     def find_next_working_slot(self, base_datetime: datetime) -> datetime:
         """Encuentra el siguiente slot en horario laboral considerando múltiples franjas."""
-        self._ensure_config_loaded()
-
-        if self.is_working_time(base_datetime):
-            return base_datetime
-
-        candidate = base_datetime
-        working_days = self.config.get('working_days', [1, 2, 3, 4, 5])
-        time_slots = self.get_working_time_slots()
-
-        # Buscar hasta 14 días en el futuro
-        for day_offset in range(14):
-            test_date = (candidate + timedelta(days=day_offset)).date()
-            test_weekday = test_date.isoweekday()
-
-            if test_weekday in working_days:
-                # Buscar la primera franja disponible en este día
-                for slot in time_slots:
-                    slot_start_time = time(*map(int, slot['start'].split(':')))
-                    slot_datetime = datetime.combine(test_date, slot_start_time)
-
-                    # Si es el mismo día, debe ser posterior a la hora base
-                    if day_offset == 0 and slot_datetime <= candidate:
-                        continue
-
-                    if self.is_working_time(slot_datetime):
-                        return slot_datetime
-
-        # Fallback: usar primera franja del primer día laboral
-        return candidate + timedelta(days=1)
+        return self.get_calendar().next_working(base_datetime)
 
     def get_current_working_slot_info(self, dt: datetime) -> Optional[Dict[str, str]]:
         """Obtiene información de la franja actual si está en horario laboral."""
-        if not self.is_working_time(dt):
-            return None
-
-        current_time = dt.time()
-        time_slots = self.get_working_time_slots()
-
-        for slot in time_slots:
-            start_time = time(*map(int, slot['start'].split(':')))
-            end_time = time(*map(int, slot['end'].split(':')))
-
-            if start_time <= end_time:
-                if start_time <= current_time <= end_time:
-                    return slot
-            else:
-                if current_time >= start_time or current_time <= end_time:
-                    return slot
+        return self.get_calendar().current_slot(dt)
 
-        return None
+    def schedule_retries(self, batch: Iterable[Tuple[int, str]]) -> Dict[int, Dict]:
+        """Programa los reintentos de un lote de ``(lead_id, outcome)`` en una sola transacción."""
+        return schedule_retries_batch(self, batch)
 
     def schedule_retry(self, lead_id: int, outcome: str) -> bool:
         """Programa un reintento considerando múltiples franjas horarias."""
-        if outcome is None:
-            outcome = 'unknown'
-        if not isinstance(outcome, str):
-            outcome = str(outcome) if outcome is not None else 'unknown'
-
-        conn = get_connection()
-        if not conn:
-            logger.error("No se pudo conectar a la BD")
-            return False
-
-        try:
-            with conn.cursor(dictionary=True) as cursor:
-                # Obtener información del lead
-                cursor.execute("""
-                    SELECT id AS real_id, call_attempts_count, lead_status, telefono, nombre, apellidos
-                    FROM leads
-                    WHERE id = %s
-                """, (lead_id,))
-                lead = cursor.fetchone()
-
-                if not lead:
-                    logger.error(f"Lead {lead_id} no existe en la BD")
-                    return False
-
-                lead_id = lead['real_id']
-
-                if lead['lead_status'] == 'closed':
-                    logger.info(f"Lead {lead_id} ya está cerrado")
-                    return False
-
-                # Incrementar contador e verificar máximo
-                attempts = (lead['call_attempts_count'] or 0) + 1
-                self._ensure_config_loaded()
-                max_attempts = int(self.config.get('max_attempts', 6) or 6)
-
-                if attempts >= max_attempts:
-                    return self._close_lead(cursor, lead_id, outcome, attempts)
-
-                # Calcular próxima fecha considerando múltiples franjas
-                reschedule_hours = float(self.config.get('reschedule_hours', 30) or 30)
-                next_attempt_time = datetime.now() + timedelta(hours=reschedule_hours)
-                scheduled_time = self.find_next_working_slot(next_attempt_time)
-
-                # Actualizar lead
-                cursor.execute("""
-                    UPDATE leads SET
-                        call_attempts_count = %s,
-                        last_call_attempt = NOW(),
-                        call_status = 'calling',
-                        updated_at = NOW()
-                    WHERE id = %s
-                """, (attempts, lead_id))
-
-                # Gestionar call_schedule
-                cursor.execute("""
-                    SELECT id FROM call_schedule
-                    WHERE lead_id = %s AND status = 'pending'
-                    LIMIT 1
-                """, (lead_id,))
-
-                existing_schedule = cursor.fetchone()
-
-                if existing_schedule:
-                    cursor.execute("""
-                        UPDATE call_schedule SET
-                            scheduled_at = %s,
-                            attempt_number = %s,
-                            last_outcome = %s,
-                            updated_at = NOW()
-                        WHERE id = %s
-                    """, (scheduled_time, attempts, outcome, existing_schedule['id']))
-                else:
-                    cursor.execute("""
-                        INSERT INTO call_schedule
-                        (lead_id, scheduled_at, attempt_number, status, last_outcome)
-                        VALUES (%s, %s, %s, 'pending', %s)
-                    """, (lead_id, scheduled_time, attempts, outcome))
-
-                conn.commit()
-
-                # Log con información de franja
-                slot_info = self.get_current_working_slot_info(scheduled_time)
-                slot_desc = f"franja {slot_info['start']}-{slot_info['end']}" if slot_info else "fuera de franjas"
-
-                logger.info(f"Lead {lead_id} ({lead['nombre'] or ''}) reprogramado para "
-                           f"{scheduled_time} ({slot_desc}) - intento {attempts}/{max_attempts}")
-
-                return True
-
-        except Error as e:
-            logger.error(f"Error programando reintento para lead {lead_id}: {e}")
-            if conn:
-                conn.rollback()
-            return False
-        finally:
-            conn.close()
-
-    def _close_lead(self, cursor, lead_id: int, outcome: str, attempts: int) -> bool:
-        """Cierra un lead después del máximo de intentos."""
-        self._ensure_config_loaded()
-        closure_reasons = self.config.get('closure_reasons', {}) or {}
-
-        if outcome == 'no_answer':
-            closure_reason = closure_reasons.get('no_answer', 'Ilocalizable')
-        elif outcome == 'hang_up':
-            closure_reason = closure_reasons.get('hang_up', 'No colabora')
-        elif outcome in ['invalid_phone', 'error']:
-            closure_reason = closure_reasons.get('invalid_phone', 'Telefono erroneo')
-        else:
-            closure_reason = 'Ilocalizable'
-
-        cursor.execute("""
-            UPDATE leads SET
-                lead_status = 'closed',
-                closure_reason = %s,
-                call_attempts_count = %s,
-                call_status = 'completed',
-                last_call_attempt = NOW(),
-                updated_at = NOW()
-            WHERE id = %s
-        """, (closure_reason, attempts, lead_id))
-
-        cursor.execute("""
-            UPDATE call_schedule SET
-                status = 'cancelled',
-                updated_at = NOW()
-            WHERE lead_id = %s AND status = 'pending'
-        """, (lead_id,))
-
-        logger.info(f"Lead {lead_id} CERRADO después de {attempts} intentos. Razón: {closure_reason}")
+        result = self.schedule_retries([(lead_id, outcome)]).get(lead_id, {})
+        if result.get('result') == 'scheduled':
+            scheduled_time = result['scheduled_at']
+            slot_info = self.get_current_working_slot_info(scheduled_time)
+            slot_desc = f"franja {slot_info['start']}-{slot_info['end']}" if slot_info else "fuera de franjas"
+            logger.info(f"Lead {lead_id} reprogramado para {scheduled_time} ({slot_desc}) - "
+                        f"intento {result['attempt_number']}")
+            return True
+        if result.get('result') == 'closed':
+            logger.info(f"Lead {lead_id} CERRADO después de {result['attempt_number']} intentos. "
+                        f"Razón: {result['closure_reason']}")
         return False
 
 # Mantener compatibilidad con el scheduler anterior
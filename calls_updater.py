@@ -6,12 +6,15 @@ Este script se ejecuta en segundo plano para sincronizar la base de datos local
 import os
 import logging
 import json
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 import time
 from dotenv import load_dotenv
 
 from db import get_connection
+from lead_lookup import normalize_phone, find_lead_id_by_phone, map_phones_to_lead_ids
 from pearl_caller import get_pearl_client, PearlAPIError
+from pearl_async import fetch_call_statuses
+from pearl_sync import sync_outbound_calls
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +23,9 @@ logger = logging.getLogger(__name__)
 # Cargar variables de entorno
 load_dotenv()
 
+# Registros básicos que se concilian por ciclo (detalles pedidos en paralelo)
+BASIC_RECORDS_BATCH = int(os.getenv('PEARL_RECONCILE_BATCH', 200))
+
 def insert_call_record(cursor, call_details: dict, lead_id: int, outbound_id: str) -> bool:
     """
     Inserta un registro detallado de la llamada en la tabla pearl_calls.
@@ -140,36 +146,11 @@ def update_call_record(cursor, call_details: dict, lead_id: int, outbound_id: st
         logger.error(f"❌ Error actualizando registro de llamada {call_details.get('id')}: {e}")
         return False
 
-def get_last_sync_time(db_conn) -> datetime:
-    """
-    Obtiene la marca de tiempo de la última llamada actualizada en la base de datos.
-    Si no hay ninguna, devuelve una fecha por defecto (24 horas atrás).
-    """
-    try:
-        cursor = db_conn.cursor(dictionary=True)
-        # Buscamos el call_time más reciente que no sea nulo en la tabla correcta (pearl_calls)
-        cursor.execute("SELECT MAX(call_time) as last_call FROM pearl_calls WHERE call_time IS NOT NULL")
-        result = cursor.fetchone()
-        cursor.close()
-        
-        if result and result['last_call']:
-            # Asegurarse de que la fecha tenga timezone para la comparación
-            return result['last_call'].replace(tzinfo=timezone.utc)
-        else:
-            # Si no hay llamadas, empezamos desde hace 7 días para asegurar que capturamos todas
-            logger.info("No se encontró una última sincronización. Se usarán los últimos 7 días.")
-            return datetime.now(timezone.utc) - timedelta(days=7)
-    except Exception as e:
-        logger.error(f"Error al obtener el último tiempo de sincronización: {e}")
-        # Fallback seguro en caso de error
-        return datetime.now(timezone.utc) - timedelta(days=7)
-
 def complete_basic_call_records():
     """Completa los registros basicos de pearl_calls con detalles completos de Pearl AI"""
     logger.info("[BASIC_RECORDS] Completando registros basicos con detalles de Pearl AI...")
 
     try:
-        pearl_client = get_pearl_client()
         db_conn = get_connection()
         cursor = db_conn.cursor()
 
@@ -186,8 +167,9 @@ def complete_basic_call_records():
             AND status != 'invalid_call_id'
             AND created_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
             AND created_at <= DATE_SUB(NOW(), INTERVAL 2 MINUTE)
-            LIMIT 20
-        """)
+            ORDER BY created_at
+            LIMIT %s
+        """, (BASIC_RECORDS_BATCH,))
 
         basic_records = cursor.fetchall()
 
@@ -195,14 +177,19 @@ def complete_basic_call_records():
             logger.info("[BASIC_RECORDS] No hay registros basicos para completar")
             return 0
 
+        # Obtener detalles completos de Pearl AI en paralelo para todo el lote
+        logger.info(f"[BASIC_RECORDS] Consultando {len(basic_records)} llamadas en Pearl AI...")
+        details_by_call = fetch_call_statuses([record[1] for record in basic_records])
+
         completed = 0
 
         for record_id, call_id, lead_id, phone_number, outbound_id, created_at in basic_records:
             try:
                 logger.info(f"[BASIC_RECORDS] Completando call_id: {call_id}")
 
-                # Obtener detalles completos de Pearl AI
-                call_details = pearl_client.get_call_status(call_id)
+                call_details = details_by_call.get(call_id)
+                if isinstance(call_details, Exception):
+                    raise call_details
 
                 if call_details:
                     # Actualizar registro existente con detalles completos
@@ -242,8 +229,128 @@ def complete_basic_call_records():
         logger.error(f"[BASIC_RECORDS] Error completando registros basicos: {e}")
         return 0
 
+def resolve_call_leads(cursor, calls: list) -> dict:
+    """Mapa teléfono normalizado -> lead_id para todas las llamadas del lote, en una consulta."""
+    return map_phones_to_lead_ids(cursor, [call.get('to') for call in calls if call.get('to')])
+
+def _scheduler_integration():
+    """``enhanced_process_call_result`` o None si la integración con el scheduler no está disponible."""
+    try:
+        from call_manager_scheduler_integration import enhanced_process_call_result
+    except ImportError:
+        logger.warning("⚠️ Módulo de integración scheduler no disponible, usando método básico")
+        return None
+    return enhanced_process_call_result
+
+def process_pearl_call(cursor, call_details: dict, outbound_id: str, lead_ids: dict = None) -> bool:
+    """
+    Aplica una llamada de Pearl dentro de la transacción de la página: registro
+    en pearl_calls (y, sin integración con el scheduler, resultado en el lead).
+    El paso por el scheduler se hace en ``apply_pearl_call_results`` una vez
+    confirmada la página.
+
+    Si se pasa ``lead_ids`` (ver ``resolve_call_leads``), el lead se toma del
+    mapa precargado en lugar de consultarlo por teléfono.
+
+    Returns:
+        True si se aplicó; False si se omitió (sin teléfono o sin lead asociado).
+    """
+    # Buscar lead_id por teléfono en lugar de por campo 'orden'
+    phone_number = call_details.get('to')
+    if not phone_number:
+        logger.debug(f"Llamada con ID {call_details.get('id')} no tiene teléfono. Se omite.")
+        return False
+
+    # Normalizar teléfono igual que la columna indexada telefono_norm
+    phone_normalized = normalize_phone(phone_number)
+
+    # Buscar el lead por teléfono normalizado
+    if lead_ids is not None:
+        lead_id = lead_ids.get(phone_normalized)
+    else:
+        lead_id = find_lead_id_by_phone(cursor, phone_normalized, include_secondary=False)
+
+    if not lead_id:
+        logger.debug(f"No se encontró lead para el teléfono {phone_number} (normalizado: {phone_normalized}) en llamada {call_details.get('id')}. Se omite.")
+        return False
+
+    logger.debug(f"📞 Procesando llamada {call_details.get('id')} para lead {lead_id} (teléfono: {phone_number} -> {phone_normalized})")
+
+    # 1. INSERTAR/ACTUALIZAR EN PEARL_CALLS (registro detallado)
+    call_inserted = insert_call_record(cursor, call_details, lead_id, outbound_id)
+
+    # 2. EL RESULTADO SE PROCESA CON EL SCHEDULER TRAS CONFIRMAR LA PÁGINA
+    if _scheduler_integration() is not None:
+        return True
+
+    # Fallback al método original
+    update_data = {
+        'call_id': call_details.get('id'),
+        'call_time': convert_pearl_datetime(call_details.get('startTime')),
+        'call_status': str(call_details.get('status', ''))[:50],
+        'call_duration': call_details.get('duration'),
+        'call_summary': call_details.get('summary', {}).get('text') if isinstance(call_details.get('summary'), dict) else call_details.get('summary'),
+        'call_recording_url': call_details.get('recordingUrl'),
+        'pearl_call_response': json.dumps(call_details) if call_details else '',
+        'updated_at': datetime.now()
+    }
+
+    update_fields = {k: v for k, v in update_data.items() if v is not None}
+
+    if update_fields:
+        set_clause = ", ".join([f"{key} = %s" for key in update_fields.keys()])
+        sql = f"UPDATE leads SET {set_clause} WHERE id = %s"
+        params = list(update_fields.values()) + [lead_id]
+        cursor.execute(sql, tuple(params))
+
+    if cursor.rowcount > 0 or call_inserted:
+        status_msg = "✅ COMPLETO" if call_inserted else "⚠️ PARCIAL (solo leads)"
+        logger.debug(f"{status_msg} - Lead {lead_id} procesado con llamada {call_details.get('id')}")
+        return True
+    return False
+
+def apply_pearl_call_results(calls: list, lead_ids: dict):
+    """
+    Procesa con la integración del scheduler las llamadas ya confirmadas en
+    pearl_calls. ``lead_ids`` es el mapa de ``resolve_call_leads`` de la página.
+    """
+    enhanced_process_call_result = _scheduler_integration()
+    if enhanced_process_call_result is None:
+        return
+
+    # Las reprogramaciones de la página se aplican juntas al final
+    reschedule = []
+    for call_details in calls:
+        lead_id = (lead_ids or {}).get(normalize_phone(call_details.get('to')))
+        if not lead_id:
+            continue
+
+        # Mapear el resultado de Pearl AI al formato esperado por enhanced_process_call_result
+        pearl_status = call_details.get('status')
+        call_result = {
+            'success': pearl_status == 4,  # 4 = Completed/Success
+            'status': map_pearl_status_to_result(0, pearl_status),
+            'duration': call_details.get('duration') or 0,
+            'error_message': get_error_message_from_pearl_status(0, pearl_status),
+            'lead_id': lead_id,
+            'phone_number': call_details.get('to') or ''
+        }
+
+        try:
+            enhanced_process_call_result(lead_id, call_result, call_details, reschedule=reschedule)
+            logger.debug(f"✅ COMPLETO - Lead {lead_id} procesado con scheduler integration para llamada {call_details.get('id')}")
+        except Exception as e:
+            logger.error(f"❌ Error en integración scheduler para lead {lead_id}: {e}")
+
+    if reschedule:
+        from call_manager_scheduler_integration import reschedule_failed_calls
+        reschedule_failed_calls(reschedule)
+
 def update_calls_from_pearl():
-    """Función principal que se encarga de obtener y actualizar las llamadas."""
+    """
+    Función principal que se encarga de obtener y actualizar las llamadas.
+    La sincronización es incremental por outbound (ver pearl_sync.py).
+    """
     logger.info("[PEARL_SYNC] Iniciando ciclo de actualización de llamadas de Pearl AI...")
 
     # 1. Primero completar registros básicos creados por call_manager
@@ -266,164 +373,17 @@ def update_calls_from_pearl():
             logger.error("No se pudo establecer conexión con la base de datos.")
             return
 
-        # 1. Determinar el rango de fechas para la búsqueda
-        from_date_dt = get_last_sync_time(db_conn)
-        to_date_dt = datetime.now(timezone.utc)
-
-        # Formato para la API de Pearl (ISO 8601 con 'Z' para UTC)
-        from_date_str = from_date_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        to_date_str = to_date_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-        # 2. Obtener llamadas de la API de Pearl (con paginación)
-        logger.info(f"Buscando llamadas para outbound {outbound_id} desde {from_date_str} hasta {to_date_str}")
-        all_calls = []
-        skip = 0
-        limit = 100  # Máximo permitido por Pearl AI
-        
-        while True:
-            try:
-                # Obtener página de llamadas
-                response_data = pearl_client.search_calls_paginated(outbound_id, from_date_str, to_date_str, skip, limit)
-                
-                if isinstance(response_data, dict):
-                    total_count = response_data.get('count', 0)
-                    page_calls = response_data.get('results', [])
-                else:
-                    page_calls = response_data if isinstance(response_data, list) else []
-                    total_count = len(page_calls)
-                
-                if not page_calls:
-                    break
-                    
-                all_calls.extend(page_calls)
-                logger.info(f"Obtenidas {len(page_calls)} llamadas (página {skip//limit + 1}). Total: {len(all_calls)}/{total_count}")
-                
-                # Si obtenimos menos del límite, es la última página
-                if len(page_calls) < limit:
-                    break
-                    
-                skip += limit
-                
-                # Seguridad: no más de 20 páginas (2000 llamadas)
-                if skip >= 2000:
-                    logger.warning("Límite de paginación alcanzado (2000 llamadas)")
-                    break
-                    
-            except PearlAPIError as e:
-                logger.error(f"Error al buscar llamadas en la API de Pearl (skip={skip}): {e}")
-                break
-
-        calls = all_calls
-        if not calls:
-            logger.info("No se encontraron nuevas llamadas para actualizar.")
-            return
-
-        # 3. Actualizar la base de datos con las llamadas obtenidas
-        logger.info(f"✅ Encontradas {len(calls)} llamadas. Procesando...")
-        updated_count = 0
-        cursor = db_conn.cursor()
-
-        for call_item in calls:
-            call_details = None
-            lead_id = None
-            try:
-                # Si la API devuelve solo IDs, obtenemos los detalles completos
-                if isinstance(call_item, str):
-                    logger.info(f"Elemento es un ID de llamada ('{call_item}'). Obteniendo detalles...")
-                    call_details = pearl_client.get_call_status(call_item)
-                elif isinstance(call_item, dict):
-                    call_details = call_item
-                else:
-                    logger.warning(f"Elemento desconocido en la respuesta de la API: {call_item}")
-                    continue
-
-                if not call_details:
-                    logger.warning(f"No se pudieron obtener detalles para la llamada: {call_item}")
-                    continue
-
-                # Buscar lead_id por teléfono en lugar de por campo 'orden'
-                phone_number = call_details.get('to')
-                if not phone_number:
-                    logger.debug(f"Llamada con ID {call_details.get('id')} no tiene teléfono. Se omite.")
-                    continue
-                
-                # Normalizar teléfono: quitar +34 y espacios para buscar en BD
-                phone_normalized = phone_number.replace('+34', '').replace(' ', '').replace('-', '')
-                
-                # Buscar el lead por teléfono normalizado
-                cursor.execute("SELECT id FROM leads WHERE telefono = %s LIMIT 1", (phone_normalized,))
-                lead_result = cursor.fetchone()
-                
-                if not lead_result:
-                    logger.debug(f"No se encontró lead para el teléfono {phone_number} (normalizado: {phone_normalized}) en llamada {call_details.get('id')}. Se omite.")
-                    continue
-                    
-                lead_id = lead_result[0]
-                logger.debug(f"📞 Procesando llamada {call_details.get('id')} para lead {lead_id} (teléfono: {phone_number} -> {phone_normalized})")
-
-                # 1. INSERTAR/ACTUALIZAR EN PEARL_CALLS (registro detallado)
-                call_inserted = insert_call_record(cursor, call_details, lead_id, outbound_id)
-                
-                # 2. PROCESAR RESULTADO CON EL SCHEDULER INTEGRADO
-                try:
-                    from call_manager_scheduler_integration import enhanced_process_call_result
-                    
-                    # Mapear el resultado de Pearl AI al formato esperado por enhanced_process_call_result
-                    pearl_status = call_details.get('status')
-                    call_result = {
-                        'success': pearl_status == 4,  # 4 = Completed/Success
-                        'status': map_pearl_status_to_result(0, pearl_status),
-                        'duration': call_details.get('duration') or 0,
-                        'error_message': get_error_message_from_pearl_status(0, pearl_status),
-                        'lead_id': lead_id,
-                        'phone_number': call_details.get('to') or ''
-                    }
-                    
-                    # Procesar el resultado con la integración del scheduler
-                    enhanced_process_call_result(lead_id, call_result, call_details)
-                    
-                    updated_count += 1
-                    logger.debug(f"✅ COMPLETO - Lead {lead_id} procesado con scheduler integration para llamada {call_details.get('id')}")
-                    
-                except ImportError:
-                    logger.warning("⚠️ Módulo de integración scheduler no disponible, usando método básico")
-                    
-                    # Fallback al método original
-                    update_data = {
-                        'call_id': call_details.get('id'),
-                        'call_time': convert_pearl_datetime(call_details.get('startTime')),
-                        'call_status': str(call_details.get('status', ''))[:50],
-                        'call_duration': call_details.get('duration'),
-                        'call_summary': call_details.get('summary', {}).get('text') if isinstance(call_details.get('summary'), dict) else call_details.get('summary'),
-                        'call_recording_url': call_details.get('recordingUrl'),
-                        'pearl_call_response': json.dumps(call_details) if call_details else '',
-                        'updated_at': datetime.now()
-                    }
-
-                    update_fields = {k: v for k, v in update_data.items() if v is not None}
-                    
-                    if update_fields:
-                        set_clause = ", ".join([f"{key} = %s" for key in update_fields.keys()])
-                        sql = f"UPDATE leads SET {set_clause} WHERE id = %s"
-                        params = list(update_fields.values()) + [lead_id]
-                        cursor.execute(sql, tuple(params))
-                        
-                    if cursor.rowcount > 0 or call_inserted:
-                        updated_count += 1
-                        status_msg = "✅ COMPLETO" if call_inserted else "⚠️ PARCIAL (solo leads)"
-                        logger.debug(f"{status_msg} - Lead {lead_id} procesado con llamada {call_details.get('id')}")
-                        
-                except Exception as e:
-                    logger.error(f"❌ Error en integración scheduler para lead {lead_id}: {e}")
-                    # Continuar con el procesamiento básico en caso de error
-
-            except Exception as e:
-                call_id_log = call_details.get('id') if call_details else call_item
-                logger.error(f"Error procesando la llamada {call_id_log} para el lead {lead_id}: {e}")
-
-        db_conn.commit()
-        cursor.close()
-        logger.info(f"✅ Proceso de actualización finalizado. {updated_count} leads actualizados de {len(calls)} llamadas recibidas.")
+        # 2. Sincronizar solo las llamadas nuevas o modificadas desde la marca de agua
+        stats = sync_outbound_calls(
+            db_conn, pearl_client, outbound_id,
+            lambda cursor, call_details, lead_ids: process_pearl_call(cursor, call_details, outbound_id, lead_ids),
+            prepare_page=resolve_call_leads,
+            after_commit=apply_pearl_call_results
+        )
+
+        logger.info(f"✅ Proceso de actualización finalizado. {stats['processed']} leads actualizados de "
+                    f"{stats['received']} llamadas recibidas ({stats['unchanged']} sin cambios, "
+                    f"{stats['skipped']} sin lead, {stats['errors']} con error).")
 
     except Exception as e:
         logger.error(f"Error inesperado en el proceso de actualización de llamadas: {e}")
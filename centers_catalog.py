@@ -0,0 +1,261 @@
+"""
+Catálogo de centros (áreas) de TuoTempo con caché e índices.
+
+El catálogo completo se descarga de ``GET /{instance}/areas`` como mucho una vez
+cada ``CENTERS_CACHE_TTL`` segundos (petición condicional con ETag /
+Last-Modified cuando TuoTempo los devuelve) y se guarda también en disco, de
+modo que un reinicio no obliga a descargarlo de nuevo. Sobre la lista en
+memoria se mantienen índices por código postal, provincia, ciudad y areaid,
+así que las búsquedas no hacen ninguna petición ni recorren la lista entera.
+
+Si una recarga falla se sigue sirviendo la última copia disponible.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from tuotempo_api_logger import log_requests_call
+
+# Cargar variables de entorno
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TUOTEMPO_BASE_URL = "https://app.tuotempo.com/api/v3"
+CENTERS_CACHE_TTL = int(os.getenv('CENTERS_CACHE_TTL', 6 * 3600))  # segundos
+CENTERS_CACHE_DIR = os.getenv('CENTERS_CACHE_DIR', tempfile.gettempdir())
+
+
+def extract_areas(data: Any) -> List[Dict]:
+    """Extrae la lista de áreas de los distintos formatos de respuesta de /areas."""
+    areas = []
+    if isinstance(data, dict):
+        if "return" in data:
+            ret_data = data["return"]
+            if isinstance(ret_data, dict) and "results" in ret_data:
+                results = ret_data["results"]
+                if isinstance(results, dict) and "areas" in results:
+                    areas = results["areas"]
+                elif isinstance(results, list):
+                    areas = results
+            elif isinstance(ret_data, list):
+                areas = ret_data
+        elif "results" in data:
+            results = data["results"]
+            if isinstance(results, dict) and "areas" in results:
+                areas = results["areas"]
+            elif isinstance(results, list):
+                areas = results
+        elif "areas" in data:
+            areas = data["areas"]
+    elif isinstance(data, list):
+        areas = data
+    if not isinstance(areas, list):
+        return []
+    return [area for area in areas if isinstance(area, dict)]
+
+
+def normalize_key(value: Any) -> str:
+    """Clave de índice: sin espacios sobrantes, minúsculas y sin tildes."""
+    text = unicodedata.normalize('NFKD', str(value or '').strip().casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def normalize_cp(value: Any) -> str:
+    """Código postal de 5 dígitos (recupera el cero inicial perdido en Excel)."""
+    cp = str(value or '').strip()
+    if cp.endswith('.0'):
+        cp = cp[:-2]
+    return cp.zfill(5) if cp.isdigit() and len(cp) < 5 else cp
+
+
+class CentersCatalog:
+    """Catálogo de centros con caché en memoria y en disco e índices de búsqueda."""
+
+    def __init__(self, instance_id: Optional[str] = None, lang: str = 'es',
+                 ttl: int = CENTERS_CACHE_TTL, cache_dir: str = CENTERS_CACHE_DIR):
+        self.instance_id = instance_id or os.getenv("TUOTEMPO_INSTANCE_ID", "tt_portal_adeslas")
+        self.lang = lang
+        self.ttl = ttl
+        self.cache_path = os.path.join(cache_dir, f"tuotempo_centers_{self.instance_id}_{lang}.json")
+
+        self._lock = threading.Lock()
+        self._centers: List[Dict] = []
+        self._by_areaid: Dict[str, Dict] = {}
+        self._by_cp: Dict[str, List[Dict]] = {}
+        self._by_province: Dict[str, List[Dict]] = {}
+        self._by_city: Dict[str, List[Dict]] = {}
+        self._fetched_at = 0.0
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._metrics = {'refreshes': 0, 'not_modified': 0, 'refresh_errors': 0, 'disk_loads': 0}
+
+        self._load_from_disk()
+
+    # --- Carga y recarga ---
+
+    def _index(self, centers: List[Dict]):
+        by_areaid, by_cp, by_province, by_city = {}, {}, {}, {}
+        for center in centers:
+            if center.get('areaid'):
+                by_areaid[str(center['areaid'])] = center
+            by_cp.setdefault(normalize_cp(center.get('cp')), []).append(center)
+            by_province.setdefault(normalize_key(center.get('province')), []).append(center)
+            by_city.setdefault(normalize_key(center.get('city')), []).append(center)
+        self._centers = centers
+        self._by_areaid, self._by_cp = by_areaid, by_cp
+        self._by_province, self._by_city = by_province, by_city
+
+    def _load_from_disk(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._index(cached.get('centers', []))
+            self._fetched_at = float(cached.get('fetched_at', 0))
+            self._etag = cached.get('etag')
+            self._last_modified = cached.get('last_modified')
+            self._metrics['disk_loads'] += 1
+            logger.info(f"[CENTROS] {len(self._centers)} centros cargados desde {self.cache_path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[CENTROS] Caché en disco no válida ({self.cache_path}): {e}")
+
+    def _save_to_disk(self):
+        data = {
+            'fetched_at': self._fetched_at,
+            'etag': self._etag,
+            'last_modified': self._last_modified,
+            'centers': self._centers,
+        }
+        try:
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"[CENTROS] No se pudo guardar la caché en disco: {e}")
+
+    def _is_fresh(self) -> bool:
+        return bool(self._centers) and time.time() - self._fetched_at < self.ttl
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Recarga el catálogo desde TuoTempo si ha caducado (o si ``force``).
+
+        Returns:
+            True si el catálogo está disponible (fresco o, tras un error, la copia anterior).
+        """
+        if not force and self._is_fresh():
+            return True
+        with self._lock:
+            # Otro hilo puede haberlo recargado mientras esperábamos el lock
+            if not force and self._is_fresh():
+                return True
+
+            url = f"{TUOTEMPO_BASE_URL}/{self.instance_id}/areas"
+            headers = {"content-type": "application/json; charset=UTF-8"}
+            if self._centers and self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._centers and self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+            try:
+                response = log_requests_call('GET', url, headers=headers, params={"lang": self.lang}, timeout=30)
+                if response.status_code == 304:
+                    self._metrics['not_modified'] += 1
+                    logger.info("[CENTROS] Catálogo sin cambios (304)")
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    if isinstance(data, dict) and data.get('result') not in (None, 'OK'):
+                        raise ValueError(data.get('msg') or data.get('message') or 'Respuesta no OK')
+                    centers = extract_areas(data)
+                    if not centers:
+                        raise ValueError("La respuesta no contiene centros")
+                    self._index(centers)
+                    self._etag = response.headers.get('ETag')
+                    self._last_modified = response.headers.get('Last-Modified')
+                    self._metrics['refreshes'] += 1
+                    logger.info(f"[CENTROS] Catálogo recargado: {len(centers)} centros")
+                self._fetched_at = time.time()
+                self._save_to_disk()
+                return True
+            except Exception as e:
+                self._metrics['refresh_errors'] += 1
+                if self._centers:
+                    logger.warning(f"[CENTROS] Error recargando el catálogo, se usa la copia anterior: {e}")
+                    return True
+                logger.error(f"[CENTROS] Error obteniendo el catálogo de centros: {e}")
+                return False
+
+    # --- Consultas ---
+
+    def all(self) -> List[Dict]:
+        self.refresh()
+        return list(self._centers)
+
+    def get(self, areaid: str) -> Optional[Dict]:
+        self.refresh()
+        return self._by_areaid.get(str(areaid))
+
+    def by_cp(self, cp: Any) -> List[Dict]:
+        self.refresh()
+        return list(self._by_cp.get(normalize_cp(cp), []))
+
+    def by_province(self, province: str) -> List[Dict]:
+        self.refresh()
+        return list(self._by_province.get(normalize_key(province), []))
+
+    def by_city(self, city: str) -> List[Dict]:
+        self.refresh()
+        return list(self._by_city.get(normalize_key(city), []))
+
+    def search(self, cp: Any = None, province: Optional[str] = None,
+               city: Optional[str] = None) -> List[Dict]:
+        """Centros que cumplen todos los filtros indicados (todos si no hay filtros)."""
+        self.refresh()
+        candidates = None
+        for index, key in ((self._by_cp, normalize_cp(cp) if cp else None),
+                           (self._by_province, normalize_key(province) if province else None),
+                           (self._by_city, normalize_key(city) if city else None)):
+            if key is None:
+                continue
+            matches = index.get(key, [])
+            if candidates is None:
+                candidates = matches
+            else:
+                ids = {id(center) for center in matches}
+                candidates = [center for center in candidates if id(center) in ids]
+        return list(self._centers if candidates is None else candidates)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self._metrics,
+            centers=len(self._centers),
+            age_seconds=round(time.time() - self._fetched_at, 1) if self._fetched_at else None,
+            ttl_seconds=self.ttl,
+            etag=bool(self._etag),
+        )
+
+
+_catalogs: Dict[tuple, CentersCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_centers_catalog(instance_id: Optional[str] = None, lang: str = 'es') -> CentersCatalog:
+    """Devuelve el catálogo compartido del proceso para ``instance_id``/``lang``."""
+    instance_id = instance_id or os.getenv("TUOTEMPO_INSTANCE_ID", "tt_portal_adeslas")
+    key = (instance_id, lang)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = CentersCatalog(instance_id=instance_id, lang=lang)
+        return _catalogs[key]
@@ -29,6 +29,14 @@ class Settings:
         DB_PASSWORD = os.environ.get("MYSQL_PASSWORD", os.environ.get("MYSQLPASSWORD", ""))
         DB_DATABASE = os.environ.get("MYSQL_DATABASE", os.environ.get("MYSQLDATABASE", "Segurcaixa"))
 
+    # Pool de conexiones (ver db.py)
+    DB_POOL_ENABLED = os.environ.get("DB_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_POOL_MAX_LIFETIME = int(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))  # segundos
+    DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 10))  # segundos
+    DB_POOL_HEALTH_CHECK_INTERVAL = int(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))  # segundos
+    DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 10))  # segundos
+
 settings = Settings()
 
 # Documentación de la estructura de base de datos
@@ -44,6 +52,9 @@ DB_SCHEMA_DESCRIPTION = """
 - `apellidos`: VARCHAR(150) - Apellidos del cliente
 - `telefono`: VARCHAR(20) - Teléfono principal
 - `telefono2`: VARCHAR(20) - Teléfono secundario
+- `telefono_norm` / `telefono2_norm`: VARCHAR(9) GENERATED STORED - Últimos 9 dígitos del teléfono (búsquedas por teléfono, ver lead_lookup.py)
+- `telefono_rev` / `telefono2_rev`: VARCHAR(20) GENERATED STORED - Dígitos del teléfono invertidos (búsqueda por final del número, ver lead_search.py)
+- `import_key`: VARCHAR(20) GENERATED STORED - NIF normalizado o telefono_norm (clave de la carga de ficheros, ver lead_import.py)
 - `email`: VARCHAR(100) - Correo electrónico
 - `nif`: VARCHAR(20) - Número de identificación
 - `fecha_nacimiento`: DATE - Fecha de nacimiento
@@ -113,6 +124,10 @@ DB_SCHEMA_DESCRIPTION = """
 - `idx_pearl_outbound_id`: Índice en pearl_outbound_id
 - `idx_lead_status`: Índice en lead_status
 - `idx_closure_reason`: Índice en closure_reason
+- `idx_telefono_norm` / `idx_telefono2_norm`: Índices en los teléfonos normalizados
+- `idx_telefono_rev` / `idx_telefono2_rev`: Índices en los teléfonos invertidos
+- `ft_leads_search`: FULLTEXT (ngram) en nombre, apellidos y nombre_clinica
+- `uq_leads_import_key`: UNIQUE en (origen_archivo, import_key)
 
 ## Tabla: call_schedule
 **Programación automática de llamadas**
@@ -21,7 +21,7 @@ import threading
 import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from config import settings
+from db import get_connection
 
 # Cargar variables de entorno
 load_dotenv()
@@ -29,19 +29,6 @@ load_dotenv()
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Configuración de la base de datos
-DB_CONFIG = {
-    'host': settings.DB_HOST,
-    'port': settings.DB_PORT,
-    'user': settings.DB_USER,
-    'password': settings.DB_PASSWORD,
-    'database': settings.DB_DATABASE,
-    'ssl_disabled': True,
-    'autocommit': True,
-    'charset': 'utf8mb4',
-    'use_unicode': True
-}
-
 class DaemonMonitor:
     """Clase para monitorear el estado del daemon de reservas automáticas"""
     
@@ -61,23 +48,11 @@ class DaemonMonitor:
         self.lock = threading.Lock()
     
     def get_db_connection(self):
-        """Establece conexión con la base de datos MySQL"""
-        try:
-            connection = mysql.connector.connect(**DB_CONFIG)
-            return connection
-        except mysql.connector.Error as err:
-            logger.error(f"Error conectando a MySQL: {err}")
-            # Si falla con SSL, intentar sin SSL
-            if 'SSL' in str(err) or '2026' in str(err):
-                try:
-                    logger.info("Intentando conexión sin SSL...")
-                    config_no_ssl = DB_CONFIG.copy()
-                    config_no_ssl['ssl_disabled'] = True
-                    connection = mysql.connector.connect(**config_no_ssl)
-                    return connection
-                except mysql.connector.Error as err2:
-                    logger.error(f"Error conectando sin SSL: {err2}")
-            return None
+        """Obtiene una conexión del pool compartido de MySQL (ver db.py)"""
+        conn = get_connection()
+        if conn is None:
+            logger.error("Error conectando a MySQL: no hay conexión disponible en el pool")
+        return conn
     
     def create_daemon_status_table(self):
         """Crea la tabla para almacenar el estado del daemon si no existe"""
@@ -0,0 +1,151 @@
+"""
+Trabajos en segundo plano del dashboard (ver background_jobs.py).
+
+- ``importar_leads``: carga de un Excel/CSV de ``data/`` (antes dentro de la
+  petición de ``/recargar-datos``). Publica el progreso por bloques y se puede
+  cancelar entre bloques; lo ya guardado se conserva. El fichero está en el
+  disco local de la réplica que recibió la subida, así que el trabajo es
+  ``host_bound``: sólo lo reclama un runner de esa máquina.
+- ``exportar_datos``: exportación completa de leads y llamadas a Excel. El
+  fichero se guarda en el disco local (``data/``) de la réplica que ejecutó
+  el trabajo y se descarga desde ``/api/jobs/<id>/download``; con varias
+  réplicas, la descarga solo funciona si la atiende esa misma réplica o si
+  ``data/`` es un volumen compartido.
+- ``reconstruir_agregado_leads`` / ``verificar_agregado_leads``: mantenimiento
+  de ``leads_daily_stats`` (ver leads_rollup.py).
+
+Las cargas y exportaciones se anotan en ``recargas`` como hasta ahora.
+"""
+
+import logging
+import os
+from datetime import date
+from typing import Any, Dict
+
+import leads_rollup
+from background_jobs import JobCancelled, JobContext, register_job_type
+from dashboard_stats import invalidate_dashboard_stats
+from db import get_connection
+from utils import exportar_datos_completos, load_excel_data
+
+logger = logging.getLogger(__name__)
+
+# Tipos que se pueden lanzar desde POST /api/jobs (el resto tienen su propia ruta)
+MAINTENANCE_JOB_TYPES = ('reconstruir_agregado_leads', 'verificar_agregado_leads')
+
+
+def _registrar_recarga(connection, usuario_id, archivo, registros, resultado, mensaje):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO recargas (usuario_id, archivo, registros_importados, resultado, mensaje) VALUES (%s, %s, %s, %s, %s)",
+            (usuario_id, archivo, registros, resultado, mensaje)
+        )
+    connection.commit()
+
+
+def _count_leads(connection) -> int:
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM leads")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def importar_leads(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """
+    Carga ``params['archivo_path']`` con origen ``params['origen_archivo']`` (modo aditivo).
+
+    La ruta es local a la máquina que encoló el trabajo (se registra con
+    ``host_bound=True``); si esa réplica no vuelve, el trabajo queda en cola.
+    """
+    archivo_path = params['archivo_path']
+    archivo = os.path.basename(archivo_path)
+    connection = get_connection()
+    if not connection:
+        raise RuntimeError("No se pudo conectar a la base de datos.")
+    try:
+        registros_previos = _count_leads(connection)
+        logger.info(f"Registros existentes en leads: {registros_previos}")
+        logger.info(f"Añadiendo nuevos datos desde: {archivo} (modo aditivo)")
+        ctx.progress(force=True, archivo=archivo, filas=0)
+
+        def on_progress(stats):
+            ctx.progress(archivo=archivo, filas=stats['filas'], bloques=stats['bloques'],
+                         insertados=stats['insertados'], actualizados=stats['actualizados'],
+                         errores=stats['errores'])
+
+        resultado_carga = load_excel_data(connection, archivo_path, origen_archivo=params.get('origen_archivo'),
+                                          on_progress=on_progress,
+                                          should_cancel=lambda: ctx.cancel_requested)
+        invalidate_dashboard_stats()
+
+        registros = resultado_carga.get('insertados', 0)
+        actualizados = resultado_carga.get('actualizados', 0)
+        errores = resultado_carga.get('errores', 0)
+        registros_totales = _count_leads(connection)
+        logger.info(f"Total de registros después de la carga: {registros_totales}")
+
+        estado = resultado_carga.get('estado')
+        prefijo = "Carga cancelada" if estado == 'cancelado' else "Carga completada"
+        mensaje = (f"{prefijo} (modo aditivo). Insertados: {registros}. Actualizados: {actualizados}. "
+                   f"Errores: {errores}. Total en BD: {registros_totales}.")
+        if resultado_carga.get('detalle_errores'):
+            mensaje += f" Primeros errores: {'; '.join(resultado_carga['detalle_errores'])}"
+        resultado = {'completado': 'ok', 'cancelado': 'cancelled'}.get(estado, 'error')
+        _registrar_recarga(connection, ctx.usuario_id, archivo, registros, resultado, mensaje)
+
+        if estado == 'cancelado':
+            raise JobCancelled()
+        if estado == 'error':
+            raise RuntimeError(mensaje)
+        return {
+            'mensaje': mensaje, 'insertados': registros, 'actualizados': actualizados,
+            'errores': errores, 'total_bd': registros_totales,
+        }
+    finally:
+        if connection.is_connected():
+            connection.close()
+
+
+def exportar_datos(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Exporta leads y llamadas a ``data/export_completo_*.xlsx``."""
+    connection = get_connection()
+    if not connection:
+        raise RuntimeError("No se pudo conectar a la base de datos.")
+    try:
+        ctx.progress(force=True, fase='exportando')
+        success, result = exportar_datos_completos(connection)
+        if not success:
+            raise RuntimeError(result)
+        filename = os.path.basename(result)
+        _registrar_recarga(connection, ctx.usuario_id, filename, 0, 'export', f'Exportado a {filename}')
+        return {'archivo': filename, 'ruta': result}
+    finally:
+        if connection.is_connected():
+            connection.close()
+
+
+def _since(params: Dict[str, Any]):
+    return date.fromisoformat(params['since']) if params.get('since') else None
+
+
+def reconstruir_agregado_leads(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Recalcula ``leads_daily_stats`` (todo o desde ``params['since']``)."""
+    ctx.progress(force=True, fase='reconstruyendo')
+    if not leads_rollup.rebuild(since=_since(params)):
+        raise RuntimeError("No se pudo reconstruir el agregado de leads (ver logs).")
+    return {'mensaje': 'Agregado de leads reconstruido'}
+
+
+def verificar_agregado_leads(params: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Compara ``leads_daily_stats`` con leads; con ``params['fix']`` recalcula los días descuadrados."""
+    ctx.progress(force=True, fase='verificando')
+    days = leads_rollup.verify(since=_since(params), fix=bool(params.get('fix')))
+    return {'dias_descuadrados': [day.isoformat() for day in days], 'corregidos': bool(params.get('fix'))}
+
+
+register_job_type('importar_leads', importar_leads, host_bound=True)
+register_job_type('exportar_datos', exportar_datos)
+register_job_type('reconstruir_agregado_leads', reconstruir_agregado_leads)
+register_job_type('verificar_agregado_leads', verificar_agregado_leads)
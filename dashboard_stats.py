@@ -0,0 +1,253 @@
+"""
+Estadísticas del dashboard principal (``/``) con caché.
+
+Todas las métricas de leads se calculan en una única pasada sobre la tabla:
+un ``GROUP BY`` por estado y subestado que además suma los leads con el
+máximo de intentos y los que tienen pack. El resto (totales, tasas, subestados
+de "Volver a llamar" y "No Interesado") se deriva en Python de esas filas, que
+son pocas (una por combinación de estado/subestado).
+
+El resultado se guarda por conjunto de filtros ``origen_archivo`` durante
+``DASHBOARD_STATS_TTL`` segundos y se descarta antes si:
+
+- cambia ``MAX(leads.updated_at)`` (cualquier INSERT/UPDATE de leads, venga del
+  proceso que venga; la comprobación es una lectura del índice
+  ``idx_leads_updated_at``), o
+- se llama a ``invalidate_dashboard_stats()`` (borrados de leads, recargas).
+
+La caché es de cada proceso e ``invalidate_dashboard_stats()`` solo vacía la
+del proceso que la llama. Los INSERT/UPDATE se detectan en todos por
+``updated_at``, pero un borrado de leads hecho en otro worker o réplica
+(que no cambia ``MAX(updated_at)``) puede no verse aquí hasta que caduque la
+entrada, como mucho ``DASHBOARD_STATS_TTL`` segundos.
+
+Cada resultado incluye ``cache = {hit, age_seconds, ttl_seconds}``.
+"""
+
+import logging
+import os
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_STATS_TTL = int(os.getenv('DASHBOARD_STATS_TTL', 60))  # segundos
+DASHBOARD_STATS_CACHE_MAX = 64
+DEFAULT_MAX_ATTEMPTS = 6
+
+# Subestados que se muestran siempre (aunque estén a 0)
+SUBESTADOS_VOLVER = [
+    'buzón', 'no disponible cliente', 'Interesado. Problema técnico', 'cortado'
+]
+SUBESTADOS_NO_INTERES = [
+    'Paciente con tratamiento',
+    'Paciente con tratamiento particular',
+    'Llamará cuando esté interesado',
+    'Solicitan baja póliza',
+    'No desea informar motivo / no colabora',
+    # LEGACY - mantener compatibilidad
+    'no disponibilidad cliente',
+    'Descontento con Adeslas',
+    'No da motivos',
+    'Próxima baja'
+]
+
+_cache: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+_cache_lock = threading.Lock()
+_generation = 0
+
+
+def invalidate_dashboard_stats():
+    """Descarta las estadísticas cacheadas de este proceso (p. ej. tras borrar o recargar leads)."""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _cache.clear()
+
+
+def _fold(value: Any) -> str:
+    """Comparación como la collation de la tabla: sin espacios extremos, mayúsculas ni tildes."""
+    text = unicodedata.normalize('NFKD', str(value).strip().casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _filter_key(filtro_origen_archivo) -> Tuple[str, ...]:
+    if not filtro_origen_archivo:
+        return ()
+    if isinstance(filtro_origen_archivo, str):
+        return (filtro_origen_archivo,)
+    return tuple(sorted(set(filtro_origen_archivo)))
+
+
+def _empty_stats(filtro_origen_archivo) -> Dict[str, Any]:
+    return {
+        'total_leads': 0,
+        'llamadas_hoy': 0,
+        'contactados': 0,
+        'conversion_rate': '0%',
+        'citas_contactados_rate': '0%',
+        'citas_total': 0,
+        'estados': {
+            'volver_llamar': 0,
+            'no_interesado': 0,
+            'cita_sin_pack': 0,
+            'cita_con_pack': 0,
+            'utiles_positivos': 0,
+            'utiles_negativos': 0,
+            'no_util': 0
+        },
+        'filtro_origen': filtro_origen_archivo,  # Incluir info del filtro aplicado
+        'archivos_disponibles': []  # Lista de archivos disponibles para el selector
+    }
+
+
+def _leads_version(cursor) -> Optional[str]:
+    cursor.execute("SELECT MAX(updated_at) AS version FROM leads")
+    row = cursor.fetchone()
+    version = row['version'] if row else None
+    return version.isoformat() if version else None
+
+
+def _max_attempts(cursor) -> int:
+    try:
+        cursor.execute("SELECT config_value FROM scheduler_config WHERE config_key = 'max_attempts'")
+        row = cursor.fetchone()
+        return int(row['config_value']) if row and row.get('config_value') else DEFAULT_MAX_ATTEMPTS
+    except Exception:
+        return DEFAULT_MAX_ATTEMPTS
+
+
+def summarize(groups: List[Dict[str, Any]], filtro_origen_archivo=None) -> Dict[str, Any]:
+    """
+    Construye las estadísticas del dashboard a partir de las filas agrupadas
+    ``{estado, subestado, total, max_intentos, con_pack}``.
+    """
+    stats = _empty_stats(filtro_origen_archivo)
+    estados = {
+        'volver_llamar': 0,
+        'no_interesado': 0,
+        'cita_sin_pack': 0,
+        'cita_con_pack': 0,
+        'utiles_positivos': 0,
+        'otros_estados': 0,
+        'no_util': 0
+    }
+    volver: Dict[str, int] = {}
+    no_interes: Dict[str, int] = {}
+    total = contactados = con_pack = 0
+
+    for group in groups:
+        count = int(group['total'] or 0)
+        estado = _fold(group['estado']) if group['estado'] is not None else None
+        subestado = group['subestado']
+        total += count
+        con_pack += int(group['con_pack'] or 0)
+        estados['no_util'] += int(group['max_intentos'] or 0)
+
+        if estado is None or estado in ('', 'none'):
+            estados['otros_estados'] += count
+            continue
+        contactados += count
+        if estado == 'volver a llamar':
+            estados['volver_llamar'] += count
+            key = _fold(subestado if subestado is not None else 'Sin especificar')
+            volver[key] = volver.get(key, 0) + count
+        elif estado == 'no interesado':
+            estados['no_interesado'] += count
+            key = _fold(subestado if subestado is not None else 'Sin especificar')
+            no_interes[key] = no_interes.get(key, 0) + count
+        elif estado in ('cita agendada', 'cita manual'):
+            estados['utiles_positivos'] += count
+            if estado == 'cita agendada' and subestado is not None:
+                if _fold(subestado) == 'sin pack':
+                    estados['cita_sin_pack'] += count
+                elif _fold(subestado) == 'con pack':
+                    estados['cita_con_pack'] += count
+        elif estado in ('numero erroneo', 'interesado'):
+            estados['otros_estados'] += count
+
+    stats['total_leads'] = total
+    stats['contactados'] = contactados
+    stats['estados'] = estados
+    stats['citas_total'] = estados['utiles_positivos']
+    if contactados:
+        stats['citas_contactados_rate'] = f"{(stats['citas_total'] / contactados * 100):.0f}%"
+    stats['subestados_volver'] = {sub: volver.get(_fold(sub), 0) for sub in SUBESTADOS_VOLVER}
+    stats['subestados_no_interes'] = {sub: no_interes.get(_fold(sub), 0) for sub in SUBESTADOS_NO_INTERES}
+    stats['diarios'] = []
+    if total:
+        stats['conversion_rate'] = f"{con_pack / total * 100:.0f}%"
+    return stats
+
+
+def _compute(cursor, filtro_origen_archivo, filter_key: Tuple[str, ...]) -> Dict[str, Any]:
+    cursor.execute("SELECT nombre_archivo, total_registros FROM archivos_origen WHERE activo = 1 ORDER BY nombre_archivo")
+    archivos = cursor.fetchall()
+
+    where_clause, params = "", []
+    if filter_key:
+        where_clause = f"WHERE origen_archivo IN ({', '.join(['%s'] * len(filter_key))})"
+        params = list(filter_key)
+
+    cursor.execute(f"""
+        SELECT
+            TRIM(status_level_1) AS estado,
+            status_level_2 AS subestado,
+            COUNT(*) AS total,
+            SUM(call_attempts_count >= %s) AS max_intentos,
+            SUM(conPack = 1) AS con_pack
+        FROM leads {where_clause}
+        GROUP BY estado, subestado
+    """, [_max_attempts(cursor)] + params)
+    stats = summarize(cursor.fetchall(), filtro_origen_archivo)
+    stats['archivos_disponibles'] = archivos
+    return stats
+
+
+def get_dashboard_statistics(filtro_origen_archivo=None) -> Dict[str, Any]:
+    """
+    Estadísticas del dashboard para el filtro ``origen_archivo`` (str, lista o None).
+
+    Devuelve el resultado cacheado si sigue vigente; si no, lo recalcula.
+    """
+    filter_key = _filter_key(filtro_origen_archivo)
+    conn = get_connection()
+    if not conn:
+        logger.warning("No se pudo obtener conexión a la BD; devolviendo estadísticas vacías")
+        stats = _empty_stats(filtro_origen_archivo)
+        stats['cache'] = {'hit': False, 'age_seconds': None, 'ttl_seconds': DASHBOARD_STATS_TTL}
+        return stats
+
+    try:
+        with conn.cursor(dictionary=True) as cursor:
+            version = _leads_version(cursor)
+            generation = _generation
+            entry = _cache.get(filter_key)
+            now = time.time()
+            if (entry and entry['version'] == version and entry['generation'] == generation
+                    and now - entry['computed_at'] < DASHBOARD_STATS_TTL):
+                stats = dict(entry['stats'], filtro_origen=filtro_origen_archivo)
+                stats['cache'] = {'hit': True, 'age_seconds': round(now - entry['computed_at'], 1),
+                                  'ttl_seconds': DASHBOARD_STATS_TTL}
+                return stats
+
+            stats = _compute(cursor, filtro_origen_archivo, filter_key)
+            with _cache_lock:
+                if generation == _generation:
+                    if len(_cache) >= DASHBOARD_STATS_CACHE_MAX:
+                        _cache.clear()
+                    _cache[filter_key] = {'stats': stats, 'version': version,
+                                          'generation': generation, 'computed_at': now}
+            stats = dict(stats, cache={'hit': False, 'age_seconds': 0.0, 'ttl_seconds': DASHBOARD_STATS_TTL})
+            return stats
+    except Exception as e:
+        logger.error(f"Error calculando estadísticas: {e}")
+        stats = _empty_stats(filtro_origen_archivo)
+        stats['cache'] = {'hit': False, 'age_seconds': None, 'ttl_seconds': DASHBOARD_STATS_TTL}
+        return stats
+    finally:
+        conn.close()
@@ -1,25 +1,45 @@
 """
 Módulo centralizado para la conexión a la base de datos MySQL.
+
+Las conexiones se sirven desde un pool acotado por proceso. Los llamadores
+existentes siguen usando ``get_connection()`` / ``conn.close()``: al cerrar, la
+conexión vuelve al pool en lugar de cerrarse el socket. Para código nuevo se
+recomienda el gestor de contexto ``connection()``.
 """
+import os
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import Error
 
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Error):
+    """No se pudo obtener una conexión del pool dentro del tiempo de espera."""
+
+
 def get_database_name():
     """Devuelve el nombre de la base de datos desde la configuración."""
     return settings.DB_DATABASE
 
-def get_connection():
-    """Obtiene una conexión a MySQL usando la configuración de Settings."""
+
+def _build_config():
+    """Construye la configuración de mysql.connector a partir de Settings."""
     # Ensure all config values are strings and not None
     host = str(settings.DB_HOST) if settings.DB_HOST is not None else 'localhost'
     port = int(settings.DB_PORT) if settings.DB_PORT is not None else 3306
     user = str(settings.DB_USER) if settings.DB_USER is not None else 'root'
     password = str(settings.DB_PASSWORD) if settings.DB_PASSWORD is not None else ''
     database = str(settings.DB_DATABASE) if settings.DB_DATABASE is not None else 'Segurcaixa'
-    
-    cfg = {
+
+    return {
         'host': host,
         'port': port,
         'user': user,
@@ -29,21 +49,341 @@ def get_connection():
         'autocommit': True,
         'charset': 'utf8mb4',
         'use_unicode': True,
-        'auth_plugin': 'mysql_native_password'
+        'auth_plugin': 'mysql_native_password',
+        'connection_timeout': settings.DB_CONNECT_TIMEOUT,
     }
+
+
+def _connect_raw(cfg):
+    """Abre una conexión física a MySQL (con reintento sin SSL)."""
     try:
-        conn = mysql.connector.connect(**cfg)
-        return conn
+        return mysql.connector.connect(**cfg)
     except Exception as e:
         print(f"ERROR conectando a MySQL: {type(e).__name__}: {str(e)}")
         # Si falla con SSL, intentar sin SSL
         if 'SSL' in str(e) or '2026' in str(e):
-            try:
-                print("Intentando conexión sin SSL...")
-                cfg_no_ssl = cfg.copy()
-                cfg_no_ssl['ssl_disabled'] = True
-                conn = mysql.connector.connect(**cfg_no_ssl)
-                return conn
-            except Exception as e2:
-                print(f"ERROR conectando sin SSL: {type(e2).__name__}: {str(e2)}")
-        return None
\ No newline at end of file
+            print("Intentando conexión sin SSL...")
+            cfg_no_ssl = cfg.copy()
+            cfg_no_ssl['ssl_disabled'] = True
+            return mysql.connector.connect(**cfg_no_ssl)
+        raise
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión física prestada por el pool.
+
+    Delega todos los atributos en la conexión real; ``close()`` la devuelve al
+    pool y es idempotente, por lo que el patrón ``conn.close()`` existente en
+    el código sigue siendo válido.
+
+    Con ``dictionary=True`` los cursores devuelven filas como diccionarios por
+    defecto (equivalente al ``DictCursor`` de pymysql).
+    """
+
+    def __init__(self, pool, raw, created_at, dictionary=False):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._dictionary = dictionary
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise Error(msg="La conexión ya fue devuelta al pool")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        # Propiedades como ``autocommit`` deben aplicarse a la conexión real
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+    def is_connected(self):
+        if self._raw is None:
+            return False
+        return self._raw.is_connected()
+
+    def cursor(self, *args, **kwargs):
+        if self._dictionary and not args:
+            kwargs.setdefault('dictionary', True)
+        return self.__getattr__('cursor')(*args, **kwargs)
+
+    def close(self):
+        """Devuelve la conexión al pool."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created_at)
+
+    def discard(self):
+        """Cierra la conexión física sin devolverla al pool (p.ej. tras un error de red)."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._discard(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # Evitar fugas si un llamador olvida cerrar la conexión
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones MySQL con comprobación de salud, reciclado por
+    antigüedad, tiempo máximo de espera al obtener conexión y métricas.
+    """
+
+    def __init__(self, cfg, size=10, max_lifetime=1800, checkout_timeout=10,
+                 health_check_interval=30, reuse=True, name='default'):
+        self.cfg = cfg
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        # reuse=False: cada close() cierra la conexión física (pool desactivado)
+        self.reuse = reuse
+        self.name = name
+
+        self._cond = threading.Condition()
+        # Conexiones ociosas: (raw, created_at, last_used)
+        self._idle = deque()
+        self._in_use = 0
+        self._metrics = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def acquire(self, timeout=None, dictionary=False):
+        """
+        Obtiene una conexión del pool.
+
+        Raises:
+            PoolTimeoutError: Si no hay conexión disponible en ``timeout`` segundos.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        msg=f"Pool '{self.name}' agotado: {self._in_use}/{self.size} conexiones en uso")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            candidate = self._idle.pop() if self._idle else None
+
+        try:
+            raw, created_at = self._checkout(candidate)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._metrics['checkouts'] += 1
+            self._metrics['wait_time_total'] += waited
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], waited)
+        return PooledConnection(self, raw, created_at, dictionary=dictionary)
+
+    @contextmanager
+    def connection(self, timeout=None, dictionary=False):
+        """Gestor de contexto que devuelve la conexión al pool al salir."""
+        conn = self.acquire(timeout, dictionary=dictionary)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Devuelve las métricas actuales del pool."""
+        with self._cond:
+            metrics = dict(self._metrics)
+            checkouts = metrics['checkouts']
+            metrics.update({
+                'name': self.name,
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'wait_time_avg': (metrics['wait_time_total'] / checkouts) if checkouts else 0.0,
+            })
+        return metrics
+
+    def close_all(self):
+        """Cierra todas las conexiones ociosas (las prestadas se cierran al devolverse)."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _, _ in idle:
+            self._close_raw(raw)
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _checkout(self, candidate):
+        """Valida una conexión ociosa o crea una nueva."""
+        now = time.monotonic()
+        if candidate is not None:
+            raw, created_at, last_used = candidate
+            if self.max_lifetime and now - created_at > self.max_lifetime:
+                self._count('recycled')
+                self._close_raw(raw)
+            elif now - last_used > self.health_check_interval and not self._is_healthy(raw):
+                self._count('health_check_failures')
+                self._close_raw(raw)
+            else:
+                return raw, created_at
+
+        raw = _connect_raw(self.cfg)
+        self._count('created')
+        return raw, time.monotonic()
+
+    def _count(self, metric):
+        with self._cond:
+            self._metrics[metric] += 1
+
+    @staticmethod
+    def _is_healthy(raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _reset(self, raw):
+        """Deja la conexión en estado limpio antes de reutilizarla."""
+        if getattr(raw, 'unread_result', False):
+            raw.consume_results()
+        if getattr(raw, 'in_transaction', False) or not raw.autocommit:
+            raw.rollback()
+        if not raw.autocommit:
+            raw.autocommit = True
+
+    def _release(self, raw, created_at):
+        if not self.reuse:
+            self._discard(raw)
+            return
+        if self.max_lifetime and time.monotonic() - created_at > self.max_lifetime:
+            self._count('recycled')
+            self._discard(raw)
+            return
+        try:
+            self._reset(raw)
+        except Exception as e:
+            logger.debug(f"Descartando conexión no reutilizable: {e}")
+            self._discard(raw)
+            return
+
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, raw):
+        self._close_raw(raw)
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        self._count('closed')
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Devuelve el pool del proceso actual, creándolo si es necesario.
+
+    Se recrea tras un fork (workers de gunicorn) para no compartir sockets
+    entre procesos.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    _build_config(),
+                    size=settings.DB_POOL_SIZE,
+                    max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                    checkout_timeout=settings.DB_POOL_CHECKOUT_TIMEOUT,
+                    health_check_interval=settings.DB_POOL_HEALTH_CHECK_INTERVAL,
+                    reuse=settings.DB_POOL_ENABLED,
+                )
+                _pool_pid = pid
+    return _pool
+
+
+def get_pool_stats():
+    """Métricas del pool del proceso actual (para endpoints de estado)."""
+    return get_pool().stats()
+
+
+def get_connection(dictionary=False):
+    """
+    Obtiene una conexión a MySQL usando la configuración de Settings.
+
+    Es la única factoría de conexiones de la aplicación: blueprints, APIs y
+    daemons la comparten para reutilizar conexiones calientes del pool.
+
+    Args:
+        dictionary: Si es True, ``conn.cursor()`` devuelve filas como dict.
+
+    Returns:
+        Conexión del pool (``close()`` la devuelve al pool) o ``None`` si no
+        se pudo conectar, como hasta ahora.
+    """
+    try:
+        return get_pool().acquire(dictionary=dictionary)
+    except Exception as e:
+        print(f"ERROR obteniendo conexión del pool: {type(e).__name__}: {str(e)}")
+        return None
+
+
+@contextmanager
+def connection(timeout=None, dictionary=False):
+    """
+    Gestor de contexto para obtener una conexión del pool.
+
+    A diferencia de ``get_connection()``, lanza la excepción si no puede
+    conectar en lugar de devolver ``None``.
+
+        with connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            ...
+    """
+    conn = get_pool().acquire(timeout, dictionary=dictionary)
+    try:
+        yield conn
+    finally:
+        conn.close()
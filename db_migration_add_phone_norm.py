@@ -0,0 +1,79 @@
+"""
+Migración: columnas de teléfono normalizado e indexado en la tabla leads.
+
+Añade las columnas generadas ``telefono_norm`` y ``telefono2_norm`` (últimos
+9 dígitos de ``telefono``/``telefono2``) y sus índices, para que las búsquedas
+por teléfono de ``lead_lookup`` sean búsquedas por índice en lugar de un
+``REGEXP_REPLACE`` sobre toda la tabla. Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+PHONE_NORM_COLUMNS = {
+    'telefono_norm': (
+        "`telefono_norm` VARCHAR(9) GENERATED ALWAYS AS "
+        "(NULLIF(RIGHT(REGEXP_REPLACE(`telefono`, '[^0-9]', ''), 9), '')) STORED "
+        "COMMENT 'Últimos 9 dígitos de telefono (ver lead_lookup.py)'"
+    ),
+    'telefono2_norm': (
+        "`telefono2_norm` VARCHAR(9) GENERATED ALWAYS AS "
+        "(NULLIF(RIGHT(REGEXP_REPLACE(`telefono2`, '[^0-9]', ''), 9), '')) STORED "
+        "COMMENT 'Últimos 9 dígitos de telefono2 (ver lead_lookup.py)'"
+    ),
+}
+
+PHONE_NORM_INDEXES = {
+    'idx_telefono_norm': 'telefono_norm',
+    'idx_telefono2_norm': 'telefono2_norm',
+}
+
+
+def run_migration():
+    """Crea las columnas de teléfono normalizado y sus índices si no existen."""
+    logging.info("--- Ejecutando migración: Teléfonos normalizados en leads ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-PHONE-NORM] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+
+        for column, definition in PHONE_NORM_COLUMNS.items():
+            cursor.execute("SHOW COLUMNS FROM leads LIKE %s", (column,))
+            if cursor.fetchone():
+                logging.info(f"Columna '{column}' ya existe en leads.")
+                continue
+            logging.info(f"Añadiendo columna generada '{column}' a leads...")
+            cursor.execute(f"ALTER TABLE leads ADD COLUMN {definition}")
+            logging.info(f"✅ Columna '{column}' añadida.")
+
+        cursor.execute("SHOW INDEX FROM leads")
+        existing_indexes = {row[2] for row in cursor.fetchall()}
+        for index_name, column in PHONE_NORM_INDEXES.items():
+            if index_name in existing_indexes:
+                logging.info(f"Índice '{index_name}' ya existe en leads.")
+                continue
+            logging.info(f"Creando índice '{index_name}' sobre leads({column})...")
+            cursor.execute(f"CREATE INDEX {index_name} ON leads({column})")
+            logging.info(f"✅ Índice '{index_name}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Teléfonos normalizados' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Teléfonos normalizados': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
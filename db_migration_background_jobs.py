@@ -0,0 +1,71 @@
+"""
+Migración: tabla ``background_jobs`` de la cola de trabajos en segundo plano
+(ver background_jobs.py), con la columna ``host`` de los trabajos que sólo
+puede ejecutar la máquina que los encoló. Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+HOST_COLUMN = "`host` VARCHAR(100) NULL COMMENT 'Si no es NULL, sólo lo reclama un runner de esta máquina'"
+
+BACKGROUND_JOBS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS `background_jobs` (
+      `id` INT AUTO_INCREMENT PRIMARY KEY,
+      `job_type` VARCHAR(50) NOT NULL,
+      `params` JSON NULL,
+      `status` ENUM('queued', 'running', 'completed', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+      `progress` JSON NULL,
+      `result` JSON NULL,
+      `error` TEXT NULL,
+      `cancel_requested` BOOLEAN NOT NULL DEFAULT FALSE,
+      `usuario_id` INT NULL,
+      `worker` VARCHAR(100) NULL,
+      {HOST_COLUMN},
+      `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      `started_at` DATETIME NULL,
+      `finished_at` DATETIME NULL,
+      `heartbeat_at` DATETIME NULL,
+      INDEX `idx_background_jobs_status` (`status`, `id`),
+      INDEX `idx_background_jobs_created` (`created_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def run_migration():
+    """Crea la tabla background_jobs si no existe y le añade la columna host si falta."""
+    logging.info("--- Ejecutando migración: Cola de trabajos en segundo plano ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-BACKGROUND-JOBS] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute(BACKGROUND_JOBS_TABLE)
+        logging.info("✅ Tabla 'background_jobs' verificada.")
+
+        cursor.execute("SHOW COLUMNS FROM background_jobs")
+        if 'host' in {row[0] for row in cursor.fetchall()}:
+            logging.info("Columna 'host' ya existe en background_jobs.")
+        else:
+            cursor.execute(f"ALTER TABLE background_jobs ADD COLUMN {HOST_COLUMN} AFTER `worker`")
+            logging.info("✅ Columna 'host' añadida a background_jobs.")
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Cola de trabajos en segundo plano' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Cola de trabajos en segundo plano': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -0,0 +1,54 @@
+"""
+Migración: índices de call_schedule para el despachador de llamadas programadas.
+
+``scheduled_call_dispatcher`` lee periódicamente solo las filas modificadas
+(``updated_at >= última lectura``); sin índice sobre ``updated_at`` esa consulta
+recorrería la tabla entera. Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+CALL_SCHEDULE_INDEXES = {
+    'idx_call_schedule_updated_at': 'updated_at',
+}
+
+
+def run_migration():
+    """Crea los índices de call_schedule que falten."""
+    logging.info("--- Ejecutando migración: Índices de call_schedule ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-CALL-SCHEDULE] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute("SHOW INDEX FROM call_schedule")
+        existing_indexes = {row[2] for row in cursor.fetchall()}
+        for index_name, column in CALL_SCHEDULE_INDEXES.items():
+            if index_name in existing_indexes:
+                logging.info(f"Índice '{index_name}' ya existe en call_schedule.")
+                continue
+            logging.info(f"Creando índice '{index_name}' sobre call_schedule({column})...")
+            cursor.execute(f"CREATE INDEX {index_name} ON call_schedule({column})")
+            logging.info(f"✅ Índice '{index_name}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Índices de call_schedule' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Índices de call_schedule': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
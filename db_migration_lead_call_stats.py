@@ -0,0 +1,129 @@
+"""
+Migración: agregado de llamadas por lead (``lead_call_stats``).
+
+Crea la tabla, los triggers de ``pearl_calls`` que la mantienen de forma
+incremental y, si la tabla está vacía, la rellena a partir del histórico.
+Es segura de ejecutar varias veces (los triggers se recrean siempre, para
+que una versión nueva sustituya a la anterior).
+
+Los triggers son de una sola sentencia (sin BEGIN ... END) para no depender de
+delimitadores:
+
+- INSERT: suma la llamada al agregado de su lead.
+- UPDATE / DELETE: recalcula los leads afectados (el anterior y el nuevo si
+  cambia ``lead_id``) solo cuando cambia algún campo agregado; el recálculo
+  usa el índice de ``pearl_calls.lead_id`` y solo lee las llamadas de ese lead.
+"""
+
+import logging
+from db import get_connection
+import lead_call_stats
+
+LEAD_CALL_STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS `lead_call_stats` (
+      `lead_id` INT PRIMARY KEY,
+      `call_count` INT NOT NULL DEFAULT 0,
+      `total_duration` BIGINT NOT NULL DEFAULT 0,
+      `last_call_time` DATETIME NULL,
+      `calls_with_recording` INT NOT NULL DEFAULT 0,
+      `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+      CONSTRAINT `fk_lead_call_stats_lead` FOREIGN KEY (`lead_id`) REFERENCES `leads`(`id`) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# Recalcula el agregado de los leads de la subconsulta ``affected``
+_RECOMPUTE = """
+    INSERT INTO lead_call_stats (lead_id, call_count, total_duration, last_call_time, calls_with_recording)
+    SELECT
+        affected.lead_id,
+        COUNT(pc.id),
+        COALESCE(SUM(pc.duration), 0),
+        MAX(pc.call_time),
+        COUNT(pc.recording_url)
+    FROM ({affected}) affected
+    LEFT JOIN pearl_calls pc ON pc.lead_id = affected.lead_id
+    WHERE affected.lead_id IS NOT NULL {condition}
+    GROUP BY affected.lead_id
+    ON DUPLICATE KEY UPDATE
+        call_count = VALUES(call_count),
+        total_duration = VALUES(total_duration),
+        last_call_time = VALUES(last_call_time),
+        calls_with_recording = VALUES(calls_with_recording)
+"""
+
+LEAD_CALL_STATS_TRIGGERS = {
+    'trg_pearl_calls_stats_insert': """
+        CREATE TRIGGER trg_pearl_calls_stats_insert AFTER INSERT ON pearl_calls
+        FOR EACH ROW
+        INSERT INTO lead_call_stats (lead_id, call_count, total_duration, last_call_time, calls_with_recording)
+        SELECT NEW.lead_id, 1, COALESCE(NEW.duration, 0), NEW.call_time, NEW.recording_url IS NOT NULL
+        FROM DUAL
+        WHERE NEW.lead_id IS NOT NULL
+        ON DUPLICATE KEY UPDATE
+            call_count = call_count + 1,
+            total_duration = total_duration + VALUES(total_duration),
+            last_call_time = COALESCE(GREATEST(last_call_time, VALUES(last_call_time)),
+                                      last_call_time, VALUES(last_call_time)),
+            calls_with_recording = calls_with_recording + VALUES(calls_with_recording)
+    """,
+    'trg_pearl_calls_stats_update': """
+        CREATE TRIGGER trg_pearl_calls_stats_update AFTER UPDATE ON pearl_calls
+        FOR EACH ROW
+    """ + _RECOMPUTE.format(
+        affected="SELECT OLD.lead_id AS lead_id UNION SELECT NEW.lead_id",
+        condition="""AND NOT (OLD.lead_id <=> NEW.lead_id
+                          AND OLD.duration <=> NEW.duration
+                          AND OLD.call_time <=> NEW.call_time
+                          AND (OLD.recording_url IS NULL) <=> (NEW.recording_url IS NULL))""",
+    ),
+    'trg_pearl_calls_stats_delete': """
+        CREATE TRIGGER trg_pearl_calls_stats_delete AFTER DELETE ON pearl_calls
+        FOR EACH ROW
+    """ + _RECOMPUTE.format(affected="SELECT OLD.lead_id AS lead_id", condition=""),
+}
+
+
+def run_migration():
+    """Crea lead_call_stats, sus triggers y la rellena si está vacía."""
+    logging.info("--- Ejecutando migración: Agregado de llamadas por lead ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEAD-STATS] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute(LEAD_CALL_STATS_TABLE)
+        logging.info("✅ Tabla 'lead_call_stats' verificada.")
+
+        for trigger, ddl in LEAD_CALL_STATS_TRIGGERS.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute(ddl)
+            logging.info(f"✅ Trigger '{trigger}' creado.")
+
+        cursor.execute("SELECT COUNT(*) FROM lead_call_stats")
+        empty = cursor.fetchone()[0] == 0
+        db_conn.commit()
+        cursor.close()
+
+        if empty:
+            logging.info("Rellenando 'lead_call_stats' a partir de pearl_calls...")
+            if not lead_call_stats.rebuild():
+                return False
+
+        logging.info("--- Migración 'Agregado de llamadas por lead' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Agregado de llamadas por lead': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
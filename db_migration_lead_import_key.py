@@ -0,0 +1,89 @@
+"""
+Migración: clave de importación de leads (ver lead_import.py).
+
+- Columna generada ``import_key``: NIF sin separadores y en mayúsculas o, si no
+  hay NIF, ``telefono_norm``.
+- Índice único ``uq_leads_import_key`` (``origen_archivo``, ``import_key``): la
+  carga de Excel/CSV hace ``INSERT ... ON DUPLICATE KEY UPDATE`` sobre él, así
+  que recargar un fichero actualiza sus leads en lugar de duplicarlos. Los
+  leads sin NIF ni teléfono (``import_key`` NULL) no chocan entre sí.
+
+Si ya hay leads repetidos dentro de un mismo fichero no se puede crear el
+índice: se avisa y la importación sigue insertando sin clave hasta que se
+limpien. Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+IMPORT_KEY_COLUMN = (
+    "`import_key` VARCHAR(20) GENERATED ALWAYS AS "
+    "(COALESCE(NULLIF(UPPER(REGEXP_REPLACE(`nif`, '[^0-9A-Za-z]', '')), ''), `telefono_norm`)) STORED "
+    "COMMENT 'NIF normalizado o telefono_norm (clave de la carga de ficheros, ver lead_import.py)'"
+)
+IMPORT_KEY_INDEX = 'uq_leads_import_key'
+
+
+def run_migration():
+    """Crea la columna import_key y, si no hay duplicados, su índice único."""
+    logging.info("--- Ejecutando migración: Clave de importación de leads ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEAD-IMPORT-KEY] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute("SHOW COLUMNS FROM leads")
+        existing_columns = {row[0] for row in cursor.fetchall()}
+        missing = [col for col in ('origen_archivo', 'telefono_norm') if col not in existing_columns]
+        if missing:
+            logging.error(f"[MIGRATION-LEAD-IMPORT-KEY] Faltan las columnas {missing} en leads.")
+            return False
+
+        if 'import_key' in existing_columns:
+            logging.info("Columna 'import_key' ya existe en leads.")
+        else:
+            logging.info("Añadiendo columna generada 'import_key' a leads...")
+            cursor.execute(f"ALTER TABLE leads ADD COLUMN {IMPORT_KEY_COLUMN}")
+            logging.info("✅ Columna 'import_key' añadida.")
+
+        cursor.execute("SHOW INDEX FROM leads WHERE Key_name = %s", (IMPORT_KEY_INDEX,))
+        if cursor.fetchall():
+            logging.info(f"Índice '{IMPORT_KEY_INDEX}' ya existe en leads.")
+        else:
+            cursor.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM leads
+                    WHERE import_key IS NOT NULL
+                    GROUP BY origen_archivo, import_key
+                    HAVING COUNT(*) > 1
+                ) duplicated
+            """)
+            duplicated = cursor.fetchone()[0]
+            if duplicated:
+                logging.warning(f"Índice '{IMPORT_KEY_INDEX}' omitido: {duplicated} claves repetidas dentro "
+                                f"de un mismo origen_archivo. La carga de ficheros insertará sin clave.")
+            else:
+                logging.info(f"Creando índice único '{IMPORT_KEY_INDEX}'...")
+                cursor.execute(f"CREATE UNIQUE INDEX {IMPORT_KEY_INDEX} ON leads(origen_archivo, import_key)")
+                logging.info(f"✅ Índice '{IMPORT_KEY_INDEX}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Clave de importación de leads' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Clave de importación de leads': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
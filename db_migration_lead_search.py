@@ -0,0 +1,86 @@
+"""
+Migración: índices de búsqueda de leads (ver lead_search.py).
+
+- Columnas generadas ``telefono_rev`` / ``telefono2_rev`` con los dígitos del
+  teléfono invertidos e indexadas: buscar por el final del número es un
+  ``LIKE 'invertido%'`` por rango de índice.
+- Índice FULLTEXT ``ft_leads_search`` con el parser ``ngram`` sobre nombre,
+  apellidos y clínica.
+
+Es segura de ejecutar varias veces. Crear el índice FULLTEXT reconstruye la
+tabla, así que ``start.py`` no la ejecuta salvo con
+``RUN_LEAD_SEARCH_MIGRATION=true``; en bases grandes se lanza a mano
+(``python db_migration_lead_search.py``) fuera del horario de llamadas.
+"""
+
+import logging
+from db import get_connection
+
+LEAD_SEARCH_COLUMNS = {
+    'telefono_rev': (
+        "`telefono_rev` VARCHAR(20) GENERATED ALWAYS AS "
+        "(NULLIF(REVERSE(REGEXP_REPLACE(`telefono`, '[^0-9]', '')), '')) STORED "
+        "COMMENT 'Dígitos de telefono invertidos (búsqueda por sufijo, ver lead_search.py)'"
+    ),
+    'telefono2_rev': (
+        "`telefono2_rev` VARCHAR(20) GENERATED ALWAYS AS "
+        "(NULLIF(REVERSE(REGEXP_REPLACE(`telefono2`, '[^0-9]', '')), '')) STORED "
+        "COMMENT 'Dígitos de telefono2 invertidos (búsqueda por sufijo, ver lead_search.py)'"
+    ),
+}
+
+LEAD_SEARCH_INDEXES = {
+    'idx_telefono_rev': "INDEX idx_telefono_rev (telefono_rev)",
+    'idx_telefono2_rev': "INDEX idx_telefono2_rev (telefono2_rev)",
+    'ft_leads_search': "FULLTEXT INDEX ft_leads_search (nombre, apellidos, nombre_clinica) WITH PARSER ngram",
+}
+
+
+def run_migration():
+    """Crea las columnas e índices de búsqueda de leads que falten."""
+    logging.info("--- Ejecutando migración: Índices de búsqueda de leads ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEAD-SEARCH] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+
+        for column, definition in LEAD_SEARCH_COLUMNS.items():
+            cursor.execute("SHOW COLUMNS FROM leads LIKE %s", (column,))
+            if cursor.fetchone():
+                logging.info(f"Columna '{column}' ya existe en leads.")
+                continue
+            logging.info(f"Añadiendo columna generada '{column}' a leads...")
+            cursor.execute(f"ALTER TABLE leads ADD COLUMN {definition}")
+            logging.info(f"✅ Columna '{column}' añadida.")
+
+        cursor.execute("SHOW INDEX FROM leads")
+        existing_indexes = {row[2] for row in cursor.fetchall()}
+        for index_name, definition in LEAD_SEARCH_INDEXES.items():
+            if index_name in existing_indexes:
+                logging.info(f"Índice '{index_name}' ya existe en leads.")
+                continue
+            logging.info(f"Creando índice '{index_name}' en leads...")
+            cursor.execute(f"ALTER TABLE leads ADD {definition}")
+            logging.info(f"✅ Índice '{index_name}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Índices de búsqueda de leads' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Índices de búsqueda de leads': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -0,0 +1,70 @@
+"""
+Migración: índices de leads para el listado del gestor de llamadas.
+
+``GET /api/calls/leads`` ordena por ``call_priority ASC, updated_at DESC, id DESC``
+y pagina por cursor (keyset). Cada índice empieza por las columnas de igualdad
+de un filtro del listado y sigue con las de ordenación en el mismo sentido, así
+que MySQL recorre el índice ya ordenado desde la posición del cursor y se
+detiene al llenar la página, sin ordenar ni saltar filas (requiere índices
+descendentes, MySQL 8). Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+_ORDER_COLUMNS = "call_priority, updated_at DESC, id DESC"
+
+LEADS_GRID_INDEXES = {
+    'idx_leads_grid_order': _ORDER_COLUMNS,
+    'idx_leads_grid_status': f"call_status, {_ORDER_COLUMNS}",
+    'idx_leads_grid_selected': f"selected_for_calling, {_ORDER_COLUMNS}",
+    'idx_leads_grid_levels': f"status_level_1, status_level_2, {_ORDER_COLUMNS}",
+    'idx_leads_grid_origen': f"origen_archivo, {_ORDER_COLUMNS}",
+}
+
+
+def run_migration():
+    """Crea los índices del listado de leads que falten."""
+    logging.info("--- Ejecutando migración: Índices del listado de leads ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEADS-GRID] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute("SHOW COLUMNS FROM leads")
+        existing_columns = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SHOW INDEX FROM leads")
+        existing_indexes = {row[2] for row in cursor.fetchall()}
+
+        for index_name, columns in LEADS_GRID_INDEXES.items():
+            if index_name in existing_indexes:
+                logging.info(f"Índice '{index_name}' ya existe en leads.")
+                continue
+            missing = [col.split()[0] for col in columns.split(', ') if col.split()[0] not in existing_columns]
+            if missing:
+                logging.warning(f"Índice '{index_name}' omitido: faltan las columnas {missing} en leads.")
+                continue
+            logging.info(f"Creando índice '{index_name}' sobre leads({columns})...")
+            cursor.execute(f"CREATE INDEX {index_name} ON leads({columns})")
+            logging.info(f"✅ Índice '{index_name}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Índices del listado de leads' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Índices del listado de leads': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
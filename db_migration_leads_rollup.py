@@ -0,0 +1,116 @@
+"""
+Migración: agregado diario de leads para informes (``leads_daily_stats``).
+
+Crea la tabla, los triggers de ``leads`` que la mantienen de forma incremental
+y, si la tabla está vacía, la rellena con todo el histórico. Es segura de
+ejecutar varias veces (los triggers se recrean siempre, para que una versión
+nueva sustituya a la anterior).
+
+Los triggers son de una sola sentencia (sin BEGIN ... END) para no depender de
+delimitadores. En UPDATE solo escriben si cambia algo que afecte al agregado
+(día de ``updated_at``, estados, clínica, fichero, cita o pack); entonces restan
+el lead de su grupo anterior y lo suman al nuevo en un único INSERT.
+"""
+
+import logging
+from db import get_connection
+import leads_rollup
+from leads_rollup import ROLLUP_UPSERT, row_values
+
+LEADS_DAILY_STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS `leads_daily_stats` (
+      `day` DATE NOT NULL,
+      `bucket` CHAR(32) NOT NULL COMMENT 'MD5 de origen_archivo, status_level_1, status_level_2 y nombre_clinica',
+      `origen_archivo` VARCHAR(255) NOT NULL DEFAULT '',
+      `status_level_1` VARCHAR(100) NOT NULL DEFAULT '',
+      `status_level_2` VARCHAR(255) NOT NULL DEFAULT '',
+      `nombre_clinica` VARCHAR(200) NOT NULL DEFAULT '',
+      `leads` INT NOT NULL DEFAULT 0,
+      `con_cita` INT NOT NULL DEFAULT 0,
+      `con_pack` INT NOT NULL DEFAULT 0,
+      PRIMARY KEY (`day`, `bucket`),
+      INDEX `idx_leads_daily_stats_origen` (`origen_archivo`, `day`),
+      INDEX `idx_leads_daily_stats_status` (`status_level_1`, `day`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def _delta_select(row: str, sign: int) -> str:
+    values = row_values(row)
+    return (f"SELECT {values['day']} AS day, {values['bucket']} AS bucket, "
+            f"{values['origen_archivo']} AS origen_archivo, {values['status_level_1']} AS status_level_1, "
+            f"{values['status_level_2']} AS status_level_2, {values['nombre_clinica']} AS nombre_clinica, "
+            f"{sign} AS leads, {sign} * {values['con_cita']} AS con_cita, {sign} * {values['con_pack']} AS con_pack")
+
+
+def _trigger(name: str, event: str, deltas: str, condition: str = "") -> str:
+    select = f"SELECT * FROM ({deltas}) delta WHERE delta.day IS NOT NULL {condition}"
+    return (f"CREATE TRIGGER {name} AFTER {event} ON leads FOR EACH ROW "
+            + ROLLUP_UPSERT.format(select=select))
+
+
+_OLD, _NEW = row_values('OLD'), row_values('NEW')
+_UNCHANGED = ' AND '.join(f"{_OLD[key]} <=> {_NEW[key]}"
+                          for key in ('day', 'bucket', 'con_cita', 'con_pack'))
+
+LEADS_ROLLUP_TRIGGERS = {
+    'trg_leads_rollup_insert': _trigger('trg_leads_rollup_insert', 'INSERT', _delta_select('NEW', 1)),
+    'trg_leads_rollup_update': _trigger(
+        'trg_leads_rollup_update', 'UPDATE',
+        f"{_delta_select('OLD', -1)} UNION ALL {_delta_select('NEW', 1)}",
+        condition=f"AND NOT ({_UNCHANGED})",
+    ),
+    'trg_leads_rollup_delete': _trigger('trg_leads_rollup_delete', 'DELETE', _delta_select('OLD', -1)),
+}
+
+
+def run_migration():
+    """Crea leads_daily_stats, sus triggers y la rellena si está vacía."""
+    logging.info("--- Ejecutando migración: Agregado diario de leads ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEADS-ROLLUP] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute("SHOW COLUMNS FROM leads LIKE 'origen_archivo'")
+        if not cursor.fetchone():
+            logging.error("[MIGRATION-LEADS-ROLLUP] Falta la columna leads.origen_archivo "
+                          "(ejecutar db_migration_add_origen_archivo.py).")
+            return False
+
+        cursor.execute(LEADS_DAILY_STATS_TABLE)
+        logging.info("✅ Tabla 'leads_daily_stats' verificada.")
+
+        for trigger, ddl in LEADS_ROLLUP_TRIGGERS.items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute(ddl)
+            logging.info(f"✅ Trigger '{trigger}' creado.")
+
+        cursor.execute("SELECT COUNT(*) FROM leads_daily_stats")
+        empty = cursor.fetchone()[0] == 0
+        db_conn.commit()
+        cursor.close()
+
+        if empty:
+            logging.info("Rellenando 'leads_daily_stats' a partir de leads...")
+            if not leads_rollup.rebuild():
+                return False
+
+        logging.info("--- Migración 'Agregado diario de leads' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Agregado diario de leads': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -0,0 +1,55 @@
+"""
+Migración: índice sobre leads.updated_at.
+
+``dashboard_stats`` comprueba en cada carga del dashboard si los leads han
+cambiado leyendo ``MAX(updated_at)``; con este índice esa lectura es un único
+acceso al final del índice en lugar de un recorrido de la tabla. Es segura de
+ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+LEADS_UPDATED_AT_INDEXES = {
+    'idx_leads_updated_at': 'updated_at',
+}
+
+
+def run_migration():
+    """Crea el índice de leads.updated_at si no existe."""
+    logging.info("--- Ejecutando migración: Índice de leads.updated_at ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-LEADS-UPDATED-AT] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute("SHOW INDEX FROM leads")
+        existing_indexes = {row[2] for row in cursor.fetchall()}
+        for index_name, column in LEADS_UPDATED_AT_INDEXES.items():
+            if index_name in existing_indexes:
+                logging.info(f"Índice '{index_name}' ya existe en leads.")
+                continue
+            logging.info(f"Creando índice '{index_name}' sobre leads({column})...")
+            cursor.execute(f"CREATE INDEX {index_name} ON leads({column})")
+            logging.info(f"✅ Índice '{index_name}' creado.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Índice de leads.updated_at' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Índice de leads.updated_at': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
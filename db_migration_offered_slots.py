@@ -0,0 +1,56 @@
+"""
+Migración: tabla ``offered_slots`` con los huecos ofrecidos a cada teléfono
+(ver slot_store.py). Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+OFFERED_SLOTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS `offered_slots` (
+      `id` BIGINT AUTO_INCREMENT PRIMARY KEY,
+      `telefono_norm` VARCHAR(20) NOT NULL,
+      `slot_date` DATE NOT NULL,
+      `start_time` CHAR(5) NOT NULL COMMENT 'HH:MM',
+      `resource_id` VARCHAR(64) NOT NULL DEFAULT '',
+      `activity_id` VARCHAR(64) NULL,
+      `area_id` VARCHAR(64) NULL,
+      `slot` JSON NOT NULL,
+      `offered_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      `expires_at` DATETIME NOT NULL,
+      UNIQUE KEY `uq_offered_slots` (`telefono_norm`, `slot_date`, `start_time`, `resource_id`),
+      INDEX `idx_offered_slots_expires` (`expires_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def run_migration():
+    """Crea la tabla offered_slots si no existe."""
+    logging.info("--- Ejecutando migración: Huecos ofrecidos ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-OFFERED-SLOTS] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute(OFFERED_SLOTS_TABLE)
+        logging.info("✅ Tabla 'offered_slots' verificada.")
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Huecos ofrecidos' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Huecos ofrecidos': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -0,0 +1,66 @@
+"""
+Migración: tablas de estado de la sincronización incremental con Pearl AI.
+
+Crea ``pearl_sync_state`` (marca de agua y ventana en curso por outbound) y
+``pearl_sync_calls`` (hash del contenido de cada llamada procesada) usadas por
+``pearl_sync``. Es segura de ejecutar varias veces.
+"""
+
+import logging
+from db import get_connection
+
+PEARL_SYNC_TABLES = {
+    'pearl_sync_state': """
+        CREATE TABLE IF NOT EXISTS `pearl_sync_state` (
+          `outbound_id` VARCHAR(64) PRIMARY KEY,
+          `watermark` DATETIME NULL,
+          `window_from` DATETIME NULL,
+          `window_to` DATETIME NULL,
+          `next_skip` INT NOT NULL DEFAULT 0,
+          `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+    'pearl_sync_calls': """
+        CREATE TABLE IF NOT EXISTS `pearl_sync_calls` (
+          `call_id` VARCHAR(64) PRIMARY KEY,
+          `outbound_id` VARCHAR(64) NULL,
+          `content_hash` CHAR(40) NOT NULL,
+          `synced_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          INDEX `idx_synced_at` (`synced_at`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """,
+}
+
+
+def run_migration():
+    """Crea las tablas de estado de sincronización con Pearl si no existen."""
+    logging.info("--- Ejecutando migración: Estado de sincronización con Pearl ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-PEARL-SYNC] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        for table, ddl in PEARL_SYNC_TABLES.items():
+            cursor.execute(ddl)
+            logging.info(f"✅ Tabla '{table}' verificada.")
+
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Estado de sincronización con Pearl' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Estado de sincronización con Pearl': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -0,0 +1,53 @@
+"""
+Migración: tabla ``reservation_idempotency`` con las claves de idempotencia
+de ``/api/reservar`` (ver reservation_idempotency.py). Es segura de ejecutar
+varias veces.
+"""
+
+import logging
+from db import get_connection
+
+RESERVATION_IDEMPOTENCY_TABLE = """
+    CREATE TABLE IF NOT EXISTS `reservation_idempotency` (
+      `key_hash` CHAR(64) PRIMARY KEY COMMENT 'sha256 de key_text',
+      `key_text` VARCHAR(255) NOT NULL,
+      `status` ENUM('pending', 'done') NOT NULL DEFAULT 'pending',
+      `owner_token` CHAR(32) NULL,
+      `result` JSON NULL,
+      `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+      `expires_at` DATETIME NOT NULL,
+      INDEX `idx_reservation_idempotency_expires` (`expires_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def run_migration():
+    """Crea la tabla reservation_idempotency si no existe."""
+    logging.info("--- Ejecutando migración: Idempotencia de reservas ---")
+    db_conn = None
+    try:
+        db_conn = get_connection()
+        if not db_conn:
+            logging.error("[MIGRATION-RESERVATION-IDEMPOTENCY] No se pudo obtener conexión a la base de datos.")
+            return False
+
+        cursor = db_conn.cursor()
+        cursor.execute(RESERVATION_IDEMPOTENCY_TABLE)
+        logging.info("✅ Tabla 'reservation_idempotency' verificada.")
+        db_conn.commit()
+        cursor.close()
+        logging.info("--- Migración 'Idempotencia de reservas' completada ---")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Error durante la migración 'Idempotencia de reservas': {e}", exc_info=True)
+        if db_conn:
+            db_conn.rollback()
+        return False
+    finally:
+        if db_conn and db_conn.is_connected():
+            db_conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migration()
@@ -7,8 +7,8 @@ Monitorea la BD cada minuto y envía emails para nuevas citas
 import time
 import logging
 from datetime import datetime, timedelta
-import pymysql
 from config import settings
+from db import get_connection
 from email_notifications import send_cita_notification
 
 # Configurar logging
@@ -26,21 +26,11 @@ class EmailCitasDaemon:
         self.last_check = None
         
     def get_db_connection(self):
-        """Crear conexión a la base de datos"""
-        try:
-            connection = pymysql.connect(
-                host=settings.DB_HOST,
-                port=settings.DB_PORT,
-                user=settings.DB_USER,
-                password=settings.DB_PASSWORD,
-                database=settings.DB_DATABASE,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            return connection
-        except Exception as e:
-            logger.error(f"Error conectando a BD: {e}")
-            return None
+        """Obtener conexión del pool compartido (filas como diccionario)"""
+        connection = get_connection(dictionary=True)
+        if connection is None:
+            logger.error("Error conectando a BD: no hay conexión disponible en el pool")
+        return connection
     
     def get_new_citas(self):
         """Obtener citas nuevas desde la última verificación"""
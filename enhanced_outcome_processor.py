@@ -6,24 +6,16 @@ según las reglas de negocio:
 - 2+ veces Outcome 6 = Número erróneo → "Numero erroneo"
 """
 
-import pymysql
 import logging
 from datetime import datetime
-from config import settings
+from db import get_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_connection():
-    return pymysql.connect(
-        host=settings.DB_HOST,
-        port=settings.DB_PORT,
-        user=settings.DB_USER,
-        password=settings.DB_PASSWORD,
-        database=settings.DB_DATABASE,
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    """Conexión del pool compartido (ver db.py) con cursores de tipo diccionario."""
+    return get_pool().acquire(dictionary=True)
 
 def determine_lead_status_from_outcomes(lead_id: int, max_attempts: int = 6) -> dict:
     """
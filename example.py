@@ -1,6 +1,6 @@
 import json
 import requests
-from tuotempo_api import TuoTempoAPI
+from tuotempo_api import TuoTempoAPI, registration_ids
 from datetime import datetime
 
 def print_json(data):
@@ -118,13 +118,15 @@ def main():
                     print_json(api.handle_error(user_response))
                 return
             
-            print(f"User registered successfully with session ID: {api.session_id}")
+            member_id, session_id = registration_ids(user_response)
+            print(f"User registered successfully with session ID: {session_id}")
             
             # Step 4: Confirm appointment (Confirmar cita)
             print("\nConfirming appointment...")
             appointment_response = api.confirm_appointment(
                 availability=selected_slot,
-                communication_phone="600123456"
+                communication_phone="600123456",
+                member_id=member_id
             )
             
             if appointment_response.get("result") != "OK":
@@ -3,6 +3,7 @@
 """
 Generador de Estadísticas de Leads - Railway Database
 Analiza los resultados de contacto usando status_level_1 y status_level_2
+a partir del agregado diario leads_daily_stats (ver leads_rollup.py)
 """
 
 import os
@@ -11,6 +12,7 @@ from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 import json
 from db import get_connection # Importar la función de conexión centralizada
+import leads_rollup
 
 class LeadsStatsGenerator:
     def __init__(self):
@@ -30,46 +32,29 @@ class LeadsStatsGenerator:
             return False
     
     def get_leads_data(self, fecha_desde=None, fecha_hasta=None):
-        """Obtener datos de leads con filtros de fecha opcionales"""
+        """Obtener el agregado diario de leads (leads_daily_stats) con filtros de fecha opcionales.
+        
+        Cada fila es un grupo día/estado/subestado/clínica con su número de
+        leads ('count') y cuántos tienen cita ('con_cita').
+        """
         try:
             cursor = self.connection.cursor(dictionary=True)
-            
-            # Query base
-            query = """
-            SELECT 
-                id,
-                telefono,
-                nombre,
-                apellidos,
-                status_level_1,
-                status_level_2,
-                updated_at,
-                cita AS fecha_cita,
-                hora_cita,
-                nombre_clinica AS clinica,
-            call_summary AS observaciones
-            FROM leads 
-            WHERE 1=1
-            """
-            
-            params = []
-            
-            # Añadir filtros de fecha si se proporcionan
-            if fecha_desde:
-                query += " AND DATE(updated_at) >= %s"
-                params.append(fecha_desde)
-                
-            if fecha_hasta:
-                query += " AND DATE(updated_at) <= %s"
-                params.append(fecha_hasta)
-                
-            query += " ORDER BY updated_at DESC"
-            
-            cursor.execute(query, params)
-            leads = cursor.fetchall()
+            rows = leads_rollup.query(
+                cursor, desde=fecha_desde, hasta=fecha_hasta,
+                group_by=('day', 'status_level_1', 'status_level_2', 'nombre_clinica')
+            )
             cursor.close()
             
-            print(f"📊 Obtenidos {len(leads)} leads para análisis")
+            leads = [{
+                'day': row['day'],
+                'status_level_1': row['status_level_1'] or None,
+                'status_level_2': row['status_level_2'] or None,
+                'clinica': row['nombre_clinica'] or None,
+                'count': row['leads'],
+                'con_cita': row['con_cita'],
+            } for row in rows]
+            
+            print(f"📊 Obtenidos {sum(lead['count'] for lead in leads)} leads para análisis")
             return leads
             
         except Exception as e:
@@ -88,11 +73,11 @@ class LeadsStatsGenerator:
             
             # Contar combinaciones
             combo = f"{status_1} → {status_2}"
-            combinations[combo] += 1
+            combinations[combo] += lead['count']
             
             # Contar individuales
-            status_1_counts[status_1] += 1
-            status_2_counts[status_2] += 1
+            status_1_counts[status_1] += lead['count']
+            status_2_counts[status_2] += lead['count']
         
         return combinations, status_1_counts, status_2_counts
     
@@ -103,14 +88,12 @@ class LeadsStatsGenerator:
         appointment_by_status = defaultdict(int)
         
         for lead in leads:
-            has_appointment = bool(lead.get('fecha_cita') and lead.get('hora_cita'))
             status_1 = lead.get('status_level_1') or 'Sin definir'
             
-            if has_appointment:
-                with_appointment += 1
-                appointment_by_status[status_1] += 1
-            else:
-                without_appointment += 1
+            with_appointment += lead['con_cita']
+            without_appointment += lead['count'] - lead['con_cita']
+            if lead['con_cita']:
+                appointment_by_status[status_1] += lead['con_cita']
         
         return {
             'con_cita': with_appointment,
@@ -131,14 +114,11 @@ class LeadsStatsGenerator:
             clinica = lead.get('clinica') or 'Sin asignar'
             status_1 = lead.get('status_level_1') or 'Sin definir'
             status_2 = lead.get('status_level_2') or 'Sin definir'
-            has_appointment = bool(lead.get('fecha_cita') and lead.get('hora_cita'))
-            
-            clinic_stats[clinica]['total'] += 1
-            clinic_stats[clinica]['status_1'][status_1] += 1
-            clinic_stats[clinica]['status_2'][status_2] += 1
             
-            if has_appointment:
-                clinic_stats[clinica]['con_cita'] += 1
+            clinic_stats[clinica]['total'] += lead['count']
+            clinic_stats[clinica]['status_1'][status_1] += lead['count']
+            clinic_stats[clinica]['status_2'][status_2] += lead['count']
+            clinic_stats[clinica]['con_cita'] += lead['con_cita']
         
         return dict(clinic_stats)
     
@@ -151,20 +131,16 @@ class LeadsStatsGenerator:
         })
         
         for lead in leads:
-            fecha = lead.get('updated_at')
-            if fecha:
-                day = fecha.date().isoformat()
-                status_1 = lead.get('status_level_1') or 'Sin definir'
-                has_appointment = bool(lead.get('fecha_cita') and lead.get('hora_cita'))
-                
-                daily_stats[day]['total'] += 1
-                
-                # Considerar "contactado" si tiene algún status definido
-                if status_1 != 'Sin definir':
-                    daily_stats[day]['contactados'] += 1
-                
-                if has_appointment:
-                    daily_stats[day]['citas'] += 1
+            day = lead['day'].isoformat()
+            status_1 = lead.get('status_level_1') or 'Sin definir'
+            
+            daily_stats[day]['total'] += lead['count']
+            
+            # Considerar "contactado" si tiene algún status definido
+            if status_1 != 'Sin definir':
+                daily_stats[day]['contactados'] += lead['count']
+            
+            daily_stats[day]['citas'] += lead['con_cita']
         
         return dict(daily_stats)
     
@@ -178,6 +154,9 @@ class LeadsStatsGenerator:
             print("❌ No se encontraron leads para analizar")
             return
         
+        total_leads = sum(lead['count'] for lead in leads)
+        leads_contactados = sum(lead['count'] for lead in leads if lead.get('status_level_1'))
+        
         # Realizar análisis
         combinations, status_1_counts, status_2_counts = self.analyze_status_combinations(leads)
         appointments = self.analyze_appointments(leads)
@@ -188,18 +167,18 @@ class LeadsStatsGenerator:
         report = {
             'metadata': {
                 'fecha_generacion': datetime.now().isoformat(),
-                'total_leads': len(leads),
+                'total_leads': total_leads,
                 'periodo': {
                     'desde': fecha_desde.isoformat() if fecha_desde else 'Todos los registros',
                     'hasta': fecha_hasta.isoformat() if fecha_hasta else 'Hasta la fecha'
                 }
             },
             'resumen_general': {
-                'total_leads': len(leads),
-                'leads_contactados': sum(1 for lead in leads if lead.get('status_level_1')),
+                'total_leads': total_leads,
+                'leads_contactados': leads_contactados,
                 'leads_con_cita': appointments['con_cita'],
-                'tasa_contacto': round((sum(1 for lead in leads if lead.get('status_level_1')) / len(leads)) * 100, 2),
-                'tasa_conversion_cita': round((appointments['con_cita'] / len(leads)) * 100, 2)
+                'tasa_contacto': round((leads_contactados / total_leads) * 100, 2),
+                'tasa_conversion_cita': round((appointments['con_cita'] / total_leads) * 100, 2)
             },
             'status_level_1': dict(status_1_counts),
             'status_level_2': dict(status_2_counts),
@@ -9,9 +9,10 @@ import os
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 from db import get_connection # Importar la función de conexión centralizada
+import leads_rollup
 
 def get_leads_data():
-    """Obtener datos de leads"""
+    """Obtener los grupos estado/subestado/clínica del agregado leads_daily_stats"""
     connection = None  # Inicializar la variable
     try:
         connection = get_connection()
@@ -20,25 +21,16 @@ def get_leads_data():
 
         cursor = connection.cursor(dictionary=True)
         
-        query = """
-        SELECT 
-            id,
-            telefono,
-            nombre,
-            apellidos,
-            status_level_1,
-            status_level_2,
-            updated_at,
-            cita AS fecha_cita,
-            hora_cita,
-            nombre_clinica AS clinica,
-            call_summary AS observaciones
-        FROM leads 
-        ORDER BY updated_at DESC
-        """
-        
-        cursor.execute(query)
-        leads = cursor.fetchall()
+        rows = leads_rollup.query(
+            cursor, group_by=('status_level_1', 'status_level_2', 'nombre_clinica')
+        )
+        leads = [{
+            'status_level_1': row['status_level_1'] or None,
+            'status_level_2': row['status_level_2'] or None,
+            'clinica': row['nombre_clinica'] or None,
+            'count': row['leads'],
+            'con_cita': row['con_cita'],
+        } for row in rows]
         cursor.close()
         connection.close()
         
@@ -58,21 +50,22 @@ def generate_html_report():
         return None
     
     # Análisis de datos
-    total_leads = len(leads)
-    leads_contactados = sum(1 for lead in leads if lead.get('status_level_1'))
-    leads_con_cita = sum(1 for lead in leads if lead.get('fecha_cita') and lead.get('hora_cita'))
-    
-    # Contadores
-    status_1_counts = Counter(lead.get('status_level_1') or 'Sin definir' for lead in leads)
-    status_2_counts = Counter(lead.get('status_level_2') or 'Sin definir' for lead in leads)
-    clinic_counts = Counter(lead.get('clinica') or 'Sin asignar' for lead in leads)
+    total_leads = sum(lead['count'] for lead in leads)
+    leads_contactados = sum(lead['count'] for lead in leads if lead.get('status_level_1'))
+    leads_con_cita = sum(lead['con_cita'] for lead in leads)
     
-    # Combinaciones de status
+    # Contadores y combinaciones de status
+    status_1_counts = Counter()
+    status_2_counts = Counter()
+    clinic_counts = Counter()
     combinations = Counter()
     for lead in leads:
         status_1 = lead.get('status_level_1') or 'Sin definir'
         status_2 = lead.get('status_level_2') or 'Sin definir'
-        combinations[f"{status_1} → {status_2}"] += 1
+        status_1_counts[status_1] += lead['count']
+        status_2_counts[status_2] += lead['count']
+        clinic_counts[lead.get('clinica') or 'Sin asignar'] += lead['count']
+        combinations[f"{status_1} → {status_2}"] += lead['count']
     
     # Generar HTML
     html_content = f"""
@@ -0,0 +1,169 @@
+"""
+Agregado de llamadas por lead (tabla ``lead_call_stats``).
+
+Mantiene por lead el número de llamadas, la duración total, la última llamada
+y cuántas tienen grabación, para que el listado de leads y el recálculo de
+``call_attempts_count`` no tengan que agrupar todo ``pearl_calls`` en cada
+petición.
+
+La tabla se actualiza de forma incremental con triggers sobre ``pearl_calls``
+(ver ``db_migration_lead_call_stats``), así que cubre todos los procesos que
+escriben llamadas. Este módulo ofrece la reconstrucción completa y la
+verificación contra ``pearl_calls``:
+
+    python lead_call_stats.py verify          # lista leads descuadrados
+    python lead_call_stats.py verify --fix    # y los recalcula
+    python lead_call_stats.py rebuild         # reconstrucción completa
+"""
+
+import argparse
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+STATS_COLUMNS = ('call_count', 'total_duration', 'last_call_time', 'calls_with_recording')
+REBUILD_CHUNK = 1000
+
+# Agregado de referencia, calculado directamente sobre pearl_calls
+_AGGREGATE_SELECT = """
+    SELECT
+        lead_id,
+        COUNT(*) AS call_count,
+        COALESCE(SUM(duration), 0) AS total_duration,
+        MAX(call_time) AS last_call_time,
+        COUNT(recording_url) AS calls_with_recording
+    FROM pearl_calls
+    WHERE lead_id IS NOT NULL {extra}
+    GROUP BY lead_id
+"""
+
+_UPSERT = """
+    INSERT INTO lead_call_stats (lead_id, call_count, total_duration, last_call_time, calls_with_recording)
+    {select}
+    ON DUPLICATE KEY UPDATE
+        call_count = VALUES(call_count),
+        total_duration = VALUES(total_duration),
+        last_call_time = VALUES(last_call_time),
+        calls_with_recording = VALUES(calls_with_recording)
+"""
+
+
+def refresh_leads(cursor, lead_ids: Iterable[int]) -> int:
+    """Recalcula el agregado de ``lead_ids`` desde pearl_calls (sin commit)."""
+    lead_ids = sorted({int(lead_id) for lead_id in lead_ids if lead_id})
+    refreshed = 0
+    for i in range(0, len(lead_ids), REBUILD_CHUNK):
+        chunk = lead_ids[i:i + REBUILD_CHUNK]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        # Leads sin llamadas: el agregado desaparece
+        cursor.execute(f"DELETE FROM lead_call_stats WHERE lead_id IN ({placeholders})", chunk)
+        select = _AGGREGATE_SELECT.format(extra=f"AND lead_id IN ({placeholders})")
+        cursor.execute(_UPSERT.format(select=select), chunk)
+        refreshed += len(chunk)
+    return refreshed
+
+
+def rebuild() -> bool:
+    """Reconstruye ``lead_call_stats`` completa a partir de pearl_calls."""
+    conn = get_connection()
+    if not conn:
+        logger.error("[LEAD_STATS] No se pudo conectar para reconstruir el agregado")
+        return False
+    try:
+        conn.start_transaction()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM lead_call_stats")
+        cursor.execute(_UPSERT.format(select=_AGGREGATE_SELECT.format(extra='')))
+        rows = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        logger.info(f"[LEAD_STATS] Agregado reconstruido ({rows} filas afectadas)")
+        return True
+    except Exception as e:
+        logger.error(f"[LEAD_STATS] Error reconstruyendo el agregado: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def verify(fix: bool = False, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Compara ``lead_call_stats`` con el agregado real de pearl_calls.
+
+    Args:
+        fix: Recalcula los leads descuadrados.
+        limit: Máximo de diferencias a devolver (None = todas).
+
+    Returns:
+        Lista de ``{'lead_id', 'expected': {...}, 'stored': {...}}`` descuadrados.
+    """
+    conn = get_connection()
+    if not conn:
+        logger.error("[LEAD_STATS] No se pudo conectar para verificar el agregado")
+        return []
+    try:
+        cursor = conn.cursor(dictionary=True)
+        aggregate = _AGGREGATE_SELECT.format(extra='')
+        mismatch = ' OR '.join(f"NOT (a.{col} <=> s.{col})" for col in STATS_COLUMNS)
+        select_cols = ', '.join(
+            [f"a.{col} AS expected_{col}" for col in STATS_COLUMNS] +
+            [f"s.{col} AS stored_{col}" for col in STATS_COLUMNS]
+        )
+        # Leads cuyo agregado no coincide (o falta) y filas con llamadas que ya no existen
+        cursor.execute(f"""
+            SELECT a.lead_id, {select_cols}
+            FROM ({aggregate}) a
+            LEFT JOIN lead_call_stats s ON s.lead_id = a.lead_id
+            WHERE {mismatch}
+            UNION ALL
+            SELECT s.lead_id, {select_cols}
+            FROM lead_call_stats s
+            LEFT JOIN ({aggregate}) a ON a.lead_id = s.lead_id
+            WHERE a.lead_id IS NULL AND s.call_count > 0
+        """)
+        rows = cursor.fetchall()
+
+        differences = [{
+            'lead_id': row['lead_id'],
+            'expected': {col: row[f'expected_{col}'] for col in STATS_COLUMNS},
+            'stored': {col: row[f'stored_{col}'] for col in STATS_COLUMNS},
+        } for row in rows]
+
+        if differences:
+            logger.warning(f"[LEAD_STATS] {len(differences)} leads con el agregado descuadrado")
+            if fix:
+                conn.start_transaction()
+                refresh_leads(cursor, [diff['lead_id'] for diff in differences])
+                conn.commit()
+                logger.info(f"[LEAD_STATS] {len(differences)} leads recalculados")
+        else:
+            logger.info("[LEAD_STATS] Agregado consistente con pearl_calls")
+        cursor.close()
+        return differences[:limit] if limit else differences
+    except Exception as e:
+        logger.error(f"[LEAD_STATS] Error verificando el agregado: {e}")
+        conn.rollback()
+        return []
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Reconstruye o verifica la tabla lead_call_stats.")
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--fix', action='store_true', help='Con verify, recalcula los leads descuadrados.')
+    parser.add_argument('--show', type=int, default=20, help='Diferencias a mostrar con verify.')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        raise SystemExit(0 if rebuild() else 1)
+
+    diffs = verify(fix=args.fix)
+    for diff in diffs[:args.show]:
+        print(f"Lead {diff['lead_id']}: esperado {diff['expected']} / guardado {diff['stored']}")
+    print(f"{len(diffs)} leads descuadrados" + (" (corregidos)" if args.fix and diffs else ""))
@@ -0,0 +1,345 @@
+"""
+Importación de leads desde Excel (.xlsx) o CSV por bloques.
+
+El fichero se lee en streaming (openpyxl en modo solo lectura o
+``pd.read_csv(chunksize=...)``), de ``LEAD_IMPORT_CHUNK_SIZE`` filas cada vez,
+así que la memoria no depende del tamaño del fichero. Cada bloque:
+
+1. Renombra las columnas del fichero a las de ``leads`` (``COLUMN_ALIASES``).
+2. Normaliza teléfonos, NIF y ``conPack`` con operaciones vectorizadas.
+3. Se guarda con un único ``INSERT ... VALUES (...), (...) ON DUPLICATE KEY
+   UPDATE`` sobre el índice único ``uq_leads_import_key`` (``origen_archivo``,
+   ``import_key``), donde ``import_key`` es el NIF normalizado o, si no hay,
+   ``telefono_norm`` (ver ``db_migration_lead_import_key``). Recargar un fichero
+   actualiza sus leads en vez de duplicarlos; solo se sobrescriben las columnas
+   que trae el fichero, nunca el estado de llamadas.
+4. Hace commit. Si el bloque falla se repite fila a fila y solo cuentan como
+   error las filas que fallan.
+
+Si el índice único aún no existe se insertan las filas sin clave (como antes).
+El progreso se notifica tras cada bloque al callback ``on_progress`` (las
+cargas del dashboard lo publican en su trabajo, ver dashboard_jobs.py) y se
+guarda para ``get_import_progress()`` (importaciones de este proceso).
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LEAD_IMPORT_CHUNK_SIZE = int(os.getenv('LEAD_IMPORT_CHUNK_SIZE', 1000))  # filas por bloque
+# Importaciones terminadas que se conservan en el registro de progreso
+LEAD_IMPORT_PROGRESS_KEEP = 20
+# Errores de fila que se guardan en el resultado
+MAX_ERROR_SAMPLES = 5
+
+IMPORT_KEY_INDEX = 'uq_leads_import_key'
+
+# Columna de leads -> nombres con los que puede venir en el fichero
+COLUMN_ALIASES = {
+    'nombre': ['nombre', 'name', 'first name', 'firstname'],
+    'apellidos': ['apellidos', 'surname', 'last name', 'lastname'],
+    'telefono': ['teléfono', 'telefono', 'telefono1', 'teléfono1', 'phone', 'mobile', 'phone number', 'tel', 'teléfono móvil', 'teléfono principal', 'teléfono contacto', 'teléfono cliente', 'número', 'número teléfono'],
+    'telefono2': ['teléfono2', 'telefono2', 'telefono 2', 'teléfono 2', 'phone2', 'mobile2', 'telefono secundario', 'tel2', 'teléfono alternativo', 'otro teléfono'],
+    'nif': ['nif', 'dni', 'documento'],
+    'fecha_nacimiento': ['fecha nacimiento', 'fecha_nacimiento', 'fechanacimiento', 'birth date'],
+    'sexo': ['sexo', 'gender'],
+    'certificado': ['certificado', 'certificate'],
+    'clinica_id': ['clinica id', 'clinica_id', 'clinic id'],
+    'delegacion': ['delegacion', 'delegation'],
+    'poliza': ['poliza', 'policy'],
+    'segmento': ['segmento', 'segment'],
+    'email': ['email', 'correo electronico'],
+    'cita': ['cita', 'fecha_cita', 'fecha cita', 'appointment date'],
+    'nombre_clinica': ['nombre_clinica', 'nombre clinica', 'clinic name', 'nombreclinica'],
+    'direccion_clinica': ['direccion_clinica', 'direccion clinica', 'clinic address', 'direccionclinica'],
+    'codigo_postal': ['codigo_postal', 'codigo postal', 'postal code', 'codigopostal'],
+    'ciudad': ['ciudad', 'city'],
+    'orden': ['orden', 'order', 'id'],
+}
+
+# Columnas de leads que se escriben en la importación
+LEADS_COLUMNS = [
+    'nombre', 'apellidos', 'nombre_clinica', 'direccion_clinica', 'codigo_postal',
+    'ciudad', 'telefono', 'area_id', 'match_source', 'match_confidence', 'cita',
+    'conPack', 'ultimo_estado', 'resultado_llamada', 'telefono2', 'call_id',
+    'call_time', 'call_duration', 'call_summary', 'call_recording_url',
+    'status_level_1', 'status_level_2', 'hora_rellamada', 'error_tecnico',
+    'razon_vuelta_a_llamar', 'razon_no_interes', 'certificado',
+    'clinica_id', 'delegacion', 'fecha_nacimiento', 'nif', 'orden', 'poliza',
+    'segmento', 'sexo', 'origen_archivo'
+]
+
+_progress: Dict[str, Dict[str, Any]] = {}
+_progress_lock = threading.Lock()
+
+
+def _normalize_header(name: Any) -> str:
+    return re.sub(r'[^a-z0-9]+', '', str(name).lower().strip())
+
+
+def map_columns(columns: List[Any]) -> Dict[str, str]:
+    """Columna del fichero -> columna de leads, para las que se reconocen."""
+    normalized = {_normalize_header(col): str(col) for col in columns}
+    mapping = {}
+    for db_col, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            source = normalized.get(_normalize_header(alias))
+            if source is not None:
+                mapping[source] = db_col
+                break
+    return mapping
+
+
+def _read_chunks(source, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Bloques de ``chunk_size`` filas del fichero, con sus cabeceras originales."""
+    if isinstance(source, str) and not source.endswith('.xlsx'):
+        yield from pd.read_csv(source, dtype=str, chunksize=chunk_size)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) if col is not None else f"columna_{i}" for i, col in enumerate(header)]
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _clean_phone(column: pd.Series) -> pd.Series:
+    """Solo dígitos y '+' (los números leídos como float pierden el '.0'); None si no hay dígitos."""
+    text = column.astype('string').str.strip().str.replace(r'\.0$', '', regex=True)
+    text = text.str.replace(r'[^0-9+]', '', regex=True)
+    return text.where(text.str.contains(r'\d', regex=True).fillna(False))
+
+
+def _import_keys(df: pd.DataFrame) -> pd.Series:
+    """``import_key`` de cada fila, igual que la columna generada: NIF normalizado o ``telefono_norm``."""
+    nif = df['nif'].astype('string').str.replace(r'[^0-9A-Za-z]', '', regex=True).str.upper()
+    phone = df['telefono'].astype('string').str.replace(r'\D', '', regex=True).str[-9:]
+    phone = phone.where(phone.str.len().fillna(0) > 0)
+    return nif.where(nif.str.len().fillna(0) > 0, phone)
+
+
+def _prepare_chunk(df: pd.DataFrame, mapping: Dict[str, str], origen_archivo: str) -> pd.DataFrame:
+    """Renombra, completa y normaliza un bloque a las columnas ``LEADS_COLUMNS`` (+ ``_import_key``)."""
+    df = df.rename(columns=mapping)
+    df = df.loc[:, ~df.columns.duplicated()]
+    for col in LEADS_COLUMNS:
+        if col not in df.columns:
+            df[col] = origen_archivo if col == 'origen_archivo' else None
+
+    for col in ('telefono', 'telefono2'):
+        df[col] = _clean_phone(df[col])
+    df['nif'] = df['nif'].astype('string').str.strip()
+    df['conPack'] = (df['conPack'].astype('string').str.strip().str.lower()
+                     .isin(['1', 'si', 'sí', 'true', 'yes']).astype(int))
+
+    df = df[LEADS_COLUMNS].astype(object)
+    df = df.where(df.notna(), None)
+    df['_import_key'] = _import_keys(df).astype(object).where(lambda keys: keys.notna(), None)
+    return df
+
+
+def _upsert_sql(rows: int, update_columns: List[str], keyed: bool) -> str:
+    row_placeholders = f"({', '.join(['%s'] * len(LEADS_COLUMNS))})"
+    sql = (f"INSERT INTO leads ({', '.join(LEADS_COLUMNS)}) VALUES "
+           + ', '.join([row_placeholders] * rows))
+    if keyed:
+        updates = ', '.join(f"{col} = VALUES({col})" for col in update_columns) or "id = id"
+        sql += f" ON DUPLICATE KEY UPDATE {updates}"
+    return sql
+
+
+def _existing_keys(cursor, origen_archivo: str, keys: List[str]) -> set:
+    if not keys:
+        return set()
+    cursor.execute(
+        f"SELECT import_key FROM leads WHERE origen_archivo = %s AND import_key IN ({', '.join(['%s'] * len(keys))})",
+        [origen_archivo] + keys
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _has_import_key(connection) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW INDEX FROM leads WHERE Key_name = %s", (IMPORT_KEY_INDEX,))
+        return bool(cursor.fetchall())
+
+
+def _write_chunk(connection, df: pd.DataFrame, origen_archivo: str,
+                 update_columns: List[str], keyed: bool, stats: Dict[str, Any]) -> None:
+    """Guarda un bloque; si falla, lo repite fila a fila para aislar las filas erróneas."""
+    rows = list(df[LEADS_COLUMNS].itertuples(index=False, name=None))
+    keys = df['_import_key']
+    try:
+        with connection.cursor() as cursor:
+            updated = 0
+            if keyed:
+                existing = _existing_keys(cursor, origen_archivo, list(keys.dropna().unique()))
+                updated = int((keys.isin(existing) | (keys.notna() & keys.duplicated())).sum())
+            cursor.execute(_upsert_sql(len(rows), update_columns, keyed),
+                           [value for row in rows for value in row])
+        connection.commit()
+        stats['insertados'] += len(rows) - updated
+        stats['actualizados'] += updated
+        return
+    except Exception as e:
+        connection.rollback()
+        logger.warning(f"[LEAD_IMPORT] Bloque {stats['bloques'] + 1} fallido ({e}); reintentando fila a fila")
+
+    sql = _upsert_sql(1, update_columns, keyed)
+    for offset, row in enumerate(rows):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, row)
+                affected = cursor.rowcount
+            connection.commit()
+            # INSERT ... ON DUPLICATE KEY UPDATE: 1 = insertada, 2 = actualizada, 0 = sin cambios
+            stats['insertados' if affected == 1 else 'actualizados'] += 1
+        except Exception as e:
+            connection.rollback()
+            stats['errores'] += 1
+            if len(stats['detalle_errores']) < MAX_ERROR_SAMPLES:
+                stats['detalle_errores'].append(f"Fila {stats['filas'] + offset + 2}: {e}")
+
+
+def _publish(import_id: str, stats: Dict[str, Any],
+             on_progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+    snapshot = dict(stats, detalle_errores=list(stats['detalle_errores']))
+    with _progress_lock:
+        _progress[import_id] = snapshot
+        finished = [key for key, item in _progress.items() if item['estado'] != 'en_curso']
+        for key in finished[:-LEAD_IMPORT_PROGRESS_KEEP]:
+            del _progress[key]
+    if on_progress:
+        on_progress(snapshot)
+
+
+def get_import_progress() -> List[Dict[str, Any]]:
+    """Importaciones en curso y recientes de este proceso (más recientes primero)."""
+    with _progress_lock:
+        items = [dict(item) for item in _progress.values()]
+    return sorted(items, key=lambda item: item['inicio'], reverse=True)
+
+
+def import_leads(connection, source, origen_archivo: str, chunk_size: int = LEAD_IMPORT_CHUNK_SIZE,
+                 on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 should_cancel: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Importa un fichero de leads por bloques.
+
+    Args:
+        connection: Conexión MySQL (se hace commit por bloque).
+        source: Ruta a un .xlsx/.csv o un fichero .xlsx en memoria (BytesIO).
+        origen_archivo: Valor de ``leads.origen_archivo`` para las filas sin él.
+        chunk_size: Filas por bloque.
+        on_progress: Se llama con el progreso tras cada bloque.
+        should_cancel: Se consulta antes de cada bloque; si devuelve True la
+            importación se detiene (los bloques ya guardados se conservan) con
+            ``estado = 'cancelado'``.
+
+    Returns:
+        Dict con ``insertados``, ``actualizados``, ``errores``, ``total``,
+        ``bloques`` y ``detalle_errores`` (primeros errores de fila).
+    """
+    import_id = f"{origen_archivo}@{time.time():.6f}"
+    stats = {
+        'id': import_id, 'origen_archivo': origen_archivo, 'estado': 'en_curso',
+        'inicio': datetime.now().isoformat(timespec='seconds'), 'fin': None,
+        'filas': 0, 'bloques': 0, 'insertados': 0, 'actualizados': 0, 'errores': 0,
+        'detalle_errores': [],
+    }
+    _publish(import_id, stats, on_progress)
+    started = time.monotonic()
+
+    try:
+        keyed = _has_import_key(connection)
+        if not keyed:
+            logger.warning(f"[LEAD_IMPORT] Falta el índice {IMPORT_KEY_INDEX}: se insertan las filas sin "
+                           f"comprobar duplicados (ejecutar db_migration_lead_import_key.py)")
+        mapping, update_columns = None, []
+        for chunk in _read_chunks(source, chunk_size):
+            if should_cancel and should_cancel():
+                logger.warning(f"[LEAD_IMPORT] Importación de {origen_archivo} cancelada tras {stats['filas']} filas")
+                stats['estado'] = 'cancelado'
+                break
+            if mapping is None:
+                mapping = map_columns(list(chunk.columns))
+                update_columns = [col for col in dict.fromkeys(mapping.values())
+                                  if col in LEADS_COLUMNS and col != 'origen_archivo']
+                logger.info(f"[LEAD_IMPORT] Columnas reconocidas: {mapping}")
+            df = _prepare_chunk(chunk, mapping, origen_archivo)
+            _write_chunk(connection, df, origen_archivo, update_columns, keyed, stats)
+            stats['filas'] += len(df)
+            stats['bloques'] += 1
+            _publish(import_id, stats, on_progress)
+        else:
+            stats['estado'] = 'completado'
+    except Exception as e:
+        logger.error(f"[LEAD_IMPORT] Error importando {origen_archivo}: {e}", exc_info=True)
+        stats['estado'] = 'error'
+        stats['detalle_errores'].append(str(e))
+    finally:
+        stats['fin'] = datetime.now().isoformat(timespec='seconds')
+        _publish(import_id, stats, on_progress)
+
+    stats['total'] = stats['filas']
+    logger.info(f"[LEAD_IMPORT] {origen_archivo}: {stats['filas']} filas en {stats['bloques']} bloques "
+                f"({time.monotonic() - started:.1f}s) | Insertados: {stats['insertados']} | "
+                f"Actualizados: {stats['actualizados']} | Errores: {stats['errores']}")
+    return stats
+
+
+def registrar_archivo_origen(connection, nombre_archivo, registros_importados):
+    """
+    Registra o actualiza un archivo en la tabla archivos_origen.
+    """
+    try:
+        with connection.cursor() as cursor:
+            # Verificar si el archivo ya existe
+            cursor.execute("SELECT id, total_registros FROM archivos_origen WHERE nombre_archivo = %s", (nombre_archivo,))
+            resultado = cursor.fetchone()
+
+            if resultado:
+                # Actualizar registro existente
+                archivo_id, total_anterior = resultado
+                nuevo_total = total_anterior + registros_importados
+                cursor.execute("""
+                    UPDATE archivos_origen
+                    SET total_registros = %s, fecha_creacion = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (nuevo_total, archivo_id))
+                logger.info(f"Archivo origen '{nombre_archivo}' actualizado: {total_anterior} -> {nuevo_total} registros")
+            else:
+                # Crear nuevo registro
+                cursor.execute("""
+                    INSERT INTO archivos_origen (nombre_archivo, descripcion, total_registros, usuario_creacion)
+                    VALUES (%s, %s, %s, %s)
+                """, (nombre_archivo, f"Importación automática de {nombre_archivo}", registros_importados, "sistema"))
+                logger.info(f"Nuevo archivo origen '{nombre_archivo}' registrado con {registros_importados} registros")
+
+            connection.commit()
+    except Exception as e:
+        logger.error(f"Error en registrar_archivo_origen: {e}")
+        raise
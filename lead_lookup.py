@@ -0,0 +1,116 @@
+"""
+Búsqueda de leads por teléfono.
+
+Los teléfonos de la tabla ``leads`` se guardan tal y como llegan (con prefijo
++34, espacios, guiones...). Las columnas generadas ``telefono_norm`` y
+``telefono2_norm`` (ver schema.sql) contienen los últimos 9 dígitos del número
+y están indexadas, de modo que resolver un teléfono a un lead es una búsqueda
+por índice. MySQL las mantiene sincronizadas en cada INSERT/UPDATE, ya venga
+el dato de la carga de Excel, de una edición manual o de un webhook.
+
+Todos los servicios deben usar ``normalize_phone`` y las funciones de este
+módulo en lugar de ``REGEXP_REPLACE(telefono, ...)`` u otras normalizaciones
+ad-hoc.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+# Número de dígitos de un teléfono nacional español
+PHONE_NORM_DIGITS = 9
+
+# Tamaño máximo de las listas IN (...) en las búsquedas masivas
+BULK_LOOKUP_CHUNK = 500
+
+
+def normalize_phone(phone: Any) -> str:
+    """
+    Normaliza un teléfono al formato de ``telefono_norm``: solo dígitos y, si
+    sobran, los últimos 9 (número nacional sin prefijo de país).
+
+    >>> normalize_phone('+34 629-20-33-15')
+    '629203315'
+    """
+    if phone is None:
+        return ""
+    digits = re.sub(r'\D', '', str(phone))
+    if len(digits) > PHONE_NORM_DIGITS:
+        digits = digits[-PHONE_NORM_DIGITS:]
+    return digits
+
+
+def find_leads_by_phone(cursor, phone: Any, columns: str = "id", limit: int = 5,
+                        include_secondary: bool = True) -> List[Any]:
+    """
+    Devuelve los leads cuyo teléfono principal (o secundario) coincide con
+    ``phone``. Primero se devuelven las coincidencias por ``telefono``.
+
+    Args:
+        cursor: Cursor abierto (de tuplas o de diccionarios).
+        phone: Teléfono en cualquier formato.
+        columns: Columnas a seleccionar de ``leads``.
+        limit: Máximo de filas por columna de teléfono.
+        include_secondary: Si también se busca en ``telefono2``.
+    """
+    phone_norm = normalize_phone(phone)
+    if not phone_norm:
+        return []
+
+    cursor.execute(
+        f"SELECT {columns} FROM leads WHERE telefono_norm = %s LIMIT %s",
+        (phone_norm, limit)
+    )
+    rows = list(cursor.fetchall())
+    if include_secondary and len(rows) < limit:
+        cursor.execute(
+            f"SELECT {columns} FROM leads WHERE telefono2_norm = %s LIMIT %s",
+            (phone_norm, limit - len(rows))
+        )
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def find_lead_by_phone(cursor, phone: Any, columns: str = "id",
+                       include_secondary: bool = True) -> Optional[Any]:
+    """Devuelve el primer lead que coincide con ``phone`` o ``None``."""
+    rows = find_leads_by_phone(cursor, phone, columns=columns, limit=1,
+                               include_secondary=include_secondary)
+    return rows[0] if rows else None
+
+
+def find_lead_id_by_phone(cursor, phone: Any, include_secondary: bool = True) -> Optional[int]:
+    """Devuelve el id del primer lead que coincide con ``phone`` o ``None``."""
+    row = find_lead_by_phone(cursor, phone, columns="id", include_secondary=include_secondary)
+    if row is None:
+        return None
+    return row['id'] if isinstance(row, dict) else row[0]
+
+
+def map_phones_to_lead_ids(cursor, phones: Iterable[Any],
+                           include_secondary: bool = False) -> Dict[str, int]:
+    """
+    Resuelve de una vez muchos teléfonos a leads (una consulta por bloque de
+    ``BULK_LOOKUP_CHUNK`` en lugar de una por teléfono).
+
+    Returns:
+        Dict teléfono normalizado -> id del lead (el de menor id si hay varios).
+        Los teléfonos sin lead no aparecen en el resultado.
+    """
+    pending = sorted({p for p in (normalize_phone(phone) for phone in phones) if p})
+    result: Dict[str, int] = {}
+
+    columns = ['telefono_norm', 'telefono2_norm'] if include_secondary else ['telefono_norm']
+    for column in columns:
+        pending = [phone for phone in pending if phone not in result]
+        for start in range(0, len(pending), BULK_LOOKUP_CHUNK):
+            chunk = pending[start:start + BULK_LOOKUP_CHUNK]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"SELECT {column} AS phone_norm, MIN(id) AS lead_id FROM leads "
+                f"WHERE {column} IN ({placeholders}) GROUP BY {column}",
+                chunk
+            )
+            for row in cursor.fetchall():
+                phone_norm, lead_id = (row['phone_norm'], row['lead_id']) if isinstance(row, dict) else row
+                result.setdefault(phone_norm, lead_id)
+    return result
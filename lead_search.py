@@ -0,0 +1,164 @@
+"""
+Búsqueda de leads por texto libre (nombre, apellidos, clínica, teléfono o id).
+
+Sustituye los ``LIKE '%x%'`` sobre varias columnas, que recorren la tabla
+entera, por búsquedas que usan índices (ver ``db_migration_lead_search``):
+
+- Nombres y clínica: índice FULLTEXT con el parser ``ngram`` sobre
+  (nombre, apellidos, nombre_clinica). Encuentra fragmentos de palabra, ordena
+  por relevancia y, con la collation de la tabla (``utf8mb4_unicode_ci``), no
+  distingue mayúsculas ni tildes.
+- Teléfonos: prefijo del número nacional sobre ``telefono_norm`` y sufijo
+  sobre ``telefono_rev`` (los dígitos del teléfono invertidos), ambos por
+  rango de índice. No se buscan dígitos en mitad del número.
+- Un término numérico también se compara con el id del lead.
+
+Los resultados salen ordenados por relevancia (id exacto, teléfono exacto,
+prefijo, sufijo; o la puntuación FULLTEXT) y después por ``updated_at``.
+Si la migración aún no se ha aplicado (no se ejecuta sola en el arranque,
+ver ``db_migration_lead_search``) se usa la búsqueda antigua con LIKE.
+"""
+
+import logging
+import re
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from lead_lookup import PHONE_NORM_DIGITS, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Longitud mínima de un término (y tamaño de token del parser ngram)
+MIN_TERM_LENGTH = 2
+# Dígitos mínimos para buscar por prefijo/sufijo de teléfono
+MIN_PHONE_DIGITS = 3
+# Máximo de candidatos por rama antes de ordenar y paginar
+SEARCH_CANDIDATES = 1000
+
+SCORE_ID = 100
+SCORE_PHONE_EXACT = 90
+SCORE_PHONE_PREFIX = 60
+SCORE_PHONE_SUFFIX = 50
+
+FULLTEXT_COLUMNS = "nombre, apellidos, nombre_clinica"
+
+# Errores de MySQL que indican que faltan las columnas/índices de búsqueda
+_MISSING_SEARCH_INDEX_ERRNOS = (1054, 1191)  # Unknown column / Can't find FULLTEXT index
+
+_PHONE_TERM = re.compile(r'^\+?[\d\s().-]+$')
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+
+def _fulltext_query(term: str) -> Optional[str]:
+    """Término -> consulta BOOLEAN MODE que exige cada palabra (como frase ngram)."""
+    words = [w for w in _BOOLEAN_OPERATORS.sub(' ', term).split() if len(w) >= MIN_TERM_LENGTH]
+    if not words:
+        return None
+    return ' '.join(f'+"{word}"' for word in words)
+
+
+def _branches(term: str) -> List[Tuple[str, List[Any]]]:
+    """Ramas ``(SELECT id, score ... WHERE <cond>, params)`` para ``term``."""
+    branches = []
+    if _PHONE_TERM.match(term):
+        digits = re.sub(r'\D', '', term)
+        if term.startswith(('+34', '0034')):
+            digits = digits[2:] if term.startswith('+') else digits[4:]
+        if digits and len(digits) <= 10:
+            branches.append((f"SELECT id, {SCORE_ID} AS score FROM leads WHERE id = %s", [int(digits)]))
+        if len(digits) >= MIN_PHONE_DIGITS:
+            if len(digits) >= PHONE_NORM_DIGITS:
+                phone = normalize_phone(digits)
+                for column in ('telefono_norm', 'telefono2_norm'):
+                    branches.append((f"SELECT id, {SCORE_PHONE_EXACT} AS score FROM leads WHERE {column} = %s",
+                                     [phone]))
+            else:
+                for column in ('telefono_norm', 'telefono2_norm'):
+                    branches.append((f"SELECT id, {SCORE_PHONE_PREFIX} AS score FROM leads WHERE {column} LIKE %s",
+                                     [f"{digits}%"]))
+            for column in ('telefono_rev', 'telefono2_rev'):
+                branches.append((f"SELECT id, {SCORE_PHONE_SUFFIX} AS score FROM leads WHERE {column} LIKE %s",
+                                 [f"{digits[::-1]}%"]))
+        return branches
+
+    query = _fulltext_query(term)
+    if query:
+        match = f"MATCH({FULLTEXT_COLUMNS}) AGAINST (%s IN BOOLEAN MODE)"
+        branches.append((f"SELECT id, {match} AS score FROM leads WHERE {match}", [query, query]))
+    return branches
+
+
+def _qualify(columns: Union[str, Sequence[str]]) -> str:
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(',')]
+    return ', '.join(f"l.{column}" for column in columns)
+
+
+def _legacy_search(cursor, term: str, select: str, limit: int,
+                   conditions: Sequence[str], params: Sequence[Any]) -> List[Any]:
+    """Búsqueda con LIKE (sin índices) para bases de datos sin migrar."""
+    pattern = f"%{term}%"
+    where = ["(l.telefono LIKE %s OR l.telefono2 LIKE %s OR l.nombre LIKE %s "
+             "OR l.apellidos LIKE %s OR l.nombre_clinica LIKE %s OR l.id = %s)"]
+    where.extend(f"({condition})" for condition in conditions)
+    search_id = int(term) if term.isdigit() else 0
+    cursor.execute(
+        f"SELECT {select} FROM leads l WHERE {' AND '.join(where)} ORDER BY l.updated_at DESC LIMIT %s",
+        [pattern] * 5 + [search_id] + list(params) + [limit]
+    )
+    return list(cursor.fetchall())
+
+
+def search_leads(cursor, term: str, columns: Union[str, Sequence[str]] = '*', limit: int = 20,
+                 conditions: Sequence[str] = (), params: Sequence[Any] = ()) -> List[Any]:
+    """
+    Busca leads por ``term`` y los devuelve ordenados por relevancia.
+
+    Args:
+        cursor: Cursor abierto (de tuplas o de diccionarios).
+        term: Texto tecleado: nombre, apellidos, clínica, teléfono (completo,
+            inicio o final) o id.
+        columns: Columnas de ``leads`` a devolver ('*' = todas). Se añade
+            ``search_score``.
+        limit: Máximo de resultados.
+        conditions: Filtros adicionales sobre ``leads`` (sin alias), p. ej.
+            ``["status_level_1 = %s"]``; se aplican dentro de cada rama para
+            no perder resultados al limitar candidatos.
+        params: Parámetros de ``conditions``.
+
+    Returns:
+        Lista de filas; vacía si ``term`` es demasiado corto.
+    """
+    term = (term or '').strip()
+    if len(term) < MIN_TERM_LENGTH:
+        return []
+    select = _qualify(columns)
+    branches = _branches(term)
+    if not branches:
+        return []
+
+    extra = ''.join(f" AND ({condition})" for condition in conditions)
+    union_sql, union_params = [], []
+    for branch_sql, branch_params in branches:
+        union_sql.append(f"({branch_sql}{extra} ORDER BY score DESC LIMIT {SEARCH_CANDIDATES})")
+        union_params.extend(list(branch_params) + list(params))
+
+    query = f"""
+        SELECT {select}, hits.score AS search_score
+        FROM (
+            SELECT id, MAX(score) AS score
+            FROM ({' UNION ALL '.join(union_sql)}) candidates
+            GROUP BY id
+        ) hits
+        JOIN leads l ON l.id = hits.id
+        ORDER BY hits.score DESC, l.updated_at DESC
+        LIMIT %s
+    """
+    try:
+        cursor.execute(query, union_params + [limit])
+        return list(cursor.fetchall())
+    except Exception as e:
+        if getattr(e, 'errno', None) not in _MISSING_SEARCH_INDEX_ERRNOS:
+            raise
+        logger.warning(f"Índices de búsqueda de leads no disponibles ({e}); se usa LIKE. "
+                       f"Ejecutar db_migration_lead_search.py")
+        return _legacy_search(cursor, term, select, limit, conditions, params)
@@ -0,0 +1,252 @@
+"""
+Agregado diario de leads para los informes (tabla ``leads_daily_stats``).
+
+Cada fila cuenta los leads cuyo último cambio (``DATE(updated_at)``) cae en un
+día, por fichero de origen, ``status_level_1``, ``status_level_2`` y clínica,
+con cuántos tienen cita (fecha y hora) y cuántos pack. Es lo que calculaban los
+informes leyendo la tabla ``leads`` entera y agrupando en Python; ahora leen
+unas pocas filas de aquí.
+
+La tabla se mantiene de forma incremental con triggers sobre ``leads`` (ver
+``db_migration_leads_rollup``): cuando un lead cambia de día, estado, clínica,
+fichero, cita o pack se resta de su grupo anterior y se suma al nuevo. Este
+módulo ofrece la consulta para los informes, la reconstrucción (que sirve
+también para rellenar el histórico) y la verificación contra ``leads``:
+
+    python leads_rollup.py rebuild [--since YYYY-MM-DD]
+    python leads_rollup.py verify [--since YYYY-MM-DD] [--fix]
+
+Los valores NULL de las dimensiones se guardan como cadena vacía.
+"""
+
+import argparse
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('day', 'origen_archivo', 'status_level_1', 'status_level_2', 'nombre_clinica')
+MEASURES = ('leads', 'con_cita', 'con_pack')
+
+
+def row_values(row: str) -> Dict[str, str]:
+    """Expresiones SQL de las dimensiones y medidas de una fila de leads (``NEW``, ``OLD`` o un alias)."""
+    text = lambda column: f"TRIM(COALESCE({row}.{column}, ''))"
+    values = {
+        'day': f"DATE({row}.updated_at)",
+        'origen_archivo': text('origen_archivo'),
+        'status_level_1': text('status_level_1'),
+        'status_level_2': text('status_level_2'),
+        'nombre_clinica': text('nombre_clinica'),
+        'con_cita': f"({row}.cita IS NOT NULL AND NULLIF({row}.hora_cita, '00:00:00') IS NOT NULL)",
+        'con_pack': f"COALESCE({row}.conPack = 1, 0)",
+    }
+    # El grupo se identifica por un hash de las dimensiones de texto (no caben todas en la PK)
+    values['bucket'] = "MD5(CONCAT_WS(CHAR(31 USING utf8mb4), {}))".format(
+        ', '.join(values[dim] for dim in DIMENSIONS[1:]))
+    return values
+
+
+# Suma las filas de ``select`` a sus grupos (también la usan los triggers)
+ROLLUP_UPSERT = """
+    INSERT INTO leads_daily_stats
+        (day, bucket, origen_archivo, status_level_1, status_level_2, nombre_clinica, leads, con_cita, con_pack)
+    {select}
+    ON DUPLICATE KEY UPDATE
+        leads_daily_stats.leads = leads_daily_stats.leads + VALUES(leads),
+        leads_daily_stats.con_cita = leads_daily_stats.con_cita + VALUES(con_cita),
+        leads_daily_stats.con_pack = leads_daily_stats.con_pack + VALUES(con_pack)
+"""
+
+_REBUILD_SELECT = """
+    SELECT day, bucket, ANY_VALUE(origen_archivo), ANY_VALUE(status_level_1), ANY_VALUE(status_level_2),
+           ANY_VALUE(nombre_clinica), COUNT(*), SUM(con_cita), SUM(con_pack)
+    FROM (
+        SELECT {day} AS day, {bucket} AS bucket, {origen_archivo} AS origen_archivo,
+               {status_level_1} AS status_level_1, {status_level_2} AS status_level_2,
+               {nombre_clinica} AS nombre_clinica, {con_cita} AS con_cita, {con_pack} AS con_pack
+        FROM leads l
+        WHERE l.updated_at IS NOT NULL {extra}
+    ) grouped
+    GROUP BY day, bucket
+"""
+
+
+def _day_range(since: Optional[date], until: Optional[date], column: str) -> Tuple[str, List[Any]]:
+    """Condición ``AND column`` dentro de los días ``since``..``until`` (ambos incluidos)."""
+    conditions, params = [], []
+    if since:
+        conditions.append(f"{column} >= %s")
+        params.append(since)
+    if until:
+        conditions.append(f"{column} < %s")
+        params.append(until + timedelta(days=1))
+    return ''.join(f" AND {condition}" for condition in conditions), params
+
+
+def rebuild(since: Optional[date] = None, until: Optional[date] = None) -> bool:
+    """
+    Recalcula ``leads_daily_stats`` desde ``leads`` (todo, o los días
+    ``since``..``until`` ambos incluidos). Sirve para el relleno inicial.
+    """
+    conn = get_connection()
+    if not conn:
+        logger.error("[LEADS_ROLLUP] No se pudo conectar para reconstruir el agregado")
+        return False
+    try:
+        conn.start_transaction()
+        cursor = conn.cursor()
+        delete_range, delete_params = _day_range(since, until, 'day')
+        cursor.execute(f"DELETE FROM leads_daily_stats WHERE 1=1{delete_range}", delete_params)
+        extra, params = _day_range(since, until, 'l.updated_at')
+        select = _REBUILD_SELECT.format(extra=extra, **row_values('l'))
+        cursor.execute(ROLLUP_UPSERT.format(select=select), params)
+        rows = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        logger.info(f"[LEADS_ROLLUP] Agregado reconstruido ({rows} filas afectadas)")
+        return True
+    except Exception as e:
+        logger.error(f"[LEADS_ROLLUP] Error reconstruyendo el agregado: {e}")
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def verify(since: Optional[date] = None, fix: bool = False) -> List[date]:
+    """
+    Compara ``leads_daily_stats`` con ``leads`` y devuelve los días descuadrados.
+
+    Args:
+        since: Primer día a comprobar (None = todos).
+        fix: Reconstruye los días descuadrados.
+    """
+    conn = get_connection()
+    if not conn:
+        logger.error("[LEADS_ROLLUP] No se pudo conectar para verificar el agregado")
+        return []
+    try:
+        cursor = conn.cursor()
+        extra, params = _day_range(since, None, 'l.updated_at')
+        stored_range, stored_params = _day_range(since, None, 's.day')
+        expected = _REBUILD_SELECT.format(extra=extra, **row_values('l')).replace(
+            "COUNT(*), SUM(con_cita), SUM(con_pack)",
+            "COUNT(*) AS leads, SUM(con_cita) AS con_cita, SUM(con_pack) AS con_pack")
+        mismatch = ' OR '.join(f"NOT (e.{m} <=> s.{m})" for m in MEASURES)
+        cursor.execute(f"""
+            SELECT DISTINCT e.day
+            FROM ({expected}) e
+            LEFT JOIN leads_daily_stats s ON s.day = e.day AND s.bucket = e.bucket
+            WHERE {mismatch}
+            UNION
+            SELECT DISTINCT s.day
+            FROM leads_daily_stats s
+            LEFT JOIN ({expected}) e ON e.day = s.day AND e.bucket = s.bucket
+            WHERE e.day IS NULL AND s.leads <> 0 {stored_range}
+        """, params + params + stored_params)
+        days = sorted(row[0] for row in cursor.fetchall())
+        cursor.close()
+    except Exception as e:
+        logger.error(f"[LEADS_ROLLUP] Error verificando el agregado: {e}")
+        return []
+    finally:
+        conn.close()
+
+    if days:
+        logger.warning(f"[LEADS_ROLLUP] {len(days)} días con el agregado descuadrado")
+        if fix:
+            for day in days:
+                rebuild(since=day, until=day)
+            logger.info(f"[LEADS_ROLLUP] {len(days)} días recalculados")
+    else:
+        logger.info("[LEADS_ROLLUP] Agregado consistente con leads")
+    return days
+
+
+def _in_condition(column: str, value: Union[str, Sequence[str]], params: List[Any]) -> str:
+    values = [value] if isinstance(value, str) else list(value)
+    params.extend(values)
+    return f"{column} IN ({', '.join(['%s'] * len(values))})"
+
+
+def query(cursor, desde: Optional[date] = None, hasta: Optional[date] = None,
+          group_by: Iterable[str] = ('status_level_1',),
+          origen_archivo: Union[None, str, Sequence[str]] = None,
+          status_level_1: Union[None, str, Sequence[str]] = None,
+          status_level_2: Union[None, str, Sequence[str]] = None,
+          nombre_clinica: Union[None, str, Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Consulta el agregado diario.
+
+    Args:
+        cursor: Cursor abierto (mysql.connector o pymysql, de tuplas o de diccionarios).
+        desde, hasta: Días (de ``updated_at``) a incluir, ambos incluidos.
+        group_by: Dimensiones por las que agrupar (subconjunto de ``DIMENSIONS``;
+            vacío = un único total).
+        origen_archivo, status_level_1, status_level_2, nombre_clinica: Filtros
+            por valor (o lista de valores). Los estados se comparan sin espacios
+            extremos; '' es "sin valor".
+
+    Returns:
+        Lista de dicts con las dimensiones de ``group_by`` y ``leads``,
+        ``con_cita`` y ``con_pack``.
+    """
+    group_by = list(group_by)
+    unknown = [dim for dim in group_by if dim not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Dimensiones no válidas: {unknown}")
+
+    conditions, params = ["1=1"], []
+    if desde:
+        conditions.append("day >= %s")
+        params.append(desde)
+    if hasta:
+        conditions.append("day <= %s")
+        params.append(hasta)
+    for column, value in (('origen_archivo', origen_archivo), ('status_level_1', status_level_1),
+                          ('status_level_2', status_level_2), ('nombre_clinica', nombre_clinica)):
+        if value is not None:
+            conditions.append(_in_condition(column, value, params))
+
+    select = ', '.join(group_by + [f"SUM({m}) AS {m}" for m in MEASURES])
+    sql = f"SELECT {select} FROM leads_daily_stats WHERE {' AND '.join(conditions)}"
+    if group_by:
+        sql += f" GROUP BY {', '.join(group_by)} HAVING SUM(leads) <> 0 ORDER BY {', '.join(group_by)}"
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    columns = [d[0] for d in cursor.description]
+    result = []
+    for row in rows:
+        item = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+        for measure in MEASURES:
+            item[measure] = int(item[measure] or 0)
+        result.append(item)
+    return result
+
+
+def totals(cursor, **filters) -> Dict[str, int]:
+    """Totales (``leads``, ``con_cita``, ``con_pack``) para los filtros de ``query``."""
+    rows = query(cursor, group_by=(), **filters)
+    return rows[0] if rows else {m: 0 for m in MEASURES}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Reconstruye o verifica la tabla leads_daily_stats.")
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--since', type=date.fromisoformat, help='Primer día (YYYY-MM-DD).')
+    parser.add_argument('--fix', action='store_true', help='Con verify, reconstruye los días descuadrados.')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        raise SystemExit(0 if rebuild(since=args.since) else 1)
+
+    bad_days = verify(since=args.since, fix=args.fix)
+    for bad_day in bad_days:
+        print(f"Día descuadrado: {bad_day}")
+    print(f"{len(bad_days)} días descuadrados" + (" (corregidos)" if args.fix and bad_days else ""))
@@ -0,0 +1,186 @@
+"""
+Cliente asíncrono (asyncio + aiohttp) de la API de Pearl AI para operaciones
+masivas de lectura: conciliación de registros básicos de pearl_calls y
+recuperación de summaries tras una caída.
+
+Replica los métodos de lectura de ``pearl_caller.PearlCaller`` (misma
+configuración, timeouts por endpoint y política de reintentos) y permite lanzar
+cientos de consultas en paralelo, acotadas por un semáforo y por un token
+bucket. Las llamadas salientes (``make_call``) siguen usando el cliente
+síncrono.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+import aiohttp
+from dotenv import load_dotenv
+
+from pearl_caller import (
+    DEFAULT_TIMEOUTS, RETRY_STATUS, PearlAPIError, _parse_retry_after
+)
+from rate_limiter import TokenBucket
+
+# Cargar variables de entorno
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPearlCaller:
+    """Cliente asíncrono de solo lectura para la API de Pearl AI."""
+
+    def __init__(self, concurrency: Optional[int] = None, rate: Optional[float] = None):
+        """
+        Args:
+            concurrency: Peticiones simultáneas máximas (PEARL_ASYNC_CONCURRENCY, 20).
+            rate: Peticiones por segundo (PEARL_ASYNC_PER_SECOND, 10; 0 = sin límite).
+        """
+        self.account_id = os.getenv('PEARL_ACCOUNT_ID')
+        self.secret_key = os.getenv('PEARL_SECRET_KEY')
+        self.api_url = os.getenv('PEARL_API_URL', 'https://api.nlpearl.ai/v1')
+
+        if not self.account_id or not self.secret_key:
+            raise PearlAPIError(
+                "Credenciales de Pearl AI no configuradas. "
+                "Asegúrate de definir PEARL_ACCOUNT_ID y PEARL_SECRET_KEY en .env"
+            )
+
+        self.headers = {
+            "Authorization": f"Bearer {self.account_id}:{self.secret_key}",
+            "Content-Type": "application/json"
+        }
+        self.concurrency = concurrency or int(os.getenv('PEARL_ASYNC_CONCURRENCY', 20))
+        self.rate_limiter = TokenBucket(
+            rate=rate if rate is not None else float(os.getenv('PEARL_ASYNC_PER_SECOND', 10))
+        )
+        self.max_retries = int(os.getenv('PEARL_HTTP_MAX_RETRIES', 3))
+        self.backoff_base = float(os.getenv('PEARL_HTTP_BACKOFF', 0.5))
+        self.backoff_max = float(os.getenv('PEARL_HTTP_BACKOFF_MAX', 30))
+        self.timeouts = {
+            endpoint: float(os.getenv(f'PEARL_TIMEOUT_{endpoint.upper()}', default))
+            for endpoint, default in DEFAULT_TIMEOUTS.items()
+        }
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self._session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _throttle(self):
+        """Espera (sin bloquear el bucle) hasta disponer de un token del limitador."""
+        while True:
+            wait = self.rate_limiter.try_acquire()
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    async def _request_json(self, method: str, url: str, endpoint: str, error_label: str,
+                            json_payload: Optional[Dict] = None):
+        """
+        Ejecuta una petición de lectura con semáforo, límite de tasa, timeout
+        por endpoint y reintentos. Devuelve el JSON o lanza ``PearlAPIError``.
+        """
+        if self._session is None:
+            raise PearlAPIError("AsyncPearlCaller debe usarse con 'async with'")
+
+        timeout = aiohttp.ClientTimeout(total=self.timeouts.get(endpoint, 30))
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self._semaphore:
+                await self._throttle()
+                try:
+                    async with self._session.request(method, url, json=json_payload, timeout=timeout) as response:
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        text = await response.text()
+                        retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                        if response.status not in RETRY_STATUS or attempt > self.max_retries:
+                            raise PearlAPIError(f"Error al {error_label}: {response.status} - {text}")
+                        reason = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt > self.max_retries:
+                        raise PearlAPIError(f"Error de conexión al {error_label}: {e!r}")
+                    retry_after = None
+                    reason = e.__class__.__name__
+
+            # Esperar fuera del semáforo para no bloquear a otras peticiones
+            delay = self._backoff_delay(attempt, retry_after)
+            logger.warning(f"[PEARL_ASYNC] {endpoint}: {reason}; reintento {attempt}/{self.max_retries} en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def get_call_status(self, call_id: str) -> Dict:
+        """Equivalente asíncrono de ``PearlCaller.get_call_status``."""
+        return await self._request_json('GET', f"{self.api_url}/Call/{call_id}", 'status', 'obtener estado')
+
+    async def get_outbound_details(self, outbound_id: str) -> Dict:
+        """Equivalente asíncrono de ``PearlCaller.get_outbound_details``."""
+        return await self._request_json('GET', f"{self.api_url}/Outbound/{outbound_id}", 'outbound',
+                                        'obtener detalles')
+
+    async def search_calls_paginated(self, outbound_id: str, from_date: str, to_date: str,
+                                     skip: int = 0, limit: int = 100) -> Dict:
+        """Equivalente asíncrono de ``PearlCaller.search_calls_paginated``."""
+        payload = {"fromDate": from_date, "toDate": to_date, "skip": skip, "limit": limit}
+        return await self._request_json('POST', f"{self.api_url}/Outbound/{outbound_id}/Calls", 'search',
+                                        'buscar llamadas paginadas', json_payload=payload)
+
+    async def get_call_statuses(self, call_ids: Iterable[str]) -> Dict[str, Union[Dict, Exception]]:
+        """
+        Obtiene en paralelo el detalle de varias llamadas.
+
+        Returns:
+            Dict call_id -> detalle de la llamada, o la excepción si falló.
+            Un fallo individual no interrumpe el resto.
+        """
+        call_ids = list(dict.fromkeys(call_ids))
+        results = await asyncio.gather(
+            *(self.get_call_status(call_id) for call_id in call_ids),
+            return_exceptions=True
+        )
+        return dict(zip(call_ids, results))
+
+
+def fetch_call_statuses(call_ids: List[str], concurrency: Optional[int] = None,
+                        rate: Optional[float] = None) -> Dict[str, Union[Dict, Exception]]:
+    """
+    Punto de entrada síncrono para los procesos batch: obtiene el detalle de
+    ``call_ids`` en paralelo y devuelve ``{call_id: detalle | excepción}``.
+
+    No debe llamarse desde dentro de un bucle asyncio en ejecución.
+    """
+    if not call_ids:
+        return {}
+
+    async def _run():
+        async with AsyncPearlCaller(concurrency=concurrency, rate=rate) as client:
+            return await client.get_call_statuses(call_ids)
+
+    started = time.monotonic()
+    results = asyncio.run(_run())
+    failed = sum(1 for r in results.values() if isinstance(r, Exception))
+    logger.info(f"[PEARL_ASYNC] {len(results)} detalles de llamada obtenidos en "
+                f"{time.monotonic() - started:.1f}s ({failed} con error)")
+    return results
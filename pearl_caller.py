@@ -4,12 +4,17 @@ Maneja la autenticación, obtención de outbound IDs y realización de llamadas.
 """
 
 import os
+import random
+import threading
+import time
 import requests
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Cargar variables de entorno
 load_dotenv()
@@ -21,6 +26,42 @@ class PearlAPIError(Exception):
     """Excepción personalizada para errores de la API de Pearl."""
     pass
 
+# Timeouts por endpoint (segundos). Se pueden sobrescribir con
+# PEARL_TIMEOUT_<ENDPOINT>, p. ej. PEARL_TIMEOUT_SEARCH=90
+DEFAULT_TIMEOUTS = {
+    'outbound': 10,
+    'call': 30,
+    'search': 60,
+    'status': 10,
+    'recording': 60,
+}
+
+# Códigos HTTP que se reintentan. En peticiones no idempotentes (crear llamada)
+# solo se reintentan los que garantizan que la petición no se procesó.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_STATUS_NON_IDEMPOTENT = {429, 503}
+
+# Límites superiores (ms) de los buckets del histograma de latencias
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convierte una cabecera Retry-After (segundos o fecha HTTP) en segundos de espera."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
 class PearlCaller:
     """Clase para gestionar llamadas automáticas a través de la API de Pearl AI."""
     
@@ -43,8 +84,127 @@ class PearlCaller:
             "Authorization": f"Bearer {self.account_id}:{self.secret_key}",
             "Content-Type": "application/json"
         }
-        
+
+        # Sesión HTTP persistente (keep-alive) compartida por todos los hilos.
+        # Las cabeceras de autenticación se envían por petición para no
+        # filtrarlas a las URLs de grabaciones, que son de otro dominio.
+        pool_size = int(os.getenv('PEARL_HTTP_POOL_SIZE', 10))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Política de reintentos: backoff exponencial con jitter
+        self.max_retries = int(os.getenv('PEARL_HTTP_MAX_RETRIES', 3))
+        self.backoff_base = float(os.getenv('PEARL_HTTP_BACKOFF', 0.5))
+        self.backoff_max = float(os.getenv('PEARL_HTTP_BACKOFF_MAX', 30))
+        self.timeouts = {
+            endpoint: float(os.getenv(f'PEARL_TIMEOUT_{endpoint.upper()}', default))
+            for endpoint, default in DEFAULT_TIMEOUTS.items()
+        }
+
+        self._metrics_lock = threading.Lock()
+        self._metrics: Dict[str, Dict] = {}
+
         logger.info("Cliente Pearl AI inicializado correctamente")
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Segundos de espera antes del reintento ``attempt`` (1, 2, ...)."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: aleatorio entre 0 y base * 2^(intento-1)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def _record(self, endpoint: str, elapsed: float, status: Optional[int] = None,
+                error: bool = False, retried: bool = False):
+        """Acumula contadores e histograma de latencias por endpoint."""
+        elapsed_ms = elapsed * 1000
+        with self._metrics_lock:
+            m = self._metrics.get(endpoint)
+            if m is None:
+                m = self._metrics[endpoint] = {
+                    'requests': 0, 'errors': 0, 'retries': 0, 'status': {},
+                    'latency_ms_total': 0.0, 'latency_ms_max': 0.0,
+                    'latency_buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            m['requests'] += 1
+            if error:
+                m['errors'] += 1
+            if retried:
+                m['retries'] += 1
+            if status is not None:
+                m['status'][str(status)] = m['status'].get(str(status), 0) + 1
+            m['latency_ms_total'] += elapsed_ms
+            m['latency_ms_max'] = max(m['latency_ms_max'], elapsed_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    m['latency_buckets'][i] += 1
+                    break
+            else:
+                m['latency_buckets'][-1] += 1
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        """Devuelve contadores y latencias por endpoint (para /health/pearl)."""
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        with self._metrics_lock:
+            result = {}
+            for endpoint, m in self._metrics.items():
+                result[endpoint] = {
+                    'requests': m['requests'],
+                    'errors': m['errors'],
+                    'retries': m['retries'],
+                    'status': dict(m['status']),
+                    'latency_ms_avg': round(m['latency_ms_total'] / m['requests'], 1) if m['requests'] else 0,
+                    'latency_ms_max': round(m['latency_ms_max'], 1),
+                    'latency_histogram': dict(zip(labels, m['latency_buckets'])),
+                }
+            return result
+
+    def _request(self, method: str, url: str, endpoint: str, idempotent: bool = True,
+                 authenticated: bool = True, **kwargs) -> requests.Response:
+        """
+        Ejecuta una petición sobre la sesión persistente con el timeout del
+        endpoint y reintentos con backoff (respetando ``Retry-After``).
+
+        Devuelve la última respuesta obtenida (aunque sea de error); lanza
+        ``requests.RequestException`` si el último intento falla por conexión.
+        """
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint, 30))
+        if authenticated:
+            kwargs.setdefault('headers', self.headers)
+        retry_status = RETRY_STATUS if idempotent else RETRY_STATUS_NON_IDEMPOTENT
+
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                # Sin idempotencia solo se reintenta si no llegó a conectar
+                if idempotent:
+                    retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                else:
+                    retryable = isinstance(e, requests.exceptions.ConnectTimeout)
+                will_retry = retryable and attempt <= self.max_retries
+                self._record(endpoint, time.monotonic() - started, error=True, retried=will_retry)
+                if not will_retry:
+                    raise
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"[PEARL] {endpoint}: {e.__class__.__name__}; reintento {attempt}/{self.max_retries} en {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            will_retry = response.status_code in retry_status and attempt <= self.max_retries
+            self._record(endpoint, time.monotonic() - started, status=response.status_code,
+                         error=response.status_code >= 400, retried=will_retry)
+            if not will_retry:
+                return response
+
+            delay = self._backoff_delay(attempt, _parse_retry_after(response.headers.get('Retry-After')))
+            logger.warning(f"[PEARL] {endpoint}: HTTP {response.status_code}; reintento {attempt}/{self.max_retries} en {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
     
     def test_connection(self) -> bool:
         """
@@ -54,11 +214,7 @@ class PearlCaller:
             bool: True si la conexión es exitosa, False en caso contrario
         """
         try:
-            response = requests.get(
-                f"{self.api_url}/Outbound",
-                headers=self.headers,
-                timeout=10
-            )
+            response = self._request('GET', f"{self.api_url}/Outbound", 'outbound')
             
             if response.status_code == 200:
                 logger.info("✅ Conexión con Pearl AI exitosa")
@@ -83,11 +239,7 @@ class PearlCaller:
         """
         try:
             logger.info("Obteniendo campañas outbound...")
-            response = requests.get(
-                f"{self.api_url}/Outbound",
-                headers=self.headers,
-                timeout=10
-            )
+            response = self._request('GET', f"{self.api_url}/Outbound", 'outbound')
             
             if response.status_code == 200:
                 campaigns = response.json()
@@ -118,11 +270,7 @@ class PearlCaller:
         """
         try:
             logger.info(f"Obteniendo detalles de outbound ID: {outbound_id}")
-            response = requests.get(
-                f"{self.api_url}/Outbound/{outbound_id}",
-                headers=self.headers,
-                timeout=10
-            )
+            response = self._request('GET', f"{self.api_url}/Outbound/{outbound_id}", 'outbound')
             
             if response.status_code == 200:
                 details = response.json()
@@ -191,7 +339,8 @@ class PearlCaller:
             logger.debug(f"📦 Payload completo: {json.dumps(call_payload, indent=2)}")
             
             url = f"{self.api_url}/Outbound/{outbound_id}/Call"
-            response = requests.post(url, headers=self.headers, json=call_payload, timeout=30)
+            # Crear una llamada no es idempotente: solo se reintenta si Pearl la rechazó (429/503)
+            response = self._request('POST', url, 'call', idempotent=False, json=call_payload)
             
             response_data = {}
             try:
@@ -235,12 +384,8 @@ class PearlCaller:
                 "limit": 100  # Máximo permitido por Pearl AI
             }
             logger.info(f"Buscando llamadas para outbound {outbound_id} de {from_date} a {to_date}")
-            response = requests.post(
-                f"{self.api_url}/Outbound/{outbound_id}/Calls",
-                headers=self.headers,
-                json=search_payload,
-                timeout=60
-            )
+            response = self._request('POST', f"{self.api_url}/Outbound/{outbound_id}/Calls", 'search',
+                                     json=search_payload)
 
             if response.status_code == 200:
                 calls = response.json()
@@ -268,12 +413,8 @@ class PearlCaller:
                 "skip": skip,
                 "limit": limit
             }
-            response = requests.post(
-                f"{self.api_url}/Outbound/{outbound_id}/Calls",
-                headers=self.headers,
-                json=search_payload,
-                timeout=60
-            )
+            response = self._request('POST', f"{self.api_url}/Outbound/{outbound_id}/Calls", 'search',
+                                     json=search_payload)
 
             if response.status_code == 200:
                 calls = response.json()
@@ -315,7 +456,7 @@ class PearlCaller:
             logger.info(f"URL de grabación encontrada: {recording_url}")
             
             # Realizar la petición de descarga
-            response = requests.get(recording_url, timeout=60, stream=True)
+            response = self._request('GET', recording_url, 'recording', authenticated=False, stream=True)
 
             if response.status_code == 200:
                 # Asegurarse de que el directorio de destino existe
@@ -354,11 +495,7 @@ class PearlCaller:
         """
         try:
             logger.info(f"Obteniendo estado de llamada: {call_id}")
-            response = requests.get(
-                f"{self.api_url}/Call/{call_id}",
-                headers=self.headers,
-                timeout=10
-            )
+            response = self._request('GET', f"{self.api_url}/Call/{call_id}", 'status')
 
             if response.status_code == 200:
                 call_data = response.json()
@@ -520,6 +657,10 @@ def get_pearl_client() -> PearlCaller:
         _pearl_client = PearlCaller()
     return _pearl_client
 
+def get_pearl_metrics() -> Dict[str, Dict]:
+    """Métricas HTTP del cliente singleton (vacías si aún no se ha creado)."""
+    return _pearl_client.get_metrics() if _pearl_client is not None else {}
+
 # Funciones de utilidad para usar directamente
 def test_pearl_connection() -> bool:
     """Prueba rápida de conexión con Pearl AI."""
@@ -0,0 +1,319 @@
+"""
+Sincronización incremental de llamadas de Pearl AI.
+
+En lugar de recalcular la ventana desde ``MAX(call_time)`` y reprocesar todas
+las llamadas de la ventana en cada ciclo, se guarda por outbound:
+
+- una marca de agua (``pearl_sync_state.watermark``) hasta la que la
+  sincronización está completa; cada ciclo pide solo desde la marca menos un
+  solapamiento (para captar llamadas que cambian de estado después),
+- la ventana en curso y el offset de la siguiente página, confirmados tras cada
+  página, para reanudar exactamente donde se quedó si el proceso cae,
+- el hash del contenido de cada llamada procesada (``pearl_sync_calls``), de
+  modo que las llamadas del solapamiento que no han cambiado se omiten. Las
+  llamadas cuyo procesamiento falla se guardan con hash vacío y se reintentan
+  por id al inicio de cada ciclo.
+
+Los efectos que escriben por otras conexiones (scheduler, contadores de
+intentos) no pueden ir en la transacción de la página: se ejecutan en
+``after_commit`` una vez confirmada, de modo que ven las filas de la página y
+una página deshecha o repetida no los aplica dos veces.
+
+No hay tope artificial de páginas: el coste de un ciclo es proporcional a las
+llamadas nuevas o modificadas.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pearl_async import fetch_call_statuses
+from pearl_caller import PearlAPIError
+
+logger = logging.getLogger(__name__)
+
+SYNC_PAGE_SIZE = 100  # Máximo permitido por Pearl AI
+SYNC_OVERLAP = timedelta(minutes=int(os.getenv('PEARL_SYNC_OVERLAP_MINUTES', 10)))
+SYNC_BOOTSTRAP_DAYS = 7
+SYNC_HASH_RETENTION_DAYS = 30
+FAILED_HASH = ''  # content_hash de las llamadas cuyo procesamiento falló (se reintentan por id)
+
+PEARL_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def content_hash(call: Dict) -> str:
+    """Hash estable del contenido de una llamada devuelta por Pearl."""
+    payload = json.dumps(call, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _utcnow() -> datetime:
+    """Fecha actual en UTC sin tzinfo (formato de las columnas DATETIME)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _load_state(cursor, outbound_id: str) -> Optional[Dict]:
+    cursor.execute("""
+        SELECT watermark, window_from, window_to, next_skip
+        FROM pearl_sync_state WHERE outbound_id = %s
+    """, (outbound_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if isinstance(row, dict):
+        return row
+    return dict(zip(('watermark', 'window_from', 'window_to', 'next_skip'), row))
+
+
+def _save_state(cursor, outbound_id: str, watermark: Optional[datetime], window_from: Optional[datetime],
+                window_to: Optional[datetime], next_skip: int):
+    cursor.execute("""
+        INSERT INTO pearl_sync_state (outbound_id, watermark, window_from, window_to, next_skip)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            watermark = VALUES(watermark),
+            window_from = VALUES(window_from),
+            window_to = VALUES(window_to),
+            next_skip = VALUES(next_skip)
+    """, (outbound_id, watermark, window_from, window_to, next_skip))
+
+
+def _bootstrap_watermark(cursor) -> datetime:
+    """Marca de agua inicial: última llamada registrada o, si no hay, hace 7 días."""
+    cursor.execute("SELECT MAX(call_time) FROM pearl_calls WHERE call_time IS NOT NULL")
+    row = cursor.fetchone()
+    last_call = (list(row.values())[0] if isinstance(row, dict) else row[0]) if row else None
+    if last_call:
+        return last_call
+    logger.info(f"[PEARL_SYNC] Sin historial previo. Se usarán los últimos {SYNC_BOOTSTRAP_DAYS} días.")
+    return _utcnow() - timedelta(days=SYNC_BOOTSTRAP_DAYS)
+
+
+def _known_hashes(cursor, call_ids: List[str]) -> Dict[str, str]:
+    if not call_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(call_ids))
+    cursor.execute(
+        f"SELECT call_id, content_hash FROM pearl_sync_calls WHERE call_id IN ({placeholders})",
+        call_ids
+    )
+    rows = cursor.fetchall()
+    return {
+        (row['call_id'] if isinstance(row, dict) else row[0]):
+        (row['content_hash'] if isinstance(row, dict) else row[1])
+        for row in rows
+    }
+
+
+def _page_items(response_data) -> list:
+    if isinstance(response_data, dict):
+        return response_data.get('results', []) or []
+    return response_data if isinstance(response_data, list) else []
+
+
+def _process_calls(cursor, calls: List[Dict], outbound_id: str,
+                   process_call: Callable[[object, Dict, Any], bool],
+                   prepare_page: Optional[Callable[[object, List[Dict]], Any]],
+                   stats: Dict[str, int]):
+    """
+    Aplica las llamadas que cambiaron y guarda su hash. Las que fallan quedan
+    marcadas con ``content_hash = FAILED_HASH`` para reintentarlas en el
+    siguiente ciclo aunque ya no entren en la ventana. Cada llamada va en su
+    propio SAVEPOINT: si falla, se deshacen sólo sus escrituras.
+
+    Returns:
+        ``(applied, page_context)``: llamadas aplicadas y contexto de la página,
+        para ``after_commit``.
+    """
+    known = _known_hashes(cursor, [call['id'] for call in calls if call.get('id')])
+    changed = []
+    for call in calls:
+        digest = content_hash(call)
+        if call.get('id') and known.get(call['id']) == digest:
+            stats['unchanged'] += 1
+        else:
+            changed.append((call, digest))
+
+    page_context = prepare_page(cursor, [call for call, _ in changed]) if prepare_page and changed else None
+
+    applied = []
+    synced = []
+    for call, digest in changed:
+        call_id = call.get('id')
+        cursor.execute("SAVEPOINT pearl_sync_call")
+        try:
+            handled = process_call(cursor, call, page_context)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT pearl_sync_call")
+            stats['errors'] += 1
+            logger.error(f"[PEARL_SYNC] Error procesando la llamada {call_id}: {e}")
+            if call_id:
+                synced.append((call_id, outbound_id, FAILED_HASH))
+            continue
+        stats['processed' if handled else 'skipped'] += 1
+        if handled:
+            applied.append(call)
+        if call_id:
+            synced.append((call_id, outbound_id, digest))
+
+    if synced:
+        cursor.executemany("""
+            INSERT INTO pearl_sync_calls (call_id, outbound_id, content_hash)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                outbound_id = VALUES(outbound_id),
+                content_hash = VALUES(content_hash)
+        """, synced)
+    return applied, page_context
+
+
+def _run_after_commit(after_commit: Optional[Callable[[List[Dict], Any], None]],
+                      applied: List[Dict], page_context: Any):
+    """Ejecuta ``after_commit`` con las llamadas ya confirmadas; sus errores no deshacen la página."""
+    if not after_commit or not applied:
+        return
+    try:
+        after_commit(applied, page_context)
+    except Exception as e:
+        logger.error(f"[PEARL_SYNC] Error aplicando los efectos de {len(applied)} llamadas confirmadas: {e}")
+
+
+def _retry_failed_calls(db_conn, cursor, outbound_id: str,
+                        process_call: Callable[[object, Dict, Any], bool],
+                        prepare_page: Optional[Callable[[object, List[Dict]], Any]],
+                        after_commit: Optional[Callable[[List[Dict], Any], None]],
+                        stats: Dict[str, int], limit: int):
+    """Reintenta las llamadas que fallaron en ciclos anteriores (pidiendo sus detalles por id)."""
+    cursor.execute(
+        "SELECT call_id FROM pearl_sync_calls WHERE outbound_id = %s AND content_hash = %s LIMIT %s",
+        (outbound_id, FAILED_HASH, limit)
+    )
+    ids = [row['call_id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+    if not ids:
+        return
+    logger.info(f"[PEARL_SYNC] Reintentando {len(ids)} llamadas que fallaron en ciclos anteriores")
+    details_by_id = fetch_call_statuses(ids)
+    calls = [call for call in (details_by_id.get(call_id) for call_id in ids) if isinstance(call, dict) and call]
+    stats['retried'] += len(calls)
+    if not calls:
+        return
+    db_conn.start_transaction()
+    try:
+        applied, page_context = _process_calls(cursor, calls, outbound_id, process_call, prepare_page, stats)
+        db_conn.commit()
+    except Exception:
+        db_conn.rollback()
+        raise
+    _run_after_commit(after_commit, applied, page_context)
+
+
+def sync_outbound_calls(db_conn, pearl_client, outbound_id: str,
+                        process_call: Callable[[object, Dict, Any], bool],
+                        prepare_page: Optional[Callable[[object, List[Dict]], Any]] = None,
+                        after_commit: Optional[Callable[[List[Dict], Any], None]] = None,
+                        page_size: int = SYNC_PAGE_SIZE) -> Dict[str, int]:
+    """
+    Sincroniza las llamadas nuevas o modificadas de un outbound.
+
+    Args:
+        db_conn: Conexión a la BD; cada página (y su offset) va en una transacción.
+        pearl_client: Cliente ``PearlCaller``.
+        outbound_id: Outbound a sincronizar.
+        process_call: ``process_call(cursor, call_details, page_context)``;
+            devuelve True si la llamada se aplicó y False si se omitió a
+            propósito (p. ej. sin lead). Si lanza, se deshacen sus escrituras,
+            se marca como fallida y se reintenta por id al inicio de los
+            siguientes ciclos (aunque la marca de agua ya la haya dejado atrás).
+        prepare_page: ``prepare_page(cursor, calls)`` opcional, invocado una
+            vez por página con las llamadas que cambiaron; su resultado se pasa
+            como ``page_context`` (p. ej. el mapa teléfono -> lead del lote).
+        after_commit: ``after_commit(applied_calls, page_context)`` opcional,
+            invocado tras confirmar cada página con las llamadas aplicadas.
+            Aquí van las escrituras por otras conexiones. Se ejecuta una sola
+            vez por llamada confirmada; si falla o el proceso cae antes, esos
+            efectos no se reintentan.
+
+    Returns:
+        Contadores del ciclo (pages, received, unchanged, processed, skipped, errors, retried).
+    """
+    stats = {'pages': 0, 'received': 0, 'unchanged': 0, 'processed': 0, 'skipped': 0, 'errors': 0, 'retried': 0}
+    cursor = db_conn.cursor()
+
+    _retry_failed_calls(db_conn, cursor, outbound_id, process_call, prepare_page, after_commit, stats, page_size)
+
+    state = _load_state(cursor, outbound_id)
+    if state and state['window_from'] is not None:
+        # Ventana a medias de un ciclo anterior: reanudar en la página pendiente
+        watermark = state['watermark']
+        window_from, window_to, skip = state['window_from'], state['window_to'], state['next_skip']
+        logger.info(f"[PEARL_SYNC] Reanudando ventana {window_from} - {window_to} desde offset {skip}")
+    else:
+        watermark = state['watermark'] if state and state['watermark'] else _bootstrap_watermark(cursor)
+        window_from, window_to, skip = watermark - SYNC_OVERLAP, _utcnow(), 0
+        _save_state(cursor, outbound_id, watermark, window_from, window_to, skip)
+        db_conn.commit()
+
+    from_str = window_from.strftime(PEARL_DATE_FORMAT)
+    to_str = window_to.strftime(PEARL_DATE_FORMAT)
+    logger.info(f"[PEARL_SYNC] Buscando llamadas para outbound {outbound_id} desde {from_str} hasta {to_str}")
+
+    while True:
+        try:
+            response_data = pearl_client.search_calls_paginated(outbound_id, from_str, to_str, skip, page_size)
+        except PearlAPIError as e:
+            # El estado queda guardado: el siguiente ciclo reanuda en este offset
+            logger.error(f"[PEARL_SYNC] Error al buscar llamadas (skip={skip}): {e}")
+            stats['errors'] += 1
+            cursor.close()
+            return stats
+
+        items = _page_items(response_data)
+        if not items:
+            break
+
+        # Si la API devuelve solo IDs, se piden los detalles en paralelo
+        ids = [item for item in items if isinstance(item, str)]
+        details_by_id = fetch_call_statuses(ids) if ids else {}
+
+        calls = []
+        for item in items:
+            call = details_by_id.get(item) if isinstance(item, str) else item
+            if isinstance(call, dict) and call:
+                calls.append(call)
+            else:
+                stats['errors'] += 1
+                logger.warning(f"[PEARL_SYNC] No se pudieron obtener detalles para la llamada: {item}")
+
+        # La página y su offset se confirman juntos: tras una caída se reanuda
+        # en la primera página no confirmada
+        db_conn.start_transaction()
+        try:
+            applied, page_context = _process_calls(cursor, calls, outbound_id, process_call, prepare_page, stats)
+            _save_state(cursor, outbound_id, watermark, window_from, window_to, skip + len(items))
+            db_conn.commit()
+        except Exception:
+            db_conn.rollback()
+            raise
+        _run_after_commit(after_commit, applied, page_context)
+
+        skip += len(items)
+        stats['pages'] += 1
+        stats['received'] += len(items)
+        logger.info(f"[PEARL_SYNC] Página {stats['pages']}: {len(items)} llamadas "
+                    f"(acumulado {stats['received']}, sin cambios {stats['unchanged']})")
+
+        if len(items) < page_size:
+            break
+
+    # Ventana completada: avanzar la marca de agua y purgar hashes antiguos
+    _save_state(cursor, outbound_id, window_to, None, None, 0)
+    cursor.execute(
+        "DELETE FROM pearl_sync_calls WHERE synced_at < NOW() - INTERVAL %s DAY LIMIT 1000",
+        (SYNC_HASH_RETENTION_DAYS,)
+    )
+    db_conn.commit()
+    cursor.close()
+    return stats
@@ -20,15 +20,17 @@ Uso:
     python procesador_reservas_automaticas.py --daemon --interval 30
 """
 
+import argparse
 import mysql.connector
 import logging
 import os
 import time
 import threading
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-from config import settings
-from tuotempo import Tuotempo
+from db import get_connection
+from tuotempo import get_tuotempo_client_for_env
+from slot_availability_cache import extract_availabilities
 from daemon_monitor import daemon_monitor, initialize_daemon_monitor
 
 # Cargar variables de entorno
@@ -57,37 +59,16 @@ class ProcesadorReservasAutomaticas:
         # Inicializar sistema de monitoreo
         initialize_daemon_monitor()
 
-    # Configuración de la base de datos
-    DB_CONFIG = {
-        'host': settings.DB_HOST,
-        'port': settings.DB_PORT,
-        'user': settings.DB_USER,
-        'password': settings.DB_PASSWORD,
-        'database': settings.DB_DATABASE,
-        'ssl_disabled': True,
-        'autocommit': True,
-        'charset': 'utf8mb4',
-        'use_unicode': True
-    }
+    def get_tuotempo_client(self):
+        """Cliente TuoTempo compartido del entorno configurado (TUOTEMPO_ENV, por defecto PRO)"""
+        return get_tuotempo_client_for_env(os.getenv('TUOTEMPO_ENV', 'PRO'))
 
     def get_db_connection(self):
-        """Establece conexión con la base de datos MySQL"""
-        try:
-            connection = mysql.connector.connect(**self.DB_CONFIG)
-            return connection
-        except mysql.connector.Error as err:
-            logger.error(f"Error conectando a MySQL: {err}")
-            # Si falla con SSL, intentar sin SSL
-            if 'SSL' in str(err) or '2026' in str(err):
-                try:
-                    logger.info("Intentando conexión sin SSL...")
-                    config_no_ssl = self.DB_CONFIG.copy()
-                    config_no_ssl['ssl_disabled'] = True
-                    connection = mysql.connector.connect(**config_no_ssl)
-                    return connection
-                except mysql.connector.Error as err2:
-                    logger.error(f"Error conectando sin SSL: {err2}")
-            return None
+        """Obtiene una conexión del pool compartido de MySQL (ver db.py)"""
+        conn = get_connection()
+        if conn is None:
+            logger.error("Error conectando a MySQL: no hay conexión disponible en el pool")
+        return conn
     
     def procesar_leads_automaticos(self):
         """Procesa todos los leads marcados para reserva automática"""
@@ -142,6 +123,10 @@ class ProcesadorReservasAutomaticas:
             leads_procesados = len(leads)
             self.logger.info(f"Encontrados {leads_procesados} leads marcados para reserva automática")
             
+            # Un único cliente para todo el ciclo: los leads del mismo centro y fecha
+            # reutilizan la disponibilidad cacheada (ver slot_availability_cache.py)
+            tuotempo = self.get_tuotempo_client()
+            
             for lead in leads:
                 try:
                     self.logger.info(f"Procesando lead {lead['id']}: {lead['nombre']} {lead['apellidos']}")
@@ -154,19 +139,19 @@ class ProcesadorReservasAutomaticas:
                         fecha_desde = date.today() + timedelta(days=15)
                     
                     # Consultar disponibilidad
-                    tuotempo = Tuotempo()
-                    slots = tuotempo.get_available_slots(
+                    respuesta_slots = tuotempo.get_available_slots(
                         locations_lid=[lead['area_id']], 
                         start_date=fecha_desde.strftime('%d-%m-%Y'), 
                         days=14
                     )
+                    slots = extract_availabilities(respuesta_slots)
                     
                     if slots and len(slots) > 0:
                         # Tomar el primer slot disponible
                         slot_seleccionado = slots[0]
                         
                         # Realizar la reserva
-                        if self.realizar_reserva(lead, slot_seleccionado):
+                        if self.realizar_reserva(lead, slot_seleccionado, tuotempo):
                             reservas_exitosas += 1
                             self.logger.info(f"Reserva realizada exitosamente para lead {lead['id']}")
                         else:
@@ -207,10 +192,10 @@ class ProcesadorReservasAutomaticas:
                 cursor.close()
                 conn.close()
     
-    def realizar_reserva(self, lead, slot):
+    def realizar_reserva(self, lead, slot, tuotempo=None):
         """Realiza la reserva para un lead específico"""
         try:
-            tuotempo = Tuotempo()
+            tuotempo = tuotempo or self.get_tuotempo_client()
             
             # Preparar datos del usuario
             user_info = {
@@ -381,7 +366,7 @@ def main():
                 time.sleep(60)  # Esperar 1 minuto antes de reintentar
     else:
         # Ejecutar una sola vez
-        procesador.procesar_reservas_automaticas()
+        procesador.procesar_leads_automaticos()
 
 if __name__ == "__main__":
     main()
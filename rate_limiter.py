@@ -0,0 +1,88 @@
+"""
+Limitador de tasa tipo token bucket para las llamadas a APIs externas
+(Pearl AI, TuoTempo).
+
+El bucket se rellena a ``rate`` tokens por segundo hasta ``capacity``; cada
+petición consume un token y, si no hay, espera a que se genere.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket seguro para usar desde varios hilos."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens por segundo (peticiones por segundo sostenidas).
+                  0 o negativo desactiva el límite.
+            capacity: Ráfaga máxima. Por defecto, ``max(1, rate)``.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Intenta consumir ``tokens`` sin bloquear.
+
+        Returns:
+            0.0 si se consumieron; si no, los segundos que faltan para poder hacerlo.
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None,
+                stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Espera hasta consumir ``tokens``.
+
+        Returns:
+            True si se consumieron; False si venció ``timeout`` o se activó
+            ``stop_event`` mientras se esperaba.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0.0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate_per_second': self.rate,
+                'burst': self.capacity,
+                'available_tokens': round(self._tokens, 2),
+            }
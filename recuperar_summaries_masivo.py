@@ -5,9 +5,12 @@ Recuperacion masiva optimizada de summaries de Railway
 
 import pymysql
 from datetime import datetime
-from pearl_caller import get_pearl_client
+from pearl_async import fetch_call_statuses
 import time
 
+# Llamadas consultadas en paralelo por bloque (el progreso se informa por bloque)
+LOTE_CONSULTA = 200
+
 # Configuracion de Railway
 RAILWAY_CONFIG = {
     'host': 'ballast.proxy.rlwy.net',
@@ -68,10 +71,7 @@ def recuperar_todos_los_summaries():
         print(f"Registros obtenidos: {len(registros)}")
         print()
 
-        # 3. Conectar a Pearl AI
-        client = get_pearl_client()
-
-        # 4. Procesar todos los registros
+        # 3. Procesar todos los registros
         actualizados = 0
         errores = 0
         sin_summary = 0
@@ -81,44 +81,47 @@ def recuperar_todos_los_summaries():
         print("PROCESANDO REGISTROS:")
         print("-" * 60)
 
-        for i, (id_registro, call_id, lead_id, created_at) in enumerate(registros, 1):
-            if i % 50 == 0:
-                elapsed = time.time() - start_time
-                rate = i / elapsed if elapsed > 0 else 0
-                remaining = (len(registros) - i) / rate if rate > 0 else 0
-                print(f"Progreso: {i}/{len(registros)} ({i/len(registros)*100:.1f}%) - {rate:.1f}/seg - ETA: {remaining/60:.1f}min")
+        for inicio in range(0, len(registros), LOTE_CONSULTA):
+            lote = registros[inicio:inicio + LOTE_CONSULTA]
 
-            try:
-                # Obtener detalles de Pearl AI
-                call_details = client.get_call_status(call_id)
+            # Obtener detalles de Pearl AI en paralelo para todo el bloque
+            detalles = fetch_call_statuses([call_id for _, call_id, _, _ in lote])
 
-                if call_details:
-                    # Extraer summary
-                    summary = call_details.get('summary', {}).get('text') if isinstance(call_details.get('summary'), dict) else call_details.get('summary')
+            for id_registro, call_id, lead_id, created_at in lote:
+                call_details = detalles.get(call_id)
 
-                    if summary and summary.strip():
-                        # Actualizar en BD
-                        cursor.execute("""
-                            UPDATE pearl_calls
-                            SET summary = %s, updated_at = NOW()
-                            WHERE id = %s
-                        """, [summary, id_registro])
+                if isinstance(call_details, Exception):
+                    errores += 1
+                    if errores <= 5:  # Solo mostrar primeros 5 errores
+                        print(f"  Error en {call_id}: {call_details}")
+                    continue
 
-                        actualizados += 1
+                if not call_details:
+                    errores += 1
+                    continue
 
-                        if actualizados % 10 == 0:
-                            conn.commit()  # Commit cada 10 actualizaciones
+                # Extraer summary
+                summary = call_details.get('summary', {}).get('text') if isinstance(call_details.get('summary'), dict) else call_details.get('summary')
 
-                    else:
-                        sin_summary += 1
+                if summary and summary.strip():
+                    # Actualizar en BD
+                    cursor.execute("""
+                        UPDATE pearl_calls
+                        SET summary = %s, updated_at = NOW()
+                        WHERE id = %s
+                    """, [summary, id_registro])
 
+                    actualizados += 1
                 else:
-                    errores += 1
+                    sin_summary += 1
+
+            conn.commit()  # Commit por bloque
 
-            except Exception as e:
-                errores += 1
-                if errores <= 5:  # Solo mostrar primeros 5 errores
-                    print(f"  Error en {call_id}: {e}")
+            procesados = inicio + len(lote)
+            elapsed = time.time() - start_time
+            rate = procesados / elapsed if elapsed > 0 else 0
+            remaining = (len(registros) - procesados) / rate if rate > 0 else 0
+            print(f"Progreso: {procesados}/{len(registros)} ({procesados/len(registros)*100:.1f}%) - {rate:.1f}/seg - ETA: {remaining/60:.1f}min")
 
         # Commit final
         conn.commit()
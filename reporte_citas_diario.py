@@ -13,6 +13,7 @@ COMO USAR:
 import pymysql
 import pandas as pd
 from datetime import datetime, timedelta
+import leads_rollup
 
 # Configuracion de Railway
 RAILWAY_CONFIG = {
@@ -102,21 +103,15 @@ def generar_reporte_diario():
     
     print(f"Encontradas {len(resultados)} citas para {ayer}")
     
-    # Mostrar resumen por fichero
-    cursor.execute(f"""
-        SELECT 
-            origen_archivo,
-            COUNT(*) as cantidad
-        FROM leads 
-        WHERE DATE(updated_at) = '{ayer}'
-        AND TRIM(status_level_1) = 'Cita Agendada'
-        GROUP BY origen_archivo
-        ORDER BY cantidad DESC
-    """)
+    # Mostrar resumen por fichero (desde el agregado diario leads_daily_stats)
+    dia = datetime.strptime(ayer, '%Y-%m-%d').date()
+    resumen = leads_rollup.query(
+        cursor, desde=dia, hasta=dia, group_by=('origen_archivo',), status_level_1='Cita Agendada'
+    )
     
     print("\nResumen por fichero:")
-    for row in cursor.fetchall():
-        print(f"  - {row[0]}: {row[1]} citas")
+    for row in sorted(resumen, key=lambda r: r['leads'], reverse=True):
+        print(f"  - {row['origen_archivo'] or None}: {row['leads']} citas")
     
     # Crear columnas para DataFrame
     columnas = [
@@ -83,7 +83,7 @@ def reprocesar_leads_fallidos():
         
         # Importar las funciones necesarias
         try:
-            from call_manager_scheduler_integration import enhanced_process_call_result
+            from call_manager_scheduler_integration import enhanced_process_call_result, reschedule_failed_calls
         except ImportError as e:
             logger.error(f"No se pudo importar enhanced_process_call_result: {e}")
             return
@@ -92,6 +92,7 @@ def reprocesar_leads_fallidos():
         leads_processed = set()
         processed_count = 0
         success_count = 0
+        reschedule = []  # Reprogramaciones del reproceso, aplicadas en un solo lote
         
         for call in recent_calls:
             lead_id = call['lead_id']
@@ -151,7 +152,7 @@ def reprocesar_leads_fallidos():
                 }
                 
                 # Procesar con el sistema integrado
-                success = enhanced_process_call_result(lead_id, call_result, pearl_response)
+                success = enhanced_process_call_result(lead_id, call_result, pearl_response, reschedule=reschedule)
                 
                 processed_count += 1
                 if success:
@@ -164,6 +165,8 @@ def reprocesar_leads_fallidos():
                 logger.error(f"❌ Error reprocesando Lead {lead_id}: {e}")
                 processed_count += 1
         
+        reschedule_failed_calls(reschedule)
+        
         # Resumen final
         logger.info(f"""
 ╔══════════════════════════════════════╗
@@ -71,7 +71,7 @@ def reprocesar_status_6_failed():
         
         # 2. Importar la integración del scheduler
         try:
-            from call_manager_scheduler_integration import enhanced_process_call_result
+            from call_manager_scheduler_integration import enhanced_process_call_result, reschedule_failed_calls
         except ImportError as e:
             logger.error(f"No se pudo importar la integración del scheduler: {e}")
             return
@@ -79,6 +79,7 @@ def reprocesar_status_6_failed():
         # 3. Procesar cada llamada fallida
         processed = 0
         scheduled = 0
+        reschedule = []  # Reprogramaciones del reproceso, aplicadas en un solo lote
         
         for call in failed_calls:
             try:
@@ -104,18 +105,19 @@ def reprocesar_status_6_failed():
                 # Procesar con el scheduler integrado
                 logger.info(f"Reprocesando Lead {call['lead_id']} ({call['nombre']} {call['apellidos']}) - Status 6 (Failed)")
                 
-                success = enhanced_process_call_result(call['lead_id'], call_result, pearl_response)
+                success = enhanced_process_call_result(call['lead_id'], call_result, pearl_response, reschedule=reschedule)
                 
                 if success:
                     processed += 1
-                    scheduled += 1
-                    logger.info(f"✅ Lead {call['lead_id']} reprogramado exitosamente")
+                    logger.info(f"✅ Lead {call['lead_id']} procesado")
                 else:
                     logger.warning(f"⚠️ Error procesando Lead {call['lead_id']}")
                 
             except Exception as e:
                 logger.error(f"❌ Error reprocesando llamada {call['call_id']} para Lead {call['lead_id']}: {e}")
         
+        scheduled = sum(1 for ok in reschedule_failed_calls(reschedule).values() if ok)
+        
         # 4. Resumen final
         logger.info(f"""
 ╔══════════════════════════════════════╗
@@ -7,6 +7,7 @@ import logging
 import pymysql
 from datetime import datetime, timedelta
 from config import settings
+from call_scheduler import RETRY_BATCH_CHUNK, cancel_pending_schedules
 
 logger = logging.getLogger(__name__)
 
@@ -209,107 +210,147 @@ def simple_reschedule_failed_call(lead_id: int, outcome: str) -> bool:
     if not lead_id or not isinstance(lead_id, int):
         logger.error(f"Invalid lead_id: {lead_id}")
         return False
-    
-    if not outcome:
-        outcome = 'unknown'
-        
-    # Leer configuración desde scheduler_config
-    config = get_retry_config_from_db(outcome)
-    logger.info(f"Lead {lead_id} - Config para '{outcome}': {config}")
-    
+    return simple_reschedule_failed_calls([(lead_id, outcome)]).get(lead_id, False)
+
+def _chunks(items):
+    """Bloques de ``RETRY_BATCH_CHUNK`` elementos (tamaño de las listas IN)."""
+    for i in range(0, len(items), RETRY_BATCH_CHUNK):
+        yield items[i:i + RETRY_BATCH_CHUNK]
+
+def simple_reschedule_failed_calls(batch) -> dict:
+    """
+    Reprograma un lote de llamadas fallidas con sentencias por conjuntos.
+
+    La configuración de reintentos se lee una vez por outcome distinto y el
+    siguiente horario laboral una vez por retraso distinto; después todo el
+    lote se escribe en una transacción, en bloques de ``RETRY_BATCH_CHUNK``
+    leads: cancelación de pendientes de leads cerrados, cierre de los que
+    agotan intentos, actualización de intentos y un INSERT multi-fila con ON
+    DUPLICATE KEY UPDATE sobre call_schedule. Como antes, si el INSERT en
+    call_schedule falla (p. ej. no existe la tabla) se registra un aviso y el
+    resto de cambios se confirma.
+
+    Args:
+        batch: Pares (lead_id, outcome). Si un lead se repite cuenta una vez
+               con el último resultado.
+
+    Returns:
+        dict: lead_id -> True si se reprogramó, False si se cerró u omitió
+    """
+    outcomes = {}
+    for lead_id, outcome in batch:
+        if not lead_id or not isinstance(lead_id, int):
+            logger.error(f"Invalid lead_id: {lead_id}")
+            continue
+        outcomes[lead_id] = outcome or 'unknown'
+    if not outcomes:
+        return {}
+
+    # Configuración y horario calculados una sola vez por outcome / retraso
+    configs = {outcome: get_retry_config_from_db(outcome) for outcome in set(outcomes.values())}
+    now = datetime.now()
+    next_attempts = {}
+    for config in configs.values():
+        if config['delay_hours'] not in next_attempts:
+            next_attempts[config['delay_hours']] = calculate_next_working_datetime(now, config['delay_hours'])
+
+    results = {lead_id: False for lead_id in outcomes}
     conn = None
     try:
         conn = get_pymysql_connection()
         if not conn:
             logger.error("No se pudo conectar a la BD")
-            return False
-            
+            return results
+
         with conn.cursor() as cursor:
-            # Obtener información real del lead para asegurar el ID correcto
-            cursor.execute("""
-                SELECT id AS real_id, call_attempts_count, lead_status, telefono, nombre, apellidos
-                FROM leads 
-                WHERE id = %s
-            """, (lead_id,))
-            lead = cursor.fetchone()
-            if not lead:
-                logger.error(f"Lead {lead_id} no existe en la BD. Abortando reprogramación.")
-                return False
-            # Forzar uso del ID real para evitar errores de cálculo
-            lead_id = lead['real_id']
-            logger.debug(f"[REPROGRAMACION] Lead real obtenido: {lead_id} (telefono={lead.get('telefono')})")
-                
-            if lead['lead_status'] == 'closed':
-                logger.info(f"Lead {lead_id} ya está cerrado - no se reprograma")
-                # Cancelar cualquier llamada programada pendiente para este lead cerrado
-                cursor.execute("""
-                    UPDATE call_schedule 
-                    SET status = 'cancelled', 
-                        updated_at = NOW()
-                    WHERE lead_id = %s AND status = 'pending'
-                """, (lead_id,))
-                return False
-            
-            current_attempts = lead['call_attempts_count'] or 0
-            
-            # Si excede intentos máximos, cerrar el lead
-            if current_attempts >= config['max_attempts']:
-                logger.info(f"Lead {lead_id} cerrado por máximo intentos ({current_attempts}/{config['max_attempts']})")
-                
-                cursor.execute("""
+            lead_ids = list(outcomes)
+            leads = {}
+            for chunk in _chunks(lead_ids):
+                cursor.execute(f"""
+                    SELECT id, call_attempts_count, lead_status
+                    FROM leads
+                    WHERE id IN ({', '.join(['%s'] * len(chunk))})
+                    FOR UPDATE
+                """, chunk)
+                leads.update({row['id']: row for row in cursor.fetchall()})
+
+            closed_ids, max_attempt_ids, schedule_rows = [], [], []
+            for lead_id, outcome in outcomes.items():
+                lead = leads.get(lead_id)
+                if not lead:
+                    logger.error(f"Lead {lead_id} no existe en la BD. Abortando reprogramación.")
+                    continue
+                if lead['lead_status'] == 'closed':
+                    logger.info(f"Lead {lead_id} ya está cerrado - no se reprograma")
+                    closed_ids.append(lead_id)
+                    continue
+                current_attempts = lead['call_attempts_count'] or 0
+                config = configs[outcome]
+                if current_attempts >= config['max_attempts']:
+                    logger.info(f"Lead {lead_id} cerrado por máximo intentos ({current_attempts}/{config['max_attempts']})")
+                    max_attempt_ids.append(lead_id)
+                    continue
+                next_attempt = next_attempts[config['delay_hours']]
+                schedule_rows.append((lead_id, next_attempt, current_attempts + 1, outcome))
+                results[lead_id] = True
+                logger.debug(f"[REPROGRAMACION] Lead {lead_id} reprogramado para {next_attempt} "
+                             f"(intento {current_attempts + 1}/{config['max_attempts']})")
+
+            for chunk in _chunks(closed_ids):
+                # Cancelar cualquier llamada programada pendiente para leads cerrados
+                cancel_pending_schedules(cursor, chunk)
+
+            for chunk in _chunks(max_attempt_ids):
+                cursor.execute(f"""
                     UPDATE leads SET
                         lead_status = 'closed',
                         closure_reason = 'Maximo intentos alcanzado',
                         selected_for_calling = FALSE,
                         updated_at = NOW()
-                    WHERE id = %s
-                """, (lead_id,))
-                
-                conn.commit()
-                return False
-            
-            # Calcular próximo intento respetando días laborables
-            next_attempt = calculate_next_working_datetime(datetime.now(), config['delay_hours'])
-            
-            # Incrementar intentos y programar próximo intento
-            cursor.execute("""
-                UPDATE leads SET
-                    call_attempts_count = %s,
-                    last_call_attempt = NOW(),
-                    call_status = 'no_selected',
-                    selected_for_calling = FALSE,
-                    updated_at = NOW()
-                WHERE id = %s
-            """, (current_attempts + 1, lead_id))
-            
-            # Insertar en call_schedule si la tabla existe
-            try:
-                cursor.execute("""
-                    INSERT INTO call_schedule (lead_id, scheduled_at, attempt_number, status, last_outcome, created_at)
-                    VALUES (%s, %s, %s, 'pending', %s, NOW())
-                    ON DUPLICATE KEY UPDATE
-                        scheduled_at = VALUES(scheduled_at),
-                        attempt_number = VALUES(attempt_number),
-                        last_outcome = VALUES(last_outcome),
+                    WHERE id IN ({', '.join(['%s'] * len(chunk))})
+                """, chunk)
+
+            for chunk in _chunks(schedule_rows):
+                # Incrementar intentos (filas bloqueadas por el SELECT ... FOR UPDATE)
+                ids = [row[0] for row in chunk]
+                cursor.execute(f"""
+                    UPDATE leads SET
+                        call_attempts_count = COALESCE(call_attempts_count, 0) + 1,
+                        last_call_attempt = NOW(),
+                        call_status = 'no_selected',
+                        selected_for_calling = FALSE,
                         updated_at = NOW()
-                """, (lead_id, next_attempt, current_attempts + 1, outcome))
-            except Exception as e:
-                logger.warning(f"No se pudo insertar en call_schedule para lead {lead_id}: {e}")
-                # Continuar sin fallar si la tabla no existe
-            
+                    WHERE id IN ({', '.join(['%s'] * len(ids))})
+                """, ids)
+
+                # Insertar en call_schedule si la tabla existe
+                try:
+                    cursor.execute(f"""
+                        INSERT INTO call_schedule (lead_id, scheduled_at, attempt_number, status, last_outcome, created_at)
+                        VALUES {', '.join(["(%s, %s, %s, 'pending', %s, NOW())"] * len(chunk))}
+                        ON DUPLICATE KEY UPDATE
+                            scheduled_at = VALUES(scheduled_at),
+                            attempt_number = VALUES(attempt_number),
+                            last_outcome = VALUES(last_outcome),
+                            updated_at = NOW()
+                    """, [value for row in chunk for value in row])
+                except Exception as e:
+                    logger.warning(f"No se pudo insertar en call_schedule para {len(chunk)} leads: {e}")
+                    # Continuar sin fallar si la tabla no existe
+
         conn.commit()
-        logger.debug(f"[REPROGRAMACION] call_schedule upsert para lead {lead_id}: scheduled_at={next_attempt}, intento={current_attempts + 1}")
-        logger.info(f"Lead {lead_id} reprogramado para {next_attempt} (intento {current_attempts + 1}/{config['max_attempts']})")
-        return True
+        logger.info(f"[REPROGRAMACION] Lote de {len(outcomes)} leads: {len(schedule_rows)} reprogramados, "
+                    f"{len(max_attempt_ids)} cerrados por máximo intentos, {len(closed_ids)} ya cerrados")
+        return results
             
     except Exception as e:
-        logger.error(f"Error en reprogramación simple para lead {lead_id}: {type(e).__name__}: {str(e)}")
+        logger.error(f"Error en reprogramación por lote de {len(outcomes)} leads: {type(e).__name__}: {str(e)}")
         if conn:
             try:
                 conn.rollback()
             except:
                 pass
-        return False
+        return {lead_id: False for lead_id in outcomes}
         
     finally:
         if conn:
@@ -0,0 +1,220 @@
+"""
+Idempotencia de ``/api/reservar`` (tabla ``reservation_idempotency``).
+
+La clave es teléfono + fecha + hora + recurso del slot pedido. Antes de
+llamar a TuoTempo la petición "reclama" la clave con un ``INSERT IGNORE``
+atómico sobre la clave primaria, de modo que entre todos los workers y
+réplicas sólo una reserva está en curso para el mismo slot:
+
+- ``claimed``: la clave es nuestra; al terminar se llama a ``complete`` (que
+  guarda el resultado durante ``RESERVATION_IDEMPOTENCY_TTL`` segundos si es
+  ``OK`` o ``SLOT_CONFLICT``) o a ``release`` (cualquier otro resultado: un
+  reintento puede volver a intentarlo).
+- ``replay``: ya hay un resultado guardado y se devuelve el mismo.
+- ``in_progress``: otra petición sigue reservando tras esperar
+  ``RESERVATION_IDEMPOTENCY_WAIT_SECONDS``.
+- ``unavailable``: la tabla no responde; se reserva sin protección (como
+  hacía la caché en fichero ante un error).
+
+Una reclamación en curso caduca a los ``RESERVATION_IDEMPOTENCY_LEASE_SECONDS``
+(p. ej. si el worker murió), y entonces otra petición puede quedársela. Un
+hilo de fondo borra las filas caducadas cada
+``RESERVATION_IDEMPOTENCY_PURGE_SECONDS``. Las métricas del worker se
+consultan con ``get_idempotency_stats()``.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Any, Dict, Optional
+
+from db import connection as db_connection
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_IDEMPOTENCY_TTL = int(os.getenv('RESERVATION_IDEMPOTENCY_TTL', 120))  # segundos
+RESERVATION_IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('RESERVATION_IDEMPOTENCY_LEASE_SECONDS', 90))
+RESERVATION_IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('RESERVATION_IDEMPOTENCY_WAIT_SECONDS', 30))
+RESERVATION_IDEMPOTENCY_PURGE_SECONDS = int(os.getenv('RESERVATION_IDEMPOTENCY_PURGE_SECONDS', 300))
+POLL_INTERVAL = 0.25  # segundos entre comprobaciones mientras se espera a otra petición
+
+# Resultados de TuoTempo que se repiten a los duplicados; el resto libera la clave
+REPLAYABLE_RESULTS = ('OK', 'SLOT_CONFLICT')
+
+CLAIMED, REPLAY, IN_PROGRESS, UNAVAILABLE = 'claimed', 'replay', 'in_progress', 'unavailable'
+
+Claim = namedtuple('Claim', 'state result token')
+
+_metrics_lock = threading.Lock()
+_metrics = {'claims': 0, 'duplicate_hits': 0, 'waits': 0, 'wait_timeouts': 0,
+            'takeovers': 0, 'released': 0, 'purged': 0, 'errors': 0}
+_purger: Optional[threading.Thread] = None
+_purger_lock = threading.Lock()
+
+
+def _count(metric: str, value: int = 1):
+    with _metrics_lock:
+        _metrics[metric] += value
+
+
+def _hash(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _try_claim(cursor, key_hash: str, key: str, token: str) -> bool:
+    """Reclama la clave si no existe o si la fila anterior ha caducado."""
+    cursor.execute("""
+        INSERT IGNORE INTO reservation_idempotency (key_hash, key_text, status, owner_token, expires_at)
+        VALUES (%s, %s, 'pending', %s, DATE_ADD(NOW(), INTERVAL %s SECOND))
+    """, (key_hash, key[:255], token, RESERVATION_IDEMPOTENCY_LEASE_SECONDS))
+    if cursor.rowcount == 1:
+        return True
+    cursor.execute("""
+        UPDATE reservation_idempotency
+        SET status = 'pending', owner_token = %s, result = NULL,
+            expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+        WHERE key_hash = %s AND expires_at <= NOW()
+    """, (token, RESERVATION_IDEMPOTENCY_LEASE_SECONDS, key_hash))
+    if cursor.rowcount == 1:
+        _count('takeovers')
+        return True
+    return False
+
+
+def claim(key: str) -> Claim:
+    """Reclama ``key`` o espera el resultado de la petición que ya la tiene (ver docstring del módulo)."""
+    key_hash = _hash(key)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + RESERVATION_IDEMPOTENCY_WAIT_SECONDS
+    waited = False
+    try:
+        while True:
+            # La conexión se devuelve al pool entre consultas: no se retiene mientras se espera
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    if _try_claim(cursor, key_hash, key, token):
+                        conn.commit()
+                        _count('claims')
+                        return Claim(CLAIMED, None, token)
+                    conn.commit()
+                    cursor.execute("""
+                        SELECT status, result FROM reservation_idempotency
+                        WHERE key_hash = %s AND expires_at > NOW()
+                    """, (key_hash,))
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+            if row and row[0] == 'done':
+                _count('duplicate_hits')
+                logger.info(f"[IDEMPOTENCIA] Reserva duplicada para {key}: se devuelve el resultado guardado")
+                return Claim(REPLAY, json.loads(row[1]) if row[1] else {}, None)
+            if row is None:
+                continue  # caducó o se liberó entre las dos consultas
+            if not waited:
+                waited = True
+                _count('waits')
+                logger.info(f"[IDEMPOTENCIA] Reserva en curso para {key}: esperando su resultado")
+            if time.monotonic() >= deadline:
+                _count('wait_timeouts')
+                logger.warning(f"[IDEMPOTENCIA] La reserva en curso para {key} no terminó en "
+                               f"{RESERVATION_IDEMPOTENCY_WAIT_SECONDS}s")
+                return Claim(IN_PROGRESS, None, None)
+            time.sleep(POLL_INTERVAL)
+    except Exception as e:
+        _count('errors')
+        logger.warning(f"[IDEMPOTENCIA] Tabla de idempotencia no disponible ({e}); se reserva sin protección")
+        return Claim(UNAVAILABLE, None, None)
+
+
+def complete(key: str, token: Optional[str], result: Dict[str, Any]):
+    """Guarda el resultado de una reserva reclamada (o libera la clave si no es repetible)."""
+    if not token:
+        return
+    if not isinstance(result, dict) or result.get('result') not in REPLAYABLE_RESULTS:
+        release(key, token)
+        return
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE reservation_idempotency
+                SET status = 'done', result = %s, expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE key_hash = %s AND owner_token = %s
+            """, (json.dumps(result, ensure_ascii=False, default=str), RESERVATION_IDEMPOTENCY_TTL,
+                  _hash(key), token))
+            conn.commit()
+            cursor.close()
+    except Exception as e:
+        _count('errors')
+        logger.warning(f"[IDEMPOTENCIA] No se pudo guardar el resultado para {key}: {e}")
+
+
+def release(key: str, token: Optional[str]):
+    """Libera una clave reclamada sin guardar resultado."""
+    if not token:
+        return
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM reservation_idempotency WHERE key_hash = %s AND owner_token = %s",
+                           (_hash(key), token))
+            conn.commit()
+            cursor.close()
+        _count('released')
+    except Exception as e:
+        _count('errors')
+        logger.warning(f"[IDEMPOTENCIA] No se pudo liberar la clave {key}: {e}")
+
+
+def purge_expired(batch: int = 1000) -> int:
+    """Borra filas caducadas. Devuelve cuántas se borraron."""
+    total = 0
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        while True:
+            cursor.execute("DELETE FROM reservation_idempotency WHERE expires_at <= NOW() LIMIT %s", (batch,))
+            deleted = cursor.rowcount
+            conn.commit()
+            total += deleted
+            if deleted < batch:
+                break
+        cursor.close()
+    if total:
+        _count('purged', total)
+    return total
+
+
+def _purge_loop():
+    while True:
+        time.sleep(RESERVATION_IDEMPOTENCY_PURGE_SECONDS)
+        try:
+            deleted = purge_expired()
+            if deleted:
+                logger.info(f"[IDEMPOTENCIA] {deleted} claves caducadas eliminadas")
+        except Exception as e:
+            logger.warning(f"[IDEMPOTENCIA] Error borrando claves caducadas: {e}")
+
+
+def start_idempotency_purger():
+    """Arranca (una vez por proceso) el hilo que borra las claves caducadas."""
+    global _purger
+    with _purger_lock:
+        if _purger is None:
+            _purger = threading.Thread(target=_purge_loop, name='idempotency-purger', daemon=True)
+            _purger.start()
+    return _purger
+
+
+def get_idempotency_stats() -> Dict[str, Any]:
+    """Métricas del worker actual."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats.update(ttl_seconds=RESERVATION_IDEMPOTENCY_TTL, lease_seconds=RESERVATION_IDEMPOTENCY_LEASE_SECONDS,
+                 wait_seconds=RESERVATION_IDEMPOTENCY_WAIT_SECONDS)
+    return stats
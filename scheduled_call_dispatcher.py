@@ -0,0 +1,356 @@
+"""
+Despachador de llamadas programadas dirigido por eventos.
+
+Sustituye al bucle de sondeo del daemon (dormir ``interval_minutes`` y leer
+``call_schedule`` en cada ciclo) por una cola de prioridad en memoria con las
+próximas entradas pendientes:
+
+- al arrancar (y en cada recarga de configuración) se cargan las entradas
+  pendientes de la ventana ``[ahora, ahora + lookahead)``,
+- cada ``resync_seconds`` (o al instante, si el cambio se hace en este proceso
+  vía ``call_scheduler.notify_schedule_changed``) se leen solo las filas con
+  ``updated_at`` posterior a la última lectura,
+- el hilo duerme exactamente hasta la siguiente llamada vencida (o hasta la
+  siguiente franja laboral si está fuera de horario) y entrega los leads
+  directamente a ``CallManager``.
+
+Los reintentos se lanzan segundos después de su ``scheduled_at`` en lugar de
+hasta un intervalo completo tarde, y los ciclos sin trabajo no consultan MySQL.
+
+Todas las comparaciones con ``scheduled_at`` usan el reloj de MySQL: cada
+lectura de ``NOW()`` actualiza la diferencia con el reloj local y ``_now()``
+la aplica, de modo que un desfase entre la BD y este servidor no adelanta ni
+retrasa las llamadas.
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db import get_connection
+from call_manager import CallManager
+from call_scheduler import CallScheduler as CleanupScheduler, add_schedule_listener
+from call_scheduler_multi_timeframes import CallSchedulerMultiTimeframes
+
+logger = logging.getLogger(__name__)
+
+LOOKAHEAD = timedelta(minutes=int(os.getenv('SCHEDULED_CALLS_LOOKAHEAD_MINUTES', 60)))
+RESYNC_SECONDS = int(os.getenv('SCHEDULED_CALLS_RESYNC_SECONDS', 60))
+REDISPATCH_AFTER = timedelta(minutes=int(os.getenv('SCHEDULED_CALLS_REDISPATCH_MINUTES', 30)))
+BUSY_RETRY_SECONDS = 5
+MAX_LOADED_ENTRIES = 5000
+
+DEFAULT_DAEMON_CONFIG = {
+    'scheduled_calls_interval_minutes': 5,
+    'daemon_enabled': True,
+    'max_calls_per_cycle': 10
+}
+
+
+class ScheduledCallDispatcher:
+    """Cola de prioridad de ``call_schedule`` con refresco incremental desde la BD."""
+
+    def __init__(self, scheduler: Optional[CallSchedulerMultiTimeframes] = None,
+                 config_loader: Optional[Callable[[], Dict]] = None,
+                 lookahead: timedelta = LOOKAHEAD, resync_seconds: int = RESYNC_SECONDS):
+        """
+        Args:
+            scheduler: Scheduler de franjas horarias (horario laboral).
+            config_loader: Devuelve la configuración del daemon
+                (``daemon_enabled``, ``max_calls_per_cycle``,
+                ``scheduled_calls_interval_minutes``). El intervalo pasa a ser
+                el periodo de recarga completa de configuración y cola.
+            lookahead: Ventana de entradas futuras mantenidas en memoria.
+            resync_seconds: Periodo de lectura de cambios de otros procesos.
+        """
+        self.scheduler = scheduler or CallSchedulerMultiTimeframes()
+        self.config_loader = config_loader or (lambda: dict(DEFAULT_DAEMON_CONFIG))
+        self.lookahead = lookahead
+        self.resync_seconds = resync_seconds
+        self.config = dict(DEFAULT_DAEMON_CONFIG)
+
+        # Heap de (scheduled_at, attempt_number, schedule_id) con borrado perezoso:
+        # solo es válida la tupla que coincide con _entries[schedule_id]
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._entries: Dict[int, Tuple[datetime, int]] = {}
+        # (schedule_id, scheduled_at) ya entregados -> instante a partir del cual
+        # se pueden volver a entregar si siguen pendientes
+        self._dispatched: Dict[Tuple[int, datetime], datetime] = {}
+        self._loaded_until: Optional[datetime] = None
+        self._changes_since: Optional[datetime] = None
+        # Reloj de la BD menos reloj local (ver _now)
+        self._clock_offset = timedelta(0)
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._changed = threading.Event()
+        self._next_resync = 0.0
+        self._next_reload = 0.0
+        self._retry_at: Optional[float] = None
+        self._metrics = {'full_reloads': 0, 'resyncs': 0, 'dispatches': 0, 'calls_dispatched': 0,
+                         'skipped_invalid': 0, 'busy_retries': 0}
+
+        add_schedule_listener(self.notify)
+
+    # --- Notificaciones ---
+
+    def notify(self):
+        """Marca que call_schedule ha cambiado y despierta al hilo despachador."""
+        self._changed.set()
+        self._wake.set()
+
+    # --- Cola en memoria ---
+
+    def _put(self, schedule_id: int, scheduled_at: datetime, attempt_number: int):
+        expires = self._dispatched.get((schedule_id, scheduled_at))
+        if expires and expires > self._now():
+            # Ya entregado a CallManager y aún sin resultado
+            self._entries.pop(schedule_id, None)
+            return
+        entry = (scheduled_at, attempt_number or 1)
+        if self._entries.get(schedule_id) != entry:
+            self._entries[schedule_id] = entry
+            heapq.heappush(self._heap, (scheduled_at, attempt_number or 1, schedule_id))
+
+    def _peek(self) -> Optional[Tuple[datetime, int, int]]:
+        while self._heap:
+            scheduled_at, attempt, schedule_id = self._heap[0]
+            if self._entries.get(schedule_id) == (scheduled_at, attempt):
+                return self._heap[0]
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime, limit: int) -> List[Tuple[datetime, int, int]]:
+        due = []
+        while len(due) < limit:
+            head = self._peek()
+            if not head or head[0] > now:
+                break
+            heapq.heappop(self._heap)
+            del self._entries[head[2]]
+            due.append(head)
+        return due
+
+    # --- Carga desde BD ---
+
+    def _now(self) -> datetime:
+        """Hora actual según el reloj de la BD (estimada con el último ``_db_now``)."""
+        return datetime.now() + self._clock_offset
+
+    def _db_now(self, cursor) -> datetime:
+        cursor.execute("SELECT NOW()")
+        db_now = cursor.fetchone()[0]
+        self._clock_offset = db_now - datetime.now()
+        return db_now
+
+    def _load_window(self, cursor, start: Optional[datetime], end: datetime):
+        """Carga las entradas pendientes con ``start <= scheduled_at < end``."""
+        params = [end]
+        condition = "scheduled_at < %s"
+        if start is not None:
+            condition = "scheduled_at >= %s AND " + condition
+            params.insert(0, start)
+        params.append(MAX_LOADED_ENTRIES)
+        cursor.execute(f"""
+            SELECT id, scheduled_at, attempt_number
+            FROM call_schedule
+            WHERE status = 'pending' AND {condition}
+            ORDER BY scheduled_at
+            LIMIT %s
+        """, params)
+        rows = cursor.fetchall()
+        for schedule_id, scheduled_at, attempt_number in rows:
+            self._put(schedule_id, scheduled_at, attempt_number)
+        # Si se alcanza el tope, la ventana cargada termina en la última entrada leída
+        self._loaded_until = rows[-1][1] if len(rows) >= MAX_LOADED_ENTRIES else end
+
+    def full_reload(self):
+        """Recarga la configuración, limpia entradas inválidas y reconstruye la cola."""
+        try:
+            self.config = dict(DEFAULT_DAEMON_CONFIG, **(self.config_loader() or {}))
+        except Exception as e:
+            logger.warning(f"[DISPATCHER] Error cargando configuración del daemon: {e}")
+        self.scheduler._config_loaded = False  # Forzar recarga de franjas y días
+        CleanupScheduler().cleanup_invalid_schedules()
+
+        conn = get_connection()
+        if not conn:
+            logger.error("[DISPATCHER] No se pudo conectar para cargar call_schedule")
+            self._next_reload = time.monotonic() + BUSY_RETRY_SECONDS * 12
+            return
+        try:
+            with conn.cursor() as cursor:
+                db_now = self._db_now(cursor)
+                self._heap, self._entries = [], {}
+                self._load_window(cursor, None, db_now + self.lookahead)
+                self._changes_since = db_now
+        finally:
+            conn.close()
+
+        now = self._now()
+        self._dispatched = {key: exp for key, exp in self._dispatched.items() if exp > now}
+        self._metrics['full_reloads'] += 1
+        interval = max(1, int(self.config.get('scheduled_calls_interval_minutes') or 5))
+        self._next_reload = time.monotonic() + interval * 60
+        self._next_resync = time.monotonic() + self.resync_seconds
+        logger.info(f"[DISPATCHER] Cola recargada: {len(self._entries)} llamadas pendientes "
+                    f"hasta {self._loaded_until}")
+
+    def sync_changes(self):
+        """Aplica las filas de call_schedule modificadas desde la última lectura."""
+        if self._loaded_until is None:
+            return
+        conn = get_connection()
+        if not conn:
+            logger.error("[DISPATCHER] No se pudo conectar para leer cambios de call_schedule")
+            self._next_resync = time.monotonic() + self.resync_seconds
+            return
+        try:
+            with conn.cursor() as cursor:
+                db_now = self._db_now(cursor)
+                cursor.execute("""
+                    SELECT id, scheduled_at, attempt_number, status
+                    FROM call_schedule
+                    WHERE updated_at >= %s
+                """, (self._changes_since,))
+                changes = cursor.fetchall()
+                for schedule_id, scheduled_at, attempt_number, status in changes:
+                    if status == 'pending' and scheduled_at < self._loaded_until:
+                        self._put(schedule_id, scheduled_at, attempt_number)
+                    else:
+                        self._entries.pop(schedule_id, None)
+                # Ampliar la ventana cuando se ha consumido la mitad
+                if db_now + self.lookahead / 2 >= self._loaded_until:
+                    self._load_window(cursor, self._loaded_until, db_now + self.lookahead)
+                self._changes_since = db_now
+        finally:
+            conn.close()
+
+        self._metrics['resyncs'] += 1
+        self._next_resync = time.monotonic() + self.resync_seconds
+        if changes:
+            logger.debug(f"[DISPATCHER] {len(changes)} cambios en call_schedule aplicados")
+
+    # --- Despacho ---
+
+    def _fetch_leads(self, schedule_ids: List[int], now: datetime) -> List[Dict]:
+        """Revalida las entradas vencidas y devuelve los leads listos para llamar."""
+        conn = get_connection()
+        if not conn:
+            raise RuntimeError("No se pudo conectar para cargar los leads programados")
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                placeholders = ', '.join(['%s'] * len(schedule_ids))
+                cursor.execute(f"""
+                    SELECT
+                        l.id,
+                        l.nombre,
+                        l.apellidos,
+                        l.telefono,
+                        l.telefono2,
+                        cs.id AS schedule_id,
+                        cs.attempt_number
+                    FROM call_schedule cs
+                    JOIN leads l ON cs.lead_id = l.id
+                    WHERE cs.id IN ({placeholders})
+                        AND cs.status = 'pending'
+                        AND cs.scheduled_at <= %s
+                        AND l.lead_status = 'open'
+                        AND (l.manual_management IS NULL OR l.manual_management = FALSE)
+                    ORDER BY cs.scheduled_at ASC, cs.attempt_number ASC
+                """, [*schedule_ids, now])
+                return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def dispatch_due(self) -> int:
+        """Entrega a CallManager las llamadas vencidas. Devuelve cuántas se lanzaron."""
+        self._retry_at = None
+        now = self._now()
+        if not self.config.get('daemon_enabled', True) or not self.scheduler.is_working_time(now):
+            return 0
+
+        max_calls = max(1, int(self.config.get('max_calls_per_cycle') or 10))
+        due = self._pop_due(now, max_calls)
+        if not due:
+            return 0
+
+        try:
+            leads = self._fetch_leads([schedule_id for _, _, schedule_id in due], now)
+            started = bool(leads) and CallManager().start(leads)
+        except Exception as e:
+            logger.error(f"[DISPATCHER] Error lanzando llamadas programadas: {e}")
+            leads, started = None, False
+
+        if leads is None or (leads and not started):
+            # CallManager ocupado (o error): devolver a la cola y reintentar en breve
+            for scheduled_at, attempt, schedule_id in due:
+                self._put(schedule_id, scheduled_at, attempt)
+            self._retry_at = time.monotonic() + BUSY_RETRY_SECONDS
+            self._metrics['busy_retries'] += 1
+            return 0
+
+        valid = {lead['schedule_id'] for lead in leads}
+        expires = now + REDISPATCH_AFTER
+        for scheduled_at, _, schedule_id in due:
+            if schedule_id in valid:
+                self._dispatched[(schedule_id, scheduled_at)] = expires
+        self._metrics['skipped_invalid'] += len(due) - len(valid)
+        self._metrics['dispatches'] += 1
+        self._metrics['calls_dispatched'] += len(leads)
+        logger.info(f"[DISPATCHER] {len(leads)} llamadas programadas entregadas a CallManager")
+        return len(leads)
+
+    def _seconds_until_next_event(self) -> float:
+        mono_now = time.monotonic()
+        deadlines = [self._next_resync, self._next_reload]
+        if self._retry_at is not None:
+            deadlines.append(self._retry_at)
+        head = self._peek()
+        if head and self.config.get('daemon_enabled', True):
+            now = self._now()
+            due_at = max(head[0], now)
+            if not self.scheduler.is_working_time(due_at):
+                due_at = self.scheduler.find_next_working_slot(due_at)
+            deadlines.append(mono_now + (due_at - now).total_seconds())
+        return max(0.0, min(deadlines) - mono_now)
+
+    def run(self):
+        """Bucle principal: duerme hasta el siguiente evento y despacha lo vencido."""
+        logger.info(f"[DISPATCHER] Iniciado (lookahead {self.lookahead}, resync {self.resync_seconds}s)")
+
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                if time.monotonic() >= self._next_reload:
+                    self._changed.clear()
+                    self.full_reload()
+                elif self._changed.is_set() or time.monotonic() >= self._next_resync:
+                    self._changed.clear()
+                    self.sync_changes()
+                self.dispatch_due()
+                timeout = self._seconds_until_next_event()
+            except Exception as e:
+                logger.error(f"[DISPATCHER] Error en el ciclo del despachador: {e}")
+                timeout = 60
+            self._wake.wait(timeout)
+
+        logger.info("[DISPATCHER] Detenido")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> Dict:
+        head = self._peek()
+        return dict(
+            self._metrics,
+            queued=len(self._entries),
+            next_due=head[0].isoformat() if head else None,
+            loaded_until=self._loaded_until.isoformat() if self._loaded_until else None,
+            in_flight=len(self._dispatched),
+        )
@@ -11,19 +11,21 @@ las reglas parametrizables de scheduler_config:
 
 El daemon:
 1. Solo ejecuta llamadas durante horarios laborables
-2. Refresca la configuración en cada ciclo
+2. Refresca la configuración cada ``scheduled_calls_interval_minutes``
 3. Respeta días no laborables
 4. Es completamente parametrizable
+
+El bucle principal delega en ``scheduled_call_dispatcher.ScheduledCallDispatcher``,
+que mantiene en memoria las próximas llamadas y despierta justo cuando vencen.
 """
 
 import time
 import logging
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict
 from db import get_connection
-from call_manager_scheduler_integration import integrate_scheduler_with_call_manager
-from call_manager import CallManager
 from call_scheduler_multi_timeframes import CallSchedulerMultiTimeframes as CallScheduler
+from scheduled_call_dispatcher import ScheduledCallDispatcher
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,8 +34,8 @@ logger = logging.getLogger(__name__)
 class ScheduledCallsDaemon:
     def __init__(self):
         self.scheduler = CallScheduler()
-        self.call_manager = None
         self._last_config_refresh = None
+        self.dispatcher = None
 
     def get_daemon_config(self) -> Dict:
         """
@@ -117,56 +119,6 @@ class ScheduledCallsDaemon:
         logger.debug("Daemon habilitado y en horario laboral - ejecutando llamadas")
         return True
 
-    def execute_scheduled_calls(self) -> Dict:
-        """
-        Ejecuta las llamadas programadas pendientes
-        """
-        if not self.should_execute_calls():
-            return {
-                'calls_executed': 0,
-                'reason': 'fuera_de_horario_o_deshabilitado',
-                'status': 'skipped'
-            }
-
-        # Obtener configuración actualizada
-        daemon_config = self.get_daemon_config()
-        max_calls = daemon_config.get('max_calls_per_cycle', 10)
-
-        # Obtener llamadas pendientes usando la integración existente
-        try:
-            leads = integrate_scheduler_with_call_manager()[:max_calls]
-
-            if not leads:
-                return {
-                    'calls_executed': 0,
-                    'reason': 'no_pending_calls',
-                    'status': 'success'
-                }
-
-            logger.info(f"Ejecutando {len(leads)} llamadas programadas")
-
-            # Inicializar call manager si no existe
-            if not self.call_manager:
-                self.call_manager = CallManager()
-
-            # Ejecutar las llamadas
-            result = self.call_manager.start(leads)
-
-            return {
-                'calls_executed': len(leads),
-                'reason': 'scheduled_calls_processed',
-                'status': 'success',
-                'details': result
-            }
-
-        except Exception as e:
-            logger.error(f"Error ejecutando llamadas programadas: {e}")
-            return {
-                'calls_executed': 0,
-                'reason': f'error: {str(e)}',
-                'status': 'error'
-            }
-
     def log_scheduler_status(self):
         """
         Log periódico del estado del scheduler para monitoreo con múltiples franjas
@@ -194,44 +146,25 @@ class ScheduledCallsDaemon:
 
     def run_daemon(self):
         """
-        Bucle principal del daemon - completamente parametrizable
+        Bucle principal del daemon: despacho dirigido por eventos.
+
+        En lugar de dormir ``scheduled_calls_interval_minutes`` entre ciclos, el
+        despachador espera hasta la siguiente llamada vencida; el intervalo se
+        usa como periodo de recarga de configuración.
         """
         logger.info("🚀 Iniciando Daemon de Llamadas Programadas (Mejorado)")
         logger.info("✅ Respeta horarios laborables y configuración dinámica")
 
+        self.dispatcher = ScheduledCallDispatcher(scheduler=self.scheduler,
+                                                  config_loader=self.get_daemon_config)
         while True:
             try:
-                # Obtener configuración actualizada cada ciclo
-                daemon_config = self.get_daemon_config()
-                interval_minutes = daemon_config.get('scheduled_calls_interval_minutes', 5)
-
-                # Log estado cada 6 ciclos (30 min si interval es 5)
-                cycle_count = getattr(self, '_cycle_count', 0) + 1
-                self._cycle_count = cycle_count
-
-                if cycle_count % 6 == 0:
-                    self.log_scheduler_status()
-
-                # Ejecutar llamadas si corresponde
-                start_time = datetime.now()
-                result = self.execute_scheduled_calls()
-                end_time = datetime.now()
-
-                duration = (end_time - start_time).total_seconds()
-
-                if result['status'] == 'success' and result['calls_executed'] > 0:
-                    logger.info(f"✅ Ejecutadas {result['calls_executed']} llamadas en {duration:.2f}s")
-                elif result['status'] == 'skipped':
-                    logger.debug(f"⏭️  Ciclo omitido: {result['reason']}")
-                elif result['status'] == 'error':
-                    logger.error(f"❌ Error en ciclo: {result['reason']}")
-
-                # Esperar hasta el siguiente ciclo
-                logger.debug(f"💤 Esperando {interval_minutes} minutos...")
-                time.sleep(interval_minutes * 60)
-
+                self.log_scheduler_status()
+                self.dispatcher.run()
+                break
             except KeyboardInterrupt:
                 logger.info("🛑 Daemon detenido por usuario")
+                self.dispatcher.stop()
                 break
             except Exception as e:
                 logger.error(f"❌ Error crítico en daemon: {e}")
@@ -2,6 +2,13 @@
 -- Se puede ejecutar de forma segura, ya que elimina las tablas si ya existen.
 
 -- Eliminar tablas en orden inverso para evitar problemas de claves foráneas
+DROP TABLE IF EXISTS `reservation_idempotency`;
+DROP TABLE IF EXISTS `offered_slots`;
+DROP TABLE IF EXISTS `background_jobs`;
+DROP TABLE IF EXISTS `leads_daily_stats`;
+DROP TABLE IF EXISTS `lead_call_stats`;
+DROP TABLE IF EXISTS `pearl_sync_calls`;
+DROP TABLE IF EXISTS `pearl_sync_state`;
 DROP TABLE IF EXISTS `call_schedule`;
 DROP TABLE IF EXISTS `pearl_calls`;
 DROP TABLE IF EXISTS `recargas`;
@@ -36,6 +43,7 @@ CREATE TABLE `call_schedule` (
   INDEX `idx_call_schedule_lead` (`lead_id`),
   INDEX `idx_call_schedule_status` (`status`),
   INDEX `idx_call_schedule_scheduled_at` (`scheduled_at`),
+  INDEX `idx_call_schedule_updated_at` (`updated_at`),
   -- Restringimos a UNA llamada pendiente por lead evitando duplicados
   UNIQUE KEY `uniq_lead_status` (`lead_id`, `status`),
   CONSTRAINT `fk_call_schedule_lead` FOREIGN KEY (`lead_id`) REFERENCES `leads`(`id`) ON DELETE CASCADE
@@ -68,6 +76,11 @@ CREATE TABLE `leads` (
   `apellidos` VARCHAR(150) NULL,
   `telefono` VARCHAR(20) NULL,
   `telefono2` VARCHAR(20) NULL,
+  `telefono_norm` VARCHAR(9) GENERATED ALWAYS AS (NULLIF(RIGHT(REGEXP_REPLACE(`telefono`, '[^0-9]', ''), 9), '')) STORED COMMENT 'Últimos 9 dígitos de telefono (ver lead_lookup.py)',
+  `telefono2_norm` VARCHAR(9) GENERATED ALWAYS AS (NULLIF(RIGHT(REGEXP_REPLACE(`telefono2`, '[^0-9]', ''), 9), '')) STORED COMMENT 'Últimos 9 dígitos de telefono2 (ver lead_lookup.py)',
+  `telefono_rev` VARCHAR(20) GENERATED ALWAYS AS (NULLIF(REVERSE(REGEXP_REPLACE(`telefono`, '[^0-9]', '')), '')) STORED COMMENT 'Dígitos de telefono invertidos (búsqueda por sufijo, ver lead_search.py)',
+  `telefono2_rev` VARCHAR(20) GENERATED ALWAYS AS (NULLIF(REVERSE(REGEXP_REPLACE(`telefono2`, '[^0-9]', '')), '')) STORED COMMENT 'Dígitos de telefono2 invertidos (búsqueda por sufijo, ver lead_search.py)',
+  `import_key` VARCHAR(20) GENERATED ALWAYS AS (COALESCE(NULLIF(UPPER(REGEXP_REPLACE(`nif`, '[^0-9A-Za-z]', '')), ''), `telefono_norm`)) STORED COMMENT 'NIF normalizado o telefono_norm (clave de la carga de ficheros, ver lead_import.py)',
   `nif` VARCHAR(20) NULL,
   `fecha_nacimiento` DATE NULL,
   `sexo` VARCHAR(10) NULL,
@@ -125,11 +138,48 @@ CREATE INDEX idx_call_priority ON leads(call_priority);
 CREATE INDEX idx_last_call_attempt ON leads(last_call_attempt);
 CREATE INDEX idx_pearl_outbound_id ON leads(pearl_outbound_id);
 
+-- Índices del listado del gestor de llamadas (filtro + orden del cursor, ver db_migration_leads_grid_indexes.py)
+CREATE INDEX idx_leads_grid_order ON leads(call_priority, updated_at DESC, id DESC);
+CREATE INDEX idx_leads_grid_status ON leads(call_status, call_priority, updated_at DESC, id DESC);
+CREATE INDEX idx_leads_grid_selected ON leads(selected_for_calling, call_priority, updated_at DESC, id DESC);
+CREATE INDEX idx_leads_grid_levels ON leads(status_level_1, status_level_2, call_priority, updated_at DESC, id DESC);
+
+-- Detección barata de cambios en leads para la caché del dashboard (ver dashboard_stats.py)
+CREATE INDEX idx_leads_updated_at ON leads(updated_at);
+
+-- Índices para resolver un teléfono a un lead sin recorrer la tabla
+CREATE INDEX idx_telefono_norm ON leads(telefono_norm);
+CREATE INDEX idx_telefono2_norm ON leads(telefono2_norm);
+
+-- Índices de la búsqueda de leads (ver lead_search.py)
+CREATE INDEX idx_telefono_rev ON leads(telefono_rev);
+CREATE INDEX idx_telefono2_rev ON leads(telefono2_rev);
+CREATE FULLTEXT INDEX ft_leads_search ON leads(nombre, apellidos, nombre_clinica) WITH PARSER ngram;
+-- El índice único uq_leads_import_key (origen_archivo, import_key) lo crea db_migration_lead_import_key.py
+-- una vez añadida la columna origen_archivo.
+
 -- Índices para optimizar consultas del sistema de reservas automáticas
 CREATE INDEX idx_reserva_automatica ON leads(reserva_automatica);
 CREATE INDEX idx_fecha_minima_reserva ON leads(fecha_minima_reserva);
 CREATE INDEX idx_reserva_auto_fecha ON leads(reserva_automatica, fecha_minima_reserva);
 
+-- --- Agregado diario de leads para informes ---
+-- Mantenido por triggers sobre leads (ver db_migration_leads_rollup.py y leads_rollup.py).
+CREATE TABLE `leads_daily_stats` (
+  `day` DATE NOT NULL,
+  `bucket` CHAR(32) NOT NULL COMMENT 'MD5 de origen_archivo, status_level_1, status_level_2 y nombre_clinica',
+  `origen_archivo` VARCHAR(255) NOT NULL DEFAULT '',
+  `status_level_1` VARCHAR(100) NOT NULL DEFAULT '',
+  `status_level_2` VARCHAR(255) NOT NULL DEFAULT '',
+  `nombre_clinica` VARCHAR(200) NOT NULL DEFAULT '',
+  `leads` INT NOT NULL DEFAULT 0,
+  `con_cita` INT NOT NULL DEFAULT 0,
+  `con_pack` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`day`, `bucket`),
+  INDEX `idx_leads_daily_stats_origen` (`origen_archivo`, `day`),
+  INDEX `idx_leads_daily_stats_status` (`status_level_1`, `day`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- --- Tabla de Llamadas de Pearl --- 
 -- Almacena un registro detallado de cada llamada gestionada a través de Pearl AI.
 CREATE TABLE `pearl_calls` (
@@ -146,6 +196,38 @@ CREATE TABLE `pearl_calls` (
   CONSTRAINT `fk_pearl_calls_lead` FOREIGN KEY (`lead_id`) REFERENCES `leads`(`id`) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- --- Agregado de llamadas por lead ---
+-- Mantenido por triggers sobre pearl_calls (ver db_migration_lead_call_stats.py).
+CREATE TABLE `lead_call_stats` (
+  `lead_id` INT PRIMARY KEY,
+  `call_count` INT NOT NULL DEFAULT 0,
+  `total_duration` BIGINT NOT NULL DEFAULT 0 COMMENT 'Suma de pearl_calls.duration en segundos',
+  `last_call_time` DATETIME NULL,
+  `calls_with_recording` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  CONSTRAINT `fk_lead_call_stats_lead` FOREIGN KEY (`lead_id`) REFERENCES `leads`(`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --- Estado de sincronización con Pearl ---
+-- Marca de agua por outbound y ventana en curso (permite reanudar tras una caída).
+CREATE TABLE `pearl_sync_state` (
+  `outbound_id` VARCHAR(64) PRIMARY KEY,
+  `watermark` DATETIME NULL COMMENT 'Hasta dónde (UTC) se han sincronizado completamente las llamadas',
+  `window_from` DATETIME NULL COMMENT 'Inicio (UTC) de la ventana en curso; NULL si no hay ninguna',
+  `window_to` DATETIME NULL COMMENT 'Fin (UTC) de la ventana en curso',
+  `next_skip` INT NOT NULL DEFAULT 0 COMMENT 'Offset de la siguiente página a procesar en la ventana en curso',
+  `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Hash del contenido de cada llamada ya procesada, para omitir las que no han cambiado.
+CREATE TABLE `pearl_sync_calls` (
+  `call_id` VARCHAR(64) PRIMARY KEY,
+  `outbound_id` VARCHAR(64) NULL,
+  `content_hash` CHAR(40) NOT NULL COMMENT 'SHA-1 del JSON de la llamada devuelto por Pearl',
+  `synced_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  INDEX `idx_synced_at` (`synced_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- --- Tabla de Recargas ---
 -- Almacena un historial de todas las subidas de archivos Excel/CSV.
 CREATE TABLE `recargas` (
@@ -159,6 +241,59 @@ CREATE TABLE `recargas` (
   FOREIGN KEY (`usuario_id`) REFERENCES `usuarios`(`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- --- Cola de trabajos en segundo plano ---
+-- Cargas, exportaciones y mantenimiento lanzados desde el dashboard (ver background_jobs.py).
+CREATE TABLE `background_jobs` (
+  `id` INT AUTO_INCREMENT PRIMARY KEY,
+  `job_type` VARCHAR(50) NOT NULL,
+  `params` JSON NULL,
+  `status` ENUM('queued', 'running', 'completed', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+  `progress` JSON NULL,
+  `result` JSON NULL,
+  `error` TEXT NULL,
+  `cancel_requested` BOOLEAN NOT NULL DEFAULT FALSE,
+  `usuario_id` INT NULL,
+  `worker` VARCHAR(100) NULL,
+  `host` VARCHAR(100) NULL COMMENT 'Si no es NULL, sólo lo reclama un runner de esta máquina',
+  `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `started_at` DATETIME NULL,
+  `finished_at` DATETIME NULL,
+  `heartbeat_at` DATETIME NULL,
+  INDEX `idx_background_jobs_status` (`status`, `id`),
+  INDEX `idx_background_jobs_created` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --- Huecos ofrecidos ---
+-- Huecos de TuoTempo ofrecidos a cada teléfono en /api/slots; /api/reservar completa con ellos
+-- las disponibilidades parciales (ver slot_store.py). Caducan en expires_at.
+CREATE TABLE `offered_slots` (
+  `id` BIGINT AUTO_INCREMENT PRIMARY KEY,
+  `telefono_norm` VARCHAR(20) NOT NULL,
+  `slot_date` DATE NOT NULL,
+  `start_time` CHAR(5) NOT NULL COMMENT 'HH:MM',
+  `resource_id` VARCHAR(64) NOT NULL DEFAULT '',
+  `activity_id` VARCHAR(64) NULL,
+  `area_id` VARCHAR(64) NULL,
+  `slot` JSON NOT NULL,
+  `offered_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `expires_at` DATETIME NOT NULL,
+  UNIQUE KEY `uq_offered_slots` (`telefono_norm`, `slot_date`, `start_time`, `resource_id`),
+  INDEX `idx_offered_slots_expires` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --- Idempotencia de reservas ---
+-- Una fila por reserva en curso o reciente de /api/reservar (ver reservation_idempotency.py).
+CREATE TABLE `reservation_idempotency` (
+  `key_hash` CHAR(64) PRIMARY KEY COMMENT 'sha256 de key_text',
+  `key_text` VARCHAR(255) NOT NULL,
+  `status` ENUM('pending', 'done') NOT NULL DEFAULT 'pending',
+  `owner_token` CHAR(32) NULL,
+  `result` JSON NULL,
+  `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `expires_at` DATETIME NOT NULL,
+  INDEX `idx_reservation_idempotency_expires` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- --- Datos Iniciales ---
 -- Insertar un usuario administrador por defecto para poder iniciar sesión la primera vez.
 -- La contraseña es 'admin'. ¡Cámbiala en un entorno de producción real!
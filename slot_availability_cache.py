@@ -0,0 +1,261 @@
+"""
+Caché compartida de disponibilidad (huecos) de TuoTempo.
+
+Las consultas a ``GET /availabilities`` se guardan en memoria del proceso por
+(instancia, entorno, area_id, activity_id, semana, franja horaria) durante
+``SLOT_CACHE_TTL`` segundos. La "semana" es la fecha de inicio de la consulta
+normalizada a ISO (y llevada a hoy si es pasada, como hace TuoTempoAPI), que
+es lo que determina la respuesta de TuoTempo.
+
+- Coalescencia: si varios hilos piden la misma clave a la vez, sólo uno llama
+  a TuoTempo y el resto espera su resultado (como mucho
+  ``SLOT_CACHE_WAIT_SECONDS``; pasado ese tiempo consultan ellos mismos).
+- Sólo se guardan respuestas ``result == 'OK'``; los errores no se cachean.
+- Invalidación selectiva: tras una reserva confirmada o un conflicto de slot
+  (ver ``Tuotempo.create_reservation``) se descartan únicamente las entradas
+  que ofrecían ese hueco (fecha + hora + recurso). ``invalidate_area`` descarta
+  todas las de un centro.
+
+Las métricas se consultan con ``get_slot_cache_stats()``.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SLOT_CACHE_TTL = int(os.getenv('SLOT_CACHE_TTL', 60))  # segundos; 0 desactiva la caché
+SLOT_CACHE_MAX = int(os.getenv('SLOT_CACHE_MAX', 512))  # entradas
+SLOT_CACHE_WAIT_SECONDS = int(os.getenv('SLOT_CACHE_WAIT_SECONDS', 30))
+
+SlotKey = Tuple[str, str, str, str, str, str]
+SlotId = Tuple[str, str, str]
+
+_DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d', '%Y/%m/%d')
+
+_lock = threading.Lock()
+_entries: 'OrderedDict[SlotKey, Dict[str, Any]]' = OrderedDict()
+_slot_index: Dict[SlotId, Set[SlotKey]] = {}
+_inflight: Dict[SlotKey, '_Inflight'] = {}
+_generation = 0
+_metrics = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stores': 0, 'invalidations': 0, 'evictions': 0}
+
+
+class _Inflight:
+    """Consulta en curso a TuoTempo para una clave (los demás hilos esperan en ``event``)."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error: Optional[BaseException] = None
+
+
+def normalize_date(value: Any) -> str:
+    """Fecha en formato ISO (YYYY-MM-DD); si no se reconoce, la cadena original sin espacios."""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or '').strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return text
+
+
+def normalize_time(value: Any) -> str:
+    """Hora en formato HH:MM (sin segundos)."""
+    parts = str(value or '').strip().split(':')
+    if len(parts) >= 2:
+        return f"{parts[0].zfill(2)}:{parts[1]}"
+    return ''
+
+
+def make_key(instance_id: str, environment: str, area_id: Any, activity_id: Any,
+             start_date: Any, time_preference: Optional[str]) -> SlotKey:
+    """Clave de caché de una consulta de disponibilidad."""
+    week = normalize_date(start_date)
+    today = date.today().isoformat()
+    if len(week) == 10 and week < today:
+        week = today
+    return (str(instance_id or ''), str(environment or ''), str(area_id or ''), str(activity_id or ''),
+            week, str(time_preference or '').upper())
+
+
+def extract_availabilities(resp: Any) -> List[Dict]:
+    """Lista de availabilities de una respuesta de TuoTempo (a cualquier profundidad)."""
+    if not isinstance(resp, dict):
+        return []
+    if isinstance(resp.get('availabilities'), list):
+        return resp['availabilities']
+    for value in resp.values():
+        if isinstance(value, dict):
+            found = extract_availabilities(value)
+            if found:
+                return found
+    return []
+
+
+def _slot_id(start_date: Any, start_time: Any, resource_id: Any) -> SlotId:
+    return (normalize_date(start_date), normalize_time(start_time), str(resource_id or ''))
+
+
+def _slot_ids(response: Dict) -> Set[SlotId]:
+    ids = set()
+    for slot in extract_availabilities(response):
+        if isinstance(slot, dict):
+            ids.add(_slot_id(slot.get('start_date'), slot.get('startTime'),
+                             slot.get('resourceid') or slot.get('resourceId')))
+    return ids
+
+
+def _is_cacheable(response: Any) -> bool:
+    return isinstance(response, dict) and response.get('result') == 'OK'
+
+
+def _drop(key: SlotKey):
+    """Elimina una entrada y sus referencias en el índice de huecos (con ``_lock`` tomado)."""
+    entry = _entries.pop(key, None)
+    if not entry:
+        return
+    for slot_id in entry['slot_ids']:
+        keys = _slot_index.get(slot_id)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del _slot_index[slot_id]
+
+
+def _store(key: SlotKey, response: Dict):
+    """Guarda una respuesta (con ``_lock`` tomado), expulsando las más antiguas si se supera el máximo."""
+    _drop(key)
+    slot_ids = _slot_ids(response)
+    _entries[key] = {'response': response, 'stored_at': time.time(), 'slot_ids': slot_ids}
+    for slot_id in slot_ids:
+        _slot_index.setdefault(slot_id, set()).add(key)
+    _metrics['stores'] += 1
+    while len(_entries) > SLOT_CACHE_MAX:
+        _drop(next(iter(_entries)))
+        _metrics['evictions'] += 1
+
+
+def _lookup(key: SlotKey):
+    """Respuesta vigente para ``key`` o None (con ``_lock`` tomado)."""
+    entry = _entries.get(key)
+    if not entry:
+        return None
+    if time.time() - entry['stored_at'] >= SLOT_CACHE_TTL:
+        _drop(key)
+        return None
+    return entry['response']
+
+
+def get_slots(key: SlotKey, fetch: Callable[[], Any]) -> Any:
+    """
+    Devuelve la disponibilidad de ``key`` desde la caché o llamando a ``fetch()``.
+
+    Las llamadas concurrentes con la misma clave comparten una única llamada a
+    ``fetch``. Siempre se devuelve una copia: el llamante puede modificarla.
+    """
+    if SLOT_CACHE_TTL <= 0:
+        return fetch()
+
+    with _lock:
+        cached = _lookup(key)
+        if cached is not None:
+            _metrics['hits'] += 1
+            return copy.deepcopy(cached)
+        inflight = _inflight.get(key)
+        if inflight:
+            _metrics['coalesced'] += 1
+            owner = False
+        else:
+            inflight = _inflight[key] = _Inflight()
+            _metrics['misses'] += 1
+            owner = True
+        generation = _generation
+
+    if not owner:
+        if inflight.event.wait(SLOT_CACHE_WAIT_SECONDS) and inflight.error is None:
+            return copy.deepcopy(inflight.response)
+        logger.warning(f"[SLOT-CACHE] Sin resultado de la consulta compartida para {key}; se consulta de nuevo")
+        return fetch()
+
+    try:
+        response = fetch()
+        inflight.response = response
+        with _lock:
+            # Si hubo una invalidación durante la consulta, la respuesta puede incluir un hueco ya ocupado
+            if _is_cacheable(response) and generation == _generation:
+                _store(key, copy.deepcopy(response))
+        # inflight.response lo copian los que esperan: el llamante recibe su propia copia
+        return copy.deepcopy(response)
+    except BaseException as e:
+        inflight.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        inflight.event.set()
+
+
+def invalidate_slot(start_date: Any, start_time: Any, resource_id: Any = None) -> int:
+    """
+    Descarta las entradas que ofrecían el hueco indicado (tras reservarlo o al
+    recibir un conflicto). Sin ``resource_id`` se descarta ese día/hora para
+    cualquier recurso. Devuelve el número de entradas descartadas.
+    """
+    global _generation
+    target_date, target_time, target_resource = _slot_id(start_date, start_time, resource_id)
+    with _lock:
+        _generation += 1
+        keys = set()
+        for (slot_date, slot_time, slot_resource), slot_keys in _slot_index.items():
+            if slot_date == target_date and slot_time == target_time and (
+                    not target_resource or slot_resource == target_resource):
+                keys.update(slot_keys)
+        for key in keys:
+            _drop(key)
+        _metrics['invalidations'] += len(keys)
+    if keys:
+        logger.info(f"[SLOT-CACHE] {len(keys)} consultas descartadas por el hueco {target_date} {target_time} "
+                    f"(recurso {target_resource or '*'})")
+    return len(keys)
+
+
+def invalidate_area(area_id: Any) -> int:
+    """Descarta todas las entradas de un centro. Devuelve el número de entradas descartadas."""
+    global _generation
+    with _lock:
+        _generation += 1
+        keys = [key for key in _entries if key[2] == str(area_id)]
+        for key in keys:
+            _drop(key)
+        _metrics['invalidations'] += len(keys)
+    return len(keys)
+
+
+def clear_slot_cache():
+    """Vacía la caché de disponibilidad."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+        _slot_index.clear()
+
+
+def get_slot_cache_stats() -> Dict[str, Any]:
+    """Métricas de la caché del worker actual."""
+    with _lock:
+        stats = dict(_metrics)
+        stats.update(entries=len(_entries), inflight=len(_inflight),
+                     ttl_seconds=SLOT_CACHE_TTL, max_entries=SLOT_CACHE_MAX)
+    return stats
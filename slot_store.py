@@ -0,0 +1,126 @@
+"""
+Huecos ofrecidos a cada teléfono (tabla ``offered_slots``).
+
+``/api/slots`` guarda aquí los huecos de la semana devuelta al llamante y
+``/api/reservar`` los usa para completar una disponibilidad parcial (sólo
+fecha y hora) con ``resourceid``/``activityid``. Sustituye a los ficheros
+``/tmp/cached_slots/slots_{telefono}.json``: la tabla es común a todos los
+workers y réplicas, la búsqueda es por índice (teléfono, fecha, hora HH:MM) y
+las filas caducan a los ``SLOT_STORE_TTL`` segundos.
+
+Cada nueva oferta sustituye a la anterior del mismo teléfono, como hacía el
+fichero. Las filas caducadas se borran por lotes al guardar.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from db import connection as db_connection
+from slot_availability_cache import extract_availabilities, normalize_date, normalize_time
+
+logger = logging.getLogger(__name__)
+
+SLOT_STORE_TTL = int(os.getenv('SLOT_STORE_TTL', 2 * 3600))  # segundos
+SLOT_STORE_PURGE_BATCH = 1000
+
+INSERT_SQL = """
+    INSERT INTO offered_slots
+        (telefono_norm, slot_date, start_time, resource_id, activity_id, area_id, slot, expires_at)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE
+        activity_id = VALUES(activity_id), area_id = VALUES(area_id), slot = VALUES(slot),
+        offered_at = CURRENT_TIMESTAMP, expires_at = VALUES(expires_at)
+"""
+ROW_PLACEHOLDER = "(%s, %s, %s, %s, %s, %s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))"
+
+
+def _row(telefono_norm: str, slot: Dict, area_id: Optional[str]) -> Optional[tuple]:
+    slot_date = normalize_date(slot.get('start_date'))
+    start_time = normalize_time(slot.get('startTime'))
+    if len(slot_date) != 10 or not start_time:
+        return None
+    return (
+        telefono_norm, slot_date, start_time,
+        str(slot.get('resourceid') or slot.get('resourceId') or ''),
+        slot.get('activityid') or slot.get('activityId'),
+        area_id,
+        json.dumps(slot, ensure_ascii=False, default=str),
+        SLOT_STORE_TTL,
+    )
+
+
+def save_offered_slots(telefono_norm: str, response: Any, area_id: Optional[str] = None) -> int:
+    """
+    Sustituye los huecos ofrecidos a ``telefono_norm`` por los de ``response``
+    (respuesta de TuoTempo o lista de availabilities). Devuelve cuántos se guardaron.
+    """
+    slots = response if isinstance(response, list) else extract_availabilities(response)
+    rows = [row for row in (_row(telefono_norm, s, area_id) for s in slots if isinstance(s, dict)) if row]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Sustitución atómica: nunca queda el teléfono sin huecos a medias
+            conn.start_transaction()
+            try:
+                cursor.execute("DELETE FROM offered_slots WHERE telefono_norm = %s", (telefono_norm,))
+                if rows:
+                    cursor.execute(
+                        INSERT_SQL.format(values=', '.join([ROW_PLACEHOLDER] * len(rows))),
+                        [value for row in rows for value in row]
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            cursor.execute("DELETE FROM offered_slots WHERE expires_at < NOW() LIMIT %s", (SLOT_STORE_PURGE_BATCH,))
+            if cursor.rowcount:
+                logger.info(f"[SLOT-STORE] {cursor.rowcount} huecos caducados eliminados")
+            conn.commit()
+        finally:
+            cursor.close()
+    return len(rows)
+
+
+def find_offered_slot(telefono_norm: str, start_date: Any, start_time: Any) -> Optional[Dict]:
+    """Hueco vigente ofrecido a ``telefono_norm`` en esa fecha y hora (cualquier formato), o None."""
+    slot_date = normalize_date(start_date)
+    hora = normalize_time(start_time)
+    if len(slot_date) != 10 or not hora:
+        return None
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT slot FROM offered_slots
+                WHERE telefono_norm = %s AND slot_date = %s AND start_time = %s AND expires_at > NOW()
+                ORDER BY id
+                LIMIT 1
+            """, (telefono_norm, slot_date, hora))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    return json.loads(row[0]) if row else None
+
+
+def list_offered_slots(telefono_norm: str, limit: int = 50) -> List[Dict[str, Any]]:
+    """Huecos vigentes ofrecidos a ``telefono_norm`` (para diagnóstico)."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT slot_date, start_time, resource_id, activity_id, area_id, offered_at, expires_at
+                FROM offered_slots
+                WHERE telefono_norm = %s AND expires_at > NOW()
+                ORDER BY id
+                LIMIT %s
+            """, (telefono_norm, limit))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    for row in rows:
+        for key in ('slot_date', 'offered_at', 'expires_at'):
+            if row.get(key) is not None:
+                row[key] = row[key].isoformat()
+    return rows
@@ -30,6 +30,28 @@ FRONTEND_FILES = [
     'static/js/calls_manager.js',
 ]
 PEARL_ENV_VARS = ['PEARL_ACCOUNT_ID', 'PEARL_SECRET_KEY', 'PEARL_OUTBOUND_ID']
+# Migraciones de datos/índices que se ejecutan tras la migración de esquema.
+# Cada módulo expone run_migration() -> bool y es seguro de ejecutar varias veces.
+DATA_MIGRATIONS = [
+    ('verify_admin', 'db_migration_verify_admin'),
+    ('phone_norm', 'db_migration_add_phone_norm'),
+    ('pearl_sync', 'db_migration_pearl_sync'),
+    ('call_schedule_indexes', 'db_migration_call_schedule_indexes'),
+    ('lead_call_stats', 'db_migration_lead_call_stats'),
+    ('leads_grid_indexes', 'db_migration_leads_grid_indexes'),
+    ('lead_search', 'db_migration_lead_search'),
+    ('leads_updated_at_index', 'db_migration_leads_updated_at_index'),
+    ('leads_rollup', 'db_migration_leads_rollup'),
+    ('lead_import_key', 'db_migration_lead_import_key'),
+    ('background_jobs', 'db_migration_background_jobs'),
+    ('offered_slots', 'db_migration_offered_slots'),
+    ('reservation_idempotency', 'db_migration_reservation_idempotency'),
+]
+# Migraciones que reconstruyen tablas grandes: solo se ejecutan en el arranque
+# si su variable vale 'true'; si no, se lanzan a mano fuera del horario de llamadas.
+OPT_IN_DATA_MIGRATIONS = {
+    'lead_search': 'RUN_LEAD_SEARCH_MIGRATION',
+}
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -84,17 +106,23 @@ def run_migrations():
                 logging.info("✅ Sistema de Migración Inteligente (esquema) completado exitosamente.")
                 # Ahora, ejecutar migraciones de datos adicionales
                 logging.info("--- Iniciando migraciones de datos adicionales ---")
-                try:
-                    from db_migration_verify_admin import run_migration as verify_admin_migration
-                    if verify_admin_migration():
-                        logging.info("✅ Migración de datos 'verify_admin' completada.")
-                        success = True # Solo si ambas migraciones tienen éxito
-                    else:
-                        logging.error("❌ La migración de datos 'verify_admin' falló.")
+                success = True # Solo si todas las migraciones tienen éxito
+                for migration_name, module_name in DATA_MIGRATIONS:
+                    opt_in_var = OPT_IN_DATA_MIGRATIONS.get(migration_name)
+                    if opt_in_var and os.getenv(opt_in_var, 'false').lower() != 'true':
+                        logging.info(f"Migración de datos '{migration_name}' omitida ({opt_in_var} no es 'true'). "
+                                     f"Ejecutar 'python {module_name}.py' fuera del horario de llamadas.")
+                        continue
+                    try:
+                        module = __import__(module_name)
+                        if module.run_migration():
+                            logging.info(f"✅ Migración de datos '{migration_name}' completada.")
+                        else:
+                            logging.error(f"❌ La migración de datos '{migration_name}' falló.")
+                            success = False
+                    except Exception as e:
+                        logging.error(f"❌ Error catastrófico durante la migración de datos '{migration_name}': {e}")
                         success = False
-                except Exception as e:
-                    logging.error(f"❌ Error catastrófico durante la migración de datos: {e}")
-                    success = False
             else:
                 logging.error("❌ El sistema de migración informó de un fallo durante la ejecución.")
                 # success sigue siendo False, lo que es correcto para detener el servicio.
@@ -17,6 +17,7 @@ class CallsManager {
                 offset: 0,
                 has_more: false
             },
+            leadCursors: { key: null, byOffset: {} },
             isSystemRunning: false,
             socket: null,
             retryCount: 0,
@@ -572,8 +573,19 @@ class CallsManager {
                             }
                             
                             // Agregar parámetros de paginación
-                            params.append('limit', this.state.pagination.limit || this.state.itemsPerPage);
-                            params.append('offset', this.state.pagination.offset || 0);
+                            const limit = this.state.pagination.limit || this.state.itemsPerPage;
+                            const offset = this.state.pagination.offset || 0;
+                            params.append('limit', limit);
+                            params.append('offset', offset);
+                            
+                            // Cursores conocidos por offset para estos filtros: las páginas
+                            // siguientes y los refrescos periódicos no saltan filas en la BD
+                            const cursorKey = params.toString().replace(/&?offset=\d+/, '');
+                            if (this.state.leadCursors?.key !== cursorKey) {
+                                this.state.leadCursors = { key: cursorKey, byOffset: {} };
+                            }
+                            const pageCursor = this.state.leadCursors.byOffset[offset];
+                            if (pageCursor) params.append('cursor', pageCursor);
                             
                             const queryString = params.toString();
                             const endpoint = queryString ? `leads?${queryString}` : 'leads';
@@ -587,6 +599,9 @@ class CallsManager {
                             // Guardar información de paginación
                             if (resp.pagination) {
                                 this.state.pagination = resp.pagination;
+                                if (resp.pagination.next_cursor) {
+                                    this.state.leadCursors.byOffset[offset + limit] = resp.pagination.next_cursor;
+                                }
                             }
                             
                             this.handleWebSocketMessage({ type: 'all_leads', data: leads });
@@ -0,0 +1,66 @@
+"""
+Pruebas de la preparación de bloques de la carga de leads (lead_import).
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lead_import import LEADS_COLUMNS, _prepare_chunk, map_columns
+
+
+def prepare(rows, columns, origen='fichero.xlsx'):
+    df = pd.DataFrame(rows, columns=columns)
+    return _prepare_chunk(df, map_columns(columns), origen)
+
+
+def test_map_columns_por_alias():
+    mapping = map_columns(['Nombre', 'Teléfono Móvil', 'DNI', 'Otro teléfono', 'Desconocida'])
+    assert mapping == {'Nombre': 'nombre', 'Teléfono Móvil': 'telefono', 'DNI': 'nif',
+                       'Otro teléfono': 'telefono2'}
+
+
+def test_columnas_completas_y_origen():
+    df = prepare([['Ana', '629203315']], ['Nombre', 'Telefono'])
+    assert list(df.columns) == LEADS_COLUMNS + ['_import_key']
+    row = df.iloc[0]
+    assert row['nombre'] == 'Ana'
+    assert row['origen_archivo'] == 'fichero.xlsx'
+    assert row['apellidos'] is None
+
+
+def test_telefonos_limpios():
+    df = prepare([['+34 629-203-315', 629203316.0], ['sin telefono', None]], ['Telefono', 'Telefono2'])
+    assert df['telefono'].tolist() == ['+34629203315', None]
+    assert df['telefono2'].tolist() == ['629203316', None]
+
+
+def test_conpack():
+    df = prepare([['Sí'], ['1'], ['no'], [None], [' TRUE ']], ['conPack'])
+    assert df['conPack'].tolist() == [1, 1, 0, 0, 1]
+
+
+def test_clave_de_importacion_nif_o_telefono():
+    df = prepare([['12.345.678-z', '+34 629 203 315'],
+                  [None, '0034 629 203 316'],
+                  ['  ', None],
+                  [None, None]],
+                 ['DNI', 'Telefono'])
+    assert df['_import_key'].tolist() == ['12345678Z', '629203316', None, None]
+
+
+def test_nulos_como_none():
+    df = prepare([['Ana', None, float('nan')]], ['Nombre', 'Apellidos', 'Ciudad'])
+    row = df.iloc[0]
+    assert row['apellidos'] is None
+    assert row['ciudad'] is None
+    assert all(value is None or not pd.isna(value) for value in row.tolist())
+
+
+def test_columnas_duplicadas_se_quedan_con_la_primera():
+    df = pd.DataFrame([['629203315', '699999999']], columns=['Telefono', 'Phone'])
+    df = _prepare_chunk(df, {'Telefono': 'telefono', 'Phone': 'telefono'}, 'fichero.xlsx')
+    assert df['telefono'].tolist() == ['629203315']
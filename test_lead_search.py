@@ -0,0 +1,99 @@
+"""
+Pruebas de la búsqueda de leads (lead_search) y de normalize_phone (lead_lookup).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lead_lookup import normalize_phone
+from lead_search import (SCORE_ID, SCORE_PHONE_EXACT, SCORE_PHONE_PREFIX, SCORE_PHONE_SUFFIX,
+                         _branches, _fulltext_query, search_leads)
+
+
+def scores(term):
+    return [int(sql.split(' AS score')[0].rsplit(' ', 1)[-1]) for sql, _ in _branches(term)
+            if 'MATCH(' not in sql]
+
+
+def test_normalize_phone():
+    assert normalize_phone('+34 629-20-33-15') == '629203315'
+    assert normalize_phone('0034629203315') == '629203315'
+    assert normalize_phone('629203315') == '629203315'
+    assert normalize_phone('(91) 123') == '91123'
+    assert normalize_phone(629203315) == '629203315'
+    assert normalize_phone(None) == ''
+    assert normalize_phone('sin numero') == ''
+
+
+def test_telefono_completo():
+    branches = _branches('+34 629 203 315')
+    assert scores('+34 629 203 315') == [SCORE_ID, SCORE_PHONE_EXACT, SCORE_PHONE_EXACT,
+                                         SCORE_PHONE_SUFFIX, SCORE_PHONE_SUFFIX]
+    assert branches[0][1] == [629203315]
+    assert branches[1][1] == ['629203315'] and 'telefono_norm' in branches[1][0]
+    assert 'telefono2_norm' in branches[2][0]
+    assert branches[3][1] == ['513302926%']
+
+
+def test_prefijo_doble_cero():
+    assert _branches('0034629203315')[1][1] == ['629203315']
+
+
+def test_fragmento_de_telefono():
+    branches = _branches('6292')
+    assert scores('6292') == [SCORE_ID, SCORE_PHONE_PREFIX, SCORE_PHONE_PREFIX,
+                              SCORE_PHONE_SUFFIX, SCORE_PHONE_SUFFIX]
+    assert branches[1][1] == ['6292%']
+    assert branches[3][1] == ['2926%']
+
+
+def test_numero_corto_solo_busca_id():
+    assert scores('12') == [SCORE_ID]
+
+
+def test_numero_largo_no_busca_id():
+    assert SCORE_ID not in scores('34629203315123')
+
+
+def test_texto_usa_fulltext():
+    branches = _branches('García López')
+    assert len(branches) == 1
+    sql, params = branches[0]
+    assert 'MATCH(' in sql
+    assert params == ['+"García" +"López"'] * 2
+
+
+def test_fulltext_ignora_operadores_y_palabras_cortas():
+    assert _fulltext_query('ana +-"*') == '+"ana"'
+    assert _fulltext_query('a b') is None
+    assert _branches('a b') == []
+
+
+def test_termino_demasiado_corto():
+    class Cursor:
+        def execute(self, *args):
+            raise AssertionError("No debe consultar la BD")
+
+    assert search_leads(Cursor(), ' x ') == []
+    assert search_leads(Cursor(), None) == []
+
+
+def test_search_leads_aplica_condiciones_en_cada_rama():
+    class Cursor:
+        def execute(self, sql, params):
+            self.sql, self.params = sql, params
+
+        def fetchall(self):
+            return [{'id': 1}]
+
+    cursor = Cursor()
+    rows = search_leads(cursor, '6292', columns='id, nombre', limit=10,
+                        conditions=['status_level_1 = %s'], params=['Volver a llamar'])
+    assert rows == [{'id': 1}]
+    assert cursor.sql.count('AND (status_level_1 = %s)') == 5
+    assert cursor.params.count('Volver a llamar') == 5
+    assert cursor.params[-1] == 10
+    assert cursor.sql.count('%s') == len(cursor.params)
+    assert 'l.id, l.nombre' in cursor.sql
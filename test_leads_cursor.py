@@ -0,0 +1,60 @@
+"""
+Pruebas del cursor de paginación del listado de leads (api_pearl_calls).
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api_pearl_calls import _decode_leads_cursor, _encode_leads_cursor, _leads_seek_condition
+
+
+def roundtrip(lead):
+    return _decode_leads_cursor(_encode_leads_cursor(lead))
+
+
+def test_ida_y_vuelta():
+    updated_at = datetime(2026, 10, 17, 12, 30, 5)
+    assert roundtrip({'call_priority': 3, 'updated_at': updated_at, 'id': 42}) == (3, updated_at, 42)
+
+
+def test_microsegundos():
+    updated_at = datetime(2026, 10, 17, 12, 30, 5, 123456)
+    assert roundtrip({'call_priority': 1, 'updated_at': updated_at, 'id': 7})[1] == updated_at
+
+
+def test_nulos():
+    assert roundtrip({'call_priority': None, 'updated_at': None, 'id': 9}) == (None, None, 9)
+    assert roundtrip({'call_priority': 0, 'updated_at': None, 'id': 1}) == (0, None, 1)
+
+
+def test_cursor_sin_relleno_y_seguro_en_url():
+    cursor = _encode_leads_cursor({'call_priority': 2, 'updated_at': datetime(2026, 1, 1), 'id': 123456})
+    assert '=' not in cursor
+    assert all(c.isalnum() or c in '-_' for c in cursor)
+
+
+def test_cursor_invalido():
+    for bad in ('', 'no-es-un-cursor', 'W10', 'WzEsMl0'):
+        try:
+            _decode_leads_cursor(bad)
+            assert False, f"Debería rechazar {bad!r}"
+        except ValueError:
+            pass
+
+
+def test_condicion_con_prioridad_y_fecha():
+    updated_at = datetime(2026, 10, 17, 12, 0)
+    condition, params = _leads_seek_condition(3, updated_at, 42)
+    assert condition.count('%s') == len(params)
+    assert params == [3, 3, 3, updated_at, updated_at, 42]
+    assert 'l.updated_at IS NULL' in condition, "Los NULL van al final en updated_at DESC"
+
+
+def test_condicion_con_nulos():
+    condition, params = _leads_seek_condition(None, None, 42)
+    assert condition.count('%s') == len(params)
+    assert params == [None, 42]
+    assert condition.startswith('(l.call_priority IS NOT NULL'), "Los NULL van primero en call_priority ASC"
@@ -0,0 +1,95 @@
+"""
+Pruebas del limitador de tasa (rate_limiter.TokenBucket).
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limiter import TokenBucket
+
+
+def test_rafaga_hasta_capacidad():
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.try_acquire()
+    assert 0 < wait <= 1.0, "Sin tokens debe indicar cuánto falta para el siguiente"
+
+
+def test_capacidad_por_defecto():
+    assert TokenBucket(rate=0.5).capacity == 1.0
+    assert TokenBucket(rate=4).capacity == 4.0
+
+
+def test_rellenado_con_el_tiempo():
+    bucket = TokenBucket(rate=20, capacity=1)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+    time.sleep(0.06)
+    assert bucket.try_acquire() == 0.0
+
+
+def test_desactivado_con_rate_cero():
+    bucket = TokenBucket(rate=0)
+    assert not bucket.enabled
+    assert all(bucket.try_acquire() == 0.0 for _ in range(100))
+    assert bucket.acquire(timeout=0)
+
+
+def test_acquire_espera_al_token():
+    bucket = TokenBucket(rate=20, capacity=1)
+    bucket.try_acquire()
+    started = time.monotonic()
+    assert bucket.acquire(timeout=1)
+    assert time.monotonic() - started >= 0.03
+
+
+def test_acquire_respeta_timeout():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    bucket.try_acquire()
+    started = time.monotonic()
+    assert not bucket.acquire(timeout=0.05)
+    assert time.monotonic() - started < 1
+
+
+def test_acquire_se_corta_con_stop_event():
+    bucket = TokenBucket(rate=0.1, capacity=1)
+    bucket.try_acquire()
+    stop = threading.Event()
+    threading.Timer(0.05, stop.set).start()
+    started = time.monotonic()
+    assert not bucket.acquire(stop_event=stop)
+    assert time.monotonic() - started < 1
+
+
+def test_concurrencia_no_excede_la_tasa():
+    bucket = TokenBucket(rate=50, capacity=5)
+    acquired = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            if bucket.acquire(timeout=2):
+                with lock:
+                    acquired.append(time.monotonic())
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(acquired) == 20
+    # 5 de ráfaga + 15 a 50/s: al menos ~0.3 s
+    assert max(acquired) - started >= 0.25
+
+
+def test_stats():
+    stats = TokenBucket(rate=2, capacity=4).stats()
+    assert stats['rate_per_second'] == 2.0
+    assert stats['burst'] == 4.0
+    assert stats['available_tokens'] == 4.0
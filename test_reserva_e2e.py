@@ -16,7 +16,7 @@ import random
 import string
 from datetime import datetime
 
-from tuotempo_api import TuoTempoAPI
+from tuotempo_api import TuoTempoAPI, registration_ids
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -63,12 +63,13 @@ def main():
 
     logging.info(f"Registrando usuario {fname} {lname} ({phone}) ...")
     reg_resp = api.register_non_insured_user(fname=fname, lname=lname, birthday=birthday, phone=phone)
-    if not api.session_id:
+    member_id, session_id = registration_ids(reg_resp)
+    if not member_id:
         logging.error(f"Fallo al registrar usuario: {reg_resp}")
         return
 
     logging.info("Confirmando cita ...")
-    confirm_resp = api.confirm_appointment(availability=slot, communication_phone=phone)
+    confirm_resp = api.confirm_appointment(availability=slot, communication_phone=phone, member_id=member_id)
 
     print("\n======= RESPUESTA FINAL ===========")
     print(confirm_resp)
@@ -0,0 +1,181 @@
+"""
+Pruebas de la caché de disponibilidad de TuoTempo (slot_availability_cache).
+"""
+
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import slot_availability_cache as cache
+
+NEXT_WEEK = (date.today() + timedelta(days=7)).isoformat()
+
+
+def response(*slots):
+    return {'result': 'OK', 'return': {'results': {'availabilities': [
+        {'start_date': day, 'startTime': start, 'resourceid': resource} for day, start, resource in slots
+    ]}}}
+
+
+class Fetch:
+    def __init__(self, result, delay=0.0):
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.result
+
+
+def setup_function(_):
+    cache.clear_slot_cache()
+
+
+def key(area='A1'):
+    return cache.make_key('tt_portal_adeslas', 'PRE', area, 'act', NEXT_WEEK, 'morning')
+
+
+def test_make_key_normaliza_fecha_y_franja():
+    past = (date.today() - timedelta(days=3)).strftime('%d/%m/%Y')
+    assert cache.make_key('i', 'PRE', 1, 2, past, None)[4] == date.today().isoformat()
+    future = date.today() + timedelta(days=3)
+    assert cache.make_key('i', 'PRE', 1, 2, future.strftime('%d/%m/%Y'), 'tarde') == \
+        cache.make_key('i', 'PRE', '1', '2', future.isoformat(), 'TARDE')
+
+
+def test_acierto_y_copia_independiente():
+    fetch = Fetch(response((NEXT_WEEK, '10:00', 'R1')))
+    first = cache.get_slots(key(), fetch)
+    first['result'] = 'MODIFICADO'
+    second = cache.get_slots(key(), fetch)
+    assert fetch.calls == 1
+    assert second['result'] == 'OK', "El llamante no debe poder modificar la entrada cacheada"
+
+
+def test_quien_consulta_recibe_una_copia():
+    fetch = Fetch(response((NEXT_WEEK, '10:00', 'R1')))
+    first = cache.get_slots(key(), fetch)
+    assert first is not fetch.result
+    assert first == fetch.result
+
+
+def test_caduca_tras_ttl(monkeypatch):
+    fetch = Fetch(response((NEXT_WEEK, '10:00', 'R1')))
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    cache.get_slots(key(), fetch)
+    now[0] += cache.SLOT_CACHE_TTL - 1
+    cache.get_slots(key(), fetch)
+    assert fetch.calls == 1
+    now[0] += 1
+    cache.get_slots(key(), fetch)
+    assert fetch.calls == 2
+
+
+def test_ttl_cero_desactiva(monkeypatch):
+    monkeypatch.setattr(cache, 'SLOT_CACHE_TTL', 0)
+    fetch = Fetch(response())
+    cache.get_slots(key(), fetch)
+    cache.get_slots(key(), fetch)
+    assert fetch.calls == 2
+
+
+def test_errores_no_se_cachean():
+    fetch = Fetch({'result': 'ERROR'})
+    cache.get_slots(key(), fetch)
+    cache.get_slots(key(), fetch)
+    assert fetch.calls == 2
+
+
+def test_coalescencia_de_peticiones_concurrentes():
+    fetch = Fetch(response((NEXT_WEEK, '10:00', 'R1')), delay=0.2)
+    results = []
+
+    def worker():
+        results.append(cache.get_slots(key(), fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == 1
+    assert len(results) == 8 and all(r['result'] == 'OK' for r in results)
+    stats = cache.get_slot_cache_stats()
+    assert stats['inflight'] == 0
+    assert stats['coalesced'] >= 7
+
+
+def test_error_en_la_consulta_compartida():
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("TuoTempo caído")
+
+    fallback = Fetch(response())
+    errors = []
+
+    def owner():
+        try:
+            cache.get_slots(key(), failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    started.wait(1)
+    result = cache.get_slots(key(), fallback)
+    thread.join()
+    assert errors, "El error se propaga a quien hizo la consulta"
+    assert fallback.calls == 1 and result['result'] == 'OK', "Los que esperaban consultan ellos mismos"
+
+
+def test_invalidacion_selectiva_por_hueco():
+    fetch_a = Fetch(response((NEXT_WEEK, '10:00:00', 'R1')))
+    fetch_b = Fetch(response((NEXT_WEEK, '11:00', 'R2')))
+    cache.get_slots(key('A1'), fetch_a)
+    cache.get_slots(key('A2'), fetch_b)
+
+    assert cache.invalidate_slot(NEXT_WEEK, '10:00', 'R9') == 0
+    assert cache.invalidate_slot(NEXT_WEEK, '10:00', 'R1') == 1
+    cache.get_slots(key('A1'), fetch_a)
+    cache.get_slots(key('A2'), fetch_b)
+    assert (fetch_a.calls, fetch_b.calls) == (2, 1)
+
+
+def test_invalidacion_sin_recurso_y_por_centro():
+    cache.get_slots(key('A1'), Fetch(response((NEXT_WEEK, '10:00', 'R1'))))
+    cache.get_slots(key('A2'), Fetch(response((NEXT_WEEK, '10:00', 'R2'))))
+    assert cache.invalidate_slot(NEXT_WEEK, '10:00') == 2
+
+    cache.get_slots(key('A1'), Fetch(response()))
+    assert cache.invalidate_area('A1') == 1
+    assert cache.get_slot_cache_stats()['entries'] == 0
+
+
+def test_no_guarda_respuesta_si_se_invalido_durante_la_consulta():
+    def fetch():
+        cache.invalidate_slot(NEXT_WEEK, '10:00', 'R1')
+        return response((NEXT_WEEK, '10:00', 'R1'))
+
+    cache.get_slots(key(), fetch)
+    assert cache.get_slot_cache_stats()['entries'] == 0
+
+
+def test_expulsa_las_entradas_mas_antiguas(monkeypatch):
+    monkeypatch.setattr(cache, 'SLOT_CACHE_MAX', 2)
+    for area in ('A1', 'A2', 'A3'):
+        cache.get_slots(key(area), Fetch(response()))
+    assert cache.get_slot_cache_stats()['entries'] == 2
+    fetch = Fetch(response())
+    cache.get_slots(key('A1'), fetch)
+    assert fetch.calls == 1
@@ -108,7 +108,6 @@ def main():
     member_id = None
     if user_response.get("access_token"):
         member_id = user_response.get("user_info", {}).get("memberid")
-        api.session_id = user_response.get("user_info", {}).get("sessionid")
     elif user_response.get("result") == "OK":
         member_id = user_response.get("return", {}).get("memberid")
     else:
@@ -123,15 +122,11 @@ def main():
     print(f"Usuario registrado con éxito. MemberID: {member_id}")
 
     print_separator()
-    # después de registrar al usuario
-    member_id = user_response["user_info"]["memberid"]
-    api.session_id = member_id          # <<< usar memberid, no sessionid
-
     # --- PASO 3: CONFIRMACIÓN DE RESERVA ---
     print("PASO 3: Confirmando la reserva...")
     
     # Confirmar la reserva directamente con el slot completo
-    reservation_response = api.confirm_appointment(selected_slot, USER_DATA['phone'])
+    reservation_response = api.confirm_appointment(selected_slot, USER_DATA['phone'], member_id)
     save_json_response("reservation_confirmation.json", reservation_response)
 
     # Convertir a dict si la API devuelve una cadena
@@ -0,0 +1,115 @@
+"""
+Pruebas del calendario laboral precompilado (working_calendar.WorkingCalendar).
+"""
+
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from working_calendar import WorkingCalendar, calendar_from_config
+
+# 2026-10-12 es lunes; 2026-10-17 sábado
+MONDAY = date(2026, 10, 12)
+
+
+def at(day, hour, minute=0):
+    return datetime(day.year, day.month, day.day, hour, minute)
+
+
+def test_franja_simple_y_limites():
+    calendar = WorkingCalendar(time_slots=[{"start": "10:00", "end": "20:00"}])
+    assert not calendar.is_working(at(MONDAY, 9, 59))
+    assert calendar.is_working(at(MONDAY, 10, 0))
+    assert calendar.is_working(at(MONDAY, 20, 0)), "El fin de franja es inclusivo"
+    assert not calendar.is_working(at(MONDAY, 20, 1))
+
+
+def test_fin_de_semana_no_laborable():
+    calendar = WorkingCalendar()
+    assert not calendar.is_working(datetime(2026, 10, 17, 12, 0))
+    assert calendar.next_working(datetime(2026, 10, 17, 12, 0)) == datetime(2026, 10, 19, 10, 0)
+
+
+def test_varias_franjas():
+    calendar = WorkingCalendar(time_slots=[{"start": "16:00", "end": "20:00"},
+                                           {"start": "09:00", "end": "14:00"}])
+    assert calendar.is_working(at(MONDAY, 13, 0))
+    assert not calendar.is_working(at(MONDAY, 15, 0))
+    assert calendar.next_working(at(MONDAY, 15, 0)) == at(MONDAY, 16, 0)
+    assert calendar.next_working(at(MONDAY, 7, 30)) == at(MONDAY, 9, 0)
+
+
+def test_next_working_devuelve_el_mismo_instante_si_es_laborable():
+    calendar = WorkingCalendar()
+    instant = at(MONDAY, 11, 17)
+    assert calendar.next_working(instant) == instant
+
+
+def test_next_working_tras_la_ultima_franja_pasa_al_dia_siguiente():
+    calendar = WorkingCalendar()
+    assert calendar.next_working(at(MONDAY, 21, 0)) == at(date(2026, 10, 13), 10, 0)
+    # Viernes por la tarde -> lunes
+    assert calendar.next_working(datetime(2026, 10, 16, 21, 0)) == datetime(2026, 10, 19, 10, 0)
+
+
+def test_franja_nocturna():
+    calendar = WorkingCalendar(time_slots=[{"start": "22:00", "end": "06:00"}])
+    assert calendar.is_working(at(MONDAY, 23, 30))
+    assert calendar.is_working(at(MONDAY, 5, 0))
+    assert not calendar.is_working(at(MONDAY, 12, 0))
+    assert calendar.next_working(at(MONDAY, 12, 0)) == at(MONDAY, 22, 0)
+    assert calendar.current_slot(at(MONDAY, 23, 30)) == {"start": "22:00", "end": "06:00"}
+    # La madrugada cuenta en el día del propio instante: sábado 01:00 no es laborable
+    assert not calendar.is_working(datetime(2026, 10, 17, 1, 0))
+
+
+def test_festivos():
+    holiday = date(2026, 10, 13)
+    calendar = WorkingCalendar(holidays=[holiday.isoformat(), "no-es-fecha"])
+    assert holiday in calendar.holidays
+    assert not calendar.is_working(at(holiday, 12, 0))
+    assert calendar.next_working(at(MONDAY, 21, 0)) == at(date(2026, 10, 14), 10, 0)
+
+
+def test_festivos_encadenados_con_fin_de_semana():
+    calendar = WorkingCalendar(holidays=[date(2026, 10, 16), date(2026, 10, 19)])
+    assert calendar.next_working(datetime(2026, 10, 15, 21, 0)) == datetime(2026, 10, 20, 10, 0)
+
+
+def test_calendario_regional_hereda_lo_que_no_redefine():
+    calendar = WorkingCalendar(
+        holidays=["2026-10-14"],
+        regions={"Canarias": {"working_time_slots": [{"start": "11:00", "end": "21:00"}],
+                              "holidays": ["2026-10-13"]}},
+    )
+    canarias = calendar.for_region("canarias")
+    assert canarias is not calendar
+    assert canarias.is_working(at(MONDAY, 20, 30))
+    assert not calendar.is_working(at(MONDAY, 20, 30))
+    assert not canarias.is_working(at(date(2026, 10, 13), 12, 0))
+    assert not canarias.is_working(at(date(2026, 10, 14), 12, 0)), "Hereda los festivos generales"
+    assert canarias.working_days == calendar.working_days
+    assert calendar.for_region("Madrid") is calendar
+    assert calendar.for_region(None) is calendar
+
+
+def test_configuracion_invalida_usa_valores_por_defecto():
+    calendar = WorkingCalendar(working_days=["x", 9], time_slots=[{"start": "25:00", "end": "xx"}])
+    assert calendar.working_days == frozenset([1, 2, 3, 4, 5])
+    assert calendar.slot_dicts() == [{"start": "10:00", "end": "20:00"}]
+
+
+def test_calendar_from_config_cachea_por_version():
+    config = {'working_days': '[1, 2, 3]', 'working_hours_start': '09:00', 'working_hours_end': '18:00',
+              'regional_calendars': '{"norte": {"working_days": [1]}}'}
+    calendar = calendar_from_config(config)
+    assert calendar is calendar_from_config(dict(config))
+    assert calendar.working_days == frozenset([1, 2, 3])
+    assert calendar.slot_dicts() == [{"start": "09:00", "end": "18:00"}]
+    assert calendar.for_region("Norte").working_days == frozenset([1])
+
+    changed = calendar_from_config(dict(config, working_days='[4]'))
+    assert changed is not calendar
+    assert changed.working_days == frozenset([4])
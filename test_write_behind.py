@@ -0,0 +1,171 @@
+"""
+Pruebas del buffer de escritura diferida (write_behind.WriteBehindBuffer).
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from write_behind import WriteBehindBuffer
+
+
+class Recorder:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.flushed = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.flushed.set()
+        if self.fail:
+            if self.fail is not True:
+                self.fail -= 1
+            raise RuntimeError("fallo de BD")
+
+
+def test_volcado_por_tamano():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_items=3, max_delay=60)
+    try:
+        for i in range(7):
+            buffer.add(i)
+        assert recorder.batches == [[0, 1, 2], [3, 4, 5]]
+        assert buffer.stats()['pending'] == 1
+    finally:
+        buffer.close()
+    assert recorder.batches[-1] == [6]
+
+
+def test_volcado_por_tiempo():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_items=100, max_delay=0.05)
+    try:
+        buffer.add('a')
+        buffer.add('b')
+        assert recorder.flushed.wait(1), "El lote debe volcarse al vencer max_delay"
+        assert recorder.batches == [['a', 'b']]
+    finally:
+        buffer.close()
+
+
+def test_close_vuelca_lo_pendiente_y_rechaza_nuevos():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_items=100, max_delay=60)
+    buffer.add(1)
+    buffer.close()
+    assert recorder.batches == [[1]]
+    try:
+        buffer.add(2)
+        assert False, "add() tras close() debe fallar"
+    except RuntimeError:
+        pass
+
+
+def test_error_de_volcado_conserva_el_lote_y_reintenta():
+    recorder = Recorder(fail=1)
+    buffer = WriteBehindBuffer(recorder, max_items=2, max_delay=60)
+    try:
+        buffer.add(1)
+        buffer.add(2)
+        stats = buffer.stats()
+        assert stats['flush_errors'] == 1
+        assert stats['pending'] == 2, "El lote fallido vuelve al buffer"
+        buffer.add(3)
+        assert len(recorder.batches) == 1, "Con un lote en reintento add() no fuerza otro volcado"
+        buffer.flush()
+        assert recorder.batches[-1] == [1, 2, 3]
+        assert buffer.stats()['flushed_items'] == 3
+    finally:
+        buffer.close()
+
+
+def test_descarta_el_lote_tras_agotar_los_reintentos():
+    recorder = Recorder(fail=True)
+    buffer = WriteBehindBuffer(recorder, max_items=2, max_delay=60, max_retries=1)
+    try:
+        buffer.add(1)
+        buffer.add(2)
+        buffer.flush()
+        stats = buffer.stats()
+        assert stats['flush_errors'] == 2
+        assert stats['flushes'] == 0
+        assert stats['dropped_items'] == 2
+        assert stats['pending'] == 0
+    finally:
+        buffer.close()
+
+
+def test_after_flush_fuera_del_lock_y_solo_al_terminar_el_lote():
+    seen = []
+    buffer = None
+
+    def after(items):
+        assert not buffer._flush_lock.locked(), "after_flush no debe ejecutarse con el lock de volcado"
+        seen.append(list(items))
+
+    buffer = WriteBehindBuffer(Recorder(fail=True), max_items=2, max_delay=60, after_flush=after,
+                               max_retries=1)
+    try:
+        buffer.add('x')
+        buffer.add('y')
+        assert seen == [], "No se ejecuta mientras el lote está pendiente de reintento"
+        buffer.flush()
+        assert seen == [['x', 'y']]
+    finally:
+        buffer.close()
+
+
+def test_close_agota_los_reintentos():
+    recorder = Recorder(fail=1)
+    buffer = WriteBehindBuffer(recorder, max_items=100, max_delay=0.01)
+    buffer.add(1)
+    buffer.close()
+    assert recorder.batches == [[1], [1]]
+    assert buffer.stats()['pending'] == 0
+
+
+def test_after_flush_lento_no_retrasa_el_siguiente_lote():
+    recorder = Recorder()
+    release = threading.Event()
+    buffer = WriteBehindBuffer(recorder, max_items=1, max_delay=60, after_flush=lambda items: release.wait(1))
+    try:
+        slow = threading.Thread(target=buffer.add, args=(1,))
+        slow.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        threading.Thread(target=buffer.add, args=(2,), daemon=True).start()
+        deadline = time.monotonic() + 0.5
+        while len(recorder.batches) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert recorder.batches == [[1], [2]]
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+        slow.join()
+        buffer.close()
+
+
+def test_orden_de_escritura_con_varios_hilos():
+    recorder = Recorder()
+    buffer = WriteBehindBuffer(recorder, max_items=5, max_delay=0.01)
+
+    def producer(base):
+        for i in range(50):
+            buffer.add((base, i))
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buffer.close()
+
+    flushed = [item for batch in recorder.batches for item in batch]
+    assert len(flushed) == 200
+    for base in range(4):
+        assert [i for b, i in flushed if b == base] == list(range(50))
+    assert buffer.stats()['flushed_items'] == 200
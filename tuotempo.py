@@ -1,13 +1,56 @@
 import os
 import logging
+import threading
 import requests
 import json
 from dotenv import load_dotenv
 from tuotempo_api_logger import log_tuotempo_api_call
+import slot_availability_cache
 
 # Load environment variables
 load_dotenv()
 
+# Errores de negocio de la reserva: el registro del usuario sigue siendo válido
+RESERVATION_BUSINESS_ERRORS = (
+    "MEMBER_RESERVATION_CONFLICT_ERROR",
+    "PROVIDER_RESERVATION_CONFLICT_ERROR",
+    "TUOTEMPO_MAX_RES_BOOKED_ONLINE",
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_tuotempo_client(api_key, api_secret, instance_id):
+    """
+    Cliente ``Tuotempo`` compartido por proceso para esas credenciales.
+
+    Es seguro usarlo desde varios hilos: la sesión HTTP y la caché de registros
+    son comunes y ``create_reservation`` no guarda estado por petición.
+    """
+    key = (api_key, instance_id)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = Tuotempo(api_key, api_secret, instance_id)
+    return client
+
+
+def get_tuotempo_client_for_env(env="PRO"):
+    """
+    Cliente compartido con las credenciales de ``env`` ("PRO" o "PRE"):
+    ``TUOTEMPO_API_KEY_{env}``, ``TUOTEMPO_API_SECRET_{env}`` y
+    ``TUOTEMPO_INSTANCE_ID``, con las claves por defecto de ``tuotempo_api``.
+    """
+    from tuotempo_api import DEFAULT_API_KEYS
+
+    env = (env or "PRO").upper()
+    api_key = os.getenv(f'TUOTEMPO_API_KEY_{env}') or DEFAULT_API_KEYS.get(env, DEFAULT_API_KEYS["PRE"])
+    api_secret = os.getenv(f'TUOTEMPO_API_SECRET_{env}', 'default_secret')
+    instance_id = os.getenv('TUOTEMPO_INSTANCE_ID', 'tt_portal_adeslas')
+    return get_tuotempo_client(api_key, api_secret, instance_id)
+
+
 class Tuotempo:
     """
     Clase adaptadora para mantener compatibilidad con el código existente.
@@ -66,13 +109,21 @@ class Tuotempo:
         
         logging.info(f"Adapter: buscando slots para area_id={area_id}, start_date={start_date}")
         
-        # Llamar al método correspondiente de TuoTempoAPI
+        time_preference = 'MORNING'  # Valor por defecto para evitar error de preferenciaMT vacía
+        cache_key = slot_availability_cache.make_key(
+            self.instance_id, self.environment, area_id, activity_id, start_date, time_preference
+        )
+
+        # Llamar al método correspondiente de TuoTempoAPI (a través de la caché compartida)
         try:
-            return self.client.get_available_slots(
-                activity_id=activity_id, 
-                area_id=area_id, 
-                start_date=start_date,
-                time_preference='MORNING'  # Valor por defecto para evitar error de preferenciaMT vacía
+            return slot_availability_cache.get_slots(
+                cache_key,
+                lambda: self.client.get_available_slots(
+                    activity_id=activity_id,
+                    area_id=area_id,
+                    start_date=start_date,
+                    time_preference=time_preference
+                )
             )
         except Exception as e:
             logging.error(f"Error al obtener slots: {e}")
@@ -92,17 +143,18 @@ class Tuotempo:
         """
         logging.info(f"Adapter: creando reserva para {user_info.get('name')} en {availability.get('start_date')}")
         
+        registration = {
+            'fname': user_info.get('name'),
+            'lname': user_info.get('surname'),
+            'birthday': user_info.get('birth_date'),
+            'phone': user_info.get('mobile_phone')
+        }
         try:
-            # Primero registrar al usuario
-            user_reg_response = self.client.register_non_insured_user(
-                fname=user_info.get('name'),
-                lname=user_info.get('surname'),
-                birthday=user_info.get('birth_date'),
-                phone=user_info.get('mobile_phone')
-            )
+            # Primero registrar al usuario (o reutilizar su registro reciente)
+            member_id, session_id, from_cache, user_reg_response = self.client.get_or_register_user(**registration)
             
-            # Si no hay session_id después del registro, falló
-            if not self.client.session_id:
+            # Sin memberid o sin sessionid el registro falló
+            if not member_id or not session_id:
                 return {
                     "result": "ERROR",
                     "msg": "No se pudo registrar el usuario",
@@ -115,24 +167,53 @@ class Tuotempo:
                 start_date = start_date.replace('-', '/')
             
             # Confirmar la cita
+            confirm_availability = {
+                "start_date": start_date,
+                "startTime": availability.get('startTime'),
+                "endTime": availability.get('endTime'),
+                "resourceid": availability.get('resourceid'),
+                "activityid": availability.get('activityid')
+            }
             confirm_response = self.client.confirm_appointment(
-                availability={
-                    "start_date": start_date,
-                    "startTime": availability.get('startTime'),
-                    "endTime": availability.get('endTime'),
-                    "resourceid": availability.get('resourceid'),
-                    "activityid": availability.get('activityid')
-                },
-                communication_phone=user_info.get('mobile_phone')
+                availability=confirm_availability,
+                communication_phone=user_info.get('mobile_phone'),
+                member_id=member_id
             )
             
+            # Un registro reutilizado puede haber dejado de valer: registrar de nuevo y reintentar una vez
+            if from_cache and confirm_response.get("result") != "OK" and \
+                    confirm_response.get("exception") not in RESERVATION_BUSINESS_ERRORS:
+                logging.info("Adapter: reserva rechazada con un registro reutilizado; registrando de nuevo al usuario")
+                self.client.forget_registration(registration['phone'], registration['birthday'])
+                member_id, session_id, _, user_reg_response = self.client.get_or_register_user(**registration)
+                if not member_id or not session_id:
+                    return {
+                        "result": "ERROR",
+                        "msg": "No se pudo registrar el usuario",
+                        "details": user_reg_response
+                    }
+                confirm_response = self.client.confirm_appointment(
+                    availability=confirm_availability,
+                    communication_phone=user_info.get('mobile_phone'),
+                    member_id=member_id
+                )
+            
             # Si la respuesta indica éxito
             if confirm_response.get("result") == "OK":
+                # El usuario se registra como onetime_user (ligado a una sola cita): no reutilizarlo
+                self.client.forget_registration(registration['phone'], registration['birthday'])
+                # El hueco ya no está libre: que nadie lo siga ofreciendo desde la caché
+                slot_availability_cache.invalidate_slot(
+                    start_date, availability.get('startTime'), availability.get('resourceid')
+                )
                 return confirm_response
             else:
                 # Manejo específico de errores de conflicto de reservas
                 exception = confirm_response.get("exception")
                 if exception in ["MEMBER_RESERVATION_CONFLICT_ERROR", "PROVIDER_RESERVATION_CONFLICT_ERROR"]:
+                    slot_availability_cache.invalidate_slot(
+                        start_date, availability.get('startTime'), availability.get('resourceid')
+                    )
                     return {
                         "result": "SLOT_CONFLICT",
                         "msg": "El slot solicitado ya no está disponible",
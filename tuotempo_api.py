@@ -2,13 +2,86 @@ import requests
 import json
 import os
 import logging
+import random
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 from tuotempo_api_logger import log_tuotempo_api_call, log_requests_call
 
 # Load environment variables
 load_dotenv()
 
+# HTTP: una sesión keep-alive por proceso compartida por todos los clientes e hilos
+TUOTEMPO_HTTP_POOL_SIZE = int(os.getenv('TUOTEMPO_HTTP_POOL_SIZE', 10))
+TUOTEMPO_HTTP_TIMEOUT = float(os.getenv('TUOTEMPO_HTTP_TIMEOUT', 30))  # segundos
+TUOTEMPO_HTTP_MAX_RETRIES = int(os.getenv('TUOTEMPO_HTTP_MAX_RETRIES', 2))
+TUOTEMPO_HTTP_BACKOFF = float(os.getenv('TUOTEMPO_HTTP_BACKOFF', 0.5))
+TUOTEMPO_HTTP_BACKOFF_MAX = float(os.getenv('TUOTEMPO_HTTP_BACKOFF_MAX', 5))
+
+# Códigos que se reintentan. Las peticiones no idempotentes (registro, reserva)
+# solo se reintentan cuando es seguro que TuoTempo no las procesó.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_STATUS_NON_IDEMPOTENT = {429, 503}
+
+# Registros de usuario reutilizables (teléfono + fecha de nacimiento), en segundos
+TUOTEMPO_REGISTRATION_TTL = int(os.getenv('TUOTEMPO_REGISTRATION_TTL', 1800))
+
+# API keys por defecto (VOICEBOT2) si no se configura TUOTEMPO_API_KEY_{PRE,PRO}
+DEFAULT_API_KEYS = {
+    "PRE": "3a5835be0f540c7591c754a2bf0758bb",
+    "PRO": "24b98d8d41b970d38362b52bd3505c04",
+}
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_registrations = {}
+_registrations_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {'requests': 0, 'retries': 0, 'registration_hits': 0, 'registration_misses': 0}
+
+
+def _count(metric, value=1):
+    with _metrics_lock:
+        _metrics[metric] += value
+
+
+def get_http_session():
+    """Sesión HTTP persistente (pool de conexiones keep-alive) del proceso."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=TUOTEMPO_HTTP_POOL_SIZE,
+                                      pool_maxsize=TUOTEMPO_HTTP_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+
+def get_tuotempo_http_stats():
+    """Contadores de peticiones, reintentos y registros reutilizados del proceso."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    with _registrations_lock:
+        stats['registrations_cached'] = len(_registrations)
+    return stats
+
+def registration_ids(response):
+    """
+    Devuelve ``(member_id, session_id)`` de una respuesta de ``register_non_insured_user``.
+
+    El sessionid puede venir en la raíz o dentro de ``user_info``.
+    """
+    if not isinstance(response, dict):
+        return None, None
+    user_info = response.get("user_info") or {}
+    return user_info.get("memberid"), response.get("sessionid") or user_info.get("sessionid")
+
+
 class TuoTempoAPI:
     """
     Client for TuoTempo API integration.
@@ -37,17 +110,85 @@ class TuoTempoAPI:
         self.headers = {
             "content-type": "application/json; charset=UTF-8"
         }
-        self.session_id = None
-        self.member_id = None
         
         # Set API key based on environment
         if api_key:
             self.api_key = api_key
         else:
             # Default API keys for VOICEBOT2
-            pre_key = "3a5835be0f540c7591c754a2bf0758bb"  # PRE environment
-            pro_key = "24b98d8d41b970d38362b52bd3505c04"  # PRO environment
-            self.api_key = pre_key if environment == "PRE" else pro_key
+            self.api_key = DEFAULT_API_KEYS["PRE"] if environment == "PRE" else DEFAULT_API_KEYS["PRO"]
+
+    def _request(self, method, url, idempotent=True, **kwargs):
+        """
+        Petición sobre la sesión compartida con timeout y reintentos con backoff
+        exponencial (con jitter) ante errores transitorios.
+
+        Devuelve la última respuesta (aunque sea de error); lanza
+        ``requests.RequestException`` si el último intento falla por conexión.
+        """
+        kwargs.setdefault('timeout', TUOTEMPO_HTTP_TIMEOUT)
+        retry_status = RETRY_STATUS if idempotent else RETRY_STATUS_NON_IDEMPOTENT
+        attempt = 0
+        while True:
+            attempt += 1
+            _count('requests')
+            try:
+                response = log_requests_call(method, url, session=get_http_session(), **kwargs)
+            except requests.RequestException as e:
+                # Sin idempotencia solo se reintenta si no llegó a conectar
+                if idempotent:
+                    retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                else:
+                    retryable = isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or attempt > TUOTEMPO_HTTP_MAX_RETRIES:
+                    raise
+                reason = e.__class__.__name__
+            else:
+                if response.status_code not in retry_status or attempt > TUOTEMPO_HTTP_MAX_RETRIES:
+                    return response
+                reason = f"HTTP {response.status_code}"
+                response.close()
+
+            delay = random.uniform(0, min(TUOTEMPO_HTTP_BACKOFF_MAX, TUOTEMPO_HTTP_BACKOFF * (2 ** (attempt - 1))))
+            logging.warning(f"[TuoTempoAPI] {method} {url}: {reason}; reintento {attempt}/{TUOTEMPO_HTTP_MAX_RETRIES} en {delay:.1f}s")
+            _count('retries')
+            time.sleep(delay)
+
+    def _registration_key(self, phone, birthday):
+        phone_digits = ''.join(c for c in str(phone or '') if c.isdigit())[-9:]
+        return (self.instance_id, self.environment, phone_digits, self.format_date_to_ddmmyyyy(birthday or ''))
+
+    def get_or_register_user(self, fname, lname, birthday, phone):
+        """
+        Devuelve ``(member_id, session_id, from_cache, response)`` del usuario.
+
+        Reutiliza un registro anterior del mismo teléfono + fecha de nacimiento
+        si tiene menos de ``TUOTEMPO_REGISTRATION_TTL`` segundos; si no, llama a
+        ``register_non_insured_user``. Es seguro desde varios hilos.
+        """
+        key = self._registration_key(phone, birthday)
+        with _registrations_lock:
+            cached = _registrations.get(key)
+            if cached and time.time() < cached['expires_at']:
+                _count('registration_hits')
+                return cached['member_id'], cached['session_id'], True, cached['response']
+            _registrations.pop(key, None)
+
+        _count('registration_misses')
+        response = self.register_non_insured_user(fname=fname, lname=lname, birthday=birthday, phone=phone)
+        member_id, session_id = registration_ids(response)
+        if member_id and session_id:
+            with _registrations_lock:
+                _registrations[key] = {
+                    'member_id': member_id, 'session_id': session_id, 'response': response,
+                    'expires_at': time.time() + TUOTEMPO_REGISTRATION_TTL,
+                }
+        return member_id, session_id, False, response
+
+    def forget_registration(self, phone, birthday):
+        """Descarta el registro cacheado de ese teléfono + fecha de nacimiento."""
+        with _registrations_lock:
+            _registrations.pop(self._registration_key(phone, birthday), None)
 
     @log_tuotempo_api_call
     def get_centers(self, province=None):
@@ -70,7 +211,7 @@ class TuoTempoAPI:
             params["province"] = province
 
         logging.info(f"[TuoTempoAPI] GET Centers - URL: {url}, Params: {params}")
-        response = log_requests_call('GET', url, headers=self.headers, params=params)
+        response = self._request('GET', url, headers=self.headers, params=params)
         logging.info(f"[TuoTempoAPI] GET Centers - Response: {response.status_code}")
         return response.json()
     
@@ -130,7 +271,7 @@ class TuoTempoAPI:
             params["resourceId"] = resource_id
 
         logging.info(f"[TuoTempoAPI] GET Availabilities - URL: {url}, Params: {params}")
-        response = log_requests_call('GET', url, headers=self.headers, params=params)
+        response = self._request('GET', url, headers=self.headers, params=params)
         logging.info(
             f"[TuoTempoAPI] GET Availabilities - Response: {response.status_code}, Body: {response.text[:500]}"
         )
@@ -186,7 +327,7 @@ class TuoTempoAPI:
             dict: JSON response with user registration information
             
         Note:
-            This method sets the session_id attribute which is required for confirming appointments.
+            Use ``registration_ids(response)`` to get the member id required by ``confirm_appointment``.
         """
         url = f"{self.base_url}/{self.instance_id}/users"
         params = {"lang": self.lang}
@@ -205,43 +346,35 @@ class TuoTempoAPI:
         }
         
         logging.info(f"[TuoTempoAPI] POST Register User - URL: {url}, Payload: {json.dumps(payload)}")
-        response = log_requests_call('POST', url, headers=self.headers, params=params, json=payload)
+        response = self._request('POST', url, idempotent=False, headers=self.headers, params=params, json=payload)
         response_data = response.json()
         logging.info(f"[TuoTempoAPI] POST Register User - Response: {response.status_code}, Body: {response.text[:200]}")
         
-        # Store session ID for later use in confirming appointments.
-        # The sessionid can be at the root or nested inside user_info.
-        user_info = response_data.get("user_info", {})
-        session_id = response_data.get("sessionid") or user_info.get("sessionid")
-        
-        if session_id:
-            self.session_id = session_id
-            logging.info(f"[TuoTempoAPI] SessionID extraído y guardado: {self.session_id}")
-        else:
+        # El cliente se comparte entre hilos: los ids se devuelven al llamante, no se guardan aquí
+        member_id, session_id = registration_ids(response_data)
+        if not session_id:
             logging.warning("[TuoTempoAPI] No se encontró 'sessionid' en la respuesta de registro de usuario.")
-
-        member_id = user_info.get("memberid")
         if member_id:
-            self.member_id = member_id
-            logging.info(f"[TuoTempoAPI] MemberID extraído y guardado: {self.member_id}")
+            logging.info(f"[TuoTempoAPI] Usuario registrado. MemberID: {member_id}")
         else:
             logging.warning("[TuoTempoAPI] No se encontró 'memberid' en la respuesta de registro de usuario.")
         
         return response_data
     
     @log_tuotempo_api_call
-    def confirm_appointment(self, availability, communication_phone):
+    def confirm_appointment(self, availability, communication_phone, member_id):
         """
         Confirma una cita en Tuotempo con los datos de disponibilidad y el usuario registrado
         
         Args:
             availability (dict): Información de disponibilidad de la cita
             communication_phone (str): Teléfono de contacto
+            member_id (str): Usuario de la cita (memberid devuelto por el registro)
             
         Returns:
             dict: Respuesta de la API
         """
-        if not self.member_id:
+        if not member_id:
             raise ValueError("No member ID available. Please register a user first.")
             
         # Crear la URL para la confirmación de cita
@@ -258,7 +391,7 @@ class TuoTempoAPI:
         
         # Añadir datos adicionales usando los nombres de campo correctos (con mayúscula inicial)
         payload.update({
-            "userid": self.member_id.strip() if self.member_id else "",
+            "userid": member_id.strip(),
             "Communication_phone": communication_phone.strip(),  # C mayúscula
             "Tags": "WEB_NO_ASEGURADO",  # T mayúscula
             "isExternalPayment": "false"
@@ -272,7 +405,7 @@ class TuoTempoAPI:
         logging.info(f"[TuoTempoAPI] Headers: {headers}")
         logging.info(f"[TuoTempoAPI] Payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
 
-        response = log_requests_call('POST', url, headers=headers, json=payload)
+        response = self._request('POST', url, idempotent=False, headers=headers, json=payload)
         
         logging.info(f"[TuoTempoAPI] POST Confirm Appointment - Response: {response.status_code}")
         logging.info(f"[TuoTempoAPI] Body: {response.text[:500] + '...' if len(response.text) > 500 else response.text}")
@@ -310,7 +443,7 @@ class TuoTempoAPI:
         payload = {"reason": reason} if reason else None
 
         logging.info(f"[TuoTempoAPI] DELETE Cancel Appointment - URL: {url}")
-        response = log_requests_call('DELETE', url, headers=headers, params=params, json=payload)
+        response = self._request('DELETE', url, headers=headers, params=params, json=payload)
         logging.info(f"[TuoTempoAPI] DELETE Cancel Appointment - Response: {response.status_code}")
         logging.info(f"[TuoTempoAPI] Body: {response.text[:500] + '...' if len(response.text) > 500 else response.text}")
 
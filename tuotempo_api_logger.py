@@ -168,13 +168,14 @@ def log_tuotempo_api_call(func):
     return wrapper
 
 
-def log_requests_call(method, url, **kwargs):
+def log_requests_call(method, url, session=None, **kwargs):
     """
     Función wrapper para requests que loggea automáticamente las llamadas HTTP.
 
     Args:
         method (str): Método HTTP
         url (str): URL de la llamada
+        session (requests.Session, optional): Sesión (keep-alive) sobre la que hacer la llamada
         **kwargs: Argumentos adicionales para requests
 
     Returns:
@@ -186,7 +187,9 @@ def log_requests_call(method, url, **kwargs):
 
     try:
         # Realizar la llamada HTTP real
-        if method.upper() == 'GET':
+        if session is not None:
+            response = session.request(method.upper(), url, **kwargs)
+        elif method.upper() == 'GET':
             response = requests.get(url, **kwargs)
         elif method.upper() == 'POST':
             response = requests.post(url, **kwargs)
@@ -40,13 +40,20 @@ def verify_reset_token(token, max_age_seconds=1800):
 
 
 import os
-import re
 import logging
 from datetime import datetime
 
+from lead_import import import_leads, registrar_archivo_origen
+
 logger = logging.getLogger(__name__)
 
-def load_excel_data(connection, source, origen_archivo=None):
+def load_excel_data(connection, source, origen_archivo=None, on_progress=None, should_cancel=None):
+    """
+    Carga un Excel/CSV de leads por bloques (ver lead_import.import_leads).
+
+    Devuelve el dict de la importación (``insertados``, ``actualizados``,
+    ``errores``, ``total``...).
+    """
     logger.info(f"Iniciando carga de datos desde: {source}")
     
     # Determinar el nombre del archivo origen
@@ -60,155 +67,17 @@ def load_excel_data(connection, source, origen_archivo=None):
     
     logger.info(f"Archivo origen determinado: {origen_archivo}")
     
-    try:
-        if isinstance(source, str):
-            df = pd.read_excel(source) if source.endswith('.xlsx') else pd.read_csv(source)
-        else:
-            df = pd.read_excel(source) # Para BytesIO
-    except Exception as e:
-        logger.error(f"Error al leer el archivo Excel/CSV: {e}")
-        return {'insertados': 0, 'actualizados': 0, 'errores': 0, 'total': 0}
-
-    # Lógica de mapeo de columnas y carga de datos...
-    # (Esta es la lógica que ya tenías en app_dashboard.py)
-    db_to_excel_map = {
-        'nombre': ['nombre', 'name', 'first name', 'firstname'],
-        'apellidos': ['apellidos', 'surname', 'last name', 'lastname'],
-        'telefono': ['teléfono', 'telefono', 'telefono1', 'teléfono1', 'phone', 'mobile', 'phone number', 'tel', 'teléfono móvil', 'teléfono principal', 'teléfono contacto', 'teléfono cliente', 'número', 'número teléfono'],
-        'telefono2': ['teléfono2', 'telefono2', 'telefono 2', 'teléfono 2', 'phone2', 'mobile2', 'telefono secundario', 'tel2', 'teléfono alternativo', 'otro teléfono'],
-        'nif': ['nif', 'dni', 'documento'],
-        'fecha_nacimiento': ['fecha nacimiento', 'fecha_nacimiento', 'fechanacimiento', 'birth date'],
-        'sexo': ['sexo', 'gender'],
-        'certificado': ['certificado', 'certificate'],
-        'clinica_id': ['clinica id', 'clinica_id', 'clinic id'],
-        'delegacion': ['delegacion', 'delegation'],
-        'poliza': ['poliza', 'policy'],
-        'segmento': ['segmento', 'segment'],
-        'email': ['email', 'correo electronico'],
-        'cita': ['cita', 'fecha_cita', 'fecha cita', 'appointment date'],
-        'nombre_clinica': ['nombre_clinica', 'nombre clinica', 'clinic name', 'nombreclinica'],
-        'direccion_clinica': ['direccion_clinica', 'direccion clinica', 'clinic address', 'direccionclinica'],
-        'codigo_postal': ['codigo_postal', 'codigo postal', 'postal code', 'codigopostal'],
-        'ciudad': ['ciudad', 'city'],
-        'orden': ['orden', 'order', 'id'],
-    }
-
-    normalized_excel_cols = {re.sub(r'[^a-z0-9]+', '', str(col).lower().strip()): str(col) for col in df.columns}
-    excel_to_db_map = {}
-    for db_col, aliases in db_to_excel_map.items():
-        for alias in aliases:
-            norm_alias = re.sub(r'[^a-z0-9]+', '', alias.lower().strip())
-            if norm_alias in normalized_excel_cols:
-                excel_to_db_map[normalized_excel_cols[norm_alias]] = db_col
-                break
-    
-    df.rename(columns=excel_to_db_map, inplace=True)
-
-    # --- Inserción real en MySQL ---
-    # Columnas exactas de la tabla leads (incluyendo origen_archivo)
-    leads_cols = [
-        'nombre', 'apellidos', 'nombre_clinica', 'direccion_clinica', 'codigo_postal',
-        'ciudad', 'telefono', 'area_id', 'match_source', 'match_confidence', 'cita',
-        'conPack', 'ultimo_estado', 'resultado_llamada', 'telefono2', 'call_id',
-        'call_time', 'call_duration', 'call_summary', 'call_recording_url',
-        'status_level_1', 'status_level_2', 'hora_rellamada', 'error_tecnico',
-        'razon_vuelta_a_llamar', 'razon_no_interes', 'certificado',
-        'clinica_id', 'delegacion', 'fecha_nacimiento', 'nif', 'orden', 'poliza',
-        'segmento', 'sexo', 'origen_archivo'
-    ]
-
-    # Asegurar que todos los campos existen en el DataFrame
-    for col in leads_cols:
-        if col not in df.columns:
-            if col == 'origen_archivo':
-                df[col] = origen_archivo  # Asignar el nombre del archivo origen
-            else:
-                df[col] = None
-
-    # Preprocesar teléfonos para asegurar que se importan correctamente
-    if 'telefono' in df.columns:
-        # Convertir NaN a None
-        df['telefono'] = df['telefono'].apply(lambda x: str(x).strip() if pd.notna(x) else None)
-        # Eliminar caracteres no numéricos pero mantener el + inicial si existe
-        df['telefono'] = df['telefono'].apply(lambda x: re.sub(r'[^0-9+]', '', str(x)) if pd.notna(x) else None)
-        # Asegurar que hay al menos un dígito
-        df['telefono'] = df['telefono'].apply(lambda x: x if pd.notna(x) and re.search(r'\d', str(x)) else None)
-        
-    if 'telefono2' in df.columns:
-        df['telefono2'] = df['telefono2'].apply(lambda x: str(x).strip() if pd.notna(x) else None)
-        df['telefono2'] = df['telefono2'].apply(lambda x: re.sub(r'[^0-9+]', '', str(x)) if pd.notna(x) else None)
-        df['telefono2'] = df['telefono2'].apply(lambda x: x if pd.notna(x) and re.search(r'\d', str(x)) else None)
+    resultado = import_leads(connection, source, origen_archivo,
+                             on_progress=on_progress, should_cancel=should_cancel)
     
-    # Reordenar columnas y convertir booleanos/tinyint
-    df = df[leads_cols]
-    if 'conPack' in df.columns:
-        df['conPack'] = df['conPack'].apply(lambda x: 1 if str(x).strip().lower() in ['1', 'si', 'sí', 'true', 'yes'] else 0)
-
-    registros = []
-    for _, row in df.iterrows():
-        registros.append(tuple(row[col] if pd.notna(row[col]) else None for col in leads_cols))
-
-    insertados, errores = 0, 0
-    if registros:
-        placeholders = ','.join(['%s'] * len(leads_cols))
-        cols_sql = ','.join(leads_cols)
-        sql = f"INSERT INTO leads ({cols_sql}) VALUES ({placeholders})"
+    if resultado['insertados']:
+        # Registrar/actualizar archivo origen
         try:
-            with connection.cursor() as cursor:
-                cursor.executemany(sql, registros)
-            connection.commit()
-            insertados = len(registros)
-            
-            # Registrar/actualizar archivo origen
-            try:
-                _registrar_archivo_origen(connection, origen_archivo, insertados)
-            except Exception as e:
-                logger.warning(f"Error registrando archivo origen: {e}")
-            
+            registrar_archivo_origen(connection, origen_archivo, resultado['insertados'])
         except Exception as e:
-            logger.error(f"Error insertando registros: {e}", exc_info=True)
-            errores = len(registros)
-    logger.info(f"Insertados: {insertados} | Errores: {errores}")
-
-    return {
-        'insertados': insertados,
-        'actualizados': 0,
-        'errores': errores,
-        'total': len(df)
-    }
-
-def _registrar_archivo_origen(connection, nombre_archivo, registros_importados):
-    """
-    Registra o actualiza un archivo en la tabla archivos_origen.
-    """
-    try:
-        with connection.cursor() as cursor:
-            # Verificar si el archivo ya existe
-            cursor.execute("SELECT id, total_registros FROM archivos_origen WHERE nombre_archivo = %s", (nombre_archivo,))
-            resultado = cursor.fetchone()
-            
-            if resultado:
-                # Actualizar registro existente
-                archivo_id, total_anterior = resultado
-                nuevo_total = total_anterior + registros_importados
-                cursor.execute("""
-                    UPDATE archivos_origen 
-                    SET total_registros = %s, fecha_creacion = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (nuevo_total, archivo_id))
-                logger.info(f"Archivo origen '{nombre_archivo}' actualizado: {total_anterior} -> {nuevo_total} registros")
-            else:
-                # Crear nuevo registro
-                cursor.execute("""
-                    INSERT INTO archivos_origen (nombre_archivo, descripcion, total_registros, usuario_creacion)
-                    VALUES (%s, %s, %s, %s)
-                """, (nombre_archivo, f"Importación automática de {nombre_archivo}", registros_importados, "sistema"))
-                logger.info(f"Nuevo archivo origen '{nombre_archivo}' registrado con {registros_importados} registros")
-            
-            connection.commit()
-    except Exception as e:
-        logger.error(f"Error en _registrar_archivo_origen: {e}")
-        raise
+            logger.warning(f"Error registrando archivo origen: {e}")
+    
+    return resultado
 
 def exportar_datos_completos(connection):
     """
@@ -247,182 +116,15 @@ def exportar_datos_completos(connection):
         logger.error(error_msg, exc_info=True)
         return False, error_msg
 
-from db import get_connection
+from dashboard_stats import get_dashboard_statistics
 
 def get_statistics(filtro_origen_archivo=None):
-    """Calcula estadísticas en tiempo real para el dashboard.
+    """Calcula estadísticas para el dashboard (una pasada sobre leads, con caché).
     
     Args:
         filtro_origen_archivo (str|list): Filtro por archivo origen. 
                                           Puede ser un string, lista de strings, o None para todos.
+    
+    Ver dashboard_stats.py para el cálculo y la invalidación de la caché.
     """
-    stats = {
-        'total_leads': 0,
-        'llamadas_hoy': 0,
-        'contactados': 0,
-        'conversion_rate': '0%',
-        'citas_contactados_rate': '0%',
-        'citas_total': 0,
-        'estados': {
-            'volver_llamar': 0,
-            'no_interesado': 0,
-            'cita_sin_pack': 0,
-            'cita_con_pack': 0,
-            'utiles_positivos': 0,
-            'utiles_negativos': 0,
-            'no_util': 0
-        },
-        'filtro_origen': filtro_origen_archivo,  # Incluir info del filtro aplicado
-        'archivos_disponibles': []  # Lista de archivos disponibles para el selector
-    }
-
-    conn = get_connection()
-    if not conn:
-        logger.warning("No se pudo obtener conexión a la BD; devolviendo estadísticas vacías")
-        return stats
-
-    try:
-        with conn.cursor(dictionary=True) as cursor:
-            # Obtener lista de archivos disponibles
-            cursor.execute("SELECT nombre_archivo, total_registros FROM archivos_origen WHERE activo = 1 ORDER BY nombre_archivo")
-            stats['archivos_disponibles'] = cursor.fetchall()
-            
-            # Construir cláusula WHERE para filtro de archivo origen
-            where_clause = ""
-            params = []
-            
-            if filtro_origen_archivo:
-                if isinstance(filtro_origen_archivo, str):
-                    where_clause = "WHERE origen_archivo = %s"
-                    params = [filtro_origen_archivo]
-                elif isinstance(filtro_origen_archivo, list) and filtro_origen_archivo:
-                    placeholders = ','.join(['%s'] * len(filtro_origen_archivo))
-                    where_clause = f"WHERE origen_archivo IN ({placeholders})"
-                    params = filtro_origen_archivo
-            
-            # Total leads con filtro
-            query_total = f"SELECT COUNT(*) AS cnt FROM leads {where_clause}"
-            cursor.execute(query_total, params)
-            stats['total_leads'] = cursor.fetchone()['cnt']
-
-            # Llamadas de hoy (temporalmente deshabilitado)
-            stats['llamadas_hoy'] = 0
-
-            # Obtener configuración de máximo intentos
-            try:
-                cursor.execute(
-                    "SELECT config_value FROM scheduler_config WHERE config_key = 'max_attempts'"
-                )
-                row_max = cursor.fetchone()
-                max_attempts = int(row_max['config_value']) if row_max and row_max.get('config_value') else 6
-            except Exception:
-                max_attempts = 6
-
-            # Resumen de estados actualizado para métricas de llamada
-            query_estados = f"""
-                SELECT
-                    IFNULL(SUM(CASE WHEN status_level_1 IS NOT NULL AND TRIM(status_level_1) <> '' AND TRIM(status_level_1) <> 'None' THEN 1 ELSE 0 END), 0) AS contactados,
-                    IFNULL(SUM(CASE WHEN TRIM(status_level_1) = 'Volver a llamar' THEN 1 ELSE 0 END), 0) AS volver_llamar,
-                    IFNULL(SUM(CASE WHEN TRIM(status_level_1) = 'No Interesado' THEN 1 ELSE 0 END), 0) AS no_interesado,
-                    IFNULL(SUM(CASE WHEN TRIM(status_level_1) = 'Cita Agendada' AND TRIM(status_level_2) = 'Sin Pack' THEN 1 ELSE 0 END), 0) AS cita_sin_pack,
-                    IFNULL(SUM(CASE WHEN TRIM(status_level_1) = 'Cita Agendada' AND TRIM(status_level_2) = 'Con Pack' THEN 1 ELSE 0 END), 0) AS cita_con_pack,
-                    IFNULL(SUM(CASE WHEN (TRIM(status_level_1) = 'Cita Agendada' OR TRIM(status_level_1) = 'Cita Manual') THEN 1 ELSE 0 END), 0) AS utiles_positivos,
-                    IFNULL(SUM(CASE WHEN TRIM(status_level_1) IN ('Numero erroneo', 'Interesado') OR status_level_1 IS NULL OR TRIM(status_level_1) = '' OR TRIM(status_level_1) = 'None' THEN 1 ELSE 0 END), 0) AS otros_estados
-                FROM leads {where_clause}
-            """
-            cursor.execute(query_estados, params)
-            row_states = cursor.fetchone()
-            stats['contactados'] = row_states['contactados']
-            stats['estados'] = {
-                'volver_llamar': row_states['volver_llamar'],
-                'no_interesado': row_states['no_interesado'],
-                'cita_sin_pack': row_states['cita_sin_pack'],
-                'cita_con_pack': row_states['cita_con_pack'],
-                'utiles_positivos': row_states['utiles_positivos'],
-                'otros_estados': row_states['otros_estados'],
-                'no_util': 0
-            }
-
-            # Cálculo de leads que alcanzaron el máximo de intentos
-            if where_clause:
-                where_max = where_clause + f" AND call_attempts_count >= {max_attempts}"
-            else:
-                where_max = f"WHERE call_attempts_count >= {max_attempts}"
-            cursor.execute(f"SELECT COUNT(*) AS cnt FROM leads {where_max}", params)
-            stats['estados']['no_util'] = cursor.fetchone()['cnt']
-
-            # Calcular total de citas (usando el mismo cálculo que útiles positivos) y tasa sobre contactados
-            stats['citas_total'] = row_states['utiles_positivos']
-
-            if stats['contactados']:
-                stats['citas_contactados_rate'] = f"{(stats['citas_total'] / stats['contactados'] * 100):.0f}%"
-            else:
-                stats['citas_contactados_rate'] = '0%'
-
-            # Definir todos los posibles subestados según la tabla proporcionada
-            subestados_volver_posibles = [
-                'buzón', 'no disponible cliente', 'Interesado. Problema técnico', 'cortado'
-            ]
-            
-            # Nuevas razones de no interés actualizadas
-            subestados_no_interes_posibles = [
-                'Paciente con tratamiento',
-                'Paciente con tratamiento particular', 
-                'Llamará cuando esté interesado',
-                'Solicitan baja póliza',
-                'No desea informar motivo / no colabora',
-                # LEGACY - mantener compatibilidad
-                'no disponibilidad cliente',
-                'Descontento con Adeslas', 
-                'No da motivos',
-                'Próxima baja'
-            ]
-            
-            # "No útil" se maneja por separado como estado automático, no como razón seleccionable
-            
-            # Subestados para CONFIRMADO (Citas)
-            subestados_confirmado = ['Con Pack', 'Sin Pack']
-            
-            # Ya ha ido a la clínica (sin subestados)
-            
-            # Subestados para volver a llamar - APLICAR MISMO FILTRO
-            query_subestados_volver = f"""
-                SELECT IFNULL(status_level_2, 'Sin especificar') AS sub, COUNT(*) AS cnt 
-                FROM leads 
-                WHERE TRIM(status_level_1) = 'Volver a llamar' {where_clause.replace('WHERE', 'AND') if where_clause else ''}
-                GROUP BY sub
-            """
-            cursor.execute(query_subestados_volver, params)
-            subestados_volver_actual = {r['sub']: r['cnt'] for r in cursor.fetchall()}
-            
-            # Asegurar que todos los posibles subestados estén incluidos
-            stats['subestados_volver'] = {sub: subestados_volver_actual.get(sub, 0) for sub in subestados_volver_posibles}
-            
-            # Subestados para no interesado - APLICAR MISMO FILTRO
-            query_subestados_no_interes = f"""
-                SELECT IFNULL(status_level_2, 'Sin especificar') AS sub, COUNT(*) AS cnt 
-                FROM leads 
-                WHERE TRIM(status_level_1) = 'No Interesado' {where_clause.replace('WHERE', 'AND') if where_clause else ''}
-                GROUP BY sub
-            """
-            cursor.execute(query_subestados_no_interes, params)
-            subestados_no_interes_actual = {r['sub']: r['cnt'] for r in cursor.fetchall()}
-            
-            # Asegurar que todos los posibles subestados estén incluidos
-            stats['subestados_no_interes'] = {sub: subestados_no_interes_actual.get(sub, 0) for sub in subestados_no_interes_posibles}
-
-            # Estadísticas diarias (temporalmente deshabilitado)
-            stats['diarios'] = []      
-            
-
-            # Tasa de conversión simple: leads con conPack=1 sobre total
-            if stats['total_leads']:
-                cursor.execute("SELECT COUNT(*) AS cnt FROM leads WHERE conPack = 1")
-                conversion = cursor.fetchone()['cnt'] / stats['total_leads'] * 100
-                stats['conversion_rate'] = f"{conversion:.0f}%"
-    except Exception as e:
-        logger.error(f"Error calculando estadísticas: {e}")
-    finally:
-        conn.close()
-
-    return stats
+    return get_dashboard_statistics(filtro_origen_archivo)
@@ -0,0 +1,236 @@
+"""
+Calendario laboral precompilado para los schedulers de llamadas.
+
+``scheduler_config`` guarda los días laborables, las franjas horarias ("HH:MM")
+y, opcionalmente, festivos y calendarios por región como texto/JSON. En lugar
+de volver a decodificar y partir esas cadenas en cada consulta, se compilan una
+sola vez por versión de la configuración en un ``WorkingCalendar``:
+
+- por cada día de la semana, los intervalos laborables en segundos del día,
+  fusionados y ordenados (búsqueda binaria),
+- el conjunto de festivos,
+- los calendarios regionales (``regional_calendars``), que heredan de la
+  configuración general lo que no redefinen. La región de un lead es su
+  ``delegacion`` (ver ``call_scheduler.schedule_retries_batch``).
+
+``is_working`` y ``next_working`` son O(log n) en el número de franjas.
+Las franjas que cruzan medianoche (p. ej. 22:00-06:00) cuentan, como hasta
+ahora, en el día de la semana del propio instante.
+"""
+
+import json
+import logging
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKING_DAYS = [1, 2, 3, 4, 5]
+DEFAULT_TIME_SLOTS = [{"start": "10:00", "end": "20:00"}]
+SECONDS_PER_DAY = 24 * 3600
+# Días máximos a recorrer buscando el siguiente día laborable (festivos encadenados)
+MAX_SEARCH_DAYS = 366
+
+
+def _text(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    return value
+
+
+def _json_value(value: Any, default: Any) -> Any:
+    value = _text(value)
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            logger.warning(f"Valor JSON inválido en scheduler_config: {value!r}")
+            return default
+    return value
+
+
+def _parse_hhmm(value: Any) -> Optional[int]:
+    """'HH:MM' (o 'HH:MM:SS') -> segundos desde medianoche; None si no es válido."""
+    try:
+        parts = [int(part) for part in str(_text(value) or '').split(':')[:3]]
+        if len(parts) < 2:
+            return None
+        time(*parts)  # Valida los rangos
+        return parts[0] * 3600 + parts[1] * 60 + (parts[2] if len(parts) > 2 else 0)
+    except (ValueError, TypeError):
+        return None
+
+
+def _seconds_of_day(dt: datetime) -> float:
+    return dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6
+
+
+def _merge(intervals: List[Tuple[int, int]]) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return tuple(s for s, _ in merged), tuple(e for _, e in merged)
+
+
+class WorkingCalendar:
+    """Calendario laboral compilado e inmutable."""
+
+    def __init__(self, working_days: Iterable[Any] = DEFAULT_WORKING_DAYS,
+                 time_slots: Iterable[Dict[str, Any]] = DEFAULT_TIME_SLOTS,
+                 holidays: Iterable[Any] = (), regions: Optional[Dict[str, Dict]] = None):
+        """
+        Args:
+            working_days: Días laborables ISO (1=lunes ... 7=domingo).
+            time_slots: Franjas ``{"start": "HH:MM", "end": "HH:MM"}``.
+            holidays: Fechas no laborables (``date`` o "YYYY-MM-DD").
+            regions: ``{region: {working_days?, working_time_slots?, holidays?}}``.
+        """
+        days = set()
+        for day in working_days or []:
+            try:
+                day = int(_text(day))
+            except (ValueError, TypeError):
+                continue
+            if 1 <= day <= 7:
+                days.add(day)
+        self.working_days = frozenset(days or DEFAULT_WORKING_DAYS)
+
+        slots = []
+        for slot in time_slots or []:
+            if not isinstance(slot, dict):
+                continue
+            start, end = _parse_hhmm(slot.get('start')), _parse_hhmm(slot.get('end'))
+            if start is None or end is None:
+                logger.warning(f"Slot inválido ignorado: {slot}")
+                continue
+            slots.append((start, end))
+        if not slots:
+            slots = [(10 * 3600, 20 * 3600)]
+        self.time_slots = tuple(slots)
+
+        # Intervalos [inicio, fin] (fin inclusivo) en segundos del día
+        intervals = []
+        for start, end in slots:
+            if start <= end:
+                intervals.append((start, end))
+            else:
+                intervals.extend([(0, end), (start, SECONDS_PER_DAY)])
+        self._starts, self._ends = _merge(intervals)
+
+        parsed_holidays = set()
+        for holiday in holidays or []:
+            holiday = _text(holiday)
+            try:
+                parsed_holidays.add(holiday if isinstance(holiday, date) else date.fromisoformat(str(holiday)[:10]))
+            except ValueError:
+                logger.warning(f"Festivo inválido ignorado: {holiday!r}")
+        self.holidays = frozenset(parsed_holidays)
+
+        self._regions: Dict[str, 'WorkingCalendar'] = {}
+        for region, overrides in (regions or {}).items():
+            if not isinstance(overrides, dict):
+                continue
+            self._regions[str(region).casefold()] = WorkingCalendar(
+                working_days=overrides.get('working_days', sorted(self.working_days)),
+                time_slots=overrides.get('working_time_slots', self.slot_dicts()),
+                holidays=set(self.holidays) | set(overrides.get('holidays', [])),
+            )
+
+    def slot_dicts(self) -> List[Dict[str, str]]:
+        """Franjas en el formato de ``scheduler_config`` ("HH:MM")."""
+        fmt = lambda seconds: f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+        return [{"start": fmt(start), "end": fmt(end)} for start, end in self.time_slots]
+
+    def for_region(self, region: Optional[str]) -> 'WorkingCalendar':
+        """Calendario de ``region`` (o el general si no tiene uno propio)."""
+        if not region:
+            return self
+        return self._regions.get(str(region).casefold(), self)
+
+    def is_working_day(self, day: date) -> bool:
+        return day.isoweekday() in self.working_days and day not in self.holidays
+
+    def is_working(self, dt: datetime) -> bool:
+        """True si ``dt`` cae dentro de una franja de un día laborable."""
+        if not self.is_working_day(dt.date()):
+            return False
+        seconds = _seconds_of_day(dt)
+        i = bisect_right(self._starts, seconds) - 1
+        return i >= 0 and seconds <= self._ends[i]
+
+    def next_working(self, dt: datetime) -> datetime:
+        """``dt`` si es laborable; si no, el inicio de la siguiente franja laborable."""
+        if self.is_working(dt):
+            return dt
+        day = dt.date()
+        if self.is_working_day(day):
+            i = bisect_right(self._starts, _seconds_of_day(dt))
+            if i < len(self._starts):
+                return datetime.combine(day, time(), tzinfo=dt.tzinfo) + timedelta(seconds=self._starts[i])
+        for _ in range(MAX_SEARCH_DAYS):
+            day += timedelta(days=1)
+            if self.is_working_day(day):
+                return datetime.combine(day, time(), tzinfo=dt.tzinfo) + timedelta(seconds=self._starts[0])
+        logger.warning(f"No hay días laborables en el próximo año desde {dt}")
+        return dt + timedelta(days=1)
+
+    def current_slot(self, dt: datetime) -> Optional[Dict[str, str]]:
+        """Franja configurada que contiene ``dt`` (None fuera de horario)."""
+        if not self.is_working_day(dt.date()):
+            return None
+        seconds = _seconds_of_day(dt)
+        for (start, end), slot in zip(self.time_slots, self.slot_dicts()):
+            if (start <= seconds <= end) if start <= end else (seconds >= start or seconds <= end):
+                return slot
+        return None
+
+
+# --- Caché por versión de configuración ---
+
+CALENDAR_CONFIG_KEYS = ('working_days', 'working_time_slots', 'working_hours_start', 'working_hours_end',
+                        'holidays', 'regional_calendars')
+
+_calendars: Dict[str, WorkingCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def calendar_from_config(config: Dict[str, Any]) -> WorkingCalendar:
+    """
+    Devuelve el calendario compilado para ``config`` (el dict de un scheduler).
+
+    Se compila solo cuando cambian las claves de calendario de la
+    configuración; mientras ``scheduler_config`` no cambie se reutiliza el
+    mismo objeto en todo el proceso.
+    """
+    fingerprint = json.dumps({key: _text(config.get(key)) for key in CALENDAR_CONFIG_KEYS},
+                             sort_keys=True, default=str)
+    calendar = _calendars.get(fingerprint)
+    if calendar is not None:
+        return calendar
+
+    slots = _json_value(config.get('working_time_slots'), None)
+    if not slots:
+        start = _text(config.get('working_hours_start')) or '10:00'
+        end = _text(config.get('working_hours_end')) or '20:00'
+        slots = [{"start": start, "end": end}]
+    calendar = WorkingCalendar(
+        working_days=_json_value(config.get('working_days'), DEFAULT_WORKING_DAYS),
+        time_slots=slots,
+        holidays=_json_value(config.get('holidays'), []),
+        regions=_json_value(config.get('regional_calendars'), {}),
+    )
+    with _calendars_lock:
+        # Solo interesa la versión vigente (y quizá la anterior)
+        if len(_calendars) > 8:
+            _calendars.clear()
+        _calendars[fingerprint] = calendar
+    logger.info(f"Calendario laboral compilado: días {sorted(calendar.working_days)}, "
+                f"franjas {calendar.slot_dicts()}, {len(calendar.holidays)} festivos")
+    return calendar
@@ -0,0 +1,142 @@
+"""
+Buffer de escritura diferida (write-behind) para operaciones de BD frecuentes.
+
+Acumula elementos y los entrega por lotes a una función de volcado cuando se
+alcanza un tamaño máximo o pasa un tiempo máximo desde el primer elemento
+pendiente. ``close()`` garantiza el volcado de lo pendiente al detenerse.
+
+Si el volcado falla, el lote vuelve delante de lo pendiente y se reintenta
+pasado ``max_delay``; tras ``max_retries`` fallos seguidos se descarta.
+
+El trabajo posterior a cada lote (p. ej. callbacks) va en ``after_flush``,
+que se ejecuta ya liberado el lock de volcado para no retrasar el siguiente.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Buffer acotado con volcado por tamaño/tiempo y volcado final al cerrar."""
+
+    def __init__(self, flush_fn: Callable[[List[Any]], None], max_items: int = 50,
+                 max_delay: float = 2.0, name: str = 'write-behind',
+                 after_flush: Optional[Callable[[List[Any]], None]] = None,
+                 max_retries: int = 3):
+        """
+        Args:
+            flush_fn: Recibe la lista de elementos a persistir. Si lanza, el
+                      lote se conserva y se reintenta; debe ser idempotente.
+            max_items: Tamaño de lote que dispara un volcado inmediato.
+            max_delay: Segundos máximos que un elemento espera en el buffer
+                       (y espera entre reintentos).
+            after_flush: Recibe cada lote una vez volcado o descartado tras
+                         agotar los reintentos, fuera del lock de volcado.
+            max_retries: Reintentos de un lote fallido antes de descartarlo.
+        """
+        self.flush_fn = flush_fn
+        self.after_flush = after_flush
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.name = name
+
+        self._items: List[Any] = []
+        self._oldest: float = 0.0
+        self._cond = threading.Condition()
+        # Serializa los volcados para conservar el orden de escritura
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._failures = 0  # Fallos seguidos del lote en reintento
+        self._metrics = {'added': 0, 'flushes': 0, 'flushed_items': 0, 'flush_errors': 0, 'dropped_items': 0}
+
+        self._flusher = threading.Thread(target=self._run, name=f"{name}-flusher", daemon=True)
+        self._flusher.start()
+
+    def add(self, item: Any):
+        """Añade un elemento; si el lote está completo, lo vuelca en este hilo."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Buffer '{self.name}' cerrado")
+            if not self._items:
+                self._oldest = time.monotonic()
+                self._cond.notify()
+            self._items.append(item)
+            self._metrics['added'] += 1
+            # Con un lote en reintento se espera a su turno en lugar de insistir en cada add()
+            full = len(self._items) >= self.max_items and not self._failures
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Vuelca todos los elementos pendientes."""
+        with self._flush_lock:
+            with self._cond:
+                items, self._items = self._items, []
+            if not items:
+                return
+            try:
+                self.flush_fn(items)
+            except Exception as e:
+                with self._cond:
+                    self._metrics['flush_errors'] += 1
+                    self._failures += 1
+                    failures = self._failures
+                    if failures <= self.max_retries:
+                        # El lote vuelve delante de lo pendiente para conservar el orden
+                        self._items = items + self._items
+                        self._oldest = time.monotonic()
+                        self._cond.notify()
+                    else:
+                        self._failures = 0
+                        self._metrics['dropped_items'] += len(items)
+                if failures <= self.max_retries:
+                    logger.warning(f"[{self.name}] Error volcando {len(items)} elementos "
+                                   f"(reintento {failures}/{self.max_retries}): {e}")
+                    return
+                logger.error(f"[{self.name}] Se descartan {len(items)} elementos tras "
+                             f"{failures} fallos seguidos: {e}")
+            else:
+                with self._cond:
+                    self._failures = 0
+                    self._metrics['flushes'] += 1
+                    self._metrics['flushed_items'] += len(items)
+        if self.after_flush:
+            try:
+                self.after_flush(items)
+            except Exception as e:
+                logger.error(f"[{self.name}] Error tras volcar {len(items)} elementos: {e}")
+
+    def close(self):
+        """Detiene el hilo de volcado y persiste lo pendiente (agotando los reintentos)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._flusher.join()
+        self.flush()
+        while self.stats()['pending']:
+            time.sleep(self.max_delay)
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._metrics, pending=len(self._items))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._items:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                remaining = self._oldest + self.max_delay - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()